@@ -0,0 +1,214 @@
+"""
+Measure the watcher's admission control on a burst of mentions, see
+donationsbot/functions/watcher/admission.py.
+
+--minutes of mentions are polled a minute at a time by the watcher, against
+local stand-ins for twitter, SQS and S3, so the admission state is stored and
+loaded between every poll like it is between invocations. Each minute has
+--genuine mentions from different people, and the burst adds a pile-on of
+--pile-on replies in one conversation, --copy-paste copies of one text from
+different accounts, and --repeaters accounts mentioning us --repeats times each.
+
+Reports how many of each kind were queued, the metrics published, the size of
+the stored state, and the time admission takes per mention. The reply delay of
+the genuine mentions is simulated by replying to the queue in order at twitter's
+rate limit, with and without admission control.
+
+    python benchmarks/admission_burst.py [--minutes 60] [--genuine 2]
+        [--pile-on 3000] [--copy-paste 2000] [--repeaters 20 --repeats 50]
+"""
+
+import argparse
+import itertools
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT_DIR = Path(__file__).parent.parent
+
+sys.path.insert(0, str(ROOT_DIR / "donationsbot" / "functions" / "watcher"))
+sys.path.insert(0, str(ROOT_DIR / "donationsbot" / "layers" / "shared"))
+# the bot's package, a layer of the watcher's, so after the watcher's index.py
+sys.path.append(str(ROOT_DIR / "donationsbot" / "functions" / "bot"))
+os.environ.setdefault("BUCKET_NAME", "bucket")
+os.environ.setdefault("SQS_QUEUE_URL", "queue")
+os.environ.setdefault("POWERTOOLS_TRACE_DISABLED", "1")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import tweepy  # noqa: E402
+
+from fakes import FakeMentions, FakeS3, FakeSQS, FakeSSM  # noqa: E402
+from shared.aws import ssm_client  # noqa: E402
+
+import index  # noqa: E402
+from admission import Admission, Decision  # noqa: E402
+
+TWITTER_ID = "1"
+# twitter's limit on creating tweets
+REPLIES_PER_SECOND = 200 / (15 * 60)
+GENUINE = "genuine"
+
+
+def burst(args) -> List[Tuple[float, str, Dict[str, str]]]:
+    """(seconds from the start, kind, fields) of each mention, in order."""
+    ids = itertools.count(1000)
+    seconds = args.minutes * 60
+    mentions = [
+        (
+            random.uniform(0, seconds),
+            GENUINE,
+            dict(
+                text=f"@AusPolDonations what has @donor{next(ids)} given?",
+                author_id=str(next(ids)),
+            ),
+        )
+        for _ in range(args.genuine * args.minutes)
+    ]
+    # the burst takes the middle third
+    start, end = seconds / 3, 2 * seconds / 3
+    conversation = str(next(ids))
+    mentions += [
+        (
+            random.uniform(start, end),
+            "pile-on",
+            dict(
+                text=f"@someone @AusPolDonations ratio {number}",
+                author_id=str(next(ids)),
+                conversation_id=conversation,
+            ),
+        )
+        for number in range(args.pile_on)
+    ]
+    mentions += [
+        (
+            random.uniform(start, end),
+            "copy-paste",
+            dict(
+                text=f"@user{next(ids)} @AusPolDonations Who  funds them?  #auspol",
+                author_id=str(next(ids)),
+            ),
+        )
+        for _ in range(args.copy_paste)
+    ]
+    for _ in range(args.repeaters):
+        author = str(next(ids))
+        mentions += [
+            (
+                random.uniform(start, end),
+                "repeater",
+                dict(
+                    text=f"@AusPolDonations answer me @mp{author} {number}",
+                    author_id=author,
+                ),
+            )
+            for number in range(args.repeats)
+        ]
+    mentions.sort(key=lambda mention: mention[0])
+    return mentions
+
+
+def genuine_delays(queued: List[Tuple[float, str]]) -> List[float]:
+    """
+    Seconds from each genuine mention to its reply, replying to the queue, (seconds
+    from the start, kind) of each mention, in order at twitter's rate limit.
+    """
+    delays = []
+    replied_at = 0.0
+    for at, kind in queued:
+        replied_at = max(replied_at, at) + 1 / REPLIES_PER_SECOND
+        if kind == GENUINE:
+            delays.append(replied_at - at)
+    return delays
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--minutes", type=int, default=60)
+    parser.add_argument("--genuine", type=int, default=2, help="per minute")
+    parser.add_argument("--pile-on", type=int, default=3000)
+    parser.add_argument("--copy-paste", type=int, default=2000)
+    parser.add_argument("--repeaters", type=int, default=20)
+    parser.add_argument("--repeats", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    ssm_client.set_factory(
+        lambda: FakeSSM({"TWITTER_ID": TWITTER_ID, "TWITTER_BEARER_TOKEN": "token"})
+    )
+    mentions = FakeMentions()
+    sqs = FakeSQS()
+    s3 = FakeS3()
+    index.tweepy_client.set_factory(lambda: mentions)
+    index.sqs_client.set_factory(lambda: sqs)
+    index.s3_client.set_factory(lambda: s3)
+    # poll from the first mention, rather than the last minute
+    s3.objects[f"{index.BUCKET_NAME}/{index.LATEST_TWEET_ID_KEY}"] = b"1"
+
+    stream = burst(args)
+    # the burst ends now, so state is pruned as it would be live
+    began = time.time() - args.minutes * 60
+    kind_of, created_at = {}, {}
+    decisions: Counter = Counter()
+    state_sizes = []
+    next_mention = 0
+    for minute in range(1, args.minutes + 1):
+        while next_mention < len(stream) and stream[next_mention][0] < minute * 60:
+            at, kind, fields = stream[next_mention]
+            tweet = mentions.add_mention(created_at=began + at, **fields)
+            kind_of[tweet["id"]] = kind
+            created_at[tweet["id"]] = at
+            next_mention += 1
+        index.poll_mentions()
+        for name, metric in index.metrics.metric_set.items():
+            decisions[name] += sum(metric["Value"])
+        index.metrics.clear_metrics()
+        state_sizes.append(len(s3.objects[f"{index.BUCKET_NAME}/admission.json"]))
+
+    sent = Counter(kind_of.values())
+    queued = Counter(kind_of[message["Id"]] for message in sqs.messages)
+    print(f"{'mentions':<12}{'sent':>8}{'queued':>8}")
+    for kind in sent:
+        print(f"{kind:<12}{sent[kind]:>8}{queued[kind]:>8}")
+
+    print("\nmetrics")
+    for decision in Decision:
+        print(f"  {decision.value:<22}{decisions[decision.value]:>8.0f}")
+    print(
+        f"  {'AdmissionKeys':<22}{decisions['AdmissionKeys'] / args.minutes:>8.0f}"
+        " per poll on average"
+    )
+    print(
+        f"\nstored state {statistics.mean(state_sizes) / 1000:.1f}KB on average, "
+        f"{max(state_sizes) / 1000:.1f}KB at most"
+    )
+
+    tweets = [tweepy.Tweet(tweet) for tweet in mentions.tweets]
+    admission = Admission(clock=lambda: began + args.minutes * 60)
+    start = time.perf_counter()
+    for tweet in tweets:
+        admission.admit(tweet)
+    elapsed = time.perf_counter() - start
+    print(f"admission takes {elapsed / len(tweets) * 1e6:.1f}us per mention")
+
+    print(f"\n{'genuine reply delay':<24}{'median s':>10}{'p95 s':>10}{'max s':>10}")
+    every = sorted((created_at[id], kind) for id, kind in kind_of.items())
+    admitted = sorted(
+        (created_at[message["Id"]], kind_of[message["Id"]])
+        for message in sqs.messages
+    )
+    for name, queue in [("without admission", every), ("with admission", admitted)]:
+        delays = sorted(genuine_delays(queue))
+        print(
+            f"{name:<24}{statistics.median(delays):>10.0f}"
+            f"{delays[int(len(delays) * 0.95)]:>10.0f}{delays[-1]:>10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
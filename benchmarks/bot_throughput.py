@@ -0,0 +1,108 @@
+"""
+Load test the bot handler's batch processing against a stubbed twitter client.
+
+create_tweet is replaced with a stub which sleeps for a typical API round trip, and
+a batch of mentions is processed at different concurrency levels, reporting
+throughput. Some mentions are made to fail so the partial batch failure reporting is
+exercised too.
+
+Requires the database, run `python data/build_db.py` first.
+
+    python benchmarks/bot_throughput.py [--latency 0.15] [--mentions 100]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent
+BOT_PATH = ROOT_DIR / "donationsbot" / "functions" / "bot"
+
+sys.path.insert(0, str(BOT_PATH))
+sys.path.insert(0, str(ROOT_DIR / "donationsbot" / "layers" / "shared"))
+os.environ.setdefault("POWERTOOLS_TRACE_DISABLED", "1")
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-southeast-2")
+# measure throughput, not twitter's rate limit, see benchmarks/rate_limit.py
+os.environ.setdefault("REPLY_RATE_LIMIT", "1000000")
+
+from aws_lambda_powertools.utilities.data_classes.sqs_event import (  # noqa: E402
+    SQSRecord,
+)
+
+import index  # noqa: E402
+from bot import twitter  # noqa: E402
+from bot.idempotency import InMemoryStore  # noqa: E402
+from fakes import FakeSSM  # noqa: E402
+from shared.aws import ssm_client  # noqa: E402
+
+CONCURRENCY_LEVELS = [1, 2, 5, 10, 20]
+FAILURE_RATE = 0.05
+
+
+class StubTweepyClient:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.tweets = []
+
+    def create_tweet(self, in_reply_to_tweet_id, text):
+        time.sleep(self.latency)
+        if random.random() < FAILURE_RATE:
+            raise ConnectionError("stub failure")
+        self.tweets.append((in_reply_to_tweet_id, text))
+
+
+def make_records(count: int):
+    handles = list(twitter.DATABASE.get().handles)
+    return [
+        SQSRecord(
+            {
+                "messageId": str(index),
+                "body": json.dumps(
+                    {
+                        "id": index,
+                        "text": f"@AusPolDonations {random.choice(handles)} #auspol",
+                    }
+                ),
+            }
+        )
+        for index in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.15)
+    parser.add_argument("--mentions", type=int, default=100)
+    args = parser.parse_args()
+
+    client = StubTweepyClient(latency=args.latency)
+    ssm_client.set_factory(lambda: FakeSSM({}))
+    twitter.tweepy_client.set_factory(lambda: client)
+    records = make_records(args.mentions)
+
+    print(f"{'concurrency':>12}{'seconds':>10}{'replies/s':>12}{'failed':>8}")
+    for concurrency in CONCURRENCY_LEVELS:
+        # the same mentions are replayed at each level, so forget the replies
+        index.idempotency_store = InMemoryStore()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            start = time.perf_counter()
+            failures = []
+            # the lambda receives at most 10 messages per invocation
+            for batch_start in range(0, len(records), 10):
+                failures += index.process_records(
+                    records=records[batch_start : batch_start + 10], executor=executor
+                )
+            elapsed = time.perf_counter() - start
+        print(
+            f"{concurrency:>12}{elapsed:>10.2f}"
+            f"{len(records) / elapsed:>12.1f}{len(failures):>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
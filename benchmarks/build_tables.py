@@ -0,0 +1,190 @@
+"""
+Compare data/build_tables.py against the previous version, which read the donations
+CSV once per table and went through an intermediate CSV and csv2md to write each
+markdown table.
+
+Both are run on a copy of data/tables/ in a temporary directory, and their output
+is checked to be identical. By default this uses Donations Made.csv from the latest
+release in data/src/. If there isn't one, a CSV of --rows synthetic donations is
+generated from the names in the tables.
+
+    python benchmarks/build_tables.py [--csv path] [--rows 200000] [--repeat 3]
+"""
+
+import argparse
+import csv
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from io import StringIO
+from pathlib import Path
+
+from csv2md.table import Table
+
+ROOT_DIR = Path(__file__).parent.parent
+DATA_PATH = ROOT_DIR / "data"
+
+sys.path.insert(0, str(DATA_PATH))
+
+import build_tables  # noqa: E402
+from utils import (  # noqa: E402
+    SOURCE_DONATION_MADE_TO,
+    SOURCE_DONOR_NAME,
+    SOURCE_FINANCIAL_YEAR,
+    SOURCE_VALUE,
+    find_donation_sources,
+)
+
+TABLES = ["twitter_donors_page_1.md", "twitter_donors_page_2.md", "parties.md"]
+
+
+def legacy_build_twitter_donor_table(donations_file: str) -> None:
+    twitter_handles = build_tables.get_existing_twitter_handles()
+    counter = Counter()
+    with open(donations_file) as csv_file:
+        reader = csv.DictReader(csv_file)
+        for row in reader:
+            counter.update({row[SOURCE_DONOR_NAME]: int(row[SOURCE_VALUE])})
+    fieldnames = ["Twitter", "Donor", "Total Donations"]
+    with StringIO() as page_1, StringIO() as page_2:
+        writer_page_1 = csv.DictWriter(f=page_1, fieldnames=fieldnames)
+        writer_page_2 = csv.DictWriter(f=page_2, fieldnames=fieldnames)
+        writer_page_1.writeheader()
+        writer_page_2.writeheader()
+        for donor, value in counter.most_common():
+            writer = writer_page_1 if value > 50000 else writer_page_2
+            writer.writerow(
+                {
+                    "Twitter": twitter_handles[donor],
+                    "Donor": donor.replace("|", "/"),
+                    "Total Donations": build_tables.format_money(value),
+                }
+            )
+        page_1.seek(0)
+        page_2.seek(0)
+        with open(build_tables.TWITTER_MAPPING_MARKDOWN_FILE_PAGE_1, "w") as f:
+            f.write(Table.parse_csv(file=page_1).markdown())
+        with open(build_tables.TWITTER_MAPPING_MARKDOWN_FILE_PAGE_2, "w") as f:
+            f.write(Table.parse_csv(file=page_2).markdown())
+
+
+def legacy_build_party_groups_table(donations_file: str) -> None:
+    existing_parties = build_tables.get_existing_parties()
+    counter = Counter()
+    with open(donations_file) as csv_file:
+        reader = csv.DictReader(csv_file)
+        for row in reader:
+            counter.update({row[SOURCE_DONATION_MADE_TO]: int(row[SOURCE_VALUE])})
+    with StringIO() as temp_csv_file:
+        writer = csv.DictWriter(
+            f=temp_csv_file, fieldnames=["Party", "Donation Made To", "Total Donations"]
+        )
+        writer.writeheader()
+        for donation_made_to, value in counter.most_common():
+            writer.writerow(
+                {
+                    "Party": existing_parties[donation_made_to],
+                    "Donation Made To": donation_made_to.replace("|", "/"),
+                    "Total Donations": build_tables.format_money(value),
+                }
+            )
+        temp_csv_file.seek(0)
+        with open(build_tables.PARTY_GROUPS_MARKDOWN_FILE, "w") as f:
+            f.write(Table.parse_csv(file=temp_csv_file).markdown())
+
+
+def legacy_build_tables(donations_file: str) -> None:
+    legacy_build_twitter_donor_table(donations_file)
+    legacy_build_party_groups_table(donations_file)
+
+
+def generate_donations(path: Path, rows: int) -> None:
+    donors = list(build_tables.get_existing_twitter_handles()) or ["Donor"]
+    recipients = list(build_tables.get_existing_parties()) or ["Party"]
+    random.seed(0)
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+        writer.writerow(
+            [
+                SOURCE_FINANCIAL_YEAR,
+                SOURCE_DONOR_NAME,
+                "Donor Address",
+                SOURCE_DONATION_MADE_TO,
+                SOURCE_VALUE,
+            ]
+        )
+        for _ in range(rows):
+            writer.writerow(
+                [
+                    f"20{random.randint(10, 20)}-{random.randint(11, 21)}",
+                    random.choice(donors),
+                    "1 Example Street",
+                    random.choice(recipients),
+                    random.randint(1, 100000),
+                ]
+            )
+
+
+def run(name, build, donations_file: str, repeat: int):
+    # each run starts from the original tables, as it reads them back in
+    for table in TABLES:
+        shutil.copy(DATA_PATH / "tables" / table, Path("tables") / table)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        build(donations_file)
+        timings.append(time.perf_counter() - start)
+    outputs = dict((table, (Path("tables") / table).read_text()) for table in TABLES)
+    print(f"{name:<28}{min(timings):>10.3f}")
+    return outputs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", type=Path)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        os.mkdir("tables")
+        for table in TABLES:
+            shutil.copy(DATA_PATH / "tables" / table, Path("tables") / table)
+
+        donations_file = args.csv
+        if donations_file is None:
+            try:
+                donations_file = list(find_donation_sources().values())[-1]
+            except FileNotFoundError:
+                donations_file = Path(directory) / "donations.csv"
+                generate_donations(donations_file, rows=args.rows)
+                print("no AEC release in data/src/, using synthetic donations")
+        with open(donations_file) as f:
+            rows = sum(1 for _ in f) - 1
+        print(f"{donations_file.name}: {rows} rows\n")
+
+        print(f"{'':<28}{'seconds':>10}")
+        legacy = run(
+            "csv per table, csv2md",
+            legacy_build_tables,
+            str(donations_file),
+            args.repeat,
+        )
+        single_pass = run(
+            "single pass, streaming",
+            build_tables.build_tables,
+            str(donations_file),
+            args.repeat,
+        )
+        for table in TABLES:
+            same = "identical" if legacy[table] == single_pass[table] else "DIFFERENT"
+            print(f"{table}: {same}")
+
+
+if __name__ == "__main__":
+    main()
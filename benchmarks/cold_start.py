@@ -0,0 +1,156 @@
+"""
+Compare bot cold start cost of loading the json database against the binary one.
+
+Each strategy runs in a fresh interpreter so the numbers include everything a
+lambda cold start would pay: init time to the first reply lookup, and peak RSS.
+
+    python benchmarks/cold_start.py [--runs 20]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent
+BOT_PATH = ROOT_DIR / "donationsbot" / "functions" / "bot"
+DATA_PATH = BOT_PATH / "bot" / "data"
+
+sys.path.insert(0, str(ROOT_DIR / "data"))
+
+sys.path.insert(0, str(BOT_PATH))
+
+from binary_db import write_database  # noqa: E402
+from build_db import (  # noqa: E402
+    create_party_index,
+    drop_aliases_without_replies,
+    drop_party_handles_without_donors,
+    get_aliases,
+    get_party_handles,
+)
+from bot.fuzzy import index_trigrams  # noqa: E402
+from bot.mentions import build_automaton, create_patterns  # noqa: E402
+from bot.replies import build_reply_segments  # noqa: E402
+from bot.series import donors_from_json  # noqa: E402
+
+LOOKUP_HANDLE = "#nine"
+
+JSON_STRATEGY = f"""
+import json
+with open({str(DATA_PATH / "twitter.json")!r}) as f:
+    handles = json.load(f)
+with open({str(DATA_PATH / "donors.json")!r}) as f:
+    donors = json.load(f)
+[donors[d] for d in handles[{LOOKUP_HANDLE!r}]]
+"""
+
+BINARY_STRATEGY = f"""
+import sys
+sys.path.insert(0, {str(BOT_PATH)!r})
+from bot.db import DonorDatabase
+db = DonorDatabase(sys.argv[1])
+[db.donors[d] for d in db.handles[{LOOKUP_HANDLE!r}]]
+"""
+
+# Stdlib modules both strategies use are imported before timing starts, the lambda
+# runtime has already loaded them by the time the bot module is imported.
+# ru_maxrss is inherited from the parent across fork/exec, so read VmHWM instead.
+HARNESS = """
+import collections.abc, json, mmap, struct, sys, time, typing
+start = time.perf_counter()
+exec(compile({code!r}, "strategy", "exec"))
+elapsed = time.perf_counter() - start
+with open("/proc/self/status") as f:
+    rss = next(int(line.split()[1]) for line in f if line.startswith("VmHWM"))
+print(elapsed, rss)
+"""
+
+BASELINE = "pass"
+
+
+def build_binary_database(path: Path) -> None:
+    # rebuild from the json files so the comparison uses identical data
+    with open(DATA_PATH / "twitter.json") as f:
+        handles = json.load(f)
+    with open(DATA_PATH / "donors.json") as f:
+        donors = donors_from_json(json.load(f))
+    financial_years = next(iter(donors.values())).years
+    handles = dict(
+        (handle, [donor for donor in donor_set if donor in donors])
+        for handle, donor_set in handles.items()
+        if any(donor in donors for donor in donor_set)
+    )
+    aliases = drop_aliases_without_replies(get_aliases(), handles)
+    parties = create_party_index(donors, financial_years)
+    party_handles = drop_party_handles_without_donors(
+        get_party_handles(), parties, handles
+    )
+    patterns = create_patterns(handles=[*handles, *party_handles], aliases=aliases)
+    write_database(
+        path=path,
+        twitter_handles=handles,
+        donors=dict(
+            (name, list(series.cumulative.items())) for name, series in donors.items()
+        ),
+        replies=dict(
+            (
+                handle,
+                build_reply_segments(
+                    donor_set=donor_set, donors=donors, recent_year=financial_years[-1]
+                ),
+            )
+            for handle, donor_set in handles.items()
+        ),
+        donor_trigrams=index_trigrams(donors),
+        recent_year=financial_years[-1],
+        financial_years=financial_years,
+        parties=parties,
+        party_handles=party_handles,
+        patterns=patterns,
+        automaton=build_automaton([pattern.text for pattern in patterns]),
+    )
+
+
+def run(code: str, runs: int, db_path: Path):
+    timings, rss = [], []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", HARNESS.format(code=code), str(db_path)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout.split()
+        timings.append(float(output[0]))
+        rss.append(int(output[1]))
+    return statistics.median(timings), statistics.median(rss)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = Path(tmp_dir) / "donors.db"
+        build_binary_database(db_path)
+        json_size = sum(
+            (DATA_PATH / name).stat().st_size
+            for name in ["twitter.json", "donors.json"]
+        )
+        print(f"json size:   {json_size:>10,} bytes")
+        print(f"binary size: {db_path.stat().st_size:>10,} bytes")
+
+        _, baseline_rss = run(BASELINE, args.runs, db_path)
+        for name, code in [("json", JSON_STRATEGY), ("binary", BINARY_STRATEGY)]:
+            elapsed, rss = run(code, args.runs, db_path)
+            print(
+                f"{name:<8} init {elapsed * 1000:8.2f} ms"
+                f"  rss +{(rss - baseline_rss) / 1024:7.2f} MiB"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+"""
+Compare answering lookups over the AEC's CSVs row at a time, with a csv.DictReader
+pass per lookup, against the columnar store build_db.py keeps, see data/columnar.py.
+
+The lookups are rollups like the ones replies could use: totals by recipient, by
+return type and by year, across the donor, party, associated entity, third party
+and debt returns, and Donations Made.csv if a release has it. Both approaches must
+give the same totals.
+
+The store is timed twice: building it, reading every CSV into columns and saving
+the .npz, then the rollups, which is what a full build pays; and loading the saved
+store then the rollups, which is what an incremental build pays when the CSVs
+haven't changed.
+
+    python benchmarks/columnar_store.py [--source data/src] [--repeat 5]
+"""
+
+import argparse
+import csv
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+ROOT_DIR = Path(__file__).parent.parent
+
+sys.path.insert(0, str(ROOT_DIR / "data"))
+
+from columnar import MISSING_NUMBERS, Store  # noqa: E402
+
+# table, columns grouped by, column summed
+LOOKUPS = [
+    ("Donations Made", ["Financial Year", "Donor Name", "Donation Made To"], "Value"),
+    ("Donor Returns", ["Financial Year"], "Total Donations Made"),
+    ("Donor Donations Received", ["Name"], "Value"),
+    ("Party Returns", ["Financial Year", "Party Group"], "Total Receipts"),
+    ("Associated Entity Returns", ["Associated Party"], "Total Receipts"),
+    ("Third Party Donations Received", ["Name", "Donation Received From"], "Value"),
+    ("Detailed Debts", ["Financial Year", "Return Type"], "Amount owed"),
+    ("Detailed Discretionary Benefits", ["Return Type", "Name"], "Value"),
+]
+
+Totals = Dict[Tuple[str, ...], int]
+# "<release>/<table>" -> totals
+Results = Dict[str, Totals]
+
+
+def parse_number(value: str) -> int:
+    if value in MISSING_NUMBERS:
+        return 0
+    try:
+        return int(value)
+    except ValueError:
+        return round(float(value))
+
+
+def find_releases(source: Path) -> Dict[str, Path]:
+    return dict(
+        (path.name, path)
+        for path in sorted(source.iterdir())
+        if path.is_dir() and path.name.isdigit()
+    )
+
+
+def lookup_rows(releases: Dict[str, Path]) -> Results:
+    """Each lookup as its own pass over its CSV, a row at a time."""
+    results = {}
+    for release, path in releases.items():
+        for table, by, value in LOOKUPS:
+            if not (csv_path := path / f"{table}.csv").exists():
+                continue
+            totals = Counter()
+            with open(csv_path, newline="") as f:
+                for row in csv.DictReader(f):
+                    key = tuple(row[name] for name in by)
+                    totals[key] += parse_number(row[value])
+            results[f"{release}/{table}"] = dict(totals)
+    return results
+
+
+def lookup_store(store: Store) -> Results:
+    results = {}
+    for release in sorted(store.releases()):
+        for table_name, by, value in LOOKUPS:
+            if (table := store.table(release, table_name)) is None:
+                continue
+            groups, totals = table.rollup(by=by, value=value)
+            keys = zip(*[group.tolist() for group in groups])
+            results[f"{release}/{table_name}"] = dict(zip(keys, totals.tolist()))
+    return results
+
+
+def build_store(releases: Dict[str, Path], path: Path) -> Results:
+    store = Store.read(releases)
+    store.save(path)
+    return lookup_store(store)
+
+
+def load_store(path: Path) -> Results:
+    return lookup_store(Store.load(path))
+
+
+def time_runs(
+    function: Callable[[], Results], repeat: int
+) -> Tuple[List[float], Results]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = function()
+        timings.append(time.perf_counter() - start)
+    return timings, results
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", type=Path, default=ROOT_DIR / "data" / "src")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    releases = find_releases(args.source)
+    csv_paths = [
+        path for release in releases.values() for path in release.glob("*.csv")
+    ]
+    csv_bytes = sum(path.stat().st_size for path in csv_paths)
+    store_path = Path(tempfile.mkdtemp()) / "store.npz"
+
+    rows_timings, expected = time_runs(lambda: lookup_rows(releases), args.repeat)
+    build_timings, built = time_runs(
+        lambda: build_store(releases, store_path), args.repeat
+    )
+    load_timings, loaded = time_runs(lambda: load_store(store_path), args.repeat)
+    for name, results in [("building", built), ("loading", loaded)]:
+        if results != expected:
+            differ = [key for key in expected if results.get(key) != expected[key]]
+            sys.exit(f"{name} the store gave different totals for {differ}")
+
+    groups = sum(len(totals) for totals in expected.values())
+    print(
+        f"{len(csv_paths)} CSVs in {len(releases)} releases, {csv_bytes / 1e6:.1f}MB, "
+        f"{len(expected)} lookups, {groups} groups"
+    )
+    print(f"store {store_path.stat().st_size / 1e6:.1f}MB\n")
+    print(f"{'approach':<40}{'median ms':>10}{'min ms':>10}{'speedup':>9}")
+    rows_ms = statistics.median(rows_timings) * 1000
+    for name, timings in [
+        ("row at a time, a CSV pass per lookup", rows_timings),
+        ("read CSVs to columns, save, roll up", build_timings),
+        ("load saved store, roll up", load_timings),
+    ]:
+        median_ms = statistics.median(timings) * 1000
+        line = f"{name:<40}{median_ms:>10.1f}{min(timings) * 1000:>10.1f}"
+        if timings is not rows_timings:
+            line += f"{rows_ms / median_ms:>8.1f}x"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Measure what keeping the donor database up to date from S3 costs an invocation,
+see donationsbot/functions/bot/bot/reload.py.
+
+The database is served by a fake S3 with --latency per request and --bandwidth,
+and checked for a new version every --check-seconds on a virtual clock, with an
+invocation every --interval seconds. Reports what get() costs between checks, at a
+check when nothing has changed (a conditional GET answered 304), and at a check
+which loads a new version, and the average per invocation for a day of
+invocations with a new version published --publishes times.
+
+Replies keep running on threads while new versions are swapped in, and each must
+see one complete version throughout.
+
+Requires the database, run `python data/build_db.py` first.
+
+    python benchmarks/database_reload.py [--latency 0.02] [--bandwidth 50e6]
+        [--check-seconds 60] [--interval 5] [--publishes 4]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+ROOT_DIR = Path(__file__).parent.parent
+BOT_PATH = ROOT_DIR / "donationsbot" / "functions" / "bot"
+DATA_PATH = BOT_PATH / "bot" / "data"
+
+sys.path.insert(0, str(BOT_PATH))
+sys.path.insert(0, str(ROOT_DIR / "donationsbot" / "layers" / "shared"))
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from bot.reload import ReloadingDatabase, S3Source  # noqa: E402
+from fakes import FakeS3  # noqa: E402
+from shared.lazy import LazyResource  # noqa: E402
+
+BUCKET = "donor-database"
+KEY = "donors.db"
+DAY_SECONDS = 24 * 60 * 60
+# replies running while versions are swapped in
+READERS = 4
+
+
+class ManualClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def version(packaged: bytes, number: int) -> bytes:
+    """A distinct but readable database, the reader ignores trailing bytes."""
+    return packaged + b"\0" * number
+
+
+def time_get(database: ReloadingDatabase) -> float:
+    start = time.perf_counter()
+    database.get()
+    return (time.perf_counter() - start) * 1000
+
+
+def simulate_day(
+    database: ReloadingDatabase,
+    s3: FakeS3,
+    clock: ManualClock,
+    packaged: bytes,
+    interval: float,
+    publishes: int,
+) -> List[float]:
+    """ms per invocation"""
+    timings = []
+    invocations = int(DAY_SECONDS / interval)
+    publish_every = invocations // (publishes + 1)
+    for invocation in range(invocations):
+        if publishes and invocation and invocation % publish_every == 0:
+            s3.objects[f"{BUCKET}/{KEY}"] = version(packaged, invocation)
+        clock.now = invocation * interval
+        timings.append(time_get(database))
+    return timings
+
+
+def swap_under_load(
+    database: ReloadingDatabase, s3: FakeS3, clock: ManualClock, packaged: bytes
+) -> int:
+    """Replies read while versions are swapped in, returns how many were read."""
+    stop = threading.Event()
+    errors: List[BaseException] = []
+    reads = [0] * READERS
+
+    def reply(reader: int) -> None:
+        while not stop.is_set():
+            try:
+                current = database.get()
+                handles = list(current.replies)[:50]
+                for handle in handles:
+                    current.replies[handle]
+                    current.handles[handle]
+                reads[reader] += 1
+            except BaseException as e:  # noqa: B902
+                errors.append(e)
+                return
+
+    threads = [threading.Thread(target=reply, args=(i,)) for i in range(READERS)]
+    for thread in threads:
+        thread.start()
+    loads = database.loads
+    for number in range(1, 21):
+        s3.objects[f"{BUCKET}/{KEY}"] = version(packaged, 1000 + number)
+        clock.now += database.check_seconds
+        database.get()
+        time.sleep(0.01)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    if errors:
+        sys.exit(f"a reply failed while versions were swapped in: {errors[0]!r}")
+    if database.loads - loads != 20:
+        sys.exit(f"expected 20 new versions, loaded {database.loads - loads}")
+    return sum(reads)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds")
+    parser.add_argument("--bandwidth", type=float, default=50e6, help="bytes/s")
+    parser.add_argument("--check-seconds", type=float, default=60)
+    parser.add_argument("--interval", type=float, default=5, help="seconds")
+    parser.add_argument("--publishes", type=int, default=4, help="per day")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    packaged_path = DATA_PATH / "donors.db"
+    packaged = packaged_path.read_bytes()
+    s3 = FakeS3(latency=args.latency, bandwidth=args.bandwidth)
+    s3.objects[f"{BUCKET}/{KEY}"] = packaged
+    clock = ManualClock()
+    database = ReloadingDatabase(
+        packaged=packaged_path,
+        source=S3Source(
+            client=LazyResource(name="fake_s3", factory=lambda: s3),
+            bucket=BUCKET,
+            key=KEY,
+        ),
+        check_seconds=args.check_seconds,
+        download_path=Path(tempfile.mkdtemp()),
+        clock=clock,
+    )
+
+    cold = time_get(database)
+    if s3.not_modified != 1:
+        sys.exit("the packaged database should match S3, and not be downloaded")
+    between = [time_get(database) for _ in range(1000)]
+    not_modified, new_version = [], []
+    for number in range(args.repeat):
+        clock.now += args.check_seconds
+        not_modified.append(time_get(database))
+        s3.objects[f"{BUCKET}/{KEY}"] = version(packaged, number + 1)
+        clock.now += args.check_seconds
+        new_version.append(time_get(database))
+
+    print(
+        f"database {len(packaged) / 1e6:.1f}MB, "
+        f"S3 latency {args.latency * 1000:.0f}ms, {args.bandwidth / 1e6:.0f}MB/s, "
+        f"check every {args.check_seconds:.0f}s\n"
+    )
+    print(f"{'get()':<44}{'median ms':>12}{'max ms':>10}")
+    for name, timings in [
+        ("between checks", between),
+        ("check, not modified (304)", not_modified),
+        ("check, new version downloaded and opened", new_version),
+    ]:
+        print(f"{name:<44}{statistics.median(timings):>12.4f}{max(timings):>10.2f}")
+    print(f"{'cold start, packaged matches S3':<44}{cold:>12.4f}")
+
+    s3.requests = 0
+    day = simulate_day(database, s3, clock, packaged, args.interval, args.publishes)
+    print(
+        f"\na day of invocations every {args.interval:.0f}s, {args.publishes} "
+        f"publishes: {len(day)} invocations, {s3.requests} requests to S3, "
+        f"{statistics.mean(day):.3f}ms per invocation on average"
+    )
+
+    reads = swap_under_load(database, s3, clock, packaged)
+    print(f"20 versions swapped in under {READERS} readers, {reads} replies read")
+
+
+if __name__ == "__main__":
+    main()
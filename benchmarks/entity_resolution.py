@@ -0,0 +1,115 @@
+"""
+Measure resolving donor names into entities, see data/entities.py.
+
+Reports how many distinct names each return has, how many entities they join
+into, and the biggest entities. Times the hash join against a nested loop join,
+which compares the keys of every pair of names, over the first --sample names,
+and checks both give the same entities.
+
+Requires the store, run `python data/build_db.py` first.
+
+    python benchmarks/entity_resolution.py [--sample 1000] [--repeat 5]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Mapping
+
+ROOT_DIR = Path(__file__).parent.parent
+
+sys.path.insert(0, str(ROOT_DIR / "data"))
+
+from build_db import BUILD_STORE, replace_pipes  # noqa: E402
+from columnar import Store  # noqa: E402
+from entities import (  # noqa: E402
+    SOURCES,
+    UnionFind,
+    entity_keys,
+    name_totals,
+    resolve_entities,
+)
+
+
+def nested_loop_join(names: List[str]) -> List[List[str]]:
+    keys = [set(entity_keys(name)) for name in names]
+    joined = UnionFind()
+    for i, name in enumerate(names):
+        joined.find(name)
+        for j in range(i):
+            if keys[i] & keys[j]:
+                joined.union(name, names[j])
+    members: Dict[str, List[str]] = {}
+    for name in names:
+        members.setdefault(joined.find(name), []).append(name)
+    return sorted(sorted(variants) for variants in members.values())
+
+
+def hash_join(names: List[str]) -> List[List[str]]:
+    entities = resolve_entities({"names": dict.fromkeys(names, 0)})
+    return sorted(sorted(entity.variants) for entity in entities)
+
+
+def time_runs(function, repeat: int) -> List[float]:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def load_tables(store: Store) -> Mapping[str, Mapping[str, object]]:
+    return dict(
+        (
+            release,
+            dict(
+                (table_name, replace_pipes(table, [name_column]))
+                for table_name, name_column, _ in SOURCES
+                if (table := store.table(release, table_name)) is not None
+            ),
+        )
+        for release in store.releases()
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sample", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    tables = load_tables(Store.load(BUILD_STORE))
+    totals = name_totals(tables)
+    entities = resolve_entities(totals)
+    names = sorted(set().union(*totals.values()))
+    for table_name, by_name in totals.items():
+        print(f"{table_name:<40}{len(by_name):>8} names")
+    merged = [entity for entity in entities if len(entity.variants) > 1]
+    print(
+        f"{'all returns':<40}{len(names):>8} names, {len(entities)} entities, "
+        f"{len(merged)} with more than one name\n"
+    )
+    for entity in sorted(merged, key=lambda entity: -len(entity.variants))[:5]:
+        print(f"  {entity.name}: {' / '.join(entity.variants[1:])}")
+
+    sample = names[: args.sample]
+    if hash_join(sample) != nested_loop_join(sample):
+        sys.exit("the hash join and nested loop join gave different entities")
+    print(f"\n{'join':<36}{'names':>8}{'median ms':>12}{'min ms':>10}")
+    for name, function, count in [
+        ("hash join, all returns", lambda: resolve_entities(totals), 0),
+        ("hash join", lambda: hash_join(sample), len(sample)),
+        ("nested loop join", lambda: nested_loop_join(sample), len(sample)),
+    ]:
+        timings = time_runs(function, args.repeat)
+        print(
+            f"{name:<36}{count or len(names):>8}"
+            f"{statistics.median(timings):>12.1f}{min(timings):>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,620 @@
+"""
+In-process stand-ins for twitter and the AWS services the lambdas use, so the
+lambdas can be benchmarked locally.
+"""
+
+import bisect
+import hashlib
+import io
+import itertools
+import json
+import math
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import arrow
+import requests
+import tweepy
+from botocore.exceptions import ClientError
+from requests.adapters import BaseAdapter
+from requests.structures import CaseInsensitiveDict
+
+
+# mentions and hashtags the way twitter finds them
+TOKEN_PATTERN = re.compile(r"(?<![\w@#])[@#]\w+")
+# queue URLs in the form SQS gives them, which the bot works out from a record's ARN
+TWEET_QUEUE_URL = "https://sqs.ap-southeast-2.amazonaws.com/123456789012/TweetQueue"
+NOT_FOUND_QUEUE_URL = (
+    "https://sqs.ap-southeast-2.amazonaws.com/123456789012/NotFoundQueue"
+)
+
+
+def queue_arn(queue_url: str) -> str:
+    """The ARN of the queue at queue_url, as an SQS event's records give it."""
+    region = queue_url.split(".")[1]
+    account, name = queue_url.rsplit("/", 2)[1:]
+    return f"arn:aws:sqs:{region}:{account}:{name}"
+
+
+class VirtualClock:
+    """
+    Time which passes speed times faster than real time, from the real time it was
+    created, so a replay can run at a multiple of real time. Pass its time method
+    as the clock of anything which keeps time.
+    """
+
+    def __init__(self, speed: float = 1.0):
+        self.speed = speed
+        self._start = time.time()
+        self._start_perf = time.perf_counter()
+
+    def elapsed(self) -> float:
+        return (time.perf_counter() - self._start_perf) * self.speed
+
+    def time(self) -> float:
+        return self._start + self.elapsed()
+
+    def sleep(self, seconds: float) -> None:
+        if seconds > 0:
+            time.sleep(seconds / self.speed)
+
+    def sleep_until(self, elapsed: float) -> None:
+        self.sleep(elapsed - self.elapsed())
+
+
+class FakeLambdaContext:
+    def __init__(self, function_name: str):
+        self.function_name = function_name
+        self.memory_limit_in_mb = 128
+        self.invoked_function_arn = (
+            f"arn:aws:lambda:ap-southeast-2:123456789012:function:{function_name}"
+        )
+        self.aws_request_id = str(uuid.uuid4())
+
+
+def twitter_entities(text: str) -> dict:
+    """Entities the way twitter would send them for a tweet."""
+    entities: Dict[str, List[dict]] = {"mentions": [], "hashtags": []}
+    for match in TOKEN_PATTERN.finditer(text):
+        token = match.group()
+        if token.startswith("@"):
+            entity = {"username": token[1:]}
+            entities["mentions"].append(entity)
+        else:
+            entity = {"tag": token[1:]}
+            entities["hashtags"].append(entity)
+        entity.update(start=match.start(), end=match.end())
+    return entities
+
+
+class FakeMentions:
+    """
+    get_users_mentions over a list of tweets, newest first, paginated like
+    twitter's API and filtered by since_id, start_time and end_time. Tweets include
+    their entities and created_at if they're asked for. Given a limit, requests
+    over limit per window raise TooManyRequests, with twitter's x-rate-limit-*
+    headers.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        limit: Optional[int] = None,
+        window_seconds: int = 15 * 60,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.latency = latency
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.clock = clock
+        self.tweets: List[dict] = []
+        self.calls = 0
+        self.rate_limited = 0
+        # ids, and epoch seconds the tweets were created at, in the order added
+        self._id_values: List[int] = []
+        self._created_at: List[float] = []
+        self._used = 0
+        self._reset_at = 0
+        self._ids = itertools.count(1_500_000_000_000_000_000)
+        self._lock = threading.Lock()
+
+    def add_mention(
+        self, text: str, created_at: Optional[float] = None, **fields
+    ) -> dict:
+        """Mentions must be added in the order they were made, now by default."""
+        with self._lock:
+            tweet = {"id": str(next(self._ids)), "text": text, **fields}
+            self.tweets.append(tweet)
+            self._id_values.append(int(tweet["id"]))
+            self._created_at.append(self.clock() if created_at is None else created_at)
+        return tweet
+
+    def _use_rate_limit(self) -> None:
+        if self.limit is None:
+            return
+        now = self.clock()
+        if now >= self._reset_at:
+            self._used = 0
+            self._reset_at = math.ceil(now + self.window_seconds)
+        if self._used < self.limit:
+            self._used += 1
+            return
+        self.rate_limited += 1
+        response = requests.Response()
+        response.status_code = 429
+        response.headers = CaseInsensitiveDict(
+            {
+                "content-type": "application/json",
+                "x-rate-limit-limit": str(self.limit),
+                "x-rate-limit-remaining": "0",
+                "x-rate-limit-reset": str(self._reset_at),
+            }
+        )
+        response._content = json.dumps({"title": "Too Many Requests"}).encode()
+        raise tweepy.TooManyRequests(response)
+
+    def get_users_mentions(
+        self,
+        id,
+        max_results: int = 10,
+        since_id: Optional[int] = None,
+        start_time: Optional[str] = None,
+        end_time: Optional[str] = None,
+        pagination_token: Optional[str] = None,
+        tweet_fields: Optional[List[str]] = None,
+        **kwargs,
+    ) -> tweepy.Response:
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            self._use_rate_limit()
+            # the tweets matching are self.tweets[first:last]
+            first, last = 0, len(self.tweets)
+            if since_id is not None:
+                first = bisect.bisect_right(self._id_values, int(since_id))
+            if start_time:
+                start = arrow.get(start_time).timestamp()
+                first = max(first, bisect.bisect_left(self._created_at, start))
+            if end_time:
+                end = arrow.get(end_time).timestamp()
+                last = bisect.bisect_left(self._created_at, end)
+            # pages count back from the newest
+            offset = int(pagination_token or 0)
+            page_last = last - offset
+            page_first = max(page_last - max_results, first)
+            page = self.tweets[page_first:page_last][::-1]
+            created_at = self._created_at[page_first:page_last][::-1]
+        if "entities" in (tweet_fields or []):
+            page = [{**t, "entities": twitter_entities(t["text"])} for t in page]
+        if "created_at" in (tweet_fields or []):
+            page = [
+                {**t, "created_at": arrow.get(at).format("YYYY-MM-DDTHH:mm:ss.SSS[Z]")}
+                for t, at in zip(page, created_at)
+            ]
+        meta = {"result_count": len(page)}
+        if page:
+            meta["newest_id"] = page[0]["id"]
+            meta["oldest_id"] = page[-1]["id"]
+        if page_first > first:
+            meta["next_token"] = str(offset + max_results)
+        data = [tweepy.Tweet(t) for t in page] or None
+        return tweepy.Response(data=data, includes={}, errors=[], meta=meta)
+
+
+class FakeTwitterAPI(BaseAdapter):
+    """
+    A requests transport adapter answering POST /2/tweets, limited to limit tweets
+    per window the way twitter limits them. Over the limit it responds with a 429,
+    and every response has twitter's x-rate-limit-* headers. Mount it on a tweepy
+    client's session. Each tweet is recorded with the time it was created.
+    """
+
+    def __init__(
+        self,
+        limit: int,
+        window_seconds: int,
+        latency: float = 0.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        super().__init__()
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.latency = latency
+        self.clock = clock
+        self.tweets: List[dict] = []
+        self.rate_limited = 0
+        self._used = 0
+        self._reset_at = 0
+        self._ids = itertools.count(1_600_000_000_000_000_000)
+        self._lock = threading.Lock()
+
+    def send(self, request, **kwargs) -> requests.Response:
+        time.sleep(self.latency)
+        with self._lock:
+            now = self.clock()
+            if now >= self._reset_at:
+                self._used = 0
+                self._reset_at = math.ceil(now + self.window_seconds)
+            if self._used < self.limit:
+                self._used += 1
+                tweet = {"id": str(next(self._ids)), **json.loads(request.body)}
+                self.tweets.append({**tweet, "created_at": now})
+                status_code, body = 201, {"data": tweet}
+            else:
+                self.rate_limited += 1
+                status_code, body = 429, {"title": "Too Many Requests", "status": 429}
+            headers = {
+                "content-type": "application/json",
+                "x-rate-limit-limit": str(self.limit),
+                "x-rate-limit-remaining": str(self.limit - self._used),
+                "x-rate-limit-reset": str(self._reset_at),
+            }
+        response = requests.Response()
+        response.status_code = status_code
+        response.headers = CaseInsensitiveDict(headers)
+        response._content = json.dumps(body).encode()
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class FakeStream:
+    """
+    A local HTTP server standing in for twitter's filtered stream and its rules
+    endpoint, at url and rules_url. Tweets pushed are sent to every open connection
+    as a line of JSON, with an empty line as a keep alive every keep_alive_seconds,
+    and like twitter's, tweets pushed while nothing is connected are lost.
+    disconnect() drops the open connections part way through a response, and the
+    next connections are answered with the statuses in fail_next, e.g. [429, 503].
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_json(self, status: int, body: dict) -> None:
+            content = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("content-type", "application/json")
+            self.send_header("content-length", str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def do_POST(self):
+            fake = self.server.fake
+            length = int(self.headers.get("content-length", 0))
+            rules = json.loads(self.rfile.read(length)).get("add", [])
+            with fake._lock:
+                for rule in rules:
+                    fake.rules.append({"id": str(len(fake.rules) + 1), **rule})
+            self.send_json(201, {"data": rules})
+
+        def do_GET(self):
+            fake = self.server.fake
+            if urlsplit(self.path).path.endswith("/rules"):
+                self.send_json(200, {"data": fake.rules} if fake.rules else {})
+                return
+            with fake._lock:
+                fake.connections += 1
+                status = fake.fail_next.pop(0) if fake.fail_next else 200
+            if status != 200:
+                self.send_json(status, {"title": "Failed", "status": status})
+                return
+            self.send_response(200)
+            self.send_header("content-type", "application/json")
+            self.send_header("transfer-encoding", "chunked")
+            self.end_headers()
+            lines: queue.Queue = queue.Queue()
+            with fake._lock:
+                fake._clients.append(lines)
+            try:
+                while True:
+                    try:
+                        line = lines.get(timeout=fake.keep_alive_seconds)
+                    except queue.Empty:
+                        line = b"\r\n"
+                    if line is None:
+                        # closed without the final chunk, like a dropped connection
+                        break
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                    self.wfile.flush()
+            except OSError:
+                pass
+            finally:
+                with fake._lock:
+                    fake._clients.remove(lines)
+                self.close_connection = True
+
+    def __init__(self, keep_alive_seconds: float = 20.0):
+        self.keep_alive_seconds = keep_alive_seconds
+        self.rules: List[dict] = []
+        self.fail_next: List[int] = []
+        self.connections = 0
+        self.pushed = 0
+        self.lost = 0
+        self._clients: List[queue.Queue] = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self.Handler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        host, port = self._server.server_address
+        self.url = f"http://{host}:{port}/2/tweets/search/stream"
+        self.rules_url = f"{self.url}/rules"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def connected(self) -> int:
+        with self._lock:
+            return len(self._clients)
+
+    def push(self, tweet: dict) -> None:
+        line = json.dumps({"data": tweet}).encode() + b"\r\n"
+        with self._lock:
+            self.pushed += 1
+            if not self._clients:
+                self.lost += 1
+            for lines in self._clients:
+                lines.put(line)
+
+    def disconnect(self) -> None:
+        with self._lock:
+            for lines in self._clients:
+                lines.put(None)
+
+    def close(self) -> None:
+        self.disconnect()
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class FakeSQS:
+    """
+    A queue in memory, failing a fraction of sent entries the way SQS occasionally
+    does. Received messages are hidden until their visibility timeout passes, or
+    they're deleted, like SQS.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        failure_rate: float = 0.0,
+        visibility_timeout: int = 30,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.visibility_timeout = visibility_timeout
+        self.clock = clock
+        # every entry sent successfully
+        self.messages: List[Dict[str, str]] = []
+        # entry id -> time it was first sent
+        self.sent_at: Dict[str, float] = {}
+        # receipt handle -> visibility timeout
+        self.visibility_timeouts: Dict[str, int] = {}
+        self.calls = 0
+        # message id -> [visible at, receive count, message]
+        self._queue: Dict[str, list] = {}
+        # receipt handle -> message id
+        self._receipts: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def send_message_batch(self, QueueUrl: str, Entries: List[Dict[str, str]]):
+        time.sleep(self.latency)
+        successful, failed = [], []
+        for entry in Entries:
+            if random.random() < self.failure_rate:
+                failed.append(
+                    {"Id": entry["Id"], "SenderFault": False, "Code": "InternalError"}
+                )
+            else:
+                successful.append(entry)
+        with self._lock:
+            self.calls += 1
+            self.messages += successful
+            now = self.clock()
+            for entry in successful:
+                self.sent_at.setdefault(entry["Id"], now)
+                message = {
+                    "MessageId": str(uuid.uuid4()),
+                    "Body": entry["MessageBody"],
+                    "SentTimestamp": now,
+                }
+                self._queue[message["MessageId"]] = [now, 0, message]
+        return {
+            "Successful": [{"Id": entry["Id"]} for entry in successful],
+            "Failed": failed,
+        }
+
+    def receive_message(
+        self,
+        QueueUrl: str,
+        MaxNumberOfMessages: int = 1,
+        VisibilityTimeout: Optional[int] = None,
+        **kwargs,
+    ):
+        time.sleep(self.latency)
+        if VisibilityTimeout is None:
+            VisibilityTimeout = self.visibility_timeout
+        messages = []
+        with self._lock:
+            now = self.clock()
+            for message_id, queued in self._queue.items():
+                visible_at, receive_count, message = queued
+                if visible_at > now:
+                    continue
+                receipt_handle = str(uuid.uuid4())
+                self._receipts[receipt_handle] = message_id
+                queued[0] = now + VisibilityTimeout
+                queued[1] = receive_count + 1
+                attributes = {
+                    "ApproximateReceiveCount": str(queued[1]),
+                    "SentTimestamp": str(int(message["SentTimestamp"] * 1000)),
+                }
+                message = {
+                    **message,
+                    "ReceiptHandle": receipt_handle,
+                    "Attributes": attributes,
+                }
+                messages.append(message)
+                if len(messages) == MaxNumberOfMessages:
+                    break
+        return {"Messages": messages}
+
+    def delete_message(self, QueueUrl: str, ReceiptHandle: str):
+        time.sleep(self.latency)
+        with self._lock:
+            if message_id := self._receipts.pop(ReceiptHandle, None):
+                self._queue.pop(message_id, None)
+
+    def change_message_visibility(
+        self, QueueUrl: str, ReceiptHandle: str, VisibilityTimeout: int
+    ):
+        with self._lock:
+            self.visibility_timeouts[ReceiptHandle] = VisibilityTimeout
+            if (message_id := self._receipts.get(ReceiptHandle)) in self._queue:
+                self._queue[message_id][0] = self.clock() + VisibilityTimeout
+
+    def depth(self) -> Tuple[int, int]:
+        """(visible, in flight) messages, like ApproximateNumberOfMessages*"""
+        with self._lock:
+            now = self.clock()
+            visible = sum(1 for queued in self._queue.values() if queued[0] <= now)
+        return visible, len(self._queue) - visible
+
+
+class FakeQueues:
+    """An SQS client for several queues, sending each call to its queue's FakeSQS."""
+
+    def __init__(self, queues: Dict[str, FakeSQS]):
+        self.queues = queues
+
+    def send_message_batch(self, QueueUrl: str, **kwargs):
+        return self.queues[QueueUrl].send_message_batch(QueueUrl=QueueUrl, **kwargs)
+
+    def receive_message(self, QueueUrl: str, **kwargs):
+        return self.queues[QueueUrl].receive_message(QueueUrl=QueueUrl, **kwargs)
+
+    def delete_message(self, QueueUrl: str, **kwargs):
+        return self.queues[QueueUrl].delete_message(QueueUrl=QueueUrl, **kwargs)
+
+    def change_message_visibility(self, QueueUrl: str, **kwargs):
+        return self.queues[QueueUrl].change_message_visibility(
+            QueueUrl=QueueUrl, **kwargs
+        )
+
+
+class FakeS3:
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+    def __init__(self, latency: float = 0.0, bandwidth: Optional[float] = None):
+        self.latency = latency
+        # bytes per second downloaded, None for instant
+        self.bandwidth = bandwidth
+        self.objects: Dict[str, bytes] = {}
+        self.requests = 0
+        self.puts = 0
+        self.not_modified = 0
+
+    def get_object(self, Bucket: str, Key: str, IfNoneMatch: Optional[str] = None):
+        time.sleep(self.latency)
+        self.requests += 1
+        try:
+            body = self.objects[f"{Bucket}/{Key}"]
+        except KeyError:
+            raise self.exceptions.NoSuchKey(Key) from None
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        if IfNoneMatch == etag:
+            self.not_modified += 1
+            raise ClientError(
+                {"Error": {"Code": "304", "Message": "Not Modified"}}, "GetObject"
+            )
+        if self.bandwidth:
+            time.sleep(len(body) / self.bandwidth)
+        return {"Body": io.BytesIO(body), "ETag": etag}
+
+    def put_object(self, Bucket: str, Key: str, Body: bytes, **kwargs):
+        time.sleep(self.latency)
+        self.puts += 1
+        self.objects[f"{Bucket}/{Key}"] = Body
+
+
+class FakeSSM:
+    def __init__(self, parameters: Dict[str, str]):
+        self.parameters = parameters
+        self.calls = 0
+
+    def get_parameters(self, Names: List[str], WithDecryption: bool = False):
+        self.calls += 1
+        return {
+            "Parameters": [
+                {"Name": name, "Value": self.parameters[name]}
+                for name in Names
+                if name in self.parameters
+            ]
+        }
+
+
+class FakeDynamoDB:
+    """
+    put_item, get_item and delete_item for a table keyed on tweet_id, supporting
+    only the conditional claim bot.idempotency.DynamoDBStore makes. Only the
+    parameters the lambda's pinned botocore accepts are, so a call it would reject
+    fails here too.
+    """
+
+    class exceptions:
+        class ConditionalCheckFailedException(Exception):
+            def __init__(self):
+                super().__init__("The conditional request failed")
+                self.response = {"Error": {"Code": "ConditionalCheckFailedException"}}
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.items: Dict[str, dict] = {}
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def put_item(
+        self,
+        TableName: str,
+        Item: dict,
+        ConditionExpression: Optional[str] = None,
+        ExpressionAttributeValues: Optional[dict] = None,
+    ):
+        time.sleep(self.latency)
+        key = Item["tweet_id"]["S"]
+        with self._lock:
+            self.calls += 1
+            existing = self.items.get(key)
+            if ConditionExpression is not None and existing is not None:
+                now = int(ExpressionAttributeValues[":now"]["N"])
+                if int(existing["expires_at"]["N"]) >= now:
+                    raise self.exceptions.ConditionalCheckFailedException()
+            self.items[key] = Item
+
+    def get_item(self, TableName: str, Key: dict, ConsistentRead: bool = False):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            item = self.items.get(Key["tweet_id"]["S"])
+        return {"Item": item} if item is not None else {}
+
+    def delete_item(self, TableName: str, Key: dict):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            self.items.pop(Key["tweet_id"]["S"], None)
@@ -0,0 +1,168 @@
+"""
+Compare the single pass tweet fitting against the previous two template strategy,
+which rendered the full template and fell back to a template with FY 20-21 only if
+that was too long.
+
+For every handle in twitter.json this reports time per reply, how many donation
+lines each strategy keeps, how many replies keep anything from before the most
+recent financial year, and how many replies are still over twitter's weighted
+length limit. The templates' donations are bucketed from each donor's series into
+the most recent financial year and everything before it, as they used to be.
+
+    python benchmarks/fitting.py
+"""
+
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+import jinja2
+
+ROOT_DIR = Path(__file__).parent.parent
+BOT_PATH = ROOT_DIR / "donationsbot" / "functions" / "bot"
+DATA_PATH = BOT_PATH / "bot" / "data"
+
+sys.path.insert(0, str(BOT_PATH))
+
+from bot.fitting import fit_segments, tweet_is_too_long  # noqa: E402
+from bot.replies import (  # noqa: E402
+    build_reply_segments,
+    combine_donor_data,
+    format_money,
+    get_donor_data,
+)
+from bot.series import DonationSeries, donors_from_json  # noqa: E402
+
+TEMPLATE = jinja2.Template(
+    source="""{{recipients}}{% for donor in donors %}
+
+{{ donor.name }}
+
+FY 20-21: {% if donor.donations.fy_20_21 %}
+{% for donation in donor.donations.fy_20_21 %}
+{{ donation.0 }} {{ donation.1}}{% endfor %}
+{% else %}Nothing reported to AEC{% endif %}
+
+Before 2020: {% if donor.donations.fy_earlier %}
+{% for donation in donor.donations.fy_earlier %}
+{{ donation.0 }} {{ donation.1}}{% endfor %}
+{% else %}Nothing reported to AEC{% endif %}{% endfor %}"""
+)
+
+SHORT_TEMPLATE = jinja2.Template(
+    source="""{{recipients}}{% for donor in donors %}
+
+{{ donor.name }}
+
+FY 20-21: {% if donor.donations.fy_20_21 %}
+{% for donation in donor.donations.fy_20_21 %}
+{{ donation.0 }} {{ donation.1}}{% endfor %}
+{% else %}Nothing{% endif %}{% endfor %}"""
+)
+
+DONATION_LINE = re.compile(r"\n[^\n]+ \$[\d,]+(?=\n|$)")
+# a section for years before the most recent one
+EARLIER_HEADING = re.compile(r"\n\n(?:Before \d{4}|FY \d\d-\d\d to \d\d-\d\d):")
+
+
+def legacy_donations(series: DonationSeries, recent_year: str):
+    """The templates' two buckets, the most recent financial year and before it."""
+    recent = series.span(recent_year, recent_year)
+    return dict(
+        (bucket, [[party, format_money(amount)] for party, amount in totals])
+        for bucket, totals in [
+            ("fy_20_21", series.totals(recent)),
+            ("fy_earlier", series.totals(range(recent.start))),
+        ]
+    )
+
+
+def legacy_data(donor_data, recent_year):
+    return [
+        {
+            "name": donor["name"],
+            "donations": legacy_donations(donor["donations"], recent_year),
+        }
+        for donor in donor_data
+    ]
+
+
+def legacy_reply(recipients, donor_set, donors, recent_year):
+    donor_data = get_donor_data(donor_set=donor_set, donors=donors)
+    tweet = TEMPLATE.render(
+        donors=legacy_data(combine_donor_data(donor_data), recent_year),
+        recipients=recipients,
+    )
+    if len(tweet) > 280:
+        tweet = SHORT_TEMPLATE.render(
+            donors=legacy_data(donor_data, recent_year), recipients=recipients
+        )
+    return tweet
+
+
+def single_pass_reply(recipients, donor_set, donors, recent_year):
+    segments = build_reply_segments(
+        donor_set=donor_set, donors=donors, recent_year=recent_year
+    )
+    return fit_segments(prefix=recipients, segments=segments)
+
+
+def main():
+    with open(DATA_PATH / "twitter.json") as f:
+        handles = json.load(f)
+    with open(DATA_PATH / "donors.json") as f:
+        donors = donors_from_json(json.load(f))
+    recent_year = next(iter(donors.values())).years[-1]
+
+    cases = []
+    total_lines = 0
+    for handle, donor_set in handles.items():
+        donor_set = [donor for donor in donor_set if donor in donors]
+        if not donor_set:
+            continue
+        combined = combine_donor_data(get_donor_data(donor_set, donors))[0]
+        legacy = legacy_donations(combined["donations"], recent_year)
+        total_lines += sum(len(d) for d in legacy.values())
+        cases.append((f"{handle} #auspol", donor_set))
+
+    precomputed = [
+        (
+            recipients,
+            build_reply_segments(
+                donor_set=donor_set, donors=donors, recent_year=recent_year
+            ),
+        )
+        for recipients, donor_set in cases
+    ]
+
+    print(f"{len(cases)} handles, {total_lines} donation lines in total\n")
+    print(
+        f"{'strategy':<22}{'us/reply':>10}{'lines kept':>12}"
+        f"{'any earlier':>13}{'too long':>10}"
+    )
+    strategies = [("two templates", legacy_reply), ("single pass", single_pass_reply)]
+    for name, strategy in strategies:
+        start = time.perf_counter()
+        tweets = [
+            strategy(r, donor_set, donors, recent_year) for r, donor_set in cases
+        ]
+        elapsed = time.perf_counter() - start
+        lines = sum(len(DONATION_LINE.findall(tweet)) for tweet in tweets)
+        earlier = sum(bool(EARLIER_HEADING.search(tweet)) for tweet in tweets)
+        too_long = sum(tweet_is_too_long(tweet) for tweet in tweets)
+        print(
+            f"{name:<22}{elapsed / len(cases) * 1e6:>10.1f}"
+            f"{lines / total_lines:>12.1%}{earlier:>13}{too_long:>10}"
+        )
+
+    start = time.perf_counter()
+    for recipients, segments in precomputed:
+        fit_segments(prefix=recipients, segments=segments)
+    elapsed = time.perf_counter() - start
+    print(f"{'single pass, runtime':<22}{elapsed / len(cases) * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Measure finding donors by name in the text of a tweet, see bot/fuzzy.py, across
+every donor in the database.
+
+Each donor is looked up three ways: named in a question, e.g. "what has Woodside
+Energy donated?", on its own, and as a handle made of its words run together, e.g.
+"@woodsideenergy". A lookup is a hit if the top match is the donor, or another
+donor whose name normalises to the same trigrams, e.g. "X Pty Ltd" and "X P/L".
+Tweets which don't name a donor are checked for false matches.
+
+Latency is compared against scoring every donor's trigrams against the tweet, and
+the size of the index sections is reported.
+
+    python benchmarks/fuzzy_search.py [--limit 0]
+"""
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent
+BOT_PATH = ROOT_DIR / "donationsbot" / "functions" / "bot"
+
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(BOT_PATH))
+
+from bot import db as bot_db  # noqa: E402
+from bot.fuzzy import MIN_SCORE, search, text_trigrams, words  # noqa: E402
+from bot.replies import clean_donor_name  # noqa: E402
+from cold_start import build_binary_database  # noqa: E402
+
+INDEX_SECTIONS = [
+    bot_db.SECTION_TRIGRAMS,
+    bot_db.SECTION_POSTINGS,
+    bot_db.SECTION_NAME_TRIGRAMS,
+    bot_db.SECTION_TRIGRAM_CODES,
+]
+
+MISSES = [
+    "@AusPolDonations hello",
+    "@AusPolDonations the hotel gas lobby again",
+    "@AusPolDonations who funds the parties? #auspol",
+    "@AusPolDonations thanks, this is really useful",
+    "@AusPolDonations @someone have a look at this thread",
+    "@AusPolDonations what about the big four banks and the mining lobby?",
+    "@AusPolDonations #auspol #DonationsReform we need a federal ICAC now",
+]
+
+
+def queries(name: str):
+    cleaned = clean_donor_name(name=name)
+    yield "question", f"@AusPolDonations what has {cleaned} donated? #auspol"
+    yield "name", cleaned
+    yield "handle", f"@AusPolDonations @{''.join(words(cleaned))}"
+
+
+def scan(index, donor_count: int, text: str):
+    """The baseline, scoring every donor."""
+    text_codes = text_trigrams(text)
+    best = None
+    for donor_index in range(donor_count):
+        codes = index.name_trigrams(donor_index)
+        if not codes:
+            continue
+        score = len(text_codes.intersection(codes)) / len(codes)
+        if score >= MIN_SCORE and (best is None or score > best[1]):
+            best = (donor_index, score)
+    return best
+
+
+def percentiles(timings):
+    timings = sorted(timings)
+    return (
+        statistics.median(timings) * 1e6,
+        timings[int(len(timings) * 0.99)] * 1e6,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--limit", type=int, default=0, help="only look up N donors")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = Path(tmp_dir) / "donors.db"
+        build_binary_database(db_path)
+        database = bot_db.DonorDatabase(db_path)
+        index = database.trigrams
+        total_donors = len(database.donors)
+
+        print(f"donors: {total_donors:,}")
+        index_size = 0
+        for section in INDEX_SECTIONS:
+            _, length = database.section(section)
+            index_size += length
+            print(f"  {section.decode():<10}{length:>12,} bytes")
+        print(f"  {'total':<10}{index_size:>12,} bytes")
+        print(f"database: {db_path.stat().st_size:>12,} bytes\n")
+
+        donor_count = args.limit or total_donors
+        results = {}
+        for donor_index in range(donor_count):
+            name = database.donors.name(donor_index)
+            codes = set(index.name_trigrams(donor_index))
+            for kind, text in queries(name):
+                start = time.perf_counter()
+                matches = search(index, text, k=1)
+                elapsed = time.perf_counter() - start
+                hit = bool(matches) and (
+                    set(index.name_trigrams(matches[0].donor_index)) == codes
+                )
+                timings, hits = results.setdefault(kind, ([], []))
+                timings.append(elapsed)
+                hits.append(hit)
+
+        miss_timings, false_matches = [], 0
+        for text in MISSES:
+            start = time.perf_counter()
+            matches = search(index, text, k=1)
+            miss_timings.append(time.perf_counter() - start)
+            if matches:
+                false_matches += 1
+                name = database.donors.name(matches[0].donor_index)
+                print(f"false match: {text!r} -> {name!r}")
+
+        print(f"{'query':<10}{'hit rate':>10}{'p50 us':>10}{'p99 us':>10}")
+        for kind, (timings, hits) in results.items():
+            p50, p99 = percentiles(timings)
+            rate = sum(hits) / len(hits)
+            print(f"{kind:<10}{rate:>10.1%}{p50:>10.0f}{p99:>10.0f}")
+        p50, p99 = percentiles(miss_timings)
+        rate = false_matches / len(MISSES)
+        print(f"{'no donor':<10}{rate:>10.1%}{p50:>10.0f}{p99:>10.0f}")
+
+        scan_timings = []
+        for donor_index in range(0, donor_count, max(1, donor_count // 50)):
+            name = database.donors.name(donor_index)
+            _, text = next(queries(name))
+            start = time.perf_counter()
+            scan(index, total_donors, text)
+            scan_timings.append(time.perf_counter() - start)
+        p50, p99 = percentiles(scan_timings)
+        print(f"\nscanning every donor: p50 {p50:.0f} us, p99 {p99:.0f} us")
+        database.close()
+
+
+if __name__ == "__main__":
+    main()
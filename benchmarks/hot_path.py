@@ -0,0 +1,329 @@
+"""
+Microbenchmark each stage of replying to a mention, and the whole of
+reply_to_tweet(testing=True), over every handle in bot/data/twitter.json, plus
+synthetic donors made of many entities, like #nine.
+
+The stages are finding the handles in the tweet, combining the donor data for a
+handle, building the reply's segments from it, fitting them into a tweet, and
+checking its length. The not found reply is the only template left, and is timed
+too.
+
+Each stage reports ns per op, the fastest of --repeat passes over the corpus, and
+bytes allocated per op, the most memory tracemalloc saw allocated at once during
+each op.
+
+Results can be saved as a baseline, and compared against one, flagging the stages
+which got slower or allocate more by more than --threshold. Baselines are only
+comparable on the same machine and python, and on a noisy machine --threshold
+needs to be higher. Exits with 1 if anything regressed.
+
+Handles which can't be found in a tweet, e.g. with an "&", are replied to as not
+found, and create_tweet is replaced with a stub for those replies.
+
+Requires the database, run `python data/build_db.py` first.
+
+    python benchmarks/hot_path.py [--save baseline.json] [--compare baseline.json]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+ROOT_DIR = Path(__file__).parent.parent
+BOT_PATH = ROOT_DIR / "donationsbot" / "functions" / "bot"
+
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(BOT_PATH))
+sys.path.insert(0, str(ROOT_DIR / "donationsbot" / "layers" / "shared"))
+os.environ.setdefault("POWERTOOLS_TRACE_DISABLED", "1")
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-southeast-2")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+# measure replying, not twitter's rate limit
+os.environ.setdefault("REPLY_RATE_LIMIT", "1000000")
+
+from bot import resolve, twitter  # noqa: E402
+from bot.fitting import fit_segments, tweet_is_too_long  # noqa: E402
+from bot.replies import (  # noqa: E402
+    NOT_FOUND_TEMPLATE,
+    build_reply_segments,
+    combine_donor_data,
+    get_donor_data,
+)
+from bot.series import DonationSeries  # noqa: E402
+from fakes import FakeSSM  # noqa: E402
+from shared.aws import ssm_client  # noqa: E402
+
+TWITTER_JSON_PATH = BOT_PATH / "bot" / "data" / "twitter.json"
+# entities per synthetic donor
+SYNTHETIC_ENTITIES = [10, 50]
+SYNTHETIC_PARTIES = ["ALP", "LIB", "NAT", "LNP", "GRN", "UAP", "ONP", "CLP"]
+# ops timed at once, at least
+MIN_BATCH = 20
+# bytes per op below which an increase isn't flagged, allocation is noisy
+MIN_BYTES_REGRESSION = 64
+
+Op = Callable[[], object]
+
+
+class StubTweepyClient:
+    def __init__(self):
+        self.tweets = 0
+
+    def create_tweet(self, in_reply_to_tweet_id, text):
+        self.tweets += 1
+
+
+def tweet_for(handle: str) -> str:
+    return f"@AusPolDonations what has {handle} donated? #auspol"
+
+
+def handle_ops(handle: str, recent_year: str, sink: io.StringIO) -> Dict[str, Op]:
+    """Each stage's op for a handle, with its inputs prepared up front."""
+    tweet = tweet_for(handle)
+    donors = twitter.DATABASE.get().donors
+    donor_set = twitter.DATABASE.get().handles[handle]
+    donor_data = get_donor_data(donor_set=donor_set, donors=donors)
+    segments = build_reply_segments(
+        donor_set=donor_set, donors=donors, recent_year=recent_year
+    )
+    prefix = f"{handle} #auspol"
+    text = fit_segments(prefix=prefix, segments=segments)
+
+    def reply():
+        # reply_to_tweet prints the reply when testing
+        with contextlib.redirect_stdout(sink):
+            twitter.reply_to_tweet(id=1, text=tweet, testing=True)
+        sink.seek(0)
+        sink.truncate()
+
+    return {
+        "get_handles_from_tweet": lambda: resolve.get_handles_from_tweet(tweet),
+        "combine_donor_data": lambda: combine_donor_data(donor_data),
+        "build_reply_segments": lambda: build_reply_segments(
+            donor_set=donor_set, donors=donors, recent_year=recent_year
+        ),
+        "fit_segments": lambda: fit_segments(prefix=prefix, segments=segments),
+        "tweet_is_too_long": lambda: tweet_is_too_long(text),
+        "NOT_FOUND_TEMPLATE": lambda: NOT_FOUND_TEMPLATE.render(donors=handle),
+        "reply_to_tweet": reply,
+    }
+
+
+def synthetic_donors(entities: int, years: List[str]) -> Dict[str, DonationSeries]:
+    """A donor made of many entities, each giving to every party, every year."""
+    donors = {}
+    for entity in range(entities):
+        amounts = dict(
+            (party, dict((year, 1000 * (entity + 1) * (index + 1)) for year in years))
+            for index, party in enumerate(SYNTHETIC_PARTIES)
+        )
+        name = f"Synthetic Holdings No {entity} Pty Ltd"
+        donors[name] = DonationSeries.from_amounts(years, amounts)
+    return donors
+
+
+def synthetic_ops(entities: int, financial_years: List[str]) -> Dict[str, Op]:
+    recent_year = financial_years[-1]
+    donors = synthetic_donors(entities, financial_years)
+    donor_set = list(donors)
+    donor_data = get_donor_data(donor_set=donor_set, donors=donors)
+    segments = build_reply_segments(
+        donor_set=donor_set, donors=donors, recent_year=recent_year
+    )
+    prefix = "#synthetic"
+    text = fit_segments(prefix=prefix, segments=segments)
+    return {
+        "combine_donor_data": lambda: combine_donor_data(donor_data),
+        "build_reply_segments": lambda: build_reply_segments(
+            donor_set=donor_set, donors=donors, recent_year=recent_year
+        ),
+        "fit_segments": lambda: fit_segments(prefix=prefix, segments=segments),
+        "tweet_is_too_long": lambda: tweet_is_too_long(text),
+    }
+
+
+def create_stages(
+    handles: List[str], financial_years: List[str]
+) -> Dict[str, List[Op]]:
+    """Each stage's ops, one per handle, then one per synthetic donor."""
+    recent_year = financial_years[-1]
+    stages: Dict[str, List[Op]] = {}
+    sink = io.StringIO()
+    for handle in handles:
+        for name, op in handle_ops(handle, recent_year, sink).items():
+            stages.setdefault(name, []).append(op)
+    for entities in SYNTHETIC_ENTITIES:
+        for name, op in synthetic_ops(entities, financial_years).items():
+            stages[f"{name}[{entities} entities]"] = [op]
+    return stages
+
+
+def time_ops(ops: List[Op], repeat: int, min_ops: int) -> float:
+    """
+    ns per op, the fastest of at least repeat timed passes over ops, and at least
+    min_ops ops in all. Short stages are timed MIN_BATCH ops at a time, so the
+    timer's own overhead is small next to them.
+    """
+    passes = max(1, MIN_BATCH // len(ops))
+    samples = max(repeat, min_ops // (passes * len(ops)))
+    best = float("inf")
+    for _ in range(samples):
+        start = time.perf_counter_ns()
+        for _ in range(passes):
+            for op in ops:
+                op()
+        best = min(best, time.perf_counter_ns() - start)
+    return best / (passes * len(ops))
+
+
+def allocated_bytes(ops: List[Op]) -> float:
+    """Mean peak bytes allocated during each op."""
+    tracemalloc.start()
+    try:
+        total = 0
+        for op in ops:
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            op()
+            _, peak = tracemalloc.get_traced_memory()
+            total += peak - before
+    finally:
+        tracemalloc.stop()
+    return total / len(ops)
+
+
+def measure(
+    stages: Dict[str, List[Op]], repeat: int, min_ops: int
+) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for name, ops in stages.items():
+        # warm up, e.g. the automaton's cache of decoded states
+        for op in ops:
+            op()
+        results[name] = {
+            "ops": len(ops),
+            "ns_per_op": time_ops(ops, repeat=repeat, min_ops=min_ops),
+            "bytes_per_op": allocated_bytes(ops),
+        }
+    return results
+
+
+def regressions(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    threshold: float,
+) -> Dict[str, List[str]]:
+    """The measures of each stage which regressed against the baseline."""
+    regressed = {}
+    for name, result in results.items():
+        if (base := baseline.get(name)) is None:
+            continue
+        measures = []
+        if result["ns_per_op"] > base["ns_per_op"] * (1 + threshold):
+            measures.append("ns")
+        extra_bytes = result["bytes_per_op"] - base["bytes_per_op"]
+        if (
+            extra_bytes > MIN_BYTES_REGRESSION
+            and result["bytes_per_op"] > base["bytes_per_op"] * (1 + threshold)
+        ):
+            measures.append("bytes")
+        if measures:
+            regressed[name] = measures
+    return regressed
+
+
+def change(value: float, base: float) -> str:
+    return f"{(value - base) / base:+.0%}" if base else "new"
+
+
+def report(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    regressed: Dict[str, List[str]],
+) -> None:
+    header = f"{'stage':<40}{'ops':>6}{'ns/op':>12}{'B/op':>10}"
+    if baseline:
+        header += f"{'ns':>8}{'B':>8}"
+    print(header)
+    for name, result in results.items():
+        line = (
+            f"{name:<40}{result['ops']:>6}"
+            f"{result['ns_per_op']:>12,.0f}{result['bytes_per_op']:>10,.0f}"
+        )
+        if base := baseline.get(name):
+            line += f"{change(result['ns_per_op'], base['ns_per_op']):>8}"
+            line += f"{change(result['bytes_per_op'], base['bytes_per_op']):>8}"
+            if name in regressed:
+                line += f"  REGRESSED ({', '.join(regressed[name])})"
+        print(line)
+
+
+def load_handles() -> Tuple[List[str], int]:
+    """Handles in twitter.json which are in the database, and the number which aren't"""
+    with TWITTER_JSON_PATH.open() as f:
+        handles = [handle.lower() for handle in json.load(f)]
+    database_handles = twitter.DATABASE.get().handles
+    in_database = [handle for handle in handles if handle in database_handles]
+    return in_database, len(handles) - len(in_database)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--min-ops", type=int, default=500, help="ops per timed pass, at least"
+    )
+    parser.add_argument("--save", type=Path, help="save the results as a baseline")
+    parser.add_argument("--compare", type=Path, help="compare against a baseline")
+    parser.add_argument("--threshold", type=float, default=0.1)
+    args = parser.parse_args()
+
+    ssm_client.set_factory(lambda: FakeSSM({}))
+    client = StubTweepyClient()
+    twitter.tweepy_client.set_factory(lambda: client)
+
+    handles, missing = load_handles()
+    financial_years = twitter.DATABASE.get().meta["financial_years"]
+    not_found = [
+        handle
+        for handle in handles
+        if not resolve.get_handles_from_tweet(tweet_for(handle))[2]
+    ]
+    print(f"{len(handles)} handles")
+    if missing:
+        print(f"{missing} in twitter.json but not the database")
+    if not_found:
+        print(f"{len(not_found)} not found when tweeted, e.g. {not_found[0]}")
+    print()
+
+    stages = create_stages(handles, financial_years=financial_years)
+    results = measure(stages, repeat=args.repeat, min_ops=args.min_ops)
+
+    baseline, regressed = {}, {}
+    if args.compare:
+        with args.compare.open() as f:
+            baseline = json.load(f)["stages"]
+        regressed = regressions(results, baseline, threshold=args.threshold)
+    report(results, baseline, regressed)
+
+    if args.save:
+        with args.save.open("w") as f:
+            json.dump(
+                {"python": platform.python_version(), "stages": results}, f, indent=2
+            )
+        print(f"\nsaved baseline to {args.save}")
+    if regressed:
+        print(f"\n{len(regressed)} stages regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+Compare finding handles and aliases in tweets with the automaton, see
+bot/mentions.py, against the previous tokenizer, which split the tweet on
+whitespace and kept the words starting with "@" or "#".
+
+Correctness is checked against a corpus of tweets and the handle whose reply each
+should get. The automaton is checked both scanning the text itself, and with the
+mentions and hashtags twitter would have sent as entities.
+
+Latency is also compared against searching the tweet for each pattern in turn,
+which grows with the number of patterns where the automaton doesn't.
+
+    python benchmarks/mentions.py [--repeat 2000]
+"""
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent
+BOT_PATH = ROOT_DIR / "donationsbot" / "functions" / "bot"
+
+sys.path.insert(0, str(Path(__file__).parent))
+sys.path.insert(0, str(BOT_PATH))
+
+from bot.db import DonorDatabase  # noqa: E402
+from bot.mentions import create_patterns, find_mentions, is_word_boundary  # noqa: E402
+from cold_start import build_binary_database  # noqa: E402
+from fakes import twitter_entities  # noqa: E402
+
+EXCLUDE_HANDLES = ["@auspoldonations", "#auspol", "#donationsreform", "@somecompany"]
+
+# (tweet, the handle whose reply it should get)
+CORPUS = [
+    ("@AusPolDonations @WoodsideEnergy", "@woodsideenergy"),
+    ("@AusPolDonations what has @WoodsideEnergy donated?", "@woodsideenergy"),
+    ("@AusPolDonations what about @WoodsideEnergy?", "@woodsideenergy"),
+    ("@AusPolDonations @WoodsideEnergy, @SantosLtd", "@woodsideenergy"),
+    ("@AusPolDonations (@Westpac) please", "@westpac"),
+    ("@AusPolDonations \"@Westpac\"", "@westpac"),
+    ("@AusPolDonations @WESTPAC", "@westpac"),
+    ("@AusPolDonations #santos #auspol", "#santos"),
+    ("@AusPolDonations #santos.", "#santos"),
+    ("@AusPolDonations #nine's donations", "#nine"),
+    ("@AusPolDonations #ninenews", None),
+    ("@AusPolDonations @qantas", None),
+    ("@AusPolDonations @qantas and @crownresorts", "@crownresorts"),
+    ("@AusPolDonations what has Woodside donated?", "@woodsideenergy"),
+    ("@AusPolDonations what has Woodside Energy donated?", "@woodsideenergy"),
+    ("@AusPolDonations Clubs NSW and the pokies lobby #auspol", "@clubsnsw"),
+    ("@AusPolDonations ClubsNSW?", "@clubsnsw"),
+    ("@AusPolDonations how much has the CFMEU given?", "@cfmeu"),
+    ("@AusPolDonations Commonwealth Bank vs Westpac", "@commbank"),
+    ("@AusPolDonations Mineralogy", "#minerology"),
+    ("@AusPolDonations Coca-Cola Amatil", "@cocacolaau"),
+    ("@AusPolDonations the woodsides of this world", None),
+    ("@AusPolDonations thanks!", None),
+    ("@AusPolDonations email donations@westpac.com.au", None),
+    ("@AusPolDonations #auspol #DonationsReform", None),
+    ("@AusPolDonations what about Optus and @pfizer", "@optus"),
+    ("Hey @AusPolDonations tell me what @Tabcorp has donated please.", "@tabcorp"),
+    ("@someone @AusPolDonations pfizer", "@pfizer"),
+]
+
+
+def legacy_first_reply(text: str, known_handles) -> str:
+    handles = [word.lower() for word in text.split() if word.startswith(("@", "#"))]
+    handles = [handle for handle in handles if handle not in EXCLUDE_HANDLES]
+    return next((handle for handle in handles if handle in known_handles), None)
+
+
+def first_reply(mentions) -> str:
+    return next(
+        (m.key for m in mentions if m.key and m.text not in EXCLUDE_HANDLES), None
+    )
+
+
+def naive_scan(text: str, patterns):
+    """Search the tweet for every pattern in turn."""
+    text = text.lower()
+    found = []
+    for pattern in patterns:
+        start = text.find(pattern.text)
+        while start != -1:
+            end = start + len(pattern.text)
+            if is_word_boundary(text, start, end):
+                found.append((start, pattern.key))
+            start = text.find(pattern.text, start + 1)
+    return sorted(found)
+
+
+def time_per_tweet(function, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for text, _ in CORPUS:
+            function(text)
+        timings.append((time.perf_counter() - start) / len(CORPUS))
+    return statistics.median(timings) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = Path(tmp_dir) / "donors.db"
+        build_binary_database(db_path)
+        database = DonorDatabase(db_path)
+        replies = database.replies
+
+        def scan(text):
+            return find_mentions(text, database.automaton)
+
+        def scan_entities(text):
+            return find_mentions(
+                text, database.automaton, entities=twitter_entities(text)
+            )
+
+        strategies = [
+            ("tokenizer", lambda text: legacy_first_reply(text, replies)),
+            ("automaton", lambda text: first_reply(scan(text))),
+            ("entities", lambda text: first_reply(scan_entities(text))),
+        ]
+        print(f"{len(CORPUS)} tweets\n")
+        for name, strategy in strategies:
+            wrong = [
+                (text, expected, found)
+                for text, expected in CORPUS
+                if (found := strategy(text)) != expected
+            ]
+            print(f"{name:<12}{len(CORPUS) - len(wrong):>4} correct")
+            for text, expected, found in wrong:
+                print(f"    {text!r}: expected {expected}, got {found}")
+
+        patterns = create_patterns(handles=replies, aliases={})
+        print(f"\n{'':<24}{'us/tweet':>10}")
+        for name, function in [
+            ("tokenizer", lambda text: legacy_first_reply(text, replies)),
+            ("automaton", scan),
+            ("automaton, entities", scan_entities),
+            (f"naive, {len(patterns)} patterns", lambda t: naive_scan(t, patterns)),
+        ]:
+            repeat = args.repeat if not name.startswith("naive") else args.repeat // 20
+            print(f"{name:<24}{time_per_tweet(function, max(repeat, 1)):>10.1f}")
+        database.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Compare answering "who gives to a party?" by scanning every donor in donors.db,
+the only way to answer it before, against a lookup in the party index build_db.py
+writes, which holds each party's top donors in each financial year, see
+bot/db.py's PartiesView.
+
+Both must give the same top donors for every party handle in the database.
+
+Requires the database, run `python data/build_db.py` first.
+
+    python benchmarks/party_donors.py [--repeat 5]
+"""
+
+import argparse
+import heapq
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+ROOT_DIR = Path(__file__).parent.parent
+BOT_PATH = ROOT_DIR / "donationsbot" / "functions" / "bot"
+DATA_PATH = BOT_PATH / "bot" / "data"
+
+sys.path.insert(0, str(ROOT_DIR / "data"))
+sys.path.insert(0, str(BOT_PATH))
+
+from build_db import TOP_DONORS  # noqa: E402
+from bot.db import DonorDatabase  # noqa: E402
+
+TopDonors = Dict[str, List[Tuple[str, int]]]
+
+
+def scan_donors(database: DonorDatabase, party: str) -> TopDonors:
+    """Every donor's amount given to party in each year, then the top of each."""
+    years = database.meta["financial_years"]
+    by_year: Dict[str, List[Tuple[str, int]]] = {}
+    for index in range(len(database.donors)):
+        series = database.donors.by_index(index)
+        if party not in series.cumulative:
+            continue
+        for year_index, year in enumerate(years):
+            amount = series.total(party, range(year_index, year_index + 1))
+            if amount:
+                by_year.setdefault(year, []).append(
+                    (database.donors.name(index), amount)
+                )
+    return dict(
+        (
+            year,
+            heapq.nsmallest(TOP_DONORS, donations, key=lambda d: (-d[1], d[0])),
+        )
+        for year, donations in by_year.items()
+    )
+
+
+def look_up(database: DonorDatabase, party: str) -> TopDonors:
+    return database.parties[party]
+
+
+def time_parties(
+    function: Callable[[DonorDatabase, str], TopDonors],
+    database: DonorDatabase,
+    parties: List[str],
+    repeat: int,
+) -> List[float]:
+    """ms per party, per pass"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for party in parties:
+            function(database, party)
+        timings.append((time.perf_counter() - start) * 1000 / len(parties))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    database = DonorDatabase(DATA_PATH / "donors.db")
+    parties = sorted(set(database.party_handles.values()))
+    for party in parties:
+        if scan_donors(database, party) != look_up(database, party):
+            sys.exit(f"{party}: scanning donors and the party index differ")
+
+    print(
+        f"{len(database.donors)} donors, {len(database.parties)} parties indexed, "
+        f"{len(parties)} with handles: {', '.join(parties)}\n"
+    )
+    print(f"{'approach':<28}{'median ms':>12}{'min ms':>12}{'speedup':>10}")
+    scan = time_parties(scan_donors, database, parties, args.repeat)
+    lookup = time_parties(look_up, database, parties, args.repeat)
+    for name, timings in [("scan every donor", scan), ("party index lookup", lookup)]:
+        line = f"{name:<28}{statistics.median(timings):>12.3f}{min(timings):>12.3f}"
+        if timings is lookup:
+            line += f"{statistics.median(scan) / statistics.median(lookup):>9.0f}x"
+        print(line)
+    database.close()
+
+
+if __name__ == "__main__":
+    main()
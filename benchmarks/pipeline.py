@@ -0,0 +1,447 @@
+"""
+Replay a stream of mentions through the whole pipeline, the watcher lambda polling
+for mentions and queueing them, and the bot lambda replying to them from the queues,
+with both handlers running in process against local stand-ins for twitter, SQS, S3
+and SSM.
+
+Mentions come from a recorded stream, one JSON object per line with the tweet's
+"text" and either "at", seconds from the start of the stream, or its "created_at",
+or are generated at --rate mentions per minute, with an optional burst. The
+watcher is invoked every minute like its schedule, and sends the mentions it
+resolves to the fast lane's queue or the not found lane's, see bot/resolve.py.
+--pollers stand in for the lambda's SQS event source on the fast lane, receiving
+batches of 10 and deleting the messages which didn't fail, and another fills
+batches of up to 100 from the not found lane, for up to its batching window.
+With --single-lane, not found mentions are sent to the fast lane instead. Replies
+are rate limited like twitter's, and messages are hidden for the queue's
+visibility timeout when they're received.
+
+Time passes --speed times faster than real time, so an hour replays in two minutes
+at the default speed. Stand-in latencies are real world latencies, and are scaled
+to match, but time spent in the handlers themselves is not, so keep the speed low
+enough that it's small next to a reply's latency.
+
+Reports throughput, the depth of the queues each minute, and the latency from a
+mention being tweeted to being replied to, for each lane.
+
+Requires the database, run `python data/build_db.py` first.
+
+    python benchmarks/pipeline.py [--speed 30] [--rate 10] [--minutes 30]
+        [--burst 300 --burst-at 10] [--stream mentions.jsonl] [--csv depth.csv]
+        [--not-found 0.2] [--single-lane]
+"""
+
+import argparse
+import contextlib
+import csv
+import importlib.util
+import io
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+ROOT_DIR = Path(__file__).parent.parent
+FUNCTIONS_PATH = ROOT_DIR / "donationsbot" / "functions"
+
+sys.path.insert(0, str(FUNCTIONS_PATH / "bot"))
+sys.path.insert(0, str(ROOT_DIR / "donationsbot" / "layers" / "shared"))
+# the watcher's own modules, its index.py is loaded below
+sys.path.append(str(FUNCTIONS_PATH / "watcher"))
+os.environ.setdefault("BUCKET_NAME", "bucket")
+os.environ.setdefault("POWERTOOLS_TRACE_DISABLED", "1")
+os.environ.setdefault("POWERTOOLS_METRICS_NAMESPACE", "DonationsBot")
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-southeast-2")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+# generated mentions repeat the same few texts, which isn't spam
+os.environ.setdefault("ADMISSION_MAX_AUTHORS_PER_TEXT", str(2**31))
+
+import arrow  # noqa: E402
+
+from bot import twitter  # noqa: E402
+from bot.idempotency import InMemoryStore  # noqa: E402
+from bot.resolve import Lane  # noqa: E402
+from fakes import (  # noqa: E402
+    NOT_FOUND_QUEUE_URL,
+    TWEET_QUEUE_URL,
+    FakeLambdaContext,
+    FakeMentions,
+    FakeQueues,
+    FakeS3,
+    FakeSQS,
+    FakeSSM,
+    FakeTwitterAPI,
+    VirtualClock,
+    queue_arn,
+)
+from shared.aws import ssm_client  # noqa: E402
+from shared.ratelimit import TokenBucket  # noqa: E402
+
+
+def load_handler_module(name: str, path: Path):
+    # both lambdas' handlers are in an index.py
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+os.environ.setdefault("SQS_QUEUE_URL", TWEET_QUEUE_URL)
+os.environ.setdefault("LOW_PRIORITY_QUEUE_URL", NOT_FOUND_QUEUE_URL)
+watcher_index = load_handler_module(
+    "watcher_index", FUNCTIONS_PATH / "watcher" / "index.py"
+)
+bot_index = load_handler_module("bot_index", FUNCTIONS_PATH / "bot" / "index.py")
+
+# see deployment_stack.py
+POLL_INTERVAL_SECONDS = 60
+VISIBILITY_TIMEOUT_SECONDS = 2 * 60
+SQS_BATCH_SIZE = 10
+NOT_FOUND_BATCH_SIZE = 100
+NOT_FOUND_BATCHING_WINDOW_SECONDS = 5 * 60
+# how long the event source waits for messages before receiving again
+RECEIVE_WAIT_SECONDS = 1
+SAMPLE_INTERVAL_SECONDS = 10
+TWITTER_ID = "1"
+TWITTER_PARAMETERS = {
+    "TWITTER_ID": TWITTER_ID,
+    "TWITTER_BEARER_TOKEN": "x",
+    "TWITTER_ACCESS_TOKEN": "x",
+    "TWITTER_ACCESS_TOKEN_SECRET": "x",
+    "TWITTER_CONSUMER_KEY": "x",
+    "TWITTER_CONSUMER_SECRET": "x",
+}
+CHATTER = ["thanks!", "who funds the parties? #auspol", "this is really useful"]
+
+
+def synthetic_stream(
+    rate: float, minutes: float, burst: int, burst_at: float, not_found: float
+) -> List[Tuple[float, str]]:
+    """
+    (seconds from the start, text) of mentions arriving at random, rate a minute,
+    not_found of them asking about handles the database doesn't have
+    """
+    handles = sorted(twitter.DATABASE.get().handles)
+
+    def text():
+        if (draw := random.random()) < 0.1:
+            return f"@AusPolDonations {random.choice(CHATTER)}"
+        if draw < 0.1 + not_found:
+            return f"@AusPolDonations what about @nobody{random.randrange(1000)}?"
+        return f"@AusPolDonations what about {random.choice(handles)}? #auspol"
+
+    stream, at = [], 0.0
+    while rate and (at := at + random.expovariate(rate / 60)) < minutes * 60:
+        stream.append((at, text()))
+    stream += [(burst_at * 60 + i * 0.1, text()) for i in range(burst)]
+    return sorted(stream)
+
+
+def read_stream(path: Path) -> List[Tuple[float, str]]:
+    with path.open() as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    if lines and "at" not in lines[0]:
+        first = min(arrow.get(line["created_at"]) for line in lines)
+        for line in lines:
+            line["at"] = (arrow.get(line["created_at"]) - first).total_seconds()
+    return sorted((float(line["at"]), line["text"]) for line in lines)
+
+
+class Replay:
+    def __init__(self, args, stream: List[Tuple[float, str]]):
+        self.args = args
+        self.stream = stream
+        self.clock = VirtualClock(speed=args.speed)
+        scale = 1 / args.speed
+        self.mentions = FakeMentions(latency=args.twitter_latency * scale)
+        # messages are in flight while a not found batch fills, see
+        # deployment_stack.py
+        visibility_timeouts = {
+            TWEET_QUEUE_URL: VISIBILITY_TIMEOUT_SECONDS,
+            NOT_FOUND_QUEUE_URL: VISIBILITY_TIMEOUT_SECONDS
+            + NOT_FOUND_BATCHING_WINDOW_SECONDS,
+        }
+        self.queues = dict(
+            (
+                url,
+                FakeSQS(
+                    latency=args.sqs_latency * scale,
+                    visibility_timeout=visibility_timeout,
+                    clock=self.clock.time,
+                ),
+            )
+            for url, visibility_timeout in visibility_timeouts.items()
+        )
+        self.sqs = FakeQueues(self.queues)
+        self.api = FakeTwitterAPI(
+            limit=args.limit,
+            window_seconds=twitter.REPLY_RATE_LIMIT_WINDOW_SECONDS,
+            latency=args.twitter_latency * scale,
+            clock=self.clock.time,
+        )
+        # tweet id -> virtual time it was tweeted
+        self.tweeted_at: Dict[str, float] = {}
+        # (seconds from the start, visible, in flight, replies)
+        self.samples: List[Tuple[float, int, int, int]] = []
+        self.watcher_errors = 0
+        self.invocations = 0
+        self._fed = threading.Event()
+        self._done = threading.Event()
+        self._drained_poll = threading.Event()
+
+    def install(self) -> None:
+        ssm_client.set_factory(lambda: FakeSSM(TWITTER_PARAMETERS))
+        s3 = FakeS3(latency=self.args.sqs_latency / self.args.speed)
+        watcher_index.s3_client.set_factory(lambda: s3)
+        watcher_index.sqs_client.set_factory(lambda: self.sqs)
+        watcher_index.tweepy_client.set_factory(lambda: self.mentions)
+        if self.args.single_lane:
+            watcher_index.LANE_QUEUE_URLS[Lane.NOT_FOUND] = TWEET_QUEUE_URL
+        bot_index.sqs_client.set_factory(lambda: self.sqs)
+        bot_index.idempotency_store = InMemoryStore(clock=self.clock.time)
+        # each bot lambda container has its own pool of reply threads
+        bot_index.executor = ThreadPoolExecutor(
+            max_workers=twitter.REPLY_CONCURRENCY * self.args.pollers
+        )
+        twitter.reply_budget = bot_index.reply_budget = TokenBucket(
+            name="create_tweet",
+            limit=self.args.limit,
+            window_seconds=twitter.REPLY_RATE_LIMIT_WINDOW_SECONDS,
+            clock=self.clock.time,
+        )
+
+        def create_client():
+            client = twitter.create_tweepy_client()
+            client.session.mount("https://api.twitter.com/", self.api)
+            return client
+
+        twitter.tweepy_client.set_factory(create_client)
+
+    def feed(self) -> None:
+        for at, text in self.stream:
+            self.clock.sleep_until(at)
+            tweet = self.mentions.add_mention(text)
+            self.tweeted_at[tweet["id"]] = self.clock.time()
+        self._fed.set()
+
+    def watch(self) -> None:
+        tick = 0
+        while not self._done.is_set():
+            fed = self._fed.is_set()
+            try:
+                watcher_index.handler({}, FakeLambdaContext("watcher"))
+            except Exception:
+                self.watcher_errors += 1
+            else:
+                if fed:
+                    self._drained_poll.set()
+            tick += 1
+            self.clock.sleep_until(tick * POLL_INTERVAL_SECONDS)
+
+    def receive(self, queue_url: str, batch_size: int, window_seconds: float):
+        """
+        A batch of messages like the event source would invoke the bot with, once
+        there are batch_size or window_seconds has passed since the first.
+        """
+        messages: List[Dict[str, Any]] = []
+        first_at = None
+        while not self._done.is_set():
+            response = self.sqs.receive_message(
+                QueueUrl=queue_url,
+                MaxNumberOfMessages=min(batch_size - len(messages), SQS_BATCH_SIZE),
+            )
+            messages += response["Messages"]
+            if messages and first_at is None:
+                first_at = self.clock.time()
+            if len(messages) == batch_size or (
+                messages and self.clock.time() - first_at >= window_seconds
+            ):
+                return messages
+            if not response["Messages"]:
+                self.clock.sleep(RECEIVE_WAIT_SECONDS)
+        return messages
+
+    def poll_queue(
+        self, queue_url: str, batch_size: int = SQS_BATCH_SIZE, window_seconds=0
+    ) -> None:
+        while not self._done.is_set():
+            if not (messages := self.receive(queue_url, batch_size, window_seconds)):
+                continue
+            event = {
+                "Records": [
+                    {
+                        "messageId": message["MessageId"],
+                        "receiptHandle": message["ReceiptHandle"],
+                        "body": message["Body"],
+                        "attributes": message["Attributes"],
+                        "eventSource": "aws:sqs",
+                        "eventSourceARN": queue_arn(queue_url),
+                    }
+                    for message in messages
+                ]
+            }
+            self.invocations += 1
+            result = bot_index.handler(event, FakeLambdaContext("bot"))
+            failed = set(f["itemIdentifier"] for f in result["batchItemFailures"])
+            for message in messages:
+                if message["MessageId"] not in failed:
+                    self.sqs.delete_message(
+                        QueueUrl=queue_url,
+                        ReceiptHandle=message["ReceiptHandle"],
+                    )
+
+    def sample(self) -> None:
+        tick = 0
+        while not self._done.is_set():
+            depths = [queue.depth() for queue in self.queues.values()]
+            visible, in_flight = (sum(depth) for depth in zip(*depths))
+            self.samples.append(
+                (self.clock.elapsed(), visible, in_flight, len(self.api.tweets))
+            )
+            if self._drained_poll.is_set() and visible + in_flight == 0:
+                self._done.set()
+            elif self.clock.elapsed() > self.args.timeout_minutes * 60:
+                self._done.set()
+            tick += 1
+            self.clock.sleep_until(tick * SAMPLE_INTERVAL_SECONDS)
+
+    def run(self) -> float:
+        self.install()
+        threads = [
+            threading.Thread(target=target, daemon=True)
+            for target in [self.feed, self.watch, self.sample]
+            + [lambda: self.poll_queue(TWEET_QUEUE_URL)] * self.args.pollers
+            + [
+                lambda: self.poll_queue(
+                    NOT_FOUND_QUEUE_URL,
+                    batch_size=NOT_FOUND_BATCH_SIZE,
+                    window_seconds=NOT_FOUND_BATCHING_WINDOW_SECONDS,
+                )
+            ]
+        ]
+        # the bot's metrics are printed to stdout as they would be to cloudwatch
+        with contextlib.redirect_stdout(io.StringIO()):
+            for thread in threads:
+                thread.start()
+            self._done.wait()
+            for thread in threads:
+                thread.join()
+        return self.clock.elapsed()
+
+    def lanes(self) -> Dict[str, Lane]:
+        """tweet id -> the lane the watcher resolved it to"""
+        lanes = {}
+        for queue in self.queues.values():
+            for message in queue.messages:
+                resolved = json.loads(message["MessageBody"])["resolved"]
+                lanes[message["Id"]] = Lane(resolved["lane"])
+        return lanes
+
+    def latencies(self) -> Dict[Lane, List[float]]:
+        """lane -> latency of each reply"""
+        lanes = self.lanes()
+        latencies: Dict[Lane, List[float]] = {Lane.FAST: [], Lane.NOT_FOUND: []}
+        for tweet in self.api.tweets:
+            tweet_id = tweet["reply"]["in_reply_to_tweet_id"]
+            latencies[lanes[str(tweet_id)]].append(
+                tweet["created_at"] - self.tweeted_at[tweet_id]
+            )
+        return latencies
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def report(replay: Replay, elapsed: float) -> None:
+    replies = len(replay.api.tweets)
+    lanes = replay.lanes()
+    print(
+        f"{len(replay.stream)} mentions over {replay.stream[-1][0] / 60:.1f} min, "
+        f"replayed at {replay.args.speed:g}x\n"
+    )
+    print(f"queued fast    {list(lanes.values()).count(Lane.FAST):>8}")
+    print(f"queued not found {list(lanes.values()).count(Lane.NOT_FOUND):>6}")
+    print(f"not queued     {len(replay.stream) - len(lanes):>8}")
+    print(f"replies        {replies:>8}")
+    print(f"429s           {replay.api.rate_limited:>8}")
+    print(f"invocations    {replay.invocations:>8}")
+    print(f"watcher errors {replay.watcher_errors:>8}")
+    print(f"replies/min    {replies / (elapsed / 60):>8.1f}")
+    for lane, latencies in replay.latencies().items():
+        if latencies:
+            print(f"\n{lane.value} lane, {len(latencies)} replies")
+            print(f"latency p50    {statistics.median(latencies):>7.1f}s")
+            print(f"latency p99    {percentile(latencies, 0.99):>7.1f}s")
+
+    print(f"\n{'minute':>6}{'visible':>9}{'in flight':>11}{'replies':>9}")
+    minutes: Dict[int, List[Tuple[float, int, int, int]]] = {}
+    for sample in replay.samples:
+        minutes.setdefault(int(sample[0] // 60), []).append(sample)
+    replied = 0
+    for minute, samples in sorted(minutes.items()):
+        visible = max(sample[1] for sample in samples)
+        in_flight = max(sample[2] for sample in samples)
+        total = samples[-1][3]
+        print(f"{minute:>6}{visible:>9}{in_flight:>11}{total - replied:>9}")
+        replied = total
+
+    if replay.args.csv:
+        with open(replay.args.csv, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["seconds", "visible", "in_flight", "replies"])
+            writer.writerows(
+                (f"{seconds:.1f}", visible, in_flight, replies)
+                for seconds, visible, in_flight, replies in replay.samples
+            )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--speed", type=float, default=30)
+    parser.add_argument("--stream", type=Path, help="recorded mentions, JSON lines")
+    parser.add_argument("--rate", type=float, default=10, help="mentions a minute")
+    parser.add_argument("--minutes", type=float, default=30)
+    parser.add_argument("--burst", type=int, default=0)
+    parser.add_argument("--burst-at", type=float, default=10, help="minutes in")
+    parser.add_argument(
+        "--not-found", type=float, default=0.2, help="share of unknown handles"
+    )
+    parser.add_argument(
+        "--single-lane", action="store_true", help="queue not found mentions fast"
+    )
+    parser.add_argument("--pollers", type=int, default=5)
+    parser.add_argument("--limit", type=int, default=twitter.REPLY_RATE_LIMIT)
+    parser.add_argument("--twitter-latency", type=float, default=0.15)
+    parser.add_argument("--sqs-latency", type=float, default=0.02)
+    parser.add_argument("--timeout-minutes", type=float, default=120)
+    parser.add_argument("--csv", help="write the queue depth samples here")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    if args.stream:
+        stream = read_stream(args.stream)
+    else:
+        stream = synthetic_stream(
+            rate=args.rate,
+            minutes=args.minutes,
+            burst=args.burst,
+            burst_at=args.burst_at,
+            not_found=args.not_found,
+        )
+    if not stream:
+        parser.error("no mentions to replay")
+    replay = Replay(args, stream)
+    elapsed = replay.run()
+    report(replay, elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Drive the bot through a mention storm against a fake twitter API which rate limits
+creating tweets, with and without the rate limit aware scheduler.
+
+Without it, every reply over the limit is a 429 and the message is retried after
+the queue's visibility timeout, hitting the limit again. With it, replies over the
+limit are deferred until the window resets, without calling twitter.
+
+Time is scaled down: twitter's 15 minute window is --window seconds here, and the
+queue's visibility timeout is scaled to match.
+
+Requires the database, run `python data/build_db.py` first.
+
+    python benchmarks/rate_limit.py [--mentions 200] [--limit 25] [--window 4]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent
+BOT_PATH = ROOT_DIR / "donationsbot" / "functions" / "bot"
+
+sys.path.insert(0, str(BOT_PATH))
+sys.path.insert(0, str(ROOT_DIR / "donationsbot" / "layers" / "shared"))
+os.environ.setdefault("POWERTOOLS_TRACE_DISABLED", "1")
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-southeast-2")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from aws_lambda_powertools.utilities.data_classes.sqs_event import (  # noqa: E402
+    SQSRecord,
+)
+
+import index  # noqa: E402
+from bot import twitter  # noqa: E402
+from bot.idempotency import InMemoryStore  # noqa: E402
+from fakes import (  # noqa: E402
+    TWEET_QUEUE_URL,
+    FakeSQS,
+    FakeSSM,
+    FakeTwitterAPI,
+    queue_arn,
+)
+from shared.aws import ssm_client  # noqa: E402
+from shared.ratelimit import TokenBucket  # noqa: E402
+
+# the queue's visibility timeout, and twitter's rate limit window
+VISIBILITY_TIMEOUT_SECONDS = 2 * 60
+TWITTER_WINDOW_SECONDS = 15 * 60
+BATCH_SIZE = 10
+TWITTER_PARAMETERS = [
+    "TWITTER_ACCESS_TOKEN",
+    "TWITTER_ACCESS_TOKEN_SECRET",
+    "TWITTER_CONSUMER_KEY",
+    "TWITTER_CONSUMER_SECRET",
+]
+
+scheduled_create_tweet = twitter.create_tweet
+
+
+def legacy_create_tweet(in_reply_to_tweet_id, text):
+    twitter.tweepy_client.get().create_tweet(
+        in_reply_to_tweet_id=in_reply_to_tweet_id, text=text
+    )
+
+
+def make_records(count: int):
+    handles = list(twitter.DATABASE.get().handles)
+    return [
+        SQSRecord(
+            {
+                "messageId": str(index),
+                "receiptHandle": f"receipt-{index}",
+                "eventSourceARN": queue_arn(TWEET_QUEUE_URL),
+                "body": json.dumps(
+                    {
+                        "id": 1_500_000_000_000_000_000 + index,
+                        "text": f"@AusPolDonations {random.choice(handles)} #auspol",
+                    }
+                ),
+            }
+        )
+        for index in range(count)
+    ]
+
+
+def run(records, api: FakeTwitterAPI, window_seconds: float, scheduled: bool):
+    scale = window_seconds / TWITTER_WINDOW_SECONDS
+    visibility_timeout = VISIBILITY_TIMEOUT_SECONDS * scale
+    index.DEFER_MARGIN_SECONDS = scale
+    sqs = FakeSQS()
+    index.sqs_client.set_factory(lambda: sqs)
+    index.idempotency_store = InMemoryStore()
+    twitter.reply_budget = TokenBucket(
+        name="create_tweet", limit=api.limit, window_seconds=window_seconds
+    )
+    twitter.create_tweet = scheduled_create_tweet if scheduled else legacy_create_tweet
+
+    def create_client():
+        client = twitter.create_tweepy_client()
+        client.session.mount("https://api.twitter.com/", api)
+        return client
+
+    twitter.tweepy_client.set_factory(create_client)
+
+    # message id -> (visible at, record)
+    queue = dict((r.message_id, (0.0, r)) for r in records)
+    invocations = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=BATCH_SIZE) as executor:
+        while queue:
+            now = time.perf_counter() - start
+            visible = sorted(
+                (r for visible_at, r in queue.values() if visible_at <= now),
+                key=lambda r: int(r.message_id),
+            )[:BATCH_SIZE]
+            if not visible:
+                time.sleep(min(v for v, _ in queue.values()) - now)
+                continue
+            invocations += 1
+            failures = index.process_records(records=visible, executor=executor)
+            failed = set(f["itemIdentifier"] for f in failures)
+            now = time.perf_counter() - start
+            for record in visible:
+                if record.message_id not in failed:
+                    del queue[record.message_id]
+                    continue
+                # deferred messages are hidden until the window resets, which is
+                # already in the benchmark's time
+                delay = sqs.visibility_timeouts.pop(
+                    record.receipt_handle, visibility_timeout
+                )
+                queue[record.message_id] = (now + delay, record)
+    elapsed = time.perf_counter() - start
+    return elapsed, invocations
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mentions", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=25)
+    parser.add_argument("--window", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    ssm_client.set_factory(
+        lambda: FakeSSM(dict((name, "x") for name in TWITTER_PARAMETERS))
+    )
+    records = make_records(args.mentions)
+    print(
+        f"{args.mentions} mentions, {args.limit} tweets per {args.window}s window\n"
+    )
+    print(
+        f"{'strategy':<14}{'seconds':>9}{'replies':>9}{'api calls':>11}"
+        f"{'429s':>7}{'invocations':>13}"
+    )
+    for name, scheduled in [("no scheduler", False), ("scheduler", True)]:
+        api = FakeTwitterAPI(
+            limit=args.limit, window_seconds=args.window, latency=args.latency
+        )
+        elapsed, invocations = run(
+            records, api=api, window_seconds=args.window, scheduled=scheduled
+        )
+        print(
+            f"{name:<14}{elapsed:>9.1f}{len(api.tweets):>9}"
+            f"{len(api.tweets) + api.rate_limited:>11}{api.rate_limited:>7}"
+            f"{invocations:>13}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Run the bot handler over batches of mentions, capturing the metrics it publishes in
+embedded metric format (EMF) on stdout, and report each stage's timings, for cold
+and warm invocations separately.
+
+Each simulated lambda container starts cold, and then handles --invocations warm.
+create_tweet goes to a fake twitter API with --latency, and the mentions mix
+handles, donors named without a handle, and handles not in the database, so every
+stage is timed.
+
+With PROFILE_ONE_IN=N, one in N invocations is profiled, as in the lambda, and the
+functions which took longest across every profiled invocation are printed.
+
+Requires the database, run `python data/build_db.py` first.
+
+    [PROFILE_ONE_IN=5] python benchmarks/stage_metrics.py [--containers 3]
+        [--invocations 10]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import pstats
+import random
+import statistics
+import sys
+import tempfile
+import uuid
+from pathlib import Path
+from typing import Dict, List
+
+ROOT_DIR = Path(__file__).parent.parent
+BOT_PATH = ROOT_DIR / "donationsbot" / "functions" / "bot"
+
+sys.path.insert(0, str(BOT_PATH))
+sys.path.insert(0, str(ROOT_DIR / "donationsbot" / "layers" / "shared"))
+os.environ.setdefault("POWERTOOLS_TRACE_DISABLED", "1")
+os.environ.setdefault("POWERTOOLS_METRICS_NAMESPACE", "DonationsBot")
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-southeast-2")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+os.environ.setdefault("REPLY_RATE_LIMIT", "1000000")
+# profiles are written here, to be combined
+os.environ.setdefault("PROFILE_DIR", tempfile.mkdtemp())
+
+import index  # noqa: E402
+from bot import twitter  # noqa: E402
+from bot.idempotency import InMemoryStore  # noqa: E402
+from fakes import (  # noqa: E402
+    TWEET_QUEUE_URL,
+    FakeLambdaContext,
+    FakeSSM,
+    FakeTwitterAPI,
+    queue_arn,
+)
+from shared.aws import ssm_client  # noqa: E402
+from shared.timing import metric_name  # noqa: E402
+
+TWITTER_PARAMETERS = [
+    "TWITTER_ACCESS_TOKEN",
+    "TWITTER_ACCESS_TOKEN_SECRET",
+    "TWITTER_CONSUMER_KEY",
+    "TWITTER_CONSUMER_SECRET",
+]
+STAGES = [
+    "Revalidate",
+    "Reply",
+    "Parse",
+    "Lookup",
+    "Combine",
+    "Render",
+    "Fit",
+    "CreateTweet",
+]
+
+
+def mention_text() -> str:
+    kind = random.random()
+    if kind < 0.7:
+        handle = random.choice(list(twitter.DATABASE.get().handles))
+        return f"@AusPolDonations {handle} #auspol"
+    if kind < 0.9:
+        donors = twitter.DATABASE.get().donors
+        name = donors.name(random.randrange(len(donors)))
+        return f"@AusPolDonations what has {name} donated?"
+    return "@AusPolDonations @someoneelse #auspol"
+
+
+def make_event(tweet_ids, batch_size: int) -> dict:
+    return {
+        "Records": [
+            {
+                "messageId": str(uuid.uuid4()),
+                "receiptHandle": str(uuid.uuid4()),
+                "body": json.dumps({"id": next(tweet_ids), "text": mention_text()}),
+                "eventSource": "aws:sqs",
+                "eventSourceARN": queue_arn(TWEET_QUEUE_URL),
+            }
+            for _ in range(batch_size)
+        ]
+    }
+
+
+def parse_emf(output: str) -> Dict[str, Dict[str, List[float]]]:
+    """start ("cold" or "warm") -> metric name -> values"""
+    values: Dict[str, Dict[str, List[float]]] = {}
+    for line in output.splitlines():
+        try:
+            blob = json.loads(line)
+        except ValueError:
+            continue
+        if "_aws" not in blob or "start" not in blob:
+            continue
+        for directive in blob["_aws"]["CloudWatchMetrics"]:
+            for metric in directive["Metrics"]:
+                value = blob[metric["Name"]]
+                values.setdefault(blob["start"], {}).setdefault(
+                    metric["Name"], []
+                ).extend(value if isinstance(value, list) else [value])
+    return values
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--containers", type=int, default=3)
+    parser.add_argument("--invocations", type=int, default=10, help="warm, each")
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    api = FakeTwitterAPI(limit=1_000_000, window_seconds=900, latency=args.latency)
+    ssm_client.set_factory(
+        lambda: FakeSSM(dict((name, "x") for name in TWITTER_PARAMETERS))
+    )
+
+    def create_client():
+        client = twitter.create_tweepy_client()
+        client.session.mount("https://api.twitter.com/", api)
+        return client
+
+    twitter.tweepy_client.set_factory(create_client)
+    tweet_ids = iter(range(1_500_000_000_000_000_000, 2_000_000_000_000_000_000))
+
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        for _ in range(args.containers):
+            # a new container, with nothing cached
+            index.cold_start = True
+            index.idempotency_store = InMemoryStore()
+            twitter.tweepy_client.invalidate()
+            for _ in range(args.invocations + 1):
+                event = make_event(tweet_ids, batch_size=args.batch_size)
+                index.handler(event, FakeLambdaContext("bot"))
+
+    values = parse_emf(output.getvalue())
+    invocations = args.containers * (args.invocations + 1)
+    print(f"{invocations} invocations of {args.batch_size} mentions\n")
+    print(f"{'stage':<14}{'start':>6}{'count':>7}{'p50 ms':>9}{'p99 ms':>9}")
+    for stage in STAGES:
+        for start in ["cold", "warm"]:
+            if not (timings := values.get(start, {}).get(metric_name(stage))):
+                continue
+            print(
+                f"{stage:<14}{start:>6}{len(timings):>7}"
+                f"{statistics.median(timings):>9.2f}{percentile(timings, 0.99):>9.2f}"
+            )
+
+    if profiles := sorted(Path(os.environ["PROFILE_DIR"]).glob("*.prof")):
+        stats = pstats.Stats(str(profiles[0]))
+        for path in profiles[1:]:
+            stats.add(str(path))
+        print(f"\n{len(profiles)} invocations profiled")
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(15)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+"""
+Measure the time from a mention being made to it being queued, streaming mentions
+with donationsbot/functions/watcher/stream.py against polling for them every
+minute with the watcher, using local stand-ins for twitter, SQS and S3.
+
+Polling replays --minutes of mentions, --per-minute on average, a poll at a time,
+each poll starting on the minute, so no time is spent waiting for the schedule.
+Streaming runs for --stream-seconds of real time against a local HTTP server
+standing in for twitter's filtered stream, see fakes.FakeStream, which drops the
+connection every --drop-every seconds and answers the reconnection after the
+second drop with --fail-status, so the reconnection backoff and the catch up after
+it are included. Twitter's own delay in delivering a mention to the stream isn't.
+
+Reports the latency percentiles, mentions queued twice or not at all, and the S3
+requests made by each per minute. Streaming's include storing the checkpoint every
+--checkpoint-seconds and the catch up after every drop, which twitter makes far
+less often than the default --drop-every.
+
+    python benchmarks/stream_latency.py [--minutes 30] [--per-minute 60]
+        [--stream-seconds 120] [--drop-every 40] [--fail-status 503]
+"""
+
+import argparse
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+ROOT_DIR = Path(__file__).parent.parent
+
+sys.path.insert(0, str(ROOT_DIR / "donationsbot" / "functions" / "watcher"))
+sys.path.insert(0, str(ROOT_DIR / "donationsbot" / "layers" / "shared"))
+# the bot's package, a layer of the watcher's, so after the watcher's index.py
+sys.path.append(str(ROOT_DIR / "donationsbot" / "functions" / "bot"))
+os.environ.setdefault("BUCKET_NAME", "bucket")
+os.environ.setdefault("SQS_QUEUE_URL", "queue")
+os.environ.setdefault("POWERTOOLS_TRACE_DISABLED", "1")
+os.environ.setdefault("LOG_LEVEL", "ERROR")
+
+import arrow  # noqa: E402
+
+from fakes import (  # noqa: E402
+    FakeMentions,
+    FakeS3,
+    FakeSQS,
+    FakeSSM,
+    FakeStream,
+    twitter_entities,
+)
+from shared.aws import ssm_client  # noqa: E402
+
+import index  # noqa: E402
+import stream  # noqa: E402
+
+TWITTER_ID = "1"
+
+
+def schedule(seconds: float, per_minute: float) -> List[Tuple[float, Dict[str, str]]]:
+    """(seconds from the start, fields) of each mention, in order."""
+    ids = itertools.count(1000)
+    mentions = [
+        (
+            random.uniform(0, seconds),
+            dict(
+                text=f"@AusPolDonations what has @donor{next(ids)} given?",
+                author_id=str(next(ids)),
+            ),
+        )
+        for _ in range(int(seconds / 60 * per_minute))
+    ]
+    mentions.sort(key=lambda mention: mention[0])
+    return mentions
+
+
+def install(args, mentions: FakeMentions, sqs: FakeSQS) -> FakeS3:
+    s3 = FakeS3(latency=args.s3_latency)
+    index.tweepy_client.set_factory(lambda: mentions)
+    index.sqs_client.set_factory(lambda: sqs)
+    index.s3_client.set_factory(lambda: s3)
+    # catch up from the first mention, rather than the last minute
+    s3.objects[f"{index.BUCKET_NAME}/{index.LATEST_TWEET_ID_KEY}"] = b"1"
+    return s3
+
+
+def poll(args) -> Tuple[Dict[str, float], FakeSQS, FakeS3]:
+    """
+    The time each mention was made, polled for by the watcher every minute, and
+    the stand-ins used.
+    """
+    seconds = args.minutes * 60
+    mentions = FakeMentions(latency=args.twitter_latency)
+    # the time in the replay, from when the current poll started
+    poll_at, poll_started = [0.0], [time.perf_counter()]
+    sqs = FakeSQS(
+        latency=args.sqs_latency,
+        clock=lambda: poll_at[0] + time.perf_counter() - poll_started[0],
+    )
+    s3 = install(args, mentions, sqs)
+    began = time.time() - seconds
+    created_at = {}
+    replay = iter(schedule(seconds, args.per_minute))
+    mention = next(replay, None)
+    for minute in range(1, args.minutes + 1):
+        while mention is not None and mention[0] < minute * 60:
+            at, fields = mention
+            tweet = mentions.add_mention(created_at=began + at, **fields)
+            created_at[tweet["id"]] = at
+            mention = next(replay, None)
+        poll_at[0], poll_started[0] = minute * 60, time.perf_counter()
+        index.poll_mentions()
+        index.metrics.clear_metrics()
+    return created_at, sqs, s3
+
+
+def disrupt(args, fake: FakeStream, done: threading.Event) -> None:
+    for drop in itertools.count(1):
+        if done.wait(args.drop_every):
+            return
+        if drop == 2 and args.fail_status:
+            fake.fail_next.append(args.fail_status)
+        fake.disconnect()
+
+
+def streaming(args) -> Tuple[Dict[str, float], FakeSQS, FakeS3, Dict, FakeStream]:
+    """
+    The time each mention was made, streamed by stream.py, the stand-ins used and
+    the result of the run.
+    """
+    mentions = FakeMentions(latency=args.twitter_latency)
+    sqs = FakeSQS(latency=args.sqs_latency)
+    s3 = install(args, mentions, sqs)
+    fake = FakeStream(keep_alive_seconds=args.keep_alive)
+    stream.STREAM_URL, stream.RULES_URL = fake.url, fake.rules_url
+    stream.STREAM_CHECKPOINT_SECONDS = args.checkpoint_seconds
+    created_at = {}
+    done = threading.Event()
+    start = time.monotonic()
+
+    def feed():
+        for at, fields in schedule(args.stream_seconds, args.per_minute):
+            time.sleep(max(start + at - time.monotonic(), 0))
+            now = time.time()
+            tweet = mentions.add_mention(created_at=now, **fields)
+            created_at[tweet["id"]] = now
+            fake.push(
+                {
+                    **tweet,
+                    "entities": twitter_entities(tweet["text"]),
+                    "created_at": arrow.get(now).format("YYYY-MM-DDTHH:mm:ss.SSS[Z]"),
+                }
+            )
+
+    threads = [
+        threading.Thread(target=feed, daemon=True),
+        threading.Thread(target=disrupt, args=(args, fake, done), daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+    # long enough after the last mention for the stream to send it
+    end = start + args.stream_seconds + 2 * args.keep_alive
+    result = stream.stream_mentions(time_left=lambda: end - time.monotonic())
+    done.set()
+    fake.close()
+    index.metrics.clear_metrics()
+    return created_at, sqs, s3, result, fake
+
+
+def latencies(created_at: Dict[str, float], sqs: FakeSQS) -> Dict[str, float]:
+    return dict(
+        (id, sqs.sent_at[id] - at) for id, at in created_at.items() if id in sqs.sent_at
+    )
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--minutes", type=int, default=30, help="of polling")
+    parser.add_argument("--per-minute", type=float, default=60)
+    parser.add_argument("--stream-seconds", type=float, default=120)
+    parser.add_argument("--drop-every", type=float, default=40)
+    parser.add_argument("--fail-status", type=int, default=503)
+    parser.add_argument("--keep-alive", type=float, default=1.0)
+    parser.add_argument(
+        "--checkpoint-seconds", type=float, default=stream.STREAM_CHECKPOINT_SECONDS
+    )
+    parser.add_argument("--twitter-latency", type=float, default=0.2)
+    parser.add_argument("--s3-latency", type=float, default=0.02)
+    parser.add_argument("--sqs-latency", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    ssm_client.set_factory(
+        lambda: FakeSSM(
+            {
+                "TWITTER_ID": TWITTER_ID,
+                "TWITTER_USERNAME": "AusPolDonations",
+                "TWITTER_BEARER_TOKEN": "token",
+            }
+        )
+    )
+
+    polled, poll_sqs, poll_s3 = poll(args)
+    streamed, stream_sqs, stream_s3, result, fake = streaming(args)
+
+    print(
+        f"{'mention to queue':<18}{'mentions':>10}{'p50 s':>8}{'p95 s':>8}"
+        f"{'max s':>8}{'missing':>9}{'twice':>7}"
+        f"{'S3 GET/min':>12}{'S3 PUT/min':>12}"
+    )
+    for name, created_at, sqs, s3, seconds in [
+        ("polling", polled, poll_sqs, poll_s3, args.minutes * 60),
+        ("streaming", streamed, stream_sqs, stream_s3, args.stream_seconds),
+    ]:
+        values = sorted(latencies(created_at, sqs).values())
+        sent = Counter(message["Id"] for message in sqs.messages)
+        minutes = seconds / 60
+        print(
+            f"{name:<18}{len(values):>10}{percentile(values, 0.5):>8.2f}"
+            f"{percentile(values, 0.95):>8.2f}{values[-1]:>8.2f}"
+            f"{len(created_at) - len(values):>9}"
+            f"{sum(1 for count in sent.values() if count > 1):>7}"
+            f"{s3.requests / minutes:>12.1f}{s3.puts / minutes:>12.1f}"
+        )
+    print(
+        f"\nstreaming: {result['connections']} connections, "
+        f"{fake.connections - result['connections']} refused, "
+        f"{fake.lost} mentions made while disconnected and caught up by polling"
+    )
+
+
+if __name__ == "__main__":
+    main()
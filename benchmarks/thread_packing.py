@@ -0,0 +1,149 @@
+"""
+Measure packing the replies for every handle in a mention into a thread, see
+donationsbot/functions/bot/bot/threads.py.
+
+Mentions are made of --handles handles for combined donors, whose replies are
+"A / B / ..." for several entities, e.g. #nine, picked at random with --seed,
+and always starting with #nine. Without a cap on tweets, reports how many tweets
+the first fit decreasing packing takes against packing the chunks in the order
+they're read (next fit), and against the lower bound of their total length over
+a tweet's, then with --max-tweets, how much of the replies are kept. A single
+tweet answering the first handle, as the bot replies without threads, is the
+baseline. Also times composing a thread.
+
+Requires the database, run `python data/build_db.py` first.
+
+    python benchmarks/thread_packing.py [--mentions 200] [--handles 2 3 5]
+        [--max-tweets 4] [--seed 0]
+"""
+
+import argparse
+import math
+import random
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import List, Sequence
+
+ROOT_DIR = Path(__file__).parent.parent
+BOT_PATH = ROOT_DIR / "donationsbot" / "functions" / "bot"
+
+sys.path.insert(0, str(BOT_PATH))
+
+from bot.db import DonorDatabase  # noqa: E402
+from bot.fitting import (  # noqa: E402
+    KIND_LINE,
+    TWITTER_MAX_CHARS,
+    Segment,
+    fit_segments,
+    weighted_length,
+)
+from bot.threads import (  # noqa: E402
+    Chunk,
+    compose_thread,
+    pack_chunks,
+    reply_chunks,
+    thread_marker,
+)
+
+FIRST_HANDLE = "#nine"
+UNCAPPED = 99
+# a donation line, e.g. "LIB $27,500", rather than a heading
+LINE_PATTERN = re.compile(r"^.+ \$[\d,]+$", re.MULTILINE)
+
+
+def chunks_for(prefix: str, replies: Sequence[List[Segment]]) -> List[Chunk]:
+    capacity = TWITTER_MAX_CHARS - len(thread_marker(UNCAPPED, UNCAPPED))
+    chunk_capacity = capacity - weighted_length(prefix)
+    return [
+        chunk
+        for reply, segments in enumerate(replies)
+        for chunk in reply_chunks(reply, segments, chunk_capacity)
+    ]
+
+
+def next_fit(chunks: Sequence[Chunk], first_capacity: int, capacity: int) -> int:
+    """Tweets taken by chunks in the order they're read, a new tweet when full."""
+    tweets, room = 1, first_capacity
+    for chunk in chunks:
+        if chunk.weight > room and room < first_capacity:
+            tweets += 1
+            room = capacity
+        room -= chunk.weight
+    return tweets
+
+
+def lines_in(texts: Sequence[str]) -> int:
+    return sum(len(LINE_PATTERN.findall(text)) for text in texts)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mentions", type=int, default=200)
+    parser.add_argument("--handles", type=int, nargs="+", default=[2, 3, 5])
+    parser.add_argument("--max-tweets", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    database = DonorDatabase(BOT_PATH / "bot" / "data" / "donors.db")
+    # one handle per reply, for the donors combining several entities
+    combined = dict(
+        (tuple(reply), handle)
+        for handle in sorted(database.replies)
+        if " / " in (reply := database.replies[handle])[0].text
+    )
+    first_reply = tuple(database.replies[FIRST_HANDLE])
+    handles = sorted(
+        handle for reply, handle in combined.items() if reply != first_reply
+    )
+    print(f"{len(handles) + 1} handles for combined donors, e.g. {FIRST_HANDLE}\n")
+    random.seed(args.seed)
+
+    capacity = TWITTER_MAX_CHARS - len(thread_marker(UNCAPPED, UNCAPPED))
+    print(
+        f"{'handles':>8}{'lower bound':>13}{'next fit':>10}{'FFD':>7}"
+        f"{'lines':>8}{'single':>8}{'capped':>8}{'us/thread':>11}"
+    )
+    for count in args.handles:
+        bound, sequential, packed, lines, single, capped, timings = (
+            [[] for _ in range(7)]
+        )
+        for _ in range(args.mentions):
+            mention = [FIRST_HANDLE, *random.sample(handles, count - 1)]
+            prefix = " ".join(mention)
+            replies = [database.replies[handle] for handle in mention]
+            chunks = chunks_for(prefix, replies)
+            first_capacity = capacity - weighted_length(prefix)
+            total = weighted_length(prefix) + sum(chunk.weight for chunk in chunks)
+            bound.append(math.ceil(total / capacity))
+            sequential.append(next_fit(chunks, first_capacity, capacity))
+            packed.append(len(pack_chunks(chunks, first_capacity, capacity)))
+
+            total_lines = sum(
+                segment.kind == KIND_LINE
+                for segments in replies
+                for segment in segments
+            )
+            lines.append(total_lines)
+            single_text = fit_segments(prefix=prefix, segments=replies[0])
+            single.append(lines_in([single_text]) / total_lines)
+            start = time.perf_counter()
+            texts = compose_thread(prefix, replies, max_tweets=args.max_tweets)
+            timings.append((time.perf_counter() - start) * 1e6)
+            capped.append(lines_in(texts) / total_lines)
+        print(
+            f"{count:>8}{statistics.mean(bound):>13.2f}"
+            f"{statistics.mean(sequential):>10.2f}{statistics.mean(packed):>7.2f}"
+            f"{statistics.mean(lines):>8.1f}{statistics.mean(single):>8.0%}"
+            f"{statistics.mean(capped):>8.0%}{statistics.median(timings):>11.0f}"
+        )
+    print(
+        "\ntweets without a cap, mean lines per mention, and the share of them kept "
+        f"by a single tweet, and by a thread of at most {args.max_tweets} tweets"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Backfill a gap in the watcher's checkpoint end to end, see
+donationsbot/functions/watcher/backfill.py, against local stand-ins for twitter,
+SQS and S3 holding --mentions mentions spread over --days days.
+
+Compares fetching the whole range as one window, the way a single poll would
+page through it, against --window-minutes windows fetched --concurrency at a
+time, within a rate limit of --rate-limit requests per 15 minutes on a clock
+running --speed times faster than real time. Then interrupts a backfill after
+--interrupt-after windows, and resumes it. Every run must queue each mention.
+Windows are sent in order, each once the one before it has been queued, so no
+mention should be queued after a mention from a later window. Reports how many
+were.
+
+    python benchmarks/watcher_backfill.py [--mentions 30000] [--days 7]
+        [--window-minutes 60] [--concurrency 8] [--rate-limit 450]
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+ROOT_DIR = Path(__file__).parent.parent
+
+sys.path.insert(0, str(ROOT_DIR / "donationsbot" / "functions" / "watcher"))
+sys.path.insert(0, str(ROOT_DIR / "donationsbot" / "layers" / "shared"))
+# the bot's package, a layer of the watcher's, so after the watcher's index.py
+sys.path.append(str(ROOT_DIR / "donationsbot" / "functions" / "bot"))
+os.environ.setdefault("BUCKET_NAME", "bucket")
+os.environ.setdefault("SQS_QUEUE_URL", "queue")
+os.environ.setdefault("POWERTOOLS_TRACE_DISABLED", "1")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import arrow  # noqa: E402
+
+from fakes import FakeMentions, FakeS3, FakeSQS, FakeSSM, VirtualClock  # noqa: E402
+from shared.aws import ssm_client  # noqa: E402
+from shared.ratelimit import TokenBucket  # noqa: E402
+
+import backfill  # noqa: E402
+import index  # noqa: E402
+
+TWITTER_ID = "1"
+RANGE_END = "2022-05-08T00:00:00Z"
+
+
+class Setup:
+    """Fakes holding the mentions, wired into the watcher."""
+
+    def __init__(self, args, clock: VirtualClock, created_at: List[float]) -> None:
+        self.clock = clock
+        self.mentions = FakeMentions(
+            latency=args.twitter_latency, limit=args.rate_limit, clock=clock.time
+        )
+        for number, timestamp in enumerate(created_at):
+            self.mentions.add_mention(f"@AusPolDonations #{number}", timestamp)
+        self.sqs = FakeSQS(latency=args.sqs_latency, failure_rate=args.failure_rate)
+        self.s3 = FakeS3(latency=args.s3_latency)
+        index.tweepy_client.set_factory(lambda: self.mentions)
+        index.sqs_client.set_factory(lambda: self.sqs)
+        index.s3_client.set_factory(lambda: self.s3)
+        backfill.mentions_budget = TokenBucket(
+            name="get_users_mentions",
+            limit=args.rate_limit,
+            window_seconds=backfill.MENTIONS_RATE_LIMIT_WINDOW_SECONDS,
+            clock=clock.time,
+        )
+
+    def run(self, window_seconds: int, concurrency: int, start_time: str, **kwargs):
+        return backfill.backfill(
+            start_time=start_time,
+            end_time=RANGE_END,
+            window_seconds=window_seconds,
+            concurrency=concurrency,
+            sleep=self.clock.sleep,
+            **kwargs,
+        )
+
+    def check(self, window_of: Dict[str, int]) -> Dict[str, int]:
+        """Every mention queued, and how many were queued out of window order."""
+        ids = [message["Id"] for message in self.sqs.messages]
+        if set(ids) != set(window_of):
+            sys.exit(f"queued {len(set(ids))} of {len(window_of)} mentions")
+        windows = [window_of[id] for id in ids]
+        latest_windows = itertools.accumulate(windows, max)
+        return dict(
+            queued=len(set(ids)),
+            duplicates=len(ids) - len(set(ids)),
+            out_of_order=sum(
+                window < latest for window, latest in zip(windows, latest_windows)
+            ),
+            requests=self.mentions.calls,
+            rate_limited=self.mentions.rate_limited,
+        )
+
+
+def stop_after(windows: int, s3: FakeS3, start_time: str) -> Callable[[], bool]:
+    """should_stop for a backfill, once it has recorded windows windows in S3."""
+    key = backfill.progress_key(start_time=start_time, end_time=RANGE_END)
+
+    def should_stop() -> bool:
+        if (progress := s3.objects.get(f"{index.BUCKET_NAME}/{key}")) is None:
+            return False
+        return len(json.loads(progress)["windows"]) >= windows
+
+    return should_stop
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mentions", type=int, default=30000)
+    parser.add_argument("--days", type=int, default=7)
+    parser.add_argument("--window-minutes", type=int, default=60)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate-limit", type=int, default=450)
+    parser.add_argument("--interrupt-after", type=int, default=40)
+    parser.add_argument("--speed", type=float, default=60)
+    parser.add_argument("--twitter-latency", type=float, default=0.05)
+    parser.add_argument("--sqs-latency", type=float, default=0.01)
+    parser.add_argument("--s3-latency", type=float, default=0.01)
+    parser.add_argument("--failure-rate", type=float, default=0.01)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    ssm_client.set_factory(
+        lambda: FakeSSM({"TWITTER_ID": TWITTER_ID, "TWITTER_BEARER_TOKEN": "token"})
+    )
+    random.seed(args.seed)
+    end = arrow.get(RANGE_END)
+    start = end.shift(days=-args.days)
+    start_time = start.strftime(backfill.TIME_FORMAT)
+    created_at = sorted(
+        random.uniform(start.timestamp(), end.timestamp())
+        for _ in range(args.mentions)
+    )
+    window_seconds = args.window_minutes * 60
+
+    print(
+        f"{args.mentions} mentions over {args.days} days, "
+        f"{args.rate_limit} requests per 15 minutes\n"
+    )
+    print(
+        f"{'run':<36}{'seconds':>9}{'requests':>10}{'limited':>9}"
+        f"{'queued':>8}{'dups':>6}{'reordered':>11}"
+    )
+    runs = [
+        ("one window", args.days * 24 * 60 * 60, 1, [None]),
+        (f"{args.window_minutes}m windows x{args.concurrency}", window_seconds,
+         args.concurrency, [None]),
+        (f"  interrupted after {args.interrupt_after}, resumed", window_seconds,
+         args.concurrency, [args.interrupt_after, None]),
+    ]
+    for name, seconds, concurrency, stops in runs:
+        clock = VirtualClock(speed=args.speed)
+        setup = Setup(args, clock, created_at)
+        # which window each mention is in, to check they're queued in order
+        window_of = dict(
+            (tweet["id"], int((timestamp - start.timestamp()) // seconds))
+            for tweet, timestamp in zip(setup.mentions.tweets, created_at)
+        )
+        begin = time.perf_counter()
+        for stop in stops:
+            should_stop = (
+                stop_after(stop, setup.s3, start_time) if stop else (lambda: False)
+            )
+            result = setup.run(
+                seconds, concurrency, start_time=start_time, should_stop=should_stop
+            )
+        elapsed = time.perf_counter() - begin
+        if not result["complete"]:
+            sys.exit(f"{name} didn't complete: {result}")
+        stats = setup.check(window_of)
+        print(
+            f"{name:<36}{elapsed:>9.2f}{stats['requests']:>10}"
+            f"{stats['rate_limited']:>9}{stats['queued']:>8}{stats['duplicates']:>6}"
+            f"{stats['out_of_order']:>11}"
+        )
+    print("\nseconds are real time, the rate limit resets on the faster clock")
+
+
+if __name__ == "__main__":
+    main()
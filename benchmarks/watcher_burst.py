@@ -0,0 +1,92 @@
+"""
+Measure watcher wall time on a burst of mentions, using local stand-ins for twitter,
+SQS and S3, comparing the pipelined watcher against fetching and queueing each page
+one after the other.
+
+    python benchmarks/watcher_burst.py [--mentions 1000 5000]
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).parent.parent
+
+sys.path.insert(0, str(ROOT_DIR / "donationsbot" / "functions" / "watcher"))
+sys.path.insert(0, str(ROOT_DIR / "donationsbot" / "layers" / "shared"))
+# the bot's package, a layer of the watcher's, so after the watcher's index.py
+sys.path.append(str(ROOT_DIR / "donationsbot" / "functions" / "bot"))
+os.environ.setdefault("BUCKET_NAME", "bucket")
+os.environ.setdefault("SQS_QUEUE_URL", "queue")
+os.environ.setdefault("POWERTOOLS_TRACE_DISABLED", "1")
+
+from fakes import FakeMentions, FakeS3, FakeSQS, FakeSSM  # noqa: E402
+from shared.aws import ssm_client  # noqa: E402
+
+import index  # noqa: E402
+
+TWITTER_ID = "1"
+
+
+def sequential_poll(mentions: FakeMentions, sqs: FakeSQS) -> None:
+    # how the watcher used to work: checkpoint first, then fetch a page and queue
+    # it before fetching the next.
+    kwargs = index.get_starting_point_kwargs()
+    response = mentions.get_users_mentions(
+        id=TWITTER_ID, max_results=index.MAX_RESULTS_TWITTER, **kwargs
+    )
+    if newest_id := response.meta.get("newest_id"):
+        index.store_latest_id(latest_id=int(newest_id))
+    while True:
+        messages = [
+            {"Id": tweet["id"], "MessageBody": tweet["text"]}
+            for tweet in response.data or []
+        ]
+        for batch in index.chunks(data=messages, chunk_size=index.SQS_BATCH_SIZE):
+            sqs.send_message_batch(QueueUrl=index.SQS_QUEUE_URL, Entries=batch)
+        if not (next_token := response.meta.get("next_token")):
+            break
+        response = mentions.get_users_mentions(
+            id=TWITTER_ID,
+            max_results=index.MAX_RESULTS_TWITTER,
+            pagination_token=next_token,
+            **kwargs,
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mentions", type=int, nargs="+", default=[1000, 5000])
+    parser.add_argument("--twitter-latency", type=float, default=0.1)
+    parser.add_argument("--sqs-latency", type=float, default=0.02)
+    parser.add_argument("--failure-rate", type=float, default=0.01)
+    args = parser.parse_args()
+
+    ssm_client.set_factory(
+        lambda: FakeSSM({"TWITTER_ID": TWITTER_ID, "TWITTER_BEARER_TOKEN": "token"})
+    )
+    print(f"{'mentions':>9}{'strategy':>12}{'seconds':>10}{'queued':>8}")
+    for count in args.mentions:
+        for name in ["sequential", "pipelined"]:
+            mentions = FakeMentions(latency=args.twitter_latency)
+            for i in range(count):
+                mentions.add_mention(f"@AusPolDonations #mention{i}")
+            sqs = FakeSQS(latency=args.sqs_latency, failure_rate=args.failure_rate)
+            index.tweepy_client.set_factory(lambda: mentions)
+            index.s3_client.set_factory(FakeS3)
+            index.sqs_client.set_factory(lambda: sqs)
+
+            start = time.perf_counter()
+            if name == "sequential":
+                sequential_poll(mentions=mentions, sqs=sqs)
+            else:
+                index.poll_mentions()
+            elapsed = time.perf_counter() - start
+            queued = len(set(m["Id"] for m in sqs.messages))
+            print(f"{count:>9}{name:>12}{elapsed:>10.2f}{queued:>8}")
+
+
+if __name__ == "__main__":
+    main()
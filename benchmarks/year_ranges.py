@@ -0,0 +1,186 @@
+"""
+Measure what storing each donor's donations as per financial year prefix sums
+costs in space, and what it saves when totalling a range of years.
+
+Storage compares the donations in donors.db, as prefix sums per party per year,
+against the two buckets, the most recent financial year and everything before it,
+which donors.db and donors.json held before, and against today's donors.json.
+
+Queries total every party over a random range of years for random donors, once
+from the prefix sums, one subtraction per party, and once by summing the party's
+amount in each year of the range, over the database's years and then over
+synthetic donors with --years years.
+
+Requires the database, run `python data/build_db.py` first.
+
+    python benchmarks/year_ranges.py [--queries 20000] [--years 20]
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+ROOT_DIR = Path(__file__).parent.parent
+BOT_PATH = ROOT_DIR / "donationsbot" / "functions" / "bot"
+DATA_PATH = BOT_PATH / "bot" / "data"
+
+sys.path.insert(0, str(BOT_PATH))
+
+from bot.db import (  # noqa: E402
+    SECTION_CUMSUMS,
+    SECTION_DONORS,
+    SECTION_SERIES,
+    DonorDatabase,
+)
+from bot.replies import format_money  # noqa: E402
+from bot.series import DonationSeries  # noqa: E402
+
+# the two bucket records, (name, first donation, recent count, earlier count)
+# and (party, amount)
+LEGACY_DONOR_SIZE = 16
+LEGACY_DONATION_SIZE = 16
+SYNTHETIC_DONORS = 1000
+SYNTHETIC_PARTIES = ["ALP", "LIB", "NAT", "LNP", "GRN", "UAP"]
+# passes over the queries, the fastest is reported
+REPEAT = 5
+
+Query = Tuple[DonationSeries, Dict[str, Dict[str, int]], range]
+
+
+def legacy_buckets(series: DonationSeries) -> Dict[str, List[List[str]]]:
+    recent = range(len(series.years) - 1, len(series.years))
+    return dict(
+        (bucket, [[party, format_money(amount)] for party, amount in totals])
+        for bucket, totals in [
+            ("fy_20_21", series.totals(recent)),
+            ("fy_earlier", series.totals(range(recent.start))),
+        ]
+    )
+
+
+def report_storage(database: DonorDatabase) -> None:
+    donors = [database.donors.by_index(index) for index in range(len(database.donors))]
+    legacy = [legacy_buckets(series) for series in donors]
+    legacy_json = len(json.dumps(dict(zip(database.donors, legacy))).encode())
+    legacy_binary = LEGACY_DONOR_SIZE * len(donors) + LEGACY_DONATION_SIZE * sum(
+        len(buckets["fy_20_21"]) + len(buckets["fy_earlier"]) for buckets in legacy
+    )
+    binary = sum(
+        database.section(name)[1]
+        for name in [SECTION_DONORS, SECTION_SERIES, SECTION_CUMSUMS]
+    )
+    series = sum(len(each.cumulative) for each in donors)
+    years = len(database.meta["financial_years"])
+    print(
+        f"{len(donors)} donors, {series} party series over {years} financial "
+        "years\n"
+    )
+    print(f"{'storage':<40}{'bytes':>12}{'vs donors.json':>16}")
+    for name, size in [
+        ("two buckets, donors.json", legacy_json),
+        ("two buckets, donors.db", legacy_binary),
+        ("prefix sums, donors.json", (DATA_PATH / "donors.json").stat().st_size),
+        ("prefix sums, donors.db", binary),
+    ]:
+        print(f"{name:<40}{size:>12,}{size / legacy_json:>16.0%}")
+
+
+def make_queries(donors: List[DonationSeries], count: int) -> List[Query]:
+    queries = []
+    for _ in range(count):
+        series = random.choice(donors)
+        first = random.randrange(len(series.years))
+        last = random.randrange(first, len(series.years))
+        queries.append((series, series.to_amounts(), range(first, last + 1)))
+    return queries
+
+
+def prefix_sums(query: Query) -> list:
+    series, _, years = query
+    return series.totals(years)
+
+
+def year_by_year(query: Query) -> list:
+    series, amounts, years = query
+    span = series.years[years.start : years.stop]
+    totals = [
+        (party, sum(by_year.get(year, 0) for year in span))
+        for party, by_year in amounts.items()
+    ]
+    return sorted(
+        ((party, amount) for party, amount in totals if amount),
+        key=lambda donation: donation[1],
+        reverse=True,
+    )
+
+
+def time_queries(queries: List[Query], function: Callable[[Query], list]) -> float:
+    """ns per query, the fastest of REPEAT passes"""
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter_ns()
+        for query in queries:
+            function(query)
+        best = min(best, time.perf_counter_ns() - start)
+    return best / len(queries)
+
+
+def report_queries(name: str, queries: List[Query]) -> None:
+    for query in queries:
+        if prefix_sums(query) != year_by_year(query):
+            sys.exit(f"{name}: prefix sums and year by year totals differ")
+    prefix_ns = time_queries(queries, prefix_sums)
+    year_ns = time_queries(queries, year_by_year)
+    print(
+        f"{name:<28}{prefix_ns:>12,.0f}{year_ns:>18,.0f}{year_ns / prefix_ns:>9.1f}x"
+    )
+
+
+def synthetic_donors(years: int) -> List[DonationSeries]:
+    financial_years = [f"{2000 + year}-{(year + 1) % 100:02}" for year in range(years)]
+    return [
+        DonationSeries.from_amounts(
+            financial_years,
+            dict(
+                (
+                    party,
+                    dict(
+                        (year, random.randrange(100, 100_000))
+                        for year in financial_years
+                        if random.random() < 0.5
+                    ),
+                )
+                for party in random.sample(SYNTHETIC_PARTIES, random.randint(1, 4))
+            ),
+        )
+        for _ in range(SYNTHETIC_DONORS)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=20_000)
+    parser.add_argument("--years", type=int, default=20, help="of synthetic donors")
+    args = parser.parse_args()
+    random.seed(0)
+
+    database = DonorDatabase(DATA_PATH / "donors.db")
+    report_storage(database)
+
+    print(f"\n{'query':<28}{'prefix ns':>12}{'year by year ns':>18}{'speedup':>10}")
+    donors = [database.donors.by_index(index) for index in range(len(database.donors))]
+    years = len(database.meta["financial_years"])
+    report_queries(f"database, {years} years", make_queries(donors, args.queries))
+    report_queries(
+        f"synthetic, {args.years} years",
+        make_queries(synthetic_donors(args.years), args.queries),
+    )
+    database.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,302 @@
+"""
+Write the bot database as a compact binary file which the bot lambda can mmap.
+
+The file is a small header, a directory of named sections, then the sections
+themselves. All strings live once in a shared string table and are referenced by
+(offset, length). Donors and twitter handles are stored sorted by their UTF-8 key
+so the bot can binary search them without decoding anything it doesn't need.
+
+Layout (all integers little endian):
+
+    header      magic (4s) | version (H) | section count (H)
+    directory   section count * [ name (8s) | offset (I) | length (I) ]
+    strings     UTF-8 bytes
+    donors      [ name offset (I) | name length (I) | first series (I)
+                | series count (H) ], sorted by name
+    series      [ party offset (I) | party length (I) ], per party a donor gave
+                to, see bot/series.py
+    cumsums     [ total (q) ], per series, one per financial year in meta: the
+                prefix sums of what the donor gave the party each year
+    handles     [ handle offset (I) | handle length (I) | first ref (I)
+                | ref count (I) | first segment (I) | segment count (I) ],
+                sorted by handle
+    handle_refs [ donor index (I) ]
+    segments    [ text offset (I) | text length (I) | weight (H) | kind (B) ], the
+                precomputed reply for each handle, see bot/fitting.py
+    trigrams    [ first posting (I) ], indexed by trigram code, see bot/fuzzy.py,
+                with one more entry for the end of the last trigram's postings
+    postings    [ donor index (I) ], the donors indexed under each trigram
+    name_tgs    [ first name trigram (I) ], per donor, with one more entry for
+                the end of the last donor's trigrams
+    tg_codes    [ trigram code (I) ], every trigram of each donor's name
+    meta        UTF-8 JSON, e.g. {"recent_year": "2020-21",
+                "financial_years": ["2018-19", "2019-20", "2020-21"]}
+    ac_nodes    [ first edge (I) | first output (I) | failure state (I) ], per
+                state of the automaton of handles and aliases, see bot/mentions.py,
+                with one more entry for the end of the last state's edges and
+                outputs
+    ac_edges    [ character (I) | next state (I) ], per state
+    ac_outs     [ pattern (I) ], the patterns which end in each state
+    patterns    [ key offset (I) | key length (I) | length (H) | kind (B) ]
+    parties     [ code offset (I) | code length (I) | first top list (I)
+                | top list count (H) ], sorted by party code
+    tops        [ financial year (H) | first top donor (I) | top donor count (H) ],
+                per party, the financial year an index into meta's
+    top_dons    [ donor index (I) | amount (q) ], per top list, biggest first
+    phandles    [ handle offset (I) | handle length (I) | code offset (I)
+                | code length (I) ], sorted by handle
+
+The structs and section names are imported from donationsbot/functions/bot/bot/db.py,
+which reads the file, so the writer and the reader can't disagree about the layout.
+"""
+
+import json
+import struct
+import sys
+from pathlib import Path
+from typing import Dict, List, Mapping, Sequence, Tuple
+
+BOT_PATH = Path(__file__).parent.parent / "donationsbot" / "functions" / "bot"
+sys.path.insert(0, str(BOT_PATH))
+from bot.db import (  # noqa: E402
+    DONOR,
+    EDGE,
+    HANDLE,
+    HEADER,
+    MAGIC,
+    NAME_TRIGRAM,
+    NODE,
+    OUTPUT,
+    PARTY,
+    PARTY_HANDLE,
+    PATTERN,
+    POSTING,
+    REF,
+    SECTION,
+    SECTION_CUMSUMS,
+    SECTION_DONORS,
+    SECTION_EDGES,
+    SECTION_HANDLE_REFS,
+    SECTION_HANDLES,
+    SECTION_META,
+    SECTION_NAME_TRIGRAMS,
+    SECTION_NODES,
+    SECTION_OUTPUTS,
+    SECTION_PARTIES,
+    SECTION_PARTY_HANDLES,
+    SECTION_PATTERNS,
+    SECTION_POSTINGS,
+    SECTION_SEGMENTS,
+    SECTION_SERIES,
+    SECTION_STRINGS,
+    SECTION_TOP_DONORS,
+    SECTION_TOP_LISTS,
+    SECTION_TRIGRAM_CODES,
+    SECTION_TRIGRAMS,
+    SEGMENT,
+    SERIES,
+    TOP_DONOR,
+    TOP_LIST,
+    TRIGRAM,
+    TRIGRAM_CODE,
+    VERSION,
+)
+
+# list of (party, prefix sums per financial year), in the order parties should be
+# displayed when their amounts are tied
+Series = Sequence[Tuple[str, Sequence[int]]]
+# list of (kind, text, weight) segments, see bot/fitting.py
+Segments = Sequence[Tuple[int, str, int]]
+# financial year -> [(donor, amount)], biggest first
+TopDonors = Mapping[str, Sequence[Tuple[str, int]]]
+# list of (text, key, kind) patterns, see bot/mentions.py
+Patterns = Sequence[Tuple[str, str, int]]
+# (transitions, failure transitions, outputs) per state, see bot/mentions.py
+Automaton = Tuple[Sequence[Mapping[str, int]], Sequence[int], Sequence[Sequence[int]]]
+
+
+class StringTable:
+    def __init__(self) -> None:
+        self._offsets: Dict[str, Tuple[int, int]] = {}
+        self._buffer = bytearray()
+
+    def add(self, value: str) -> Tuple[int, int]:
+        if (ref := self._offsets.get(value)) is None:
+            encoded = value.encode()
+            ref = (len(self._buffer), len(encoded))
+            self._buffer.extend(encoded)
+            self._offsets[value] = ref
+        return ref
+
+    def to_bytes(self) -> bytes:
+        return bytes(self._buffer)
+
+
+def _sort_key(value: str) -> bytes:
+    return value.encode()
+
+
+def write_database(
+    path: Path,
+    twitter_handles: Mapping[str, List[str]],
+    donors: Mapping[str, Series],
+    replies: Mapping[str, Segments],
+    donor_trigrams: Mapping[str, Tuple[Sequence[int], Sequence[int]]],
+    recent_year: str,
+    financial_years: Sequence[str],
+    parties: Mapping[str, TopDonors],
+    party_handles: Mapping[str, str],
+    patterns: Patterns,
+    automaton: Automaton,
+) -> None:
+    """
+    twitter_handles maps a lowercase handle to a list of donor names, donors maps a
+    donor name to its series, the prefix sums per financial year of each party it
+    gave to, and replies maps a handle to the precomputed segments of its reply.
+    donor_trigrams maps a donor name to the codes of (all its trigrams, the
+    trigrams to index it under).
+    parties maps a party code to its top donors in each financial year, and
+    party_handles maps a lowercase party handle to its party code.
+    automaton finds patterns, the handles and aliases a tweet can mention.
+    """
+    strings = StringTable()
+    donor_names = sorted(donors, key=_sort_key)
+    donor_index = {name: index for index, name in enumerate(donor_names)}
+
+    cumsums = struct.Struct(f"<{len(financial_years)}q")
+    donor_section = bytearray()
+    series_section = bytearray()
+    cumsum_section = bytearray()
+    series_count = 0
+    for name in donor_names:
+        series = donors[name]
+        donor_section += DONOR.pack(*strings.add(name), series_count, len(series))
+        for party, sums in series:
+            series_section += SERIES.pack(*strings.add(party))
+            cumsum_section += cumsums.pack(*sums)
+        series_count += len(series)
+
+    handle_section = bytearray()
+    handle_ref_section = bytearray()
+    segment_section = bytearray()
+    ref_count = 0
+    segment_count = 0
+    for handle in sorted(twitter_handles, key=_sort_key):
+        refs = [donor_index[donor] for donor in twitter_handles[handle]]
+        segments = replies[handle]
+        handle_section += HANDLE.pack(
+            *strings.add(handle), ref_count, len(refs), segment_count, len(segments)
+        )
+        for ref in refs:
+            handle_ref_section += REF.pack(ref)
+        ref_count += len(refs)
+        for kind, text, weight in segments:
+            segment_section += SEGMENT.pack(*strings.add(text), weight, kind)
+        segment_count += len(segments)
+
+    year_index = {year: index for index, year in enumerate(financial_years)}
+    party_section = bytearray()
+    top_list_section = bytearray()
+    top_donor_section = bytearray()
+    list_count = 0
+    top_donor_count = 0
+    for party in sorted(parties, key=_sort_key):
+        top_lists = sorted(parties[party].items(), key=lambda item: year_index[item[0]])
+        party_section += PARTY.pack(*strings.add(party), list_count, len(top_lists))
+        for year, top_donors in top_lists:
+            top_list_section += TOP_LIST.pack(
+                year_index[year], top_donor_count, len(top_donors)
+            )
+            for donor, amount in top_donors:
+                top_donor_section += TOP_DONOR.pack(donor_index[donor], amount)
+            top_donor_count += len(top_donors)
+        list_count += len(top_lists)
+
+    party_handle_section = bytearray()
+    for handle in sorted(party_handles, key=_sort_key):
+        party_handle_section += PARTY_HANDLE.pack(
+            *strings.add(handle), *strings.add(party_handles[handle])
+        )
+
+    postings: Dict[int, List[int]] = {}
+    name_trigram_section = bytearray()
+    trigram_code_section = bytearray()
+    code_count = 0
+    for index, name in enumerate(donor_names):
+        codes, indexed_codes = donor_trigrams.get(name, ((), ()))
+        name_trigram_section += NAME_TRIGRAM.pack(code_count)
+        for code in codes:
+            trigram_code_section += TRIGRAM_CODE.pack(code)
+        code_count += len(codes)
+        for code in indexed_codes:
+            postings.setdefault(code, []).append(index)
+    name_trigram_section += NAME_TRIGRAM.pack(code_count)
+
+    trigram_section = bytearray()
+    posting_section = bytearray()
+    posting_count = 0
+    for code in range(max(postings, default=-1) + 1):
+        trigram_section += TRIGRAM.pack(posting_count)
+        for donor_index in postings.get(code, ()):
+            posting_section += POSTING.pack(donor_index)
+            posting_count += 1
+    trigram_section += TRIGRAM.pack(posting_count)
+
+    meta = json.dumps(
+        {"recent_year": recent_year, "financial_years": list(financial_years)}
+    ).encode()
+
+    goto, fail, outputs = automaton
+    node_section = bytearray()
+    edge_section = bytearray()
+    output_section = bytearray()
+    edge_count = 0
+    output_count = 0
+    for state in range(len(goto)):
+        node_section += NODE.pack(edge_count, output_count, fail[state])
+        for character in sorted(goto[state]):
+            edge_section += EDGE.pack(ord(character), goto[state][character])
+        edge_count += len(goto[state])
+        for pattern in outputs[state]:
+            output_section += OUTPUT.pack(pattern)
+        output_count += len(outputs[state])
+    node_section += NODE.pack(edge_count, output_count, 0)
+
+    pattern_section = bytearray()
+    for text, key, kind in patterns:
+        pattern_section += PATTERN.pack(*strings.add(key), len(text), kind)
+
+    sections = [
+        (SECTION_STRINGS, strings.to_bytes()),
+        (SECTION_DONORS, bytes(donor_section)),
+        (SECTION_SERIES, bytes(series_section)),
+        (SECTION_CUMSUMS, bytes(cumsum_section)),
+        (SECTION_HANDLES, bytes(handle_section)),
+        (SECTION_HANDLE_REFS, bytes(handle_ref_section)),
+        (SECTION_SEGMENTS, bytes(segment_section)),
+        (SECTION_TRIGRAMS, bytes(trigram_section)),
+        (SECTION_POSTINGS, bytes(posting_section)),
+        (SECTION_NAME_TRIGRAMS, bytes(name_trigram_section)),
+        (SECTION_TRIGRAM_CODES, bytes(trigram_code_section)),
+        (SECTION_META, meta),
+        (SECTION_NODES, bytes(node_section)),
+        (SECTION_EDGES, bytes(edge_section)),
+        (SECTION_OUTPUTS, bytes(output_section)),
+        (SECTION_PATTERNS, bytes(pattern_section)),
+        (SECTION_PARTIES, bytes(party_section)),
+        (SECTION_TOP_LISTS, bytes(top_list_section)),
+        (SECTION_TOP_DONORS, bytes(top_donor_section)),
+        (SECTION_PARTY_HANDLES, bytes(party_handle_section)),
+    ]
+
+    offset = HEADER.size + SECTION.size * len(sections)
+    directory = bytearray()
+    for name, data in sections:
+        directory += SECTION.pack(name, offset, len(data))
+        offset += len(data)
+
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(sections)))
+        f.write(directory)
+        for _, data in sections:
+            f.write(data)
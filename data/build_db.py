@@ -1,46 +1,116 @@
 """
-Create 2 json files from the markdown tables, which act as the database.
+Create the database from the markdown tables.
 
-- one to map each twitter handle to a set of donors
-- another to map donors to aggregated donation data
+- a json file to map each twitter handle to a set of donors
+- a json file to map donors to their donations per party per financial year
+- a binary file containing both of the above plus the reply for every handle
+  rendered in advance, a trigram index of donor names, and an automaton to find
+  handles and aliases in tweets, which is what the bot loads
+
+Every CSV of every AEC release in src/<year>/ is loaded into a columnar store (see
+columnar.py), kept in build/store.npz, and donations are totalled from it with
+vectorised rollups. The build is incremental: content hashes of each release's
+CSVs, of the tables, and of the bot modules whose output the binary file stores
+are kept in build/manifest.json. Nothing is built if none of them have changed,
+and only releases which have changed are read into the store again. Use --full to
+start from scratch.
+
+Donor names across the returns are joined into entities (see entities.py), kept in
+build/entities.json, and each handle's reply includes the donations made under
+every name of its donors' entities.
 """
 
-import csv
+import argparse
+import hashlib
+import heapq
 import json
+import sys
+import time
 from collections import Counter, defaultdict
 from pathlib import Path
+from typing import Dict, List, Mapping, Tuple
 
+from binary_db import VERSION as DATABASE_VERSION, write_database
+from columnar import Store, Table
+from entities import SOURCES as ENTITY_SOURCES, Entity, name_totals, resolve_entities
 from utils import (
+    DONATIONS_CSV_FILENAME,
+    SOURCE_PATH,
     SOURCE_DONATION_MADE_TO,
     SOURCE_DONOR_NAME,
     SOURCE_FINANCIAL_YEAR,
     SOURCE_VALUE,
+    TARGET_ALIAS,
     TARGET_DONATION_MADE_TO,
     TARGET_DONOR,
     TARGET_PARTY,
     TARGET_TWITTER,
     WhitespaceStrippingDictReader,
+    find_releases,
 )
 
-
-def format_money(amount: int) -> str:
-    return "${:,}".format(amount)
+# reuse the bot's own rendering so precomputed replies are identical to rendering
+# them at runtime.
+BOT_PATH = Path(__file__).parent.parent / "donationsbot" / "functions" / "bot"
+sys.path.insert(0, str(BOT_PATH))
+from bot.db import DonorDatabase  # noqa: E402
+from bot.fitting import fit_segments  # noqa: E402
+from bot.fuzzy import index_trigrams  # noqa: E402
+from bot.mentions import build_automaton, create_patterns  # noqa: E402
+from bot.replies import build_reply_segments  # noqa: E402
+from bot.series import DonationSeries  # noqa: E402
 
 
 ROOT_DIR = Path(__file__).parent.parent
+DATA_PATH = Path(__file__).parent
 LAMBDA_DATA_PATH = ROOT_DIR / "donationsbot" / "functions" / "bot" / "bot" / "data"
 
-TABLES_PATH = Path(__file__).parent / "tables"
+TABLES_PATH = DATA_PATH / "tables"
 
 TABLE_TWITTER_DONORS_PAGE_1 = TABLES_PATH / "twitter_donors_page_1.md"
 TABLE_TWITTER_DONORS_PAGE_2 = TABLES_PATH / "twitter_donors_page_2.md"
 TABLE_PARTIES = TABLES_PATH / "parties.md"
+TABLE_ALIASES = TABLES_PATH / "aliases.md"
+TABLE_PARTY_HANDLES = TABLES_PATH / "party_handles.md"
+TABLES = [
+    TABLE_TWITTER_DONORS_PAGE_1,
+    TABLE_TWITTER_DONORS_PAGE_2,
+    TABLE_PARTIES,
+    TABLE_ALIASES,
+    TABLE_PARTY_HANDLES,
+]
 
-DONATIONS_CSV_FILE = Path(__file__).parent / "src" / "2022" / "Donations Made.csv"
+# donations to recipients which aren't mapped to a party yet
+UNSORTED_PARTY = "[unsorted data]"
+# donors kept for each party in each financial year, biggest first
+TOP_DONORS = 10
 
+# the bot's modules whose output the binary database stores: the replies rendered
+# in advance, the trigram index and the automaton. Changing one rebuilds it.
+BOT_MODULES = [
+    BOT_PATH / "bot" / name
+    for name in ["replies.py", "fitting.py", "series.py", "fuzzy.py", "mentions.py"]
+]
+
+# Cache of what the last build read, so only changed releases are read again.
+# Bump BUILD_VERSION whenever the store changes shape.
+BUILD_PATH = DATA_PATH / "build"
+BUILD_MANIFEST = BUILD_PATH / "manifest.json"
+BUILD_STORE = BUILD_PATH / "store.npz"
+BUILD_VERSION = 2
+
+# the store's table of each release's Donations Made.csv
+DONATIONS_TABLE = Path(DONATIONS_CSV_FILENAME).stem
 
 DB_TWITTER_HANDLES = LAMBDA_DATA_PATH / "twitter.json"
 DB_DONOR = LAMBDA_DATA_PATH / "donors.json"
+DB_BINARY = LAMBDA_DATA_PATH / "donors.db"
+# canonical donor entities, see entities.py
+DB_ENTITIES = BUILD_PATH / "entities.json"
+OUTPUTS = [DB_TWITTER_HANDLES, DB_DONOR, DB_BINARY, DB_ENTITIES]
+
+# financial year -> donor -> donation made to -> total
+Donations = Dict[str, Dict[str, Dict[str, int]]]
 
 
 def create_db_twitter_to_donors():
@@ -55,6 +125,7 @@ def create_db_twitter_to_donors():
                     data[handle.lower()].append(row[TARGET_DONOR])
     with open(DB_TWITTER_HANDLES, "w") as f:
         json.dump(data, fp=f)
+    return data
 
 
 def get_donations_made_to_party_mapping():
@@ -68,51 +139,449 @@ def get_donations_made_to_party_mapping():
     return data
 
 
-def format_donation(donation):
-    return [donation[0], format_money(donation[1])]
+def get_aliases():
+    """Maps each alias to the handle it stands for."""
+    data = dict()
+    with open(TABLE_ALIASES) as f:
+        reader = WhitespaceStrippingDictReader(f=f, delimiter="|")
+        for row in reader:
+            if "---" in row[TARGET_ALIAS]:
+                continue
+            data[row[TARGET_ALIAS]] = row[TARGET_TWITTER].lower()
+    return data
+
+
+def get_party_handles():
+    """Maps each party handle to the party's code in parties.md."""
+    data = dict()
+    with open(TABLE_PARTY_HANDLES) as f:
+        reader = WhitespaceStrippingDictReader(f=f, delimiter="|")
+        for row in reader:
+            if "---" in row[TARGET_TWITTER]:
+                continue
+            data[row[TARGET_TWITTER].lower()] = row[TARGET_PARTY]
+    return data
+
+
+def drop_party_handles_without_donors(party_handles, parties, twitter_handles):
+    data = dict()
+    for handle, party in party_handles.items():
+        if handle in twitter_handles:
+            print(f"WARNING: party handle {handle} is also a donor's handle")
+        elif party not in parties:
+            print(f"WARNING: party handle {handle} maps to {party} which has no donors")
+        else:
+            data[handle] = party
+    return data
+
+
+def drop_aliases_without_replies(aliases, twitter_handles):
+    data = dict()
+    for alias, handle in aliases.items():
+        if handle in twitter_handles:
+            data[alias] = handle
+        else:
+            print(f"WARNING: alias {alias!r} maps to {handle} which has no donations")
+    return data
 
 
 class DonationStats:
-    fy_2020_21: Counter
-    fy_earlier: Counter
+    # party -> financial year -> amount, parties in the order they were first seen
+    amounts: Dict[str, Counter]
 
     def __init__(self) -> None:
-        self.fy_2020_21 = Counter()
-        self.fy_earlier = Counter()
+        self.amounts = defaultdict(Counter)
 
-    def to_json(self):
-        return {
-            "fy_20_21": [format_donation(d) for d in self.fy_2020_21.most_common()],
-            "fy_earlier": [format_donation(d) for d in self.fy_earlier.most_common()],
-        }
+    def to_series(self, financial_years) -> DonationSeries:
+        return DonationSeries.from_amounts(financial_years, self.amounts)
+
+
+#
+# Sources
+#
+
+
+def hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def hash_release(path: Path) -> str:
+    """A hash of the names and contents of every CSV in a release."""
+    digest = hashlib.sha256()
+    for csv_path in sorted(path.glob("*.csv")):
+        digest.update(csv_path.name.encode())
+        digest.update(hash_file(csv_path).encode())
+    return digest.hexdigest()
+
+
+def replace_pipes(table: Table, columns: List[str]) -> Table:
+    # we mapped "|" to "/" in other files to avoid breaking markdown tables so do
+    # the same here
+    for column in columns:
+        table = table.map_strings(column, lambda value: value.replace("|", "/"))
+    return table
+
+
+def aggregate_donations(table: Table) -> Donations:
+    """
+    Total the donations in one release. Donations are kept by who they were made
+    to rather than by party, so the party mapping can change without reading the
+    release again.
+    """
+    table = replace_pipes(table, [SOURCE_DONOR_NAME, SOURCE_DONATION_MADE_TO])
+    (years, donors, donations_made_to), totals = table.rollup(
+        by=[SOURCE_FINANCIAL_YEAR, SOURCE_DONOR_NAME, SOURCE_DONATION_MADE_TO],
+        value=SOURCE_VALUE,
+    )
+    data = defaultdict(lambda: defaultdict(dict))
+    for financial_year, donor, donation_made_to, total in zip(
+        years.tolist(), donors.tolist(), donations_made_to.tolist(), totals.tolist()
+    ):
+        data[financial_year][donor][donation_made_to] = total
+    return data
+
+
+def merge_donations(releases: Mapping[str, Donations]) -> Donations:
+    """
+    Every release includes all financial years reported so far, and returns can be
+    amended after the fact, so take each financial year from the latest release
+    which has it.
+    """
+    data = dict()
+    for release in sorted(releases, key=int):
+        data.update(releases[release])
+    return data
 
 
-def create_db_donor_stats():
+def create_db_donor_stats(donations: Donations):
+    """
+    Each donor's series of donations per party per financial year. Returns the
+    series, and the financial years in the data, oldest first.
+    """
+    # financial years look like "2020-21", so they sort oldest first
+    financial_years = sorted(donations)
     data = defaultdict(DonationStats)
     # first, map "donations made to" to party
     donations_made_to_party_mapping = get_donations_made_to_party_mapping()
     # now maps donations to political partes.
-    with open(DONATIONS_CSV_FILE) as donations_csv_file:
-        reader = csv.DictReader(f=donations_csv_file)
-        for row in reader:
-            # we mapped "|" to "/" in other files to avoid breaking markdown tables
-            # so do the same here
-            donation_made_to = row[SOURCE_DONATION_MADE_TO].replace("|", "/")
-            if not (party := donations_made_to_party_mapping.get(donation_made_to)):
-                # our "donations made to" to party mapping isn't ready yet, just
-                # put a placeholder in until we're done.
-                party = "[unsorted data]"
-            donor = row[SOURCE_DONOR_NAME].replace("|", "/")
-            donation = {party: int(row[SOURCE_VALUE])}
-            if row[SOURCE_FINANCIAL_YEAR] == "2020-21":
-                data[donor].fy_2020_21.update(donation)
-            else:
-                data[donor].fy_earlier.update(donation)
+    for financial_year in financial_years:
+        for donor, totals in donations[financial_year].items():
+            stats = data[donor]
+            for donation_made_to, value in totals.items():
+                if not (party := donations_made_to_party_mapping.get(donation_made_to)):
+                    # our "donations made to" to party mapping isn't ready yet, just
+                    # put a placeholder in until we're done.
+                    party = UNSORTED_PARTY
+                stats.amounts[party][financial_year] += value
 
+    series = dict((k, v.to_series(financial_years)) for k, v in data.items())
     with open(DB_DONOR, "w") as donor_db_file:
-        json.dump(dict(((k, v.to_json()) for k, v in data.items())), donor_db_file)
+        json.dump(dict((k, v.to_amounts()) for k, v in series.items()), donor_db_file)
+    return series, financial_years
+
+
+def create_party_index(donors: Mapping[str, DonationSeries], financial_years):
+    """
+    The reverse of the donor stats: each party's TOP_DONORS donors in each
+    financial year, as party -> financial year -> [(donor, amount)], biggest first.
+    """
+    data = defaultdict(lambda: defaultdict(list))
+    for donor, series in donors.items():
+        for index, financial_year in enumerate(financial_years):
+            for party, amount in series.totals(range(index, index + 1)):
+                if party != UNSORTED_PARTY:
+                    data[party][financial_year].append((donor, amount))
+    return dict(
+        (
+            party,
+            dict(
+                (
+                    financial_year,
+                    heapq.nsmallest(
+                        TOP_DONORS, donations, key=lambda d: (-d[1], d[0])
+                    ),
+                )
+                for financial_year, donations in by_year.items()
+            ),
+        )
+        for party, by_year in data.items()
+    )
+
+
+def create_entities(store: Store, releases: Mapping[str, Path]) -> List[Entity]:
+    """Join the donor names in every release's returns into entities."""
+    start = time.perf_counter()
+    tables = dict(
+        (
+            release,
+            dict(
+                (table_name, replace_pipes(table, [name_column]))
+                for table_name, name_column, _ in ENTITY_SOURCES
+                if (table := store.table(release, table_name)) is not None
+            ),
+        )
+        for release in releases
+    )
+    totals = name_totals(tables)
+    entities = resolve_entities(totals)
+    elapsed = time.perf_counter() - start
+    names = len(set().union(*totals.values()))
+    merged = sum(len(entity.variants) > 1 for entity in entities)
+    print(
+        f"resolved {names} donor names into {len(entities)} entities, {merged} "
+        f"with more than one name, in {elapsed * 1000:.0f}ms"
+    )
+    return entities
+
+
+def find_entity_variants(twitter_handles, entities: List[Entity], donors):
+    """
+    The other names each handle's donors gave under, so e.g. "X Pty Ltd" and
+    "X Pty. Limited" don't have to be mapped one by one.
+    """
+    variants = dict(
+        (name, entity.variants) for entity in entities for name in entity.variants
+    )
+    data = dict()
+    for handle, donor_set in twitter_handles.items():
+        found = []
+        for donor in donor_set:
+            for variant in variants.get(donor, ()):
+                if variant in donors and variant not in donor_set + found:
+                    found.append(variant)
+        if found:
+            data[handle] = found
+    count = sum(len(found) for found in data.values())
+    print(f"found {count} more names for the donors of {len(data)} handles")
+    return data
+
+
+def write_entities(entities: List[Entity], donors) -> None:
+    """Each entity with its names' donations merged, see entities.py"""
+    data = dict()
+    for entity in entities:
+        series = [donors[name] for name in entity.variants if name in donors]
+        data[entity.name] = {
+            "variants": entity.variants,
+            "totals": entity.totals,
+            "donations": DonationSeries.combine(series).to_amounts(),
+        }
+    BUILD_PATH.mkdir(parents=True, exist_ok=True)
+    with open(DB_ENTITIES, "w") as f:
+        json.dump(data, fp=f)
+
+
+def drop_donors_without_donations(twitter_handles, donors):
+    data = dict()
+    for handle, donor_set in twitter_handles.items():
+        for donor in donor_set:
+            if donor not in donors:
+                print(f"WARNING: {handle} maps to {donor!r} which has no donations")
+        if donor_set := [donor for donor in donor_set if donor in donors]:
+            data[handle] = donor_set
+    return data
+
+
+def create_replies(twitter_handles, variants, donors, recent_year: str):
+    replies = dict()
+    start = time.process_time()
+    for handle, donor_set in twitter_handles.items():
+        replies[handle] = build_reply_segments(
+            donor_set=donor_set,
+            donors=donors,
+            recent_year=recent_year,
+            variants=variants.get(handle, ()),
+        )
+    render_seconds = time.process_time() - start
+    return replies, render_seconds
+
+
+def report_reply_savings(render_seconds: float) -> None:
+    # at runtime a reply is now a lookup of the first handle, and fitting its
+    # segments after the recipients, instead of combining donor data and building
+    # the segments.
+    database = DonorDatabase(DB_BINARY)
+    handles = list(database.replies)
+    start = time.process_time()
+    for handle in handles:
+        fit_segments(prefix=handle, segments=database.replies[handle])
+    lookup_seconds = time.process_time() - start
+    count = len(handles)
+    print(
+        f"precomputed {count} replies: "
+        f"rendering {render_seconds / count * 1e6:.1f}us/reply, "
+        f"lookup {lookup_seconds / count * 1e6:.1f}us/reply, "
+        f"saving {(render_seconds - lookup_seconds) / count * 1e6:.1f}us "
+        "CPU per reply"
+    )
+    database.close()
+
+
+#
+# Incremental build
+#
+
+
+def load_manifest() -> dict:
+    try:
+        with open(BUILD_MANIFEST) as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return {}
+    return manifest if manifest.get("version") == BUILD_VERSION else {}
+
+
+def load_store(
+    releases: Mapping[str, Path], release_hashes, manifest
+) -> Tuple[Store, List[str]]:
+    """
+    Read each release whose CSVs have changed since the last build into the store,
+    reusing the tables of those which haven't. Returns the store and the releases
+    which were read.
+    """
+    previous_hashes = manifest.get("sources", {})
+    if previous_hashes and BUILD_STORE.exists():
+        store = Store.load(BUILD_STORE)
+    else:
+        store = Store()
+    removed = store.releases() - set(releases)
+    for release in removed:
+        store.drop_release(release)
+    read = []
+    for release, path in releases.items():
+        if (
+            previous_hashes.get(release) == release_hashes[release]
+            and release in store.releases()
+        ):
+            continue
+        store.read_release(release, path)
+        read.append(release)
+    if read or removed:
+        store.save(BUILD_STORE)
+    return store, read
+
+
+def load_donations(store: Store, releases: Mapping[str, Path]) -> Donations:
+    donations = dict()
+    for release in releases:
+        if (table := store.table(release, DONATIONS_TABLE)) is not None:
+            donations[release] = aggregate_donations(table)
+    if not donations:
+        raise FileNotFoundError(f"no {DONATIONS_CSV_FILENAME} in {SOURCE_PATH}/*/")
+    return merge_donations(donations)
+
+
+def hash_inputs(releases: Mapping[str, Path]) -> dict:
+    """Hashes of everything the outputs are built from, see load_manifest."""
+    return {
+        "sources": dict(
+            (release, hash_release(path)) for release, path in releases.items()
+        ),
+        "tables": dict(
+            (str(path.relative_to(DATA_PATH)), hash_file(path)) for path in TABLES
+        ),
+        "bot_modules": dict(
+            (str(path.relative_to(BOT_PATH)), hash_file(path)) for path in BOT_MODULES
+        ),
+        # the binary database is rewritten when its format changes
+        "database_version": DATABASE_VERSION,
+    }
+
+
+def is_up_to_date(manifest: dict, inputs: dict) -> bool:
+    """Whether the last build was from the same inputs, and its outputs are there."""
+    unchanged = all(manifest.get(name) == value for name, value in inputs.items())
+    return unchanged and all(path.exists() for path in OUTPUTS)
+
+
+def build(full: bool = False) -> None:
+    start = time.perf_counter()
+    manifest = {} if full else load_manifest()
+    releases = find_releases()
+    inputs = hash_inputs(releases)
+    release_hashes = inputs["sources"]
+    if is_up_to_date(manifest, inputs):
+        print(f"up to date, {len(releases)} releases unchanged")
+        return
+
+    store, read = load_store(releases, release_hashes, manifest)
+    donations = load_donations(store, releases)
+    twitter_handles = create_db_twitter_to_donors()
+    donor_stats, financial_years = create_db_donor_stats(donations)
+    recent_year = financial_years[-1]
+    entities = create_entities(store, releases)
+    write_entities(entities, donor_stats)
+    twitter_handles = drop_donors_without_donations(twitter_handles, donor_stats)
+    replies, render_seconds = create_replies(
+        twitter_handles=twitter_handles,
+        variants=find_entity_variants(twitter_handles, entities, donor_stats),
+        donors=donor_stats,
+        recent_year=recent_year,
+    )
+    aliases = drop_aliases_without_replies(get_aliases(), twitter_handles)
+    parties = create_party_index(donor_stats, financial_years)
+    party_handles = drop_party_handles_without_donors(
+        get_party_handles(), parties, twitter_handles
+    )
+    patterns = create_patterns(
+        handles=[*twitter_handles, *party_handles], aliases=aliases
+    )
+    write_database(
+        path=DB_BINARY,
+        twitter_handles=twitter_handles,
+        donors=dict(
+            (k, list(v.cumulative.items())) for k, v in donor_stats.items()
+        ),
+        replies=replies,
+        donor_trigrams=index_trigrams(donor_stats),
+        recent_year=recent_year,
+        financial_years=financial_years,
+        parties=parties,
+        party_handles=party_handles,
+        patterns=patterns,
+        automaton=build_automaton([pattern.text for pattern in patterns]),
+    )
+    elapsed = time.perf_counter() - start
+
+    is_full = len(read) == len(releases)
+    full_build_seconds = elapsed if is_full else manifest.get("full_build_seconds")
+    BUILD_PATH.mkdir(parents=True, exist_ok=True)
+    with open(BUILD_MANIFEST, "w") as f:
+        json.dump(
+            {
+                "version": BUILD_VERSION,
+                **inputs,
+                "full_build_seconds": full_build_seconds,
+            },
+            f,
+            indent=2,
+        )
+
+    print(
+        f"read {len(read)} of {len(releases)} releases "
+        f"({', '.join(read) or 'none'}) into the store, {len(store.tables)} tables, "
+        f"most recent financial year {recent_year}"
+    )
+    if is_full:
+        print(f"full build in {elapsed:.2f}s")
+    elif full_build_seconds:
+        print(
+            f"incremental build in {elapsed:.2f}s, "
+            f"vs {full_build_seconds:.2f}s for a full build"
+        )
+    else:
+        print(f"incremental build in {elapsed:.2f}s")
+    report_reply_savings(render_seconds=render_seconds)
 
 
 if __name__ == "__main__":
-    create_db_twitter_to_donors()
-    create_db_donor_stats()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--full", action="store_true", help="ignore the previous build and start over"
+    )
+    args = parser.parse_args()
+    build(full=args.full)
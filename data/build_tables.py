@@ -1,13 +1,13 @@
 """
 Map twitter handles to donors in markdown to make it easy to collaborate
+
+The donations CSV is read once, with every row fed to each of the aggregators, and
+the tables are written straight out as markdown, in the same format as csv2md.
 """
 
 import csv
 from collections import Counter, defaultdict
-from io import StringIO
-from typing import DefaultDict
-
-from csv2md.table import Table
+from typing import DefaultDict, Iterable, List, Sequence, TextIO
 
 from utils import (
     WhitespaceStrippingDictReader,
@@ -19,6 +19,7 @@ from utils import (
     TARGET_PARTY,
     TARGET_TOTAL_DONATIONS,
     TARGET_TWITTER,
+    find_donation_sources,
 )
 
 
@@ -26,11 +27,80 @@ def format_money(amount: int) -> str:
     return "${:,}".format(amount)
 
 
-DONATIONS_FILE = "src/2022/Donations Made.csv"
 TWITTER_MAPPING_MARKDOWN_FILE_PAGE_1 = "tables/twitter_donors_page_1.md"
 TWITTER_MAPPING_MARKDOWN_FILE_PAGE_2 = "tables/twitter_donors_page_2.md"
 PARTY_GROUPS_MARKDOWN_FILE = "tables/parties.md"
 
+# donors who've given more than this in total go on the first page
+PAGE_1_MINIMUM_DONATIONS = 50000
+
+
+def get_donations_file() -> str:
+    # every release includes all the financial years reported so far
+    return str(list(find_donation_sources().values())[-1])
+
+
+#
+# Aggregation
+#
+
+
+class TotalBy:
+    """Total the value of donations by one column of the donations CSV."""
+
+    def __init__(self, column: str) -> None:
+        self.column = column
+        self.totals: Counter = Counter()
+
+    def start(self, header: List[str]) -> None:
+        self._key = header.index(self.column)
+        self._value = header.index(SOURCE_VALUE)
+
+    def add(self, row: List[str]) -> None:
+        self.totals[row[self._key]] += int(row[self._value])
+
+
+def aggregate(donations_file: str, aggregators: Sequence[TotalBy]) -> None:
+    """Feed every row of the donations CSV to each aggregator, in a single pass."""
+    with open(donations_file) as csv_file:
+        reader = csv.reader(csv_file)
+        header = next(reader)
+        for aggregator in aggregators:
+            aggregator.start(header)
+        adds = [aggregator.add for aggregator in aggregators]
+        for row in reader:
+            # csv.DictReader skips blank lines, so do the same
+            if not row:
+                continue
+            for add in adds:
+                add(row)
+
+
+#
+# Markdown
+#
+
+
+def write_markdown_table(
+    f: TextIO, header: Sequence[str], rows: Iterable[Sequence[str]]
+) -> None:
+    """
+    Write a table, with every column padded to its widest cell. The output is the
+    same as csv2md's, without going through a CSV file.
+    """
+    rows = [header, *rows]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+
+    def format_row(row):
+        return "| " + " | ".join(c.ljust(w) for c, w in zip(row, widths)) + " |"
+
+    f.write(format_row(header))
+    f.write("\n")
+    f.write(format_row(["-" * width for width in widths]))
+    for row in rows[1:]:
+        f.write("\n")
+        f.write(format_row(row))
+
 
 #
 # Twitter handles
@@ -55,53 +125,28 @@ def get_existing_twitter_handles() -> DefaultDict:
     return twitter_handles
 
 
-def build_twitter_donor_table() -> None:
+def build_twitter_donor_table(donor_totals: Counter) -> None:
 
     # load any existing twitter handles
     twitter_handles = get_existing_twitter_handles()
 
-    # use Counter() to add all donations from same donor
-    counter = Counter()
-    with open(DONATIONS_FILE) as csv_file:
-        reader = csv.DictReader(csv_file)
-        for row in reader:
-            counter.update({row[SOURCE_DONOR_NAME]: int(row[SOURCE_VALUE])})
-
-    # create a new temporary csv file to render as markdown
-    with StringIO() as temp_csv_file_page_1:
-        with StringIO() as temp_csv_file_page_2:
-            writer_page_1 = csv.DictWriter(
-                f=temp_csv_file_page_1,
-                fieldnames=[TARGET_TWITTER, TARGET_DONOR, TARGET_TOTAL_DONATIONS],
+    page_1, page_2 = [], []
+    for donor, value in donor_totals.most_common():
+        page = page_1 if value > PAGE_1_MINIMUM_DONATIONS else page_2
+        page.append(
+            (
+                twitter_handles[donor],
+                # replace "|" characters to avoid messing with markdown tables
+                donor.replace("|", "/"),
+                format_money(value),
             )
-            writer_page_2 = csv.DictWriter(
-                f=temp_csv_file_page_2,
-                fieldnames=[TARGET_TWITTER, TARGET_DONOR, TARGET_TOTAL_DONATIONS],
-            )
-            writer_page_1.writeheader()
-            writer_page_2.writeheader()
-            for donor, value in counter.most_common():
-                writer = writer_page_1 if value > 50000 else writer_page_2
-                writer.writerow(
-                    {
-                        TARGET_TWITTER: twitter_handles[donor],
-                        # replace "|" characters to avoid messing with markdown tables
-                        TARGET_DONOR: donor.replace("|", "/"),
-                        TARGET_TOTAL_DONATIONS: format_money(value),
-                    }
-                )
-
-            # seek to 0 so we can read back the file.
-            temp_csv_file_page_1.seek(0)
-            temp_csv_file_page_2.seek(0)
-
-            markdown_table_page_1 = Table.parse_csv(file=temp_csv_file_page_1)
-            markdown_table_page_2 = Table.parse_csv(file=temp_csv_file_page_2)
-
-            with open(TWITTER_MAPPING_MARKDOWN_FILE_PAGE_1, "w") as markdown_file:
-                markdown_file.write(markdown_table_page_1.markdown())
-            with open(TWITTER_MAPPING_MARKDOWN_FILE_PAGE_2, "w") as markdown_file:
-                markdown_file.write(markdown_table_page_2.markdown())
+        )
+
+    header = (TARGET_TWITTER, TARGET_DONOR, TARGET_TOTAL_DONATIONS)
+    with open(TWITTER_MAPPING_MARKDOWN_FILE_PAGE_1, "w") as markdown_file:
+        write_markdown_table(f=markdown_file, header=header, rows=page_1)
+    with open(TWITTER_MAPPING_MARKDOWN_FILE_PAGE_2, "w") as markdown_file:
+        write_markdown_table(f=markdown_file, header=header, rows=page_2)
 
 
 #
@@ -123,38 +168,32 @@ def get_existing_parties() -> DefaultDict:
     return parties
 
 
-def build_party_groups_table():
+def build_party_groups_table(recipient_totals: Counter) -> None:
     existing_parties = get_existing_parties()
-    counter = Counter()
-    with open(DONATIONS_FILE) as csv_file:
-        reader = csv.DictReader(csv_file)
-        for row in reader:
-            counter.update({row[SOURCE_DONATION_MADE_TO]: int(row[SOURCE_VALUE])})
-
-    with StringIO() as temp_csv_file:
-        writer = csv.DictWriter(
-            f=temp_csv_file,
-            fieldnames=[TARGET_PARTY, TARGET_DONATION_MADE_TO, TARGET_TOTAL_DONATIONS],
+    rows = [
+        (
+            existing_parties[donation_made_to],
+            # replace "|" characters to avoid messing with markdown tables
+            donation_made_to.replace("|", "/"),
+            format_money(value),
+        )
+        for donation_made_to, value in recipient_totals.most_common()
+    ]
+    with open(PARTY_GROUPS_MARKDOWN_FILE, "w") as markdown_file:
+        write_markdown_table(
+            f=markdown_file,
+            header=(TARGET_PARTY, TARGET_DONATION_MADE_TO, TARGET_TOTAL_DONATIONS),
+            rows=rows,
         )
-        writer.writeheader()
-        for donation_made_to, value in counter.most_common():
-            writer.writerow(
-                {
-                    TARGET_PARTY: existing_parties[donation_made_to],
-                    # replace "|" characters to avoid messing with markdown tables
-                    TARGET_DONATION_MADE_TO: donation_made_to.replace("|", "/"),
-                    TARGET_TOTAL_DONATIONS: format_money(value),
-                }
-            )
-
-        temp_csv_file.seek(0)
 
-        markdown_table = Table.parse_csv(file=temp_csv_file)
 
-        with open(PARTY_GROUPS_MARKDOWN_FILE, "w") as markdown_file:
-            markdown_file.write(markdown_table.markdown())
+def build_tables(donations_file: str) -> None:
+    donor_totals = TotalBy(SOURCE_DONOR_NAME)
+    recipient_totals = TotalBy(SOURCE_DONATION_MADE_TO)
+    aggregate(donations_file, aggregators=[donor_totals, recipient_totals])
+    build_twitter_donor_table(donor_totals=donor_totals.totals)
+    build_party_groups_table(recipient_totals=recipient_totals.totals)
 
 
 if __name__ == "__main__":
-    build_twitter_donor_table()
-    build_party_groups_table()
+    build_tables(donations_file=get_donations_file())
@@ -0,0 +1,253 @@
+"""
+Load the AEC's CSVs into typed, columnar tables with numpy.
+
+Every CSV in a release (donor returns, party returns, associated entities, debts,
+etc.) is read once into a Table, one array per column. Amounts are int64, and
+every other column is dictionary encoded: an int32 code per row into a sorted
+array of the column's distinct values, so filtering on and grouping by a string
+compares integers, and e.g. a name can be cleaned once per distinct value rather
+than once per row.
+
+A Store holds every table of every release, and is saved as a single .npz file,
+with distinct values packed as UTF-8, which loads much faster than parsing the
+CSVs again. Lookups (by recipient, by
+return type, by year...) are vectorised rollups over a table, see Table.rollup.
+
+numpy is only needed to build the database, not by the bot.
+"""
+
+import csv
+from pathlib import Path
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+# columns parsed as amounts, in dollars. Everything else is a string.
+NUMERIC_COLUMNS = {
+    "Value",
+    "Amount owed",
+    "Total Receipts",
+    "Total Payments",
+    "Total Debts",
+    "Total Discretionary Benefits",
+    "Discretionary Benefits",
+    "Capital Contributions",
+    "Total Donations Made",
+    "Total Donations Received",
+    "Electoral Expenditure",
+    "Total Expenditure",
+    "Total Gifts Received",
+}
+# amounts which weren't reported
+MISSING_NUMBERS = ["", "N/A"]
+
+# separates table, kind and column in the names of a saved store's arrays
+KEY_SEPARATOR = "::"
+# ends each of a column's distinct values when saved
+VALUE_TERMINATOR = "\x00"
+
+
+def parse_numbers(strings: np.ndarray) -> np.ndarray:
+    strings = np.where(np.isin(strings, MISSING_NUMBERS), "0", strings)
+    try:
+        return strings.astype(np.int64)
+    except ValueError:
+        # e.g. cents, which are rounded to the dollar
+        return np.rint(strings.astype(np.float64)).astype(np.int64)
+
+
+def encode(strings: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Sorted distinct values, and the int32 code of each string."""
+    # hashing is much faster than np.unique, which sorts every string
+    values = sorted(set(strings))
+    codes = dict((value, code) for code, value in enumerate(values))
+    return np.array(values, dtype=str), np.fromiter(
+        (codes[string] for string in strings), dtype=np.int32, count=len(strings)
+    )
+
+
+class Table:
+    """
+    Columns of equal length, numbers as int64 arrays, and strings as codes into
+    each column's sorted distinct values.
+    """
+
+    def __init__(
+        self,
+        columns: Sequence[str],
+        numbers: Dict[str, np.ndarray],
+        codes: Dict[str, np.ndarray],
+        values: Dict[str, np.ndarray],
+    ):
+        self.columns = list(columns)
+        self.numbers = numbers
+        self.codes = codes
+        self.values = values
+
+    def __len__(self) -> int:
+        name = self.columns[0]
+        return len(self.numbers[name] if name in self.numbers else self.codes[name])
+
+    def strings(self, name: str) -> np.ndarray:
+        """A string column, decoded."""
+        return self.values[name][self.codes[name]]
+
+    def equals(self, name: str, value: str) -> np.ndarray:
+        """A mask of the rows where a string column is value."""
+        values = self.values[name]
+        index = np.searchsorted(values, value)
+        if index == len(values) or values[index] != value:
+            return np.zeros(len(self), dtype=bool)
+        return self.codes[name] == index
+
+    def map_strings(self, name: str, function: Callable[[str], str]) -> "Table":
+        """A copy with function applied to a string column, once per distinct value"""
+        mapped = [function(value) for value in self.values[name].tolist()]
+        values, remap = encode(mapped)
+        return Table(
+            columns=self.columns,
+            numbers=self.numbers,
+            codes={**self.codes, name: remap[self.codes[name]]},
+            values={**self.values, name: values},
+        )
+
+    def rollup(
+        self, by: Sequence[str], value: str, where: Optional[np.ndarray] = None
+    ) -> Tuple[List[np.ndarray], np.ndarray]:
+        """
+        Sum a numeric column grouped by string columns, optionally only over the
+        rows in a mask. Returns each group's values of the by columns, and its
+        total, with groups in the order they first appear, like a Counter.
+        """
+        sizes = [len(self.values[name]) for name in by]
+        if np.prod(sizes, dtype=np.float64) >= 2**63:
+            raise ValueError(f"too many groups to roll up by {by}")
+        keys = np.ravel_multi_index([self.codes[name] for name in by], sizes)
+        amounts = self.numbers[value]
+        if where is not None:
+            keys, amounts = keys[where], amounts[where]
+        if not len(keys):
+            return [self.values[name][:0] for name in by], amounts[:0]
+        order = np.argsort(keys, kind="stable")
+        keys, amounts = keys[order], amounts[order]
+        starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+        totals = np.add.reduceat(amounts, starts)
+        # the sort is stable, so each group starts at its first row
+        appearance = np.argsort(order[starts], kind="stable")
+        starts, totals = starts[appearance], totals[appearance]
+        group_codes = np.unravel_index(keys[starts], sizes)
+        groups = [self.values[name][codes] for name, codes in zip(by, group_codes)]
+        return groups, totals
+
+
+def pack_values(values: np.ndarray) -> np.ndarray:
+    """
+    Distinct values as UTF-8 bytes, each terminated. numpy pads every string to
+    the longest, in UTF-32, which is several times the size of the strings.
+    """
+    packed = "".join(value + VALUE_TERMINATOR for value in values.tolist())
+    return np.frombuffer(packed.encode(), dtype=np.uint8)
+
+
+def unpack_values(packed: np.ndarray) -> np.ndarray:
+    return np.array(packed.tobytes().decode().split(VALUE_TERMINATOR)[:-1], dtype=str)
+
+
+def read_csv(path: Path) -> Table:
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        columns = next(reader)
+        rows = [row for row in reader if row]
+    # transpose to columns once, rather than looking up every field of every row
+    fields = list(zip(*rows)) if rows else [()] * len(columns)
+    numbers, codes, values = {}, {}, {}
+    for name, column in zip(columns, fields):
+        if name in NUMERIC_COLUMNS:
+            numbers[name] = parse_numbers(np.array(column, dtype=str))
+        else:
+            values[name], codes[name] = encode(column)
+    return Table(columns=columns, numbers=numbers, codes=codes, values=values)
+
+
+class Store:
+    """Tables by "<release>/<CSV file name without .csv>"."""
+
+    def __init__(self, tables: Optional[Dict[str, Table]] = None):
+        self.tables = tables or {}
+
+    @staticmethod
+    def table_name(release: str, name: str) -> str:
+        return f"{release}/{name}"
+
+    def table(self, release: str, name: str) -> Optional[Table]:
+        return self.tables.get(self.table_name(release, name))
+
+    def releases(self) -> Set[str]:
+        return set(name.split("/", 1)[0] for name in self.tables)
+
+    def read_release(self, release: str, path: Path) -> None:
+        """Read every CSV in a release's directory, replacing any read before."""
+        self.drop_release(release)
+        for csv_path in sorted(path.glob("*.csv")):
+            self.tables[self.table_name(release, csv_path.stem)] = read_csv(csv_path)
+
+    def drop_release(self, release: str) -> None:
+        for name in [name for name in self.tables if name.startswith(f"{release}/")]:
+            del self.tables[name]
+
+    @classmethod
+    def read(cls, releases: Mapping[str, Path]) -> "Store":
+        store = cls()
+        for release, path in releases.items():
+            store.read_release(release, path)
+        return store
+
+    def save(self, path: Path) -> None:
+        arrays = dict()
+        for table_name, table in self.tables.items():
+            arrays[KEY_SEPARATOR.join([table_name, "columns"])] = np.array(
+                table.columns
+            )
+            for kind, columns in [
+                ("numbers", table.numbers),
+                ("codes", table.codes),
+                ("values", table.values),
+            ]:
+                for name, array in columns.items():
+                    if kind == "values":
+                        array = pack_values(array)
+                    arrays[KEY_SEPARATOR.join([table_name, kind, name])] = array
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # uncompressed, so loading is a copy rather than decompressing
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+
+    @classmethod
+    def load(cls, path: Path) -> "Store":
+        parts: Dict[str, Dict[str, Dict[str, np.ndarray]]] = dict()
+        columns = dict()
+        with np.load(path, allow_pickle=False) as arrays:
+            for key in arrays.files:
+                table_name, kind, *name = key.split(KEY_SEPARATOR)
+                if kind == "columns":
+                    columns[table_name] = arrays[key].tolist()
+                    continue
+                array = arrays[key]
+                if kind == "values":
+                    array = unpack_values(array)
+                table = parts.setdefault(table_name, dict())
+                table.setdefault(kind, dict())[name[0]] = array
+        return cls(
+            dict(
+                (
+                    table_name,
+                    Table(
+                        columns=table_columns,
+                        numbers=parts.get(table_name, {}).get("numbers", {}),
+                        codes=parts.get(table_name, {}).get("codes", {}),
+                        values=parts.get(table_name, {}).get("values", {}),
+                    ),
+                )
+                for table_name, table_columns in columns.items()
+            )
+        )
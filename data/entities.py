@@ -0,0 +1,200 @@
+"""
+Resolve the many names the AEC's returns give one donor into a single entity.
+
+The same organisation is "X Pty Ltd" in one return, "X Pty. Limited" or "X P/L"
+in another, "X / Y" when it gave alongside a trading name, and sometimes carries
+its ABN or ACN. Each distinct name is reduced to the keys it's joined on: its
+ABN or ACN if it has one, and a normalised name, lowercase without accents,
+punctuation, titles, trading names or company suffixes, with "Surname, Given"
+people turned around. "X / Y" is also keyed on X alone.
+
+Donations Made, Donor Returns and Third Party Donations Received are hash joined
+on those keys: every name claims its keys in a dict, and a name whose key is
+already claimed is unioned with the name that claimed it, so names which share
+any key, directly or through other names, end up in one entity. Names are
+normalised once per distinct value in the store, not once per row, see
+columnar.py.
+"""
+
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Mapping, NamedTuple
+
+from columnar import Table
+
+FINANCIAL_YEAR = "Financial Year"
+# (table, column of who gave, column of how much), the returns donors appear in
+SOURCES = [
+    ("Donations Made", "Donor Name", "Value"),
+    ("Donor Returns", "Name", "Total Donations Made"),
+    ("Third Party Donations Received", "Donation Received From", "Value"),
+]
+
+KEY_ABN = "abn:"
+KEY_ACN = "acn:"
+
+# an ABN is 11 digits and an ACN 9, often written in groups
+REGISTRATION_PATTERN = re.compile(r"\b(abn|acn)\b[\s:.#-]*((?:\d[\s-]?){9,11})")
+REGISTRATION_LENGTHS = {"abn": 11, "acn": 9}
+# "X Pty Ltd t/as Y" and "X (trading as Y)" are X
+TRADING_AS_PATTERN = re.compile(r"\s*\(?\b(?:t/as|t/a|trading as)\b.*$")
+# abbreviations which would otherwise be split on their "/"
+ABBREVIATIONS = [
+    # "M/s", "M/-", "Mr/Mrs" etc. titles
+    (re.compile(r"^m[rs]*/\S*\s+"), ""),
+    (re.compile(r"\bp/l(?:td)?\b"), " pty ltd "),
+    (re.compile(r"\bn/l\b"), " nl "),
+    (re.compile(r"\ba/c\b"), " atf "),
+]
+# "X / Y", "X | Y"
+PART_SEPARATOR = re.compile(r"\s*[/|]\s*")
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+TITLES = {"mr", "mrs", "ms", "miss", "dr", "prof", "hon", "the"}
+# dropped from the end of a name, repeatedly, e.g. "x pty ltd" -> "x"
+SUFFIXES = {
+    "pty",
+    "ltd",
+    "limited",
+    "proprietary",
+    "pl",
+    "inc",
+    "incorporated",
+    "nl",
+}
+# a comma name with more words than this is an organisation, not "Surname, Given"
+MAX_PERSON_WORDS = 4
+
+
+class Entity(NamedTuple):
+    # the name it's known by, the name it gave the most under
+    name: str
+    # every name it appears under, the canonical name first
+    variants: List[str]
+    # table -> total given, see SOURCES
+    totals: Dict[str, int]
+
+
+def strip_accents(value: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", value)
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def normalise_part(part: str) -> str:
+    if "," in part and not any(
+        word in SUFFIXES for word in WORD_PATTERN.findall(part)
+    ):
+        surname, _, given = part.partition(",")
+        if len(WORD_PATTERN.findall(part)) <= MAX_PERSON_WORDS:
+            part = f"{given} {surname}"
+    words = WORD_PATTERN.findall(part)
+    while len(words) > 1 and words[0] in TITLES:
+        words.pop(0)
+    # "ACN 002 482 233 Pty Ltd" has no name left to join on
+    while words and words[-1] in SUFFIXES:
+        words.pop()
+    return " ".join(words)
+
+
+def entity_keys(name: str) -> List[str]:
+    """The keys a name is joined on, see the module docstring."""
+    text = strip_accents(name).casefold().replace("&", " and ")
+    keys = []
+    for kind, digits in REGISTRATION_PATTERN.findall(text):
+        digits = re.sub(r"\D", "", digits)
+        if len(digits) == REGISTRATION_LENGTHS[kind]:
+            keys.append((KEY_ABN if kind == "abn" else KEY_ACN) + digits)
+    text = REGISTRATION_PATTERN.sub(" ", text)
+    text = TRADING_AS_PATTERN.sub("", text)
+    for pattern, replacement in ABBREVIATIONS:
+        text = pattern.sub(replacement, text)
+    parts = [part for part in map(normalise_part, PART_SEPARATOR.split(text)) if part]
+    if parts:
+        keys.append(" / ".join(parts))
+    # a single word is too common to join on, e.g. "Vic/Tas"
+    if len(parts) > 1 and " " in parts[0]:
+        keys.append(parts[0])
+    return keys
+
+
+class UnionFind:
+    def __init__(self) -> None:
+        self.parent: Dict[str, str] = {}
+
+    def find(self, item: str) -> str:
+        self.parent.setdefault(item, item)
+        while (parent := self.parent[item]) != item:
+            # path halving, so chains stay short however names are joined
+            self.parent[item] = item = self.parent[parent]
+        return item
+
+    def union(self, a: str, b: str) -> None:
+        a, b = self.find(a), self.find(b)
+        if a != b:
+            # the smaller name is the root, so the result doesn't depend on order
+            self.parent[max(a, b)] = min(a, b)
+
+
+def name_totals(releases: Mapping[str, Mapping[str, Table]]) -> Dict[str, Counter]:
+    """
+    table -> name -> total given, from release -> table -> Table, see SOURCES.
+    Like donations, each financial year is taken from the latest release which
+    has it.
+    """
+    totals = dict()
+    for table_name, name_column, value_column in SOURCES:
+        by_year: Dict[str, Dict[str, int]] = dict()
+        for release in sorted(releases, key=int):
+            if (table := releases[release].get(table_name)) is None:
+                continue
+            (years, names), amounts = table.rollup(
+                by=[FINANCIAL_YEAR, name_column], value=value_column
+            )
+            release_years: Dict[str, Dict[str, int]] = dict()
+            for year, name, amount in zip(
+                years.tolist(), names.tolist(), amounts.tolist()
+            ):
+                release_years.setdefault(year, {})[name] = amount
+            by_year.update(release_years)
+        totals[table_name] = Counter()
+        for by_name in by_year.values():
+            totals[table_name].update(by_name)
+    return totals
+
+
+def resolve_entities(totals: Mapping[str, Mapping[str, int]]) -> List[Entity]:
+    """
+    Join every name in totals, table -> name -> total given, into entities, in
+    the order of their canonical names.
+    """
+    names = UnionFind()
+    owners: Dict[str, str] = {}
+    for by_name in totals.values():
+        for name in by_name:
+            names.find(name)
+            for key in entity_keys(name):
+                if (owner := owners.setdefault(key, name)) != name:
+                    names.union(name, owner)
+
+    members: Dict[str, List[str]] = {}
+    for name in names.parent:
+        members.setdefault(names.find(name), []).append(name)
+
+    entities = []
+    for variants in members.values():
+        entity_totals = dict(
+            (table, sum(by_name.get(name, 0) for name in variants))
+            for table, by_name in totals.items()
+        )
+        # most given in Donations Made, then in any return, then alphabetical
+        variants.sort(
+            key=lambda name: (
+                -totals.get(SOURCES[0][0], {}).get(name, 0),
+                -sum(by_name.get(name, 0) for by_name in totals.values()),
+                name,
+            )
+        )
+        entities.append(Entity(variants[0], variants, entity_totals))
+    entities.sort(key=lambda entity: entity.name)
+    return entities
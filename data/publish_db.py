@@ -0,0 +1,56 @@
+"""
+Publish the donor database built by build_db.py to S3, where running bots pick it
+up within DATABASE_CHECK_SECONDS without a redeploy, see
+donationsbot/functions/bot/bot/reload.py.
+
+The database is opened before it's uploaded, so a file the bot can't read is never
+published, and uploaded in a single part, so its ETag is its MD5 and matches the
+ETag the bot computes for the database packaged with it, with the same
+bot.reload.file_etag().
+
+    python data/publish_db.py <bucket> [--key donors.db]
+"""
+
+import argparse
+import sys
+
+import boto3
+from botocore.exceptions import ClientError
+
+# build_db puts the bot on the path
+from build_db import DB_BINARY, ROOT_DIR
+
+# bot.reload uses the shared layer
+sys.path.insert(0, str(ROOT_DIR / "donationsbot" / "layers" / "shared"))
+from bot.db import DonorDatabase  # noqa: E402
+from bot.reload import file_etag  # noqa: E402
+
+DATABASE_KEY = "donors.db"
+
+
+def publish(bucket: str, key: str) -> None:
+    database = DonorDatabase(DB_BINARY)
+    donors = len(database.donors)
+    database.close()
+    etag = file_etag(DB_BINARY)
+    client = boto3.client("s3")
+    try:
+        current = client.head_object(Bucket=bucket, Key=key)["ETag"]
+    except ClientError:
+        current = None
+    if current == etag:
+        print(f"s3://{bucket}/{key} is already up to date, {etag}")
+        return
+    with open(DB_BINARY, "rb") as f:
+        response = client.put_object(Bucket=bucket, Key=key, Body=f.read())
+    if response["ETag"] != etag:
+        sys.exit(f"uploaded {key} has ETag {response['ETag']}, expected {etag}")
+    print(f"published {donors} donors to s3://{bucket}/{key}, {etag}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("bucket")
+    parser.add_argument("--key", default=DATABASE_KEY)
+    args = parser.parse_args()
+    publish(bucket=args.bucket, key=args.key)
@@ -1,4 +1,6 @@
 import csv
+from pathlib import Path
+from typing import Dict
 
 
 SOURCE_DONOR_NAME = "Donor Name"
@@ -6,10 +8,16 @@ SOURCE_VALUE = "Value"
 SOURCE_DONATION_MADE_TO = "Donation Made To"
 SOURCE_FINANCIAL_YEAR = "Financial Year"
 
+# each AEC release is in src/<year of release>/
+SOURCE_PATH = Path(__file__).parent / "src"
+DONATIONS_CSV_FILENAME = "Donations Made.csv"
+
 TARGET_TWITTER = "Twitter"
 TARGET_DONOR = "Donor"
 TARGET_TOTAL_DONATIONS = "Total Donations"
 
+TARGET_ALIAS = "Alias"
+
 TARGET_PARTY = "Party"
 TARGET_DONATION_MADE_TO = "Donation Made To"
 
@@ -20,3 +28,23 @@ class WhitespaceStrippingDictReader(csv.DictReader):
     def __next__(self):
         next_ = super().__next__()
         return dict(map(lambda item: (item[0].strip(), item[1].strip()), next_.items()))
+
+
+def find_releases() -> Dict[str, Path]:
+    """The directory of each release in src/, by year of release."""
+    return dict(
+        (release.name, release)
+        for release in sorted(SOURCE_PATH.iterdir(), key=lambda path: path.name)
+        if release.is_dir() and release.name.isdigit()
+    )
+
+
+def find_donation_sources() -> Dict[str, Path]:
+    """Donations Made.csv from each release in src/, by year of release."""
+    sources = dict()
+    for release, directory in find_releases().items():
+        if (path := directory / DONATIONS_CSV_FILENAME).exists():
+            sources[release] = path
+    if not sources:
+        raise FileNotFoundError(f"no {DONATIONS_CSV_FILENAME} in {SOURCE_PATH}/*/")
+    return sources
@@ -8,6 +8,7 @@ from aws_cdk import (
     Duration,
     aws_lambda_python_alpha as lambda_python,
     aws_lambda as lambda_,
+    aws_dynamodb as dynamodb,
     aws_lambda_event_sources as lambda_event_sources,
     aws_logs as logs,
     aws_sns as sns,
@@ -29,6 +30,24 @@ LAMBDA_INSIGHTS_LAYER_ARN = (
 )
 
 POLL_TWITTER_INTERVAL_SECONDS = 60
+# "poll" for mentions every POLL_TWITTER_INTERVAL_SECONDS, or "stream" them as
+# they're made, see watcher/stream.py
+MENTIONS_INGESTION = "poll"
+# a streaming lambda runs for as long as lambdas can, and is invoked again as it
+# stops
+STREAM_TIMEOUT_MINUTES = 15
+# mention windows a backfill fetches at once
+BACKFILL_CONCURRENCY = 4
+# messages per bot invocation, which are replied to concurrently
+SQS_BATCH_SIZE = 10
+# how often warm bot lambdas check S3 for a new donor database
+DATABASE_CHECK_SECONDS = 60
+# the most tweets in a threaded reply answering every handle in a mention
+REPLY_THREAD_TWEETS = 4
+# not found mentions are replied to in bulk, up to this many per bot invocation,
+# waiting up to the batching window to fill a batch
+NOT_FOUND_BATCH_SIZE = 100
+NOT_FOUND_BATCHING_WINDOW_MINUTES = 5
 
 
 class DeploymentStack(Stack):
@@ -68,6 +87,31 @@ class DeploymentStack(Stack):
             scope=self, id="InsightsLayer", layer_version_arn=LAMBDA_INSIGHTS_LAYER_ARN
         )
 
+        # Code shared between the lambda functions, e.g. lazy initialisation of
+        # clients and credentials.
+        shared_layer = lambda_python.PythonLayerVersion(
+            self,
+            "SharedLayer",
+            entry="donationsbot/layers/shared",
+            compatible_runtimes=[lambda_.Runtime.PYTHON_3_9],
+            compatible_architectures=[lambda_.Architecture.ARM_64],
+        )
+
+        # The bot's package, so the watcher resolves mentions with the same code and
+        # donor database as the bot replies with, see bot/resolve.py
+        bot_layer = lambda_python.PythonLayerVersion(
+            self,
+            "BotLayer",
+            entry="donationsbot/functions/bot",
+            compatible_runtimes=[lambda_.Runtime.PYTHON_3_9],
+            compatible_architectures=[lambda_.Architecture.ARM_64],
+        )
+
+        # The donor database, published by data/publish_db.py, so dataset fixes
+        # reach the bot without a redeploy. Until something is published the bot
+        # uses the database packaged with it.
+        database_bucket = s3.Bucket(self, "DonorDatabase", versioned=True)
+
         lambda_insights_policy = iam.ManagedPolicy.from_aws_managed_policy_name(
             "CloudWatchLambdaInsightsExecutionRolePolicy"
         )
@@ -107,6 +151,15 @@ class DeploymentStack(Stack):
             # make visibility timeout longer than timeout of handler lamber function
             visibility_timeout=Duration.minutes(2),
         )
+        # The low priority lane, mentions of handles we have no donations for, which
+        # the watcher sends here rather than to tweet_queue, see bot/resolve.py
+        not_found_queue = sqs.Queue(
+            self,
+            "NotFoundQueue",
+            # messages are in flight while the event source fills a batch, as well
+            # as while the handler replies to them
+            visibility_timeout=Duration.minutes(2 + NOT_FOUND_BATCHING_WINDOW_MINUTES),
+        )
 
         tweet_watcher_lambda = lambda_python.PythonFunction(
             self,
@@ -117,15 +170,20 @@ class DeploymentStack(Stack):
             timeout=Duration.minutes(1),
             log_retention=BOT_LOG_RETENTION,
             architecture=lambda_.Architecture.ARM_64,
-            layers=[lambda_insights_layer],
+            layers=[lambda_insights_layer, shared_layer, bot_layer],
             environment={
                 "LOG_LEVEL": "INFO",
                 "POWERTOOLS_LOGGER_SAMPLE_RATE": "0.1",
                 "POWERTOOLS_LOGGER_LOG_EVENT": "true",
                 "POWERTOOLS_SERVICE_NAME": "tweet_reader",
+                "POWERTOOLS_METRICS_NAMESPACE": "DonationsBot",
                 "BUCKET_NAME": tweet_watcher_bucket.bucket_name,
                 "SQS_QUEUE_URL": tweet_queue.queue_url,
+                "LOW_PRIORITY_QUEUE_URL": not_found_queue.queue_url,
                 "POLL_INTERVAL_SECONDS": str(POLL_TWITTER_INTERVAL_SECONDS),
+                # see bot/reload.py
+                "DATABASE_BUCKET": database_bucket.bucket_name,
+                "DATABASE_CHECK_SECONDS": str(DATABASE_CHECK_SECONDS),
             },
         )
         tweet_watcher_lambda.role.add_managed_policy(policy=lambda_insights_policy)
@@ -133,20 +191,114 @@ class DeploymentStack(Stack):
 
         tweet_watcher_bucket.grant_read_write(identity=tweet_watcher_lambda)
         tweet_queue.grant_send_messages(grantee=tweet_watcher_lambda)
+        not_found_queue.grant_send_messages(grantee=tweet_watcher_lambda)
+        database_bucket.grant_read(identity=tweet_watcher_lambda)
 
+        if MENTIONS_INGESTION == "stream":
+            # Streams mentions rather than polling for them, see watcher/stream.py.
+            # It keeps the watcher's checkpoint, so only one of them is deployed.
+            tweet_stream_lambda = lambda_python.PythonFunction(
+                self,
+                "TweetStream",
+                runtime=lambda_.Runtime.PYTHON_3_9,
+                entry="donationsbot/functions/watcher",
+                index="stream.py",
+                tracing=lambda_.Tracing.ACTIVE,
+                timeout=Duration.minutes(STREAM_TIMEOUT_MINUTES),
+                # a run invoked while the last is still streaming waits for it,
+                # rather than queueing the same mentions alongside it
+                reserved_concurrent_executions=1,
+                log_retention=BOT_LOG_RETENTION,
+                architecture=lambda_.Architecture.ARM_64,
+                layers=[lambda_insights_layer, shared_layer, bot_layer],
+                environment={
+                    "LOG_LEVEL": "INFO",
+                    "POWERTOOLS_SERVICE_NAME": "tweet_stream",
+                    "POWERTOOLS_METRICS_NAMESPACE": "DonationsBot",
+                    "BUCKET_NAME": tweet_watcher_bucket.bucket_name,
+                    "SQS_QUEUE_URL": tweet_queue.queue_url,
+                    "LOW_PRIORITY_QUEUE_URL": not_found_queue.queue_url,
+                    "POLL_INTERVAL_SECONDS": str(POLL_TWITTER_INTERVAL_SECONDS),
+                    "DATABASE_BUCKET": database_bucket.bucket_name,
+                    "DATABASE_CHECK_SECONDS": str(DATABASE_CHECK_SECONDS),
+                },
+            )
+            tweet_stream_lambda.role.add_managed_policy(policy=lambda_insights_policy)
+            tweet_stream_lambda.role.attach_inline_policy(
+                policy=access_param_store_policy
+            )
+
+            tweet_watcher_bucket.grant_read_write(identity=tweet_stream_lambda)
+            tweet_queue.grant_send_messages(grantee=tweet_stream_lambda)
+            not_found_queue.grant_send_messages(grantee=tweet_stream_lambda)
+            database_bucket.grant_read(identity=tweet_stream_lambda)
+
+            schedule, target = (
+                Duration.minutes(STREAM_TIMEOUT_MINUTES),
+                tweet_stream_lambda,
+            )
+        else:
+            schedule, target = (
+                Duration.seconds(POLL_TWITTER_INTERVAL_SECONDS),
+                tweet_watcher_lambda,
+            )
         rule = events.Rule(
             self,
             "BotScheduler",
-            schedule=events.Schedule.rate(
-                duration=Duration.seconds(POLL_TWITTER_INTERVAL_SECONDS)
-            ),
+            schedule=events.Schedule.rate(duration=schedule),
+        )
+        rule.add_target(events_targets.LambdaFunction(target))
+
+        # Invoked by hand to queue mentions missed during an outage, see
+        # watcher/backfill.py. It records its progress in the watcher's bucket, so
+        # it can be invoked again to carry on if it times out.
+        tweet_backfill_lambda = lambda_python.PythonFunction(
+            self,
+            "TweetBackfill",
+            runtime=lambda_.Runtime.PYTHON_3_9,
+            entry="donationsbot/functions/watcher",
+            index="backfill.py",
+            tracing=lambda_.Tracing.ACTIVE,
+            timeout=Duration.minutes(15),
+            log_retention=BOT_LOG_RETENTION,
+            architecture=lambda_.Architecture.ARM_64,
+            layers=[lambda_insights_layer, shared_layer, bot_layer],
+            environment={
+                "LOG_LEVEL": "INFO",
+                "POWERTOOLS_SERVICE_NAME": "tweet_backfill",
+                "BUCKET_NAME": tweet_watcher_bucket.bucket_name,
+                "SQS_QUEUE_URL": tweet_queue.queue_url,
+                "LOW_PRIORITY_QUEUE_URL": not_found_queue.queue_url,
+                "DATABASE_BUCKET": database_bucket.bucket_name,
+                "BACKFILL_CONCURRENCY": str(BACKFILL_CONCURRENCY),
+            },
         )
-        rule.add_target(events_targets.LambdaFunction(tweet_watcher_lambda))
+        tweet_backfill_lambda.role.add_managed_policy(policy=lambda_insights_policy)
+        tweet_backfill_lambda.role.attach_inline_policy(
+            policy=access_param_store_policy
+        )
+
+        tweet_watcher_bucket.grant_read_write(identity=tweet_backfill_lambda)
+        tweet_queue.grant_send_messages(grantee=tweet_backfill_lambda)
+        not_found_queue.grant_send_messages(grantee=tweet_backfill_lambda)
+        database_bucket.grant_read(identity=tweet_backfill_lambda)
 
         #
         # Lambda function to reply to queued tweets.
         #
 
+        # Tweets which have been, or are being, replied to, so messages SQS delivers
+        # more than once are only replied to once. Items expire via expires_at.
+        idempotency_table = dynamodb.Table(
+            self,
+            "RepliedTweets",
+            partition_key=dynamodb.Attribute(
+                name="tweet_id", type=dynamodb.AttributeType.STRING
+            ),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
+        )
+
         bot_lambda = lambda_python.PythonFunction(
             self,
             "BotLambda",
@@ -156,18 +308,45 @@ class DeploymentStack(Stack):
             timeout=Duration.minutes(1),
             log_retention=BOT_LOG_RETENTION,
             architecture=lambda_.Architecture.ARM_64,
-            layers=[lambda_insights_layer],
+            layers=[lambda_insights_layer, shared_layer],
             environment={
                 "LOG_LEVEL": "INFO",
                 "POWERTOOLS_LOGGER_SAMPLE_RATE": "0.1",
                 "POWERTOOLS_LOGGER_LOG_EVENT": "true",
                 "POWERTOOLS_SERVICE_NAME": "donations_bot",
+                "REPLY_CONCURRENCY": str(SQS_BATCH_SIZE),
+                "POWERTOOLS_METRICS_NAMESPACE": "DonationsBot",
+                "IDEMPOTENCY_TABLE_NAME": idempotency_table.table_name,
+                # profile one in N invocations, 0 for none, see shared/profiling.py
+                "PROFILE_ONE_IN": "0",
+                # see bot/reload.py
+                "DATABASE_BUCKET": database_bucket.bucket_name,
+                "DATABASE_CHECK_SECONDS": str(DATABASE_CHECK_SECONDS),
+                # see bot/threads.py
+                "REPLY_THREAD_TWEETS": str(REPLY_THREAD_TWEETS),
             },
         )
 
         bot_lambda.role.add_managed_policy(lambda_insights_policy)
         bot_lambda.role.attach_inline_policy(policy=access_param_store_policy)
+        idempotency_table.grant_read_write_data(grantee=bot_lambda)
+        database_bucket.grant_read(identity=bot_lambda)
 
         bot_lambda.add_event_source(
-            source=lambda_event_sources.SqsEventSource(queue=tweet_queue)
+            source=lambda_event_sources.SqsEventSource(
+                queue=tweet_queue,
+                batch_size=SQS_BATCH_SIZE,
+                # only retry the messages in a batch which failed
+                report_batch_item_failures=True,
+            )
+        )
+        # the low priority lane, in bulk. Not found replies leave some of the rate
+        # limit for the fast lane, see NOT_FOUND_REPLY_RESERVE in bot/twitter.py
+        bot_lambda.add_event_source(
+            source=lambda_event_sources.SqsEventSource(
+                queue=not_found_queue,
+                batch_size=NOT_FOUND_BATCH_SIZE,
+                max_batching_window=Duration.minutes(NOT_FOUND_BATCHING_WINDOW_MINUTES),
+                report_batch_item_failures=True,
+            )
         )
@@ -0,0 +1,381 @@
+"""
+Read the binary donor database written by data/binary_db.py.
+
+The file is memory mapped and records are only decoded when they are looked up,
+so opening the database is cheap regardless of how many donors it holds.
+"""
+
+import json
+import mmap
+import struct
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from bot.fitting import Segment
+from bot.series import DonationSeries
+
+MAGIC = b"APDB"
+VERSION = 7
+
+HEADER = struct.Struct("<4sHH")
+SECTION = struct.Struct("<8sII")
+DONOR = struct.Struct("<IIIH")
+SERIES = struct.Struct("<II")
+HANDLE = struct.Struct("<IIIIII")
+SEGMENT = struct.Struct("<IIHB")
+REF = struct.Struct("<I")
+TRIGRAM = struct.Struct("<I")
+TRIGRAM_RANGE = struct.Struct("<II")
+POSTING = struct.Struct("<I")
+NAME_TRIGRAM = struct.Struct("<I")
+NAME_TRIGRAM_RANGE = struct.Struct("<II")
+TRIGRAM_CODE = struct.Struct("<I")
+NODE = struct.Struct("<III")
+NODE_RANGE = struct.Struct("<IIIIII")
+EDGE = struct.Struct("<II")
+OUTPUT = struct.Struct("<I")
+PATTERN = struct.Struct("<IIHB")
+PARTY = struct.Struct("<IIIH")
+TOP_LIST = struct.Struct("<HIH")
+TOP_DONOR = struct.Struct("<Iq")
+PARTY_HANDLE = struct.Struct("<IIII")
+
+SECTION_STRINGS = b"strings"
+SECTION_DONORS = b"donors"
+SECTION_SERIES = b"series"
+SECTION_CUMSUMS = b"cumsums"
+SECTION_HANDLES = b"handles"
+SECTION_HANDLE_REFS = b"hrefs"
+SECTION_SEGMENTS = b"segments"
+SECTION_TRIGRAMS = b"trigrams"
+SECTION_POSTINGS = b"postings"
+SECTION_NAME_TRIGRAMS = b"name_tgs"
+SECTION_TRIGRAM_CODES = b"tg_codes"
+SECTION_META = b"meta"
+SECTION_NODES = b"ac_nodes"
+SECTION_EDGES = b"ac_edges"
+SECTION_OUTPUTS = b"ac_outs"
+SECTION_PATTERNS = b"patterns"
+SECTION_PARTIES = b"parties"
+SECTION_TOP_LISTS = b"tops"
+SECTION_TOP_DONORS = b"top_dons"
+SECTION_PARTY_HANDLES = b"phandles"
+
+
+class DatabaseError(Exception):
+    pass
+
+
+class _SortedTable:
+    """
+    A table of fixed size records, sorted by a string key stored in the string
+    table. The first two fields of each record must be the key offset and length.
+    """
+
+    def __init__(self, db: "DonorDatabase", name: bytes, record: struct.Struct):
+        self._db = db
+        self._record = record
+        self._offset, length = db.section(name)
+        self._count = length // record.size
+
+    def __len__(self) -> int:
+        return self._count
+
+    def record(self, index: int) -> Tuple[int, ...]:
+        return self._record.unpack_from(
+            self._db.buffer, self._offset + index * self._record.size
+        )
+
+    def key(self, index: int) -> bytes:
+        key_offset, key_length = self.record(index)[:2]
+        return self._db.string_bytes(key_offset, key_length)
+
+    def find(self, key: str) -> Optional[int]:
+        encoded = key.encode()
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if self.key(middle) < encoded:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._count and self.key(low) == encoded:
+            return low
+        return None
+
+
+class _TableView(Mapping):
+    """
+    A Mapping over a _SortedTable, by its key, whose values are decoded from the
+    index of their record by decode.
+    """
+
+    def __init__(self, table: _SortedTable, decode: Callable[[int], Any]):
+        self._table = table
+        self._decode = decode
+
+    def __getitem__(self, key: str) -> Any:
+        if (index := self._table.find(key)) is None:
+            raise KeyError(key)
+        return self._decode(index)
+
+    def __contains__(self, key: object) -> bool:
+        return isinstance(key, str) and self._table.find(key) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return (self._table.key(index).decode() for index in range(len(self._table)))
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+
+class DonorsView(_TableView):
+    """Maps donor name to its DonationSeries, see bot/series.py"""
+
+    def __init__(self, db: "DonorDatabase"):
+        super().__init__(_SortedTable(db, SECTION_DONORS, DONOR), self.by_index)
+        self._db = db
+        self._series_offset, _ = db.section(SECTION_SERIES)
+        self._cumsums_offset, _ = db.section(SECTION_CUMSUMS)
+        self._years = tuple(db.meta["financial_years"])
+        self._cumsums = struct.Struct(f"<{len(self._years)}q")
+
+    def name(self, index: int) -> str:
+        return self._table.key(index).decode()
+
+    def by_index(self, index: int) -> DonationSeries:
+        _, _, first, count = self._table.record(index)
+        cumulative = dict()
+        for series in range(first, first + count):
+            party_offset, party_length = SERIES.unpack_from(
+                self._db.buffer, self._series_offset + series * SERIES.size
+            )
+            sums_offset = self._cumsums_offset + series * self._cumsums.size
+            party = self._db.string(party_offset, party_length)
+            cumulative[party] = self._cumsums.unpack_from(self._db.buffer, sums_offset)
+        return DonationSeries(years=self._years, cumulative=cumulative)
+
+
+class HandlesView(_TableView):
+    """Maps lowercase twitter handle to the list of donor names it represents."""
+
+    def __init__(self, db: "DonorDatabase"):
+        super().__init__(_SortedTable(db, SECTION_HANDLES, HANDLE), self._donors)
+        self._db = db
+        self._refs_offset, _ = db.section(SECTION_HANDLE_REFS)
+
+    def _donors(self, index: int) -> List[str]:
+        _, _, first, count = self._table.record(index)[:4]
+        return [
+            self._db.donors.name(
+                REF.unpack_from(self._db.buffer, self._refs_offset + i * REF.size)[0]
+            )
+            for i in range(first, first + count)
+        ]
+
+
+class RepliesView(_TableView):
+    """Maps lowercase twitter handle to the precomputed segments of its reply."""
+
+    def __init__(self, db: "DonorDatabase"):
+        super().__init__(_SortedTable(db, SECTION_HANDLES, HANDLE), self._segments)
+        self._db = db
+        self._segments_offset, _ = db.section(SECTION_SEGMENTS)
+
+    def _segments(self, index: int) -> List[Segment]:
+        first, count = self._table.record(index)[4:]
+        segments = []
+        for i in range(first, first + count):
+            text_offset, text_length, weight, kind = SEGMENT.unpack_from(
+                self._db.buffer, self._segments_offset + i * SEGMENT.size
+            )
+            text = self._db.string(text_offset, text_length)
+            segments.append(Segment(kind=kind, text=text, weight=weight))
+        return segments
+
+
+class PartiesView(_TableView):
+    """
+    Maps party code to its top donors in each financial year, as financial year ->
+    [(donor name, amount)], biggest first. Years nobody gave to the party are left
+    out.
+    """
+
+    def __init__(self, db: "DonorDatabase"):
+        super().__init__(_SortedTable(db, SECTION_PARTIES, PARTY), self._top_lists)
+        self._db = db
+        self._top_lists_offset, _ = db.section(SECTION_TOP_LISTS)
+        self._top_donors_offset, _ = db.section(SECTION_TOP_DONORS)
+        self._years = db.meta["financial_years"]
+
+    def _top_lists(self, index: int) -> Dict[str, List[Tuple[str, int]]]:
+        _, _, first_list, list_count = self._table.record(index)
+        top_lists = dict()
+        for i in range(first_list, first_list + list_count):
+            year, first, count = TOP_LIST.unpack_from(
+                self._db.buffer, self._top_lists_offset + i * TOP_LIST.size
+            )
+            top_donors = []
+            for j in range(first, first + count):
+                donor_index, amount = TOP_DONOR.unpack_from(
+                    self._db.buffer, self._top_donors_offset + j * TOP_DONOR.size
+                )
+                top_donors.append((self._db.donors.name(donor_index), amount))
+            top_lists[self._years[year]] = top_donors
+        return top_lists
+
+
+class PartyHandlesView(_TableView):
+    """Maps lowercase party handle or hashtag to its party code, see PartiesView."""
+
+    def __init__(self, db: "DonorDatabase"):
+        super().__init__(
+            _SortedTable(db, SECTION_PARTY_HANDLES, PARTY_HANDLE), self._party
+        )
+        self._db = db
+
+    def _party(self, index: int) -> str:
+        _, _, party_offset, party_length = self._table.record(index)
+        return self._db.string(party_offset, party_length)
+
+
+class TrigramIndexView:
+    """The inverted index of donor name trigrams, see bot/fuzzy.py"""
+
+    def __init__(self, db: "DonorDatabase"):
+        self._db = db
+        self._trigrams_offset, length = db.section(SECTION_TRIGRAMS)
+        # the last entry is the end of the last trigram's postings
+        self._trigram_count = max(length // TRIGRAM.size - 1, 0)
+        self._postings_offset, _ = db.section(SECTION_POSTINGS)
+        self._name_trigrams_offset, _ = db.section(SECTION_NAME_TRIGRAMS)
+        self._codes_offset, _ = db.section(SECTION_TRIGRAM_CODES)
+
+    def postings(self, code: int) -> Tuple[int, ...]:
+        """Indexes of the donors indexed under a trigram, see DonorsView."""
+        if code >= self._trigram_count:
+            return ()
+        first, end = TRIGRAM_RANGE.unpack_from(
+            self._db.buffer, self._trigrams_offset + code * TRIGRAM.size
+        )
+        return struct.unpack_from(
+            f"<{end - first}I",
+            self._db.buffer,
+            self._postings_offset + first * POSTING.size,
+        )
+
+    def name(self, donor_index: int) -> str:
+        return self._db.donors.name(donor_index)
+
+    def name_trigrams(self, donor_index: int) -> Tuple[int, ...]:
+        """Every trigram of a donor's name."""
+        first, end = NAME_TRIGRAM_RANGE.unpack_from(
+            self._db.buffer,
+            self._name_trigrams_offset + donor_index * NAME_TRIGRAM.size,
+        )
+        return struct.unpack_from(
+            f"<{end - first}I",
+            self._db.buffer,
+            self._codes_offset + first * TRIGRAM_CODE.size,
+        )
+
+
+class AutomatonView:
+    """
+    The Aho-Corasick automaton of handles and aliases, see bot/mentions.py. States
+    are decoded the first time a tweet passes through them, and kept, so the cache
+    is bounded by the size of the automaton.
+    """
+
+    def __init__(self, db: "DonorDatabase"):
+        self._db = db
+        self._nodes_offset, _ = db.section(SECTION_NODES)
+        self._edges_offset, _ = db.section(SECTION_EDGES)
+        self._outputs_offset, _ = db.section(SECTION_OUTPUTS)
+        self._patterns_offset, _ = db.section(SECTION_PATTERNS)
+        self._nodes: Dict[int, Tuple[Dict[int, int], int, List[Tuple[str, int, int]]]]
+        self._nodes = {}
+
+    def _node(self, state: int):
+        """(transitions by character, failure state, patterns) of a state"""
+        if (node := self._nodes.get(state)) is not None:
+            return node
+        first_edge, first_output, fail, end_edge, end_output, _ = (
+            NODE_RANGE.unpack_from(
+                self._db.buffer, self._nodes_offset + state * NODE.size
+            )
+        )
+        edges = struct.unpack_from(
+            f"<{(end_edge - first_edge) * 2}I",
+            self._db.buffer,
+            self._edges_offset + first_edge * EDGE.size,
+        )
+        patterns = [self._pattern(output) for output in range(first_output, end_output)]
+        node = (dict(zip(edges[::2], edges[1::2])), fail, patterns)
+        self._nodes[state] = node
+        return node
+
+    def _pattern(self, output: int) -> Tuple[str, int, int]:
+        (pattern,) = OUTPUT.unpack_from(
+            self._db.buffer, self._outputs_offset + output * OUTPUT.size
+        )
+        key_offset, key_length, length, kind = PATTERN.unpack_from(
+            self._db.buffer, self._patterns_offset + pattern * PATTERN.size
+        )
+        return self._db.string(key_offset, key_length), length, kind
+
+    def scan(self, text: str) -> Iterator[Tuple[int, int, str, int]]:
+        """(start, end, key, kind) of every pattern in text, which must be lowercase"""
+        root = self._node(0)
+        node = root
+        for position, character in enumerate(text):
+            code = ord(character)
+            while (state := node[0].get(code)) is None and node is not root:
+                node = self._node(node[1])
+            if state is None:
+                continue
+            node = self._node(state)
+            for key, length, kind in node[2]:
+                yield position + 1 - length, position + 1, key, kind
+
+
+class DonorDatabase:
+    def __init__(self, path: Path):
+        with open(path, "rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, section_count = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            raise DatabaseError(f"{path} is not a version {VERSION} donor database")
+        self._sections = {}
+        for index in range(section_count):
+            name, offset, length = SECTION.unpack_from(
+                self.buffer, HEADER.size + index * SECTION.size
+            )
+            self._sections[name.rstrip(b"\0")] = (offset, length)
+        self._strings_offset, _ = self.section(SECTION_STRINGS)
+        meta_offset, meta_length = self.section(SECTION_META)
+        self.meta = json.loads(self.buffer[meta_offset : meta_offset + meta_length])
+        self.donors = DonorsView(self)
+        self.handles = HandlesView(self)
+        self.replies = RepliesView(self)
+        self.parties = PartiesView(self)
+        self.party_handles = PartyHandlesView(self)
+        self.trigrams = TrigramIndexView(self)
+        self.automaton = AutomatonView(self)
+
+    def section(self, name: bytes) -> Tuple[int, int]:
+        try:
+            return self._sections[name]
+        except KeyError:
+            raise DatabaseError(f"missing section {name.decode()}") from None
+
+    def string_bytes(self, offset: int, length: int) -> bytes:
+        start = self._strings_offset + offset
+        return self.buffer[start : start + length]
+
+    def string(self, offset: int, length: int) -> str:
+        return self.string_bytes(offset, length).decode()
+
+    def close(self) -> None:
+        self.buffer.close()
@@ -0,0 +1,159 @@
+"""
+Fit a reply into a single tweet.
+
+Lengths are counted the way twitter counts them, see
+https://developer.twitter.com/en/docs/counting-characters
+
+- text is NFC normalised before counting
+- most latin script and punctuation weighs 1, everything else (e.g. CJK) weighs 2
+- every URL weighs 23 regardless of its length
+- every emoji, including multi code point sequences, weighs 2
+"""
+
+import re
+import unicodedata
+from typing import List, NamedTuple
+
+TWITTER_MAX_CHARS = 280
+
+# weights are scaled by 100, as per twitter-text's v3 configuration
+SCALE = 100
+DEFAULT_WEIGHT = 200
+URL_WEIGHT = 23 * SCALE
+EMOJI_WEIGHT = 2 * SCALE
+WEIGHTED_RANGES = [
+    (0, 4351, 100),
+    (8192, 8205, 100),
+    (8208, 8223, 100),
+    (8242, 8247, 100),
+]
+
+URL_PATTERN = re.compile(
+    r"(?:https?://[^\s]+)"
+    r"|(?:\b(?:[a-z0-9-]+\.)+(?:com|net|org|io|gov|edu|info|au|nz|uk)\b"
+    r"(?:/[^\s]*)?)",
+    re.IGNORECASE,
+)
+
+_EMOJI = "[\U0001F000-\U0001FAFF\u2190-\u21FF\u2300-\u23FF\u2600-\u27BF\u2B00-\u2BFF]"
+_MODIFIERS = "\uFE0F?[\U0001F3FB-\U0001F3FF]?"
+EMOJI_PATTERN = re.compile(
+    # flags are a pair of regional indicators
+    "[\U0001F1E6-\U0001F1FF]{2}"
+    # keycaps, e.g. a digit in a box
+    "|[0-9#*]\uFE0F?\u20E3"
+    # anything else, with optional presentation selector, skin tone, and any zero
+    # width joined emoji following it
+    f"|{_EMOJI}{_MODIFIERS}(?:\u200D{_EMOJI}{_MODIFIERS})*"
+)
+
+
+def _code_point_weight(character: str) -> int:
+    code_point = ord(character)
+    for start, end, weight in WEIGHTED_RANGES:
+        if start <= code_point <= end:
+            return weight
+    return DEFAULT_WEIGHT
+
+
+def _scaled_weight(text: str) -> int:
+    text = unicodedata.normalize("NFC", text)
+    weight = 0
+    if "." in text:
+        text, url_count = URL_PATTERN.subn("", text)
+        weight += url_count * URL_WEIGHT
+    if text.isascii():
+        return weight + len(text) * SCALE
+    text, emoji_count = EMOJI_PATTERN.subn("", text)
+    weight += emoji_count * EMOJI_WEIGHT
+    return weight + sum(_code_point_weight(character) for character in text)
+
+
+def weighted_length(text: str) -> int:
+    return _scaled_weight(text) // SCALE
+
+
+def tweet_is_too_long(tweet: str) -> bool:
+    return weighted_length(tweet) > TWITTER_MAX_CHARS
+
+
+# A reply is a list of sections, each made of a heading segment followed by its
+# line segments. The first heading is always included.
+KIND_REQUIRED_HEADING = 0
+KIND_HEADING = 1
+KIND_LINE = 2
+
+
+class Segment(NamedTuple):
+    kind: int
+    text: str
+    # weighted length, see weighted_length()
+    weight: int
+
+
+def make_segment(kind: int, text: str) -> Segment:
+    return Segment(kind=kind, text=text, weight=weighted_length(text))
+
+
+def more_marker(count: int) -> str:
+    return f"\n+{count} more"
+
+
+def fit_prefix(prefix: str, max_length: int) -> str:
+    """
+    The recipients, handles and hashtags separated by spaces, cut to as many as fit
+    in max_length, in the order they were mentioned. The reply still reaches the
+    author of the mention, so only who else is copied in is cut.
+    """
+    words = prefix.split(" ")
+    length = 0
+    for count, word in enumerate(words):
+        length += weighted_length(word) + (1 if count else 0)
+        if length > max_length:
+            return " ".join(words[:count])
+    return prefix
+
+
+def fit_segments(
+    prefix: str, segments: List[Segment], max_length: int = TWITTER_MAX_CHARS
+) -> str:
+    """
+    Add segments to prefix in order until the next one doesn't fit. If a section's
+    lines are cut short, a "+N more" line is added in their place, space for which
+    is reserved as we go. Once anything is cut, the lower priority sections which
+    follow are dropped entirely. The required heading always fits, the prefix is
+    cut to make room for it, see fit_prefix().
+    """
+    # number of lines which follow each line in the same section
+    following_lines = [0] * len(segments)
+    for index in range(len(segments) - 2, -1, -1):
+        if segments[index + 1].kind == KIND_LINE:
+            following_lines[index] = following_lines[index + 1] + 1
+
+    required = sum(
+        segment.weight for segment in segments if segment.kind == KIND_REQUIRED_HEADING
+    )
+    prefix = fit_prefix(prefix, max_length - required)
+    parts = [prefix]
+    remaining = max_length - weighted_length(prefix)
+    for index, segment in enumerate(segments):
+        if segment.kind == KIND_REQUIRED_HEADING:
+            parts.append(segment.text)
+            remaining -= segment.weight
+            continue
+        if segment.kind == KIND_HEADING:
+            if segment.weight > remaining:
+                break
+            parts.append(segment.text)
+            remaining -= segment.weight
+            continue
+        following = following_lines[index]
+        reserve = len(more_marker(following)) if following else 0
+        if segment.weight + reserve > remaining:
+            marker = more_marker(following + 1)
+            if len(marker) <= remaining:
+                parts.append(marker)
+            break
+        parts.append(segment.text)
+        remaining -= segment.weight
+    return "".join(parts)
@@ -0,0 +1,176 @@
+"""
+Find donors by name in the text of a tweet, for mentions which don't include a
+mapped twitter handle, e.g. "what has Woodside Energy donated?" or an unmapped
+handle like @WoodsideEnergy.
+
+Names are normalised to lowercase ASCII letters and digits, without legal forms
+like "Limited", and broken into trigrams with the spaces between words removed, so
+"Woodside Energy Limited" and @woodsideenergy are both " woodsideenergy ". An
+inverted index from trigram to donors is built at build time, see data/build_db.py.
+
+A donor's score is the fraction of its trigrams found in a run of adjacent words of
+the tweet, no more words than its name has, so a donor whose whole name appears in
+the tweet scores 1 however long the tweet is, but trigrams spanning words the name
+doesn't, e.g. "hotel gas" for "Elgas", don't count. Names shorter than
+MIN_NAME_TRIGRAMS are too likely to be found in ordinary words to be matched by
+name at all, only by their handles. Each donor is
+only indexed under its rarest few trigrams, enough that any donor which could reach
+MIN_SCORE shares one of them with the tweet (prefix filtering), so common trigrams
+like "ion" don't turn most donors into candidates. Candidates are then scored
+against all their trigrams.
+"""
+
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, NamedTuple, Set, Tuple
+
+from bot.db import TrigramIndexView
+from bot.replies import clean_donor_name
+
+ALPHABET = " abcdefghijklmnopqrstuvwxyz0123456789"
+# words left out of donor names, they're often left out when naming a donor
+NAME_STOP_WORDS = {
+    "the",
+    "and",
+    "of",
+    "limited",
+    "inc",
+    "incorporated",
+    "co",
+    "company",
+    "corp",
+    "corporation",
+}
+MIN_SCORE = 0.8
+# e.g. "Boral", " boral " has 5 trigrams
+MIN_NAME_TRIGRAMS = 6
+# trigrams in more donors than this fraction don't introduce candidates
+MAX_CANDIDATE_FRACTION = 0.02
+
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+_CODES = dict((character, code) for code, character in enumerate(ALPHABET))
+
+
+def words(text: str) -> List[str]:
+    # decompose accented letters so e.g. "à" is kept as "a"
+    text = unicodedata.normalize("NFKD", text.lower())
+    return _WORD_PATTERN.findall(text)
+
+
+def _trigram_codes(text: str) -> Set[int]:
+    """Trigrams of text, which must only contain ALPHABET, as integers."""
+    codes = [_CODES[character] for character in text]
+    size = len(ALPHABET)
+    return set(
+        (codes[i] * size + codes[i + 1]) * size + codes[i + 2]
+        for i in range(len(codes) - 2)
+    )
+
+
+def name_words(name: str) -> List[str]:
+    name_words = words(clean_donor_name(name=name))
+    return [w for w in name_words if w not in NAME_STOP_WORDS] or name_words
+
+
+def name_trigrams(name: str) -> Set[int]:
+    return _trigram_codes(f" {''.join(name_words(name))} ")
+
+
+def query_words(text: str) -> List[str]:
+    """The words of text, without those left out of names, so runs line up."""
+    return [w for w in words(text) if w not in NAME_STOP_WORDS]
+
+
+def text_trigrams(text: str) -> Set[int]:
+    """
+    Trigrams of each word, for the start and end of names, plus the trigrams of all
+    the words run together, for names of more than one word. Every trigram of any
+    run of words, see run_trigrams().
+    """
+    text_words = query_words(text)
+    codes = _trigram_codes("".join(text_words))
+    for word in text_words:
+        codes |= _trigram_codes(f" {word} ")
+    return codes
+
+
+def run_trigrams(text_words: List[str], length: int) -> List[Set[int]]:
+    """The trigrams of each run of length adjacent words, run together."""
+    return [
+        _trigram_codes(f" {''.join(text_words[start : start + length])} ")
+        for start in range(len(text_words) - length + 1)
+    ]
+
+
+def prefix_length(count: int) -> int:
+    """
+    How many of a name's rarest trigrams to index it under. A name with count
+    trigrams can only reach MIN_SCORE if the tweet contains at least this many of
+    them, so it must contain at least one of the rarest this many.
+    """
+    return count - math.ceil(MIN_SCORE * count) + 1
+
+
+def index_trigrams(
+    names: Iterable[str],
+) -> Dict[str, Tuple[List[int], List[int]]]:
+    """Map each donor name to (its trigrams, the rarest of them to index it under)."""
+    name_codes = dict((name, name_trigrams(name)) for name in names)
+    frequencies = Counter(code for codes in name_codes.values() for code in codes)
+    index = {}
+    for name, codes in name_codes.items():
+        rarest = sorted(codes, key=lambda code: (frequencies[code], code))
+        index[name] = (sorted(codes), rarest[: prefix_length(len(codes))])
+    return index
+
+
+class Match(NamedTuple):
+    donor_index: int
+    score: float
+
+
+def search(index: TrigramIndexView, text: str, k: int = 3) -> List[Match]:
+    """The k donors whose names best match text, best first."""
+    text_words = query_words(text)
+    text_codes = text_trigrams(text)
+    candidates: Set[int] = set()
+    for code in text_codes:
+        candidates.update(index.postings(code))
+
+    # run length -> trigrams of each run of that many words, found as needed
+    runs: Dict[int, List[Set[int]]] = {}
+
+    def runs_of(length: int) -> List[Set[int]]:
+        if length not in runs:
+            runs[length] = run_trigrams(text_words, length)
+        return runs[length]
+
+    matches = []
+    for donor_index in candidates:
+        codes = index.name_trigrams(donor_index)
+        # text_codes has every trigram of every run, so this is the best score any
+        # run could give, which rules out most candidates without finding the runs
+        if (
+            len(codes) < MIN_NAME_TRIGRAMS
+            or len(text_codes.intersection(codes)) < MIN_SCORE * len(codes)
+        ):
+            continue
+        word_count = len(name_words(index.name(donor_index)))
+        found = max(
+            len(run.intersection(codes))
+            for length in range(1, min(word_count, len(text_words)) + 1)
+            for run in runs_of(length)
+        )
+        if (score := found / len(codes)) >= MIN_SCORE:
+            matches.append(Match(donor_index=donor_index, score=score))
+    # prefer longer names when scores are equal, they're more specific
+    matches.sort(
+        key=lambda m: (
+            -m.score,
+            -len(index.name_trigrams(m.donor_index)),
+            m.donor_index,
+        )
+    )
+    return matches[:k]
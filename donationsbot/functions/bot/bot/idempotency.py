@@ -0,0 +1,216 @@
+"""
+Keep track of which tweets we've replied to, or are replying to, so that SQS
+redelivering a message doesn't cause a duplicate reply or use up our write limit.
+
+A tweet is claimed before replying, then marked complete once the reply is sent, or
+released if replying failed so it can be retried. Entries expire after a TTL: claims
+after a lease long enough to cover one attempt at replying, completed replies once
+SQS can no longer redeliver the message.
+"""
+
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from enum import Enum
+from typing import Callable, Optional, Tuple
+
+from shared.aws import lazy_client
+
+# longer than the bot lambda's timeout, so a claim outlives the attempt which made it
+IN_PROGRESS_TTL_SECONDS = 2 * 60
+# SQS's default message retention period
+COMPLETE_TTL_SECONDS = 4 * 24 * 60 * 60
+# a claim is tried again if the item blocking it has gone by the time it's read
+CLAIM_ATTEMPTS = 2
+
+
+class Status(str, Enum):
+    IN_PROGRESS = "IN_PROGRESS"
+    COMPLETE = "COMPLETE"
+
+
+class ClaimResult(Enum):
+    # we can go ahead and reply
+    CLAIMED = 1
+    # we've already replied
+    COMPLETE = 2
+    # someone else is replying right now
+    IN_PROGRESS = 3
+
+
+class IdempotencyStore(ABC):
+    @abstractmethod
+    def claim(self, tweet_id: str) -> ClaimResult:
+        pass
+
+    @abstractmethod
+    def complete(self, tweet_id: str) -> None:
+        pass
+
+    @abstractmethod
+    def release(self, tweet_id: str) -> None:
+        pass
+
+
+class InMemoryStore(IdempotencyStore):
+    """An LRU of tweet ids, which only lives as long as the lambda container."""
+
+    def __init__(self, max_size: int = 10000, clock: Callable[[], float] = time.time):
+        self.max_size = max_size
+        self._clock = clock
+        self._lock = threading.Lock()
+        # tweet id -> (status, expires at)
+        self._entries: "OrderedDict[str, Tuple[Status, float]]" = OrderedDict()
+
+    def _get(self, tweet_id: str) -> Optional[Status]:
+        if (entry := self._entries.get(tweet_id)) is None:
+            return None
+        status, expires_at = entry
+        if expires_at <= self._clock():
+            del self._entries[tweet_id]
+            return None
+        self._entries.move_to_end(tweet_id)
+        return status
+
+    def _set(self, tweet_id: str, status: Status, ttl_seconds: float) -> None:
+        self._entries[tweet_id] = (status, self._clock() + ttl_seconds)
+        self._entries.move_to_end(tweet_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get(self, tweet_id: str) -> Optional[Status]:
+        with self._lock:
+            return self._get(tweet_id)
+
+    def claim(self, tweet_id: str) -> ClaimResult:
+        with self._lock:
+            if (status := self._get(tweet_id)) is not None:
+                return ClaimResult[status.name]
+            self._set(tweet_id, Status.IN_PROGRESS, IN_PROGRESS_TTL_SECONDS)
+            return ClaimResult.CLAIMED
+
+    def complete(self, tweet_id: str) -> None:
+        with self._lock:
+            self._set(tweet_id, Status.COMPLETE, COMPLETE_TTL_SECONDS)
+
+    def release(self, tweet_id: str) -> None:
+        with self._lock:
+            self._entries.pop(tweet_id, None)
+
+
+class DynamoDBStore(IdempotencyStore):
+    """
+    Tweet ids in a DynamoDB table keyed on tweet_id, with TTL enabled on the
+    expires_at attribute. Claims are conditional writes, so only one invocation can
+    hold a claim at a time.
+    """
+
+    def __init__(
+        self, table_name: str, client_factory: Callable, clock=time.time
+    ) -> None:
+        self.table_name = table_name
+        self._client_factory = client_factory
+        self._clock = clock
+
+    @property
+    def _client(self):
+        return self._client_factory()
+
+    def claim(self, tweet_id: str) -> ClaimResult:
+        for _ in range(CLAIM_ATTEMPTS):
+            now = int(self._clock())
+            try:
+                self._client.put_item(
+                    TableName=self.table_name,
+                    Item={
+                        "tweet_id": {"S": tweet_id},
+                        "status": {"S": Status.IN_PROGRESS.value},
+                        "expires_at": {"N": str(now + IN_PROGRESS_TTL_SECONDS)},
+                    },
+                    # DynamoDB only deletes expired items eventually, so check
+                    # expiry too
+                    ConditionExpression=(
+                        "attribute_not_exists(tweet_id) OR expires_at < :now"
+                    ),
+                    ExpressionAttributeValues={":now": {"N": str(now)}},
+                )
+            except self._client.exceptions.ConditionalCheckFailedException:
+                # the botocore the lambda pins can't return the item which failed
+                # the condition, so it's read separately
+                if (status := self._get_status(tweet_id)) is None:
+                    # released, or expired, since
+                    continue
+                if status == Status.COMPLETE.value:
+                    return ClaimResult.COMPLETE
+                return ClaimResult.IN_PROGRESS
+            return ClaimResult.CLAIMED
+        return ClaimResult.IN_PROGRESS
+
+    def _get_status(self, tweet_id: str) -> Optional[str]:
+        response = self._client.get_item(
+            TableName=self.table_name,
+            Key={"tweet_id": {"S": tweet_id}},
+            ConsistentRead=True,
+        )
+        item = response.get("Item")
+        if item is None or int(item["expires_at"]["N"]) < int(self._clock()):
+            return None
+        return item["status"]["S"]
+
+    def complete(self, tweet_id: str) -> None:
+        self._client.put_item(
+            TableName=self.table_name,
+            Item={
+                "tweet_id": {"S": tweet_id},
+                "status": {"S": Status.COMPLETE.value},
+                "expires_at": {"N": str(int(self._clock()) + COMPLETE_TTL_SECONDS)},
+            },
+        )
+
+    def release(self, tweet_id: str) -> None:
+        self._client.delete_item(
+            TableName=self.table_name, Key={"tweet_id": {"S": tweet_id}}
+        )
+
+
+class TieredStore(IdempotencyStore):
+    """
+    An in-process LRU in front of a durable store. Tweets we know are complete are
+    answered from memory, everything else goes to the durable store.
+    """
+
+    def __init__(self, local: InMemoryStore, durable: IdempotencyStore) -> None:
+        self.local = local
+        self.durable = durable
+
+    def claim(self, tweet_id: str) -> ClaimResult:
+        if self.local.get(tweet_id) == Status.COMPLETE:
+            return ClaimResult.COMPLETE
+        result = self.durable.claim(tweet_id)
+        if result == ClaimResult.COMPLETE:
+            self.local.complete(tweet_id)
+        return result
+
+    def complete(self, tweet_id: str) -> None:
+        self.durable.complete(tweet_id)
+        self.local.complete(tweet_id)
+
+    def release(self, tweet_id: str) -> None:
+        self.local.release(tweet_id)
+        self.durable.release(tweet_id)
+
+
+def create_store() -> IdempotencyStore:
+    """
+    Use the DynamoDB table named by IDEMPOTENCY_TABLE_NAME if there is one, so
+    redeliveries to other lambda containers are caught too, otherwise only remember
+    tweets in memory.
+    """
+    local = InMemoryStore()
+    if not (table_name := os.environ.get("IDEMPOTENCY_TABLE_NAME")):
+        return local
+    dynamodb_client = lazy_client("dynamodb")
+    durable = DynamoDBStore(table_name=table_name, client_factory=dynamodb_client.get)
+    return TieredStore(local=local, durable=durable)
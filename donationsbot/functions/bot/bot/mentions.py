@@ -0,0 +1,163 @@
+"""
+Find the twitter handles, hashtags and donor aliases mentioned in a tweet.
+
+Every handle in the database, and every alias in data/tables/aliases.md, is a
+pattern in an Aho-Corasick automaton built at build time, see data/build_db.py. The
+automaton finds every pattern in the tweet in a single pass over its text, however
+many patterns there are, so "(@WoodsideEnergy)", "@WoodsideEnergy," and "what has
+Woodside donated?" all match. Matches must start and end on a word boundary, so
+#nine doesn't match in #ninenews.
+
+Where the tweet's entities were requested from twitter, its mentions and hashtags
+are taken from those instead of being found in the text.
+"""
+
+import re
+from collections import deque
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from bot.db import AutomatonView
+
+KIND_HANDLE = 0
+KIND_ALIAS = 1
+
+# mentions and hashtags the way twitter finds them, for tweets without entities
+TOKEN_PATTERN = re.compile(r"(?<![\w@#])[@#]\w+")
+
+
+class Pattern(NamedTuple):
+    # lowercase, e.g. "@woodsideenergy" or "woodside energy"
+    text: str
+    # the handle whose reply to use
+    key: str
+    kind: int
+
+
+class Automaton(NamedTuple):
+    # transitions, failure transitions, and the patterns which end in each state,
+    # including those of the states its failure transitions lead to
+    goto: List[Dict[str, int]]
+    fail: List[int]
+    outputs: List[List[int]]
+
+
+class Mention(NamedTuple):
+    start: int
+    # lowercase, as written in the tweet
+    text: str
+    # the handle whose reply to use, None if it isn't in the database
+    key: Optional[str]
+    kind: int
+
+
+def create_patterns(
+    handles: Iterable[str], aliases: Mapping[str, str]
+) -> List[Pattern]:
+    """aliases maps an alias to the handle it stands for."""
+    patterns = [
+        Pattern(text=handle, key=handle, kind=KIND_HANDLE) for handle in handles
+    ]
+    patterns += [
+        Pattern(text=normalise_alias(alias), key=handle, kind=KIND_ALIAS)
+        for alias, handle in aliases.items()
+    ]
+    return patterns
+
+
+def normalise_alias(alias: str) -> str:
+    return " ".join(alias.lower().split())
+
+
+def build_automaton(patterns: Sequence[str]) -> Automaton:
+    goto: List[Dict[str, int]] = [{}]
+    outputs: List[List[int]] = [[]]
+    for index, pattern in enumerate(patterns):
+        state = 0
+        for character in pattern:
+            if (next_state := goto[state].get(character)) is None:
+                next_state = len(goto)
+                goto[state][character] = next_state
+                goto.append({})
+                outputs.append([])
+            state = next_state
+        outputs[state].append(index)
+
+    # breadth first, so a state's failure transition always leads to a state whose
+    # outputs are already complete.
+    fail = [0] * len(goto)
+    queue = deque(goto[0].values())
+    while queue:
+        state = queue.popleft()
+        for character, next_state in goto[state].items():
+            queue.append(next_state)
+            if state:
+                fallback = fail[state]
+                while fallback and character not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(character, 0)
+            outputs[next_state] += outputs[fail[next_state]]
+    return Automaton(goto=goto, fail=fail, outputs=outputs)
+
+
+def is_word_boundary(text: str, start: int, end: int) -> bool:
+    before = text[start - 1] if start else " "
+    after = text[end] if end < len(text) else " "
+    return not (before.isalnum() or before in "_@#") and not (
+        after.isalnum() or after == "_"
+    )
+
+
+def entity_tokens(entities: Mapping[str, Any]) -> List[Tuple[int, str]]:
+    """(start, token) of the mentions and hashtags in a tweet's entities."""
+    tokens = [
+        (mention["start"], f"@{mention['username'].lower()}")
+        for mention in entities.get("mentions", [])
+    ]
+    tokens += [
+        (hashtag["start"], f"#{hashtag['tag'].lower()}")
+        for hashtag in entities.get("hashtags", [])
+    ]
+    return tokens
+
+
+def find_mentions(
+    text: str, automaton: AutomatonView, entities: Optional[Mapping[str, Any]] = None
+) -> List[Mention]:
+    """
+    The handles, hashtags and aliases in a tweet, in the order they appear.
+    entities are the tweet's entities from twitter, if they were requested.
+    """
+    text = text.lower()
+    # handles in the database which are in the tweet, by text
+    known_handles: Dict[str, str] = {}
+    mentions: Dict[int, Mention] = {}
+    for start, end, key, kind in automaton.scan(text):
+        if not is_word_boundary(text, start, end):
+            continue
+        if kind == KIND_HANDLE:
+            known_handles[text[start:end]] = key
+            continue
+        # the longest alias starting at each position wins
+        if (previous := mentions.get(start)) and len(previous.text) >= end - start:
+            continue
+        mentions[start] = Mention(start=start, text=text[start:end], key=key, kind=kind)
+
+    if entities is not None:
+        tokens = entity_tokens(entities)
+    else:
+        tokens = [(m.start(), m.group()) for m in TOKEN_PATTERN.finditer(text)]
+    for start, token in tokens:
+        mentions[start] = Mention(
+            start=start, text=token, key=known_handles.get(token), kind=KIND_HANDLE
+        )
+    return [mentions[start] for start in sorted(mentions)]
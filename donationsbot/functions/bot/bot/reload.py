@@ -0,0 +1,188 @@
+"""
+Load the donor database from S3, keep it in memory across warm invocations, and
+swap in new versions as they're published, so a dataset fix doesn't need a
+redeploy. See data/publish_db.py.
+
+The database packaged with the function is used until S3 has something newer. At
+most every DATABASE_CHECK_SECONDS, a conditional GET with the ETag of the version
+in use asks S3 for the database only if it has changed, which costs a round trip
+but no download when it hasn't. A new version is downloaded to a file of its own
+and opened before it replaces the old one, in a single assignment, so a reply in
+progress keeps reading the version it started with, and a download which fails or
+isn't a database leaves the old version in use.
+
+A local directory can stand in for the bucket, e.g. for scripts and benchmarks.
+"""
+
+import hashlib
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Optional
+
+from aws_lambda_powertools import Logger
+from botocore.exceptions import ClientError
+
+from bot.db import DonorDatabase
+from shared.aws import lazy_client
+from shared.lazy import LazyResource
+
+logger = Logger(child=True)
+
+DATABASE_BUCKET = os.environ.get("DATABASE_BUCKET")
+DATABASE_KEY = os.environ.get("DATABASE_KEY", "donors.db")
+# a local directory standing in for the bucket
+DATABASE_DIRECTORY = os.environ.get("DATABASE_DIRECTORY")
+DATABASE_CHECK_SECONDS = float(os.environ.get("DATABASE_CHECK_SECONDS", 60))
+# lambda's only writable directory
+DOWNLOAD_PATH = Path(tempfile.gettempdir())
+
+# what S3 answers a conditional GET with when the object hasn't changed
+NOT_MODIFIED_CODES = {"304", "NotModified"}
+
+
+def file_etag(path: Path) -> str:
+    """The ETag S3 gives a file uploaded in a single part, its quoted MD5."""
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return f'"{digest.hexdigest()}"'
+
+
+class S3Source:
+    def __init__(self, client: LazyResource, bucket: str, key: str) -> None:
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+
+    def fetch(self, etag: Optional[str], path: Path) -> Optional[str]:
+        """
+        Download the database to path unless its ETag is still etag. Returns its
+        ETag, or None if it hasn't changed or hasn't been published yet.
+        """
+        params = dict(Bucket=self.bucket, Key=self.key)
+        if etag:
+            params["IfNoneMatch"] = etag
+        client = self.client.get()
+        try:
+            response = client.get_object(**params)
+        except client.exceptions.NoSuchKey:
+            logger.debug(f"no donor database published to {self.bucket} yet")
+            return None
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in NOT_MODIFIED_CODES:
+                return None
+            raise
+        with open(path, "wb") as f:
+            shutil.copyfileobj(response["Body"], f)
+        return response["ETag"]
+
+
+class DirectorySource:
+    def __init__(self, directory: Path, key: str) -> None:
+        self.path = directory / key
+
+    def fetch(self, etag: Optional[str], path: Path) -> Optional[str]:
+        """Like S3Source.fetch, with ETags computed the way S3 computes them."""
+        if not self.path.exists():
+            return None
+        if (current := file_etag(self.path)) == etag:
+            return None
+        shutil.copyfile(self.path, path)
+        return current
+
+
+class ReloadingDatabase:
+    """
+    The current version of the donor database. get() is cheap between checks, and
+    safe to call from the threads replying concurrently.
+    """
+
+    def __init__(
+        self,
+        packaged: Path,
+        source=None,
+        check_seconds: float = DATABASE_CHECK_SECONDS,
+        download_path: Path = DOWNLOAD_PATH,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.packaged = packaged
+        self.source = source
+        self.check_seconds = check_seconds
+        self.download_path = download_path
+        self.etag: Optional[str] = None
+        # seconds the last check took, and how many versions have been loaded
+        self.check_seconds_taken: Optional[float] = None
+        self.loads = 0
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._database: Optional[DonorDatabase] = None
+        self._path: Optional[Path] = None
+        self._checked_at: Optional[float] = None
+        self._downloads = itertools.count()
+
+    def _is_due(self) -> bool:
+        if self._checked_at is None:
+            return True
+        if self.source is None:
+            return False
+        return self._clock() - self._checked_at >= self.check_seconds
+
+    def get(self) -> DonorDatabase:
+        if not self._is_due():
+            return self._database
+        with self._lock:
+            if self._is_due():
+                self._check()
+        return self._database
+
+    def _check(self) -> None:
+        start = time.perf_counter()
+        if self._database is None:
+            self._load(self.packaged, file_etag(self.packaged))
+        if self.source is not None:
+            try:
+                self._fetch()
+            except Exception:
+                # keep the version we have, and try again at the next check
+                logger.exception("failed to check for a new donor database")
+        self._checked_at = self._clock()
+        self.check_seconds_taken = time.perf_counter() - start
+
+    def _fetch(self) -> None:
+        path = self.download_path / f"donors-{os.getpid()}-{next(self._downloads)}.db"
+        try:
+            if (etag := self.source.fetch(self.etag, path)) is None:
+                return
+            previous = self._path
+            self._load(path, etag)
+        except Exception:
+            path.unlink(missing_ok=True)
+            raise
+        # the old version stays mapped until the replies still using it finish
+        if previous is not None:
+            previous.unlink(missing_ok=True)
+
+    def _load(self, path: Path, etag: str) -> None:
+        # open it before swapping it in, so a bad download raises here
+        database = DonorDatabase(path)
+        self._database = database
+        self._path = path if path != self.packaged else None
+        self.etag = etag
+        self.loads += 1
+        logger.info({"message": "loaded donor database", "etag": etag})
+
+
+def create_source():
+    if DATABASE_BUCKET:
+        return S3Source(
+            client=lazy_client("s3"), bucket=DATABASE_BUCKET, key=DATABASE_KEY
+        )
+    if DATABASE_DIRECTORY:
+        return DirectorySource(directory=Path(DATABASE_DIRECTORY), key=DATABASE_KEY)
+    return None
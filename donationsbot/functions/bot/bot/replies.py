@@ -0,0 +1,187 @@
+"""
+Build reply text from donor data.
+
+This module only depends on jinja2, bot.fitting and bot.series so that
+data/build_db.py can use it to precompute every reply at build time, which
+guarantees the bot's output is the same whether a reply was precomputed or built at
+runtime.
+"""
+
+from typing import List, Mapping, Sequence, Tuple
+
+import jinja2
+
+from bot.fitting import (
+    KIND_HEADING,
+    KIND_LINE,
+    KIND_REQUIRED_HEADING,
+    Segment,
+    make_segment,
+)
+from bot.series import EARLIER_YEARS_PREFIX, DonationSeries, year_order
+
+REMOVE_FROM_DONOR_NAME = ["pty", "ltd"]
+
+# the financial year replies lead with, unless the build found a later one. See
+# data/build_db.py
+RECENT_FINANCIAL_YEAR = "2020-21"
+# financial years before the recent one totalled on their own, before everything
+# earlier than them
+PREVIOUS_YEARS = 3
+
+NOT_FOUND_TEMPLATE = jinja2.Template(
+    source="""Could not find any donation data for {{ donors }}.
+    
+    If you think we're missing something, please help us with the dataset at https://github.com/LaunchlabAU/auspol-donations-twitter-bot"""
+)
+
+
+def format_money(amount: int) -> str:
+    return "${:,}".format(amount)
+
+
+def clean_donor_name(name: str) -> str:
+    new_name = " ".join(
+        part for part in name.split() if part.lower() not in REMOVE_FROM_DONOR_NAME
+    )
+    return new_name.strip()
+
+
+def combine_donor_data(donor_data):
+    name = " / ".join([d["name"] for d in donor_data])
+    donations = DonationSeries.combine([d["donations"] for d in donor_data])
+    return [{"name": name, "donations": donations}]
+
+
+def get_donor_data(
+    donor_set: List[str], donors: Mapping[str, DonationSeries]
+) -> List[dict]:
+    # combine donor names and donations for the template context
+    return [
+        {"name": clean_donor_name(name=donor), "donations": donors[donor]}
+        for donor in donor_set
+    ]
+
+
+def financial_year_headings(financial_year: str) -> Tuple[str, str]:
+    """
+    e.g. "2020-21" -> ("FY 20-21", "Before 2020"), and a bucket of earlier years,
+    "before 2020-21" -> ("Before 2020", "Before 2020"), see bot/series.py
+    """
+    if financial_year.startswith(EARLIER_YEARS_PREFIX):
+        _, heading = financial_year_headings(
+            financial_year[len(EARLIER_YEARS_PREFIX) :]
+        )
+        return heading, heading
+    start, end = financial_year.split("-")
+    return f"FY {start[-2:]}-{end}", f"Before {start}"
+
+
+def year_range_heading(first_year: str, last_year: str) -> str:
+    """e.g. ("2017-18", "2019-20") -> "FY 17-18 to 19-20"."""
+    first, _ = financial_year_headings(first_year)
+    if first_year == last_year:
+        return first
+    last, _ = financial_year_headings(last_year)
+    return f"{first} to {last[len('FY '):]}"
+
+
+def build_reply_segments(
+    donor_set: List[str],
+    donors: Mapping[str, DonationSeries],
+    recent_year: str = RECENT_FINANCIAL_YEAR,
+    variants: Sequence[str] = (),
+) -> List[Segment]:
+    """
+    Return the segments of a reply for a set of donors, in priority order, to be
+    fitted into a tweet after the recipients by bot.fitting.fit_segments.
+    variants are other names the donors gave under, see data/entities.py, whose
+    donations are included without adding to the name the reply leads with.
+    """
+    # combine donor names and donations so e.g. #nine, with multiple entities, fits
+    # into one reply.
+    donor = combine_donor_data(get_donor_data(donor_set=donor_set, donors=donors))[0]
+    if variants:
+        donor["donations"] = DonationSeries.combine(
+            [donor["donations"], *(donors[name] for name in variants)]
+        )
+    return render_segments(donor=donor, recent_year=recent_year)
+
+
+def render_lines(donations: List[Tuple[str, int]]) -> List[Segment]:
+    return [
+        make_segment(KIND_LINE, f"\n{party} {format_money(amount)}")
+        for party, amount in donations
+    ]
+
+
+def render_donor_lines(donors: List[Tuple[str, int]]) -> List[Segment]:
+    return [
+        make_segment(KIND_LINE, f"\n{clean_donor_name(name)} {format_money(amount)}")
+        for name, amount in donors
+    ]
+
+
+def render_earlier(heading: str, donations: List[Tuple[str, int]]) -> List[Segment]:
+    if donations:
+        total = sum(amount for _, amount in donations)
+        heading = f"\n\n{heading}: {format_money(total)} total"
+    else:
+        heading = f"\n\n{heading}: Nothing reported to AEC"
+    return [make_segment(KIND_HEADING, heading), *render_lines(donations)]
+
+
+def render_segments(donor: dict, recent_year: str) -> List[Segment]:
+    """
+    The segments of a reply for a donor from combine_donor_data: donations made in
+    recent_year, then before it. Once there are more than PREVIOUS_YEARS years
+    before it, those years get a section of their own, ahead of the years before
+    them, which are dropped first when the reply doesn't fit.
+    """
+    series: DonationSeries = donor["donations"]
+    recent_years = series.span(recent_year, recent_year)
+    recent = series.totals(recent_years)
+
+    recent_heading, earlier_heading = financial_year_headings(recent_year)
+    heading = f"\n\n{donor['name']}\n\n{recent_heading}:"
+    if not recent:
+        heading += " Nothing reported to AEC"
+    segments = [make_segment(KIND_REQUIRED_HEADING, heading)]
+    segments += render_lines(recent)
+
+    earlier_years = range(recent_years.start)
+    if len(earlier_years) <= PREVIOUS_YEARS:
+        return segments + render_earlier(earlier_heading, series.totals(earlier_years))
+    previous_years = earlier_years[-PREVIOUS_YEARS:]
+    first_year = series.years[previous_years[0]]
+    last_year = series.years[previous_years[-1]]
+    _, older_heading = financial_year_headings(first_year)
+    return (
+        segments
+        + render_earlier(
+            year_range_heading(first_year, last_year), series.totals(previous_years)
+        )
+        + render_earlier(older_heading, series.totals(range(previous_years.start)))
+    )
+
+
+def render_party_segments(
+    party: str, top_donors: Mapping[str, List[Tuple[str, int]]], recent_year: str
+) -> List[Segment]:
+    """
+    The segments of a reply for a party from its top donors in each financial year,
+    see bot.db.PartiesView: its biggest donors in recent_year, then in each year
+    before it, most recent first.
+    """
+    recent_heading, _ = financial_year_headings(recent_year)
+    heading = f"\n\nTop donors to {party}\n\n{recent_heading}:"
+    if not (recent := top_donors.get(recent_year, [])):
+        heading += " Nothing reported to AEC"
+    segments = [make_segment(KIND_REQUIRED_HEADING, heading)]
+    segments += render_donor_lines(recent)
+    for year in sorted(top_donors, key=year_order, reverse=True):
+        if year_order(year) < year_order(recent_year):
+            year_heading, _ = financial_year_headings(year)
+            segments.append(make_segment(KIND_HEADING, f"\n\n{year_heading}:"))
+            segments += render_donor_lines(top_donors[year])
+    return segments
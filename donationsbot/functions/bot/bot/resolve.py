@@ -0,0 +1,158 @@
+"""
+Work out what a mention is asking about: the handles it mentions, and the replies
+in the database for them, or the donor whose name it mentions.
+
+The watcher resolves mentions before queueing them, see watcher/index.py, so
+mentions without anything to reply to aren't queued at all, mentions the database
+has a reply for go to the fast lane, and mentions of handles it hasn't go to the
+low priority lane. The resolution travels in the message, and the bot replies from
+it without parsing the tweet again.
+
+This module only depends on the database and the modules finding things in it, so
+the watcher can use it without the rest of the bot.
+"""
+
+from enum import Enum
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from aws_lambda_powertools import Logger
+
+from bot.db import DonorDatabase
+from bot.fuzzy import MIN_SCORE, search
+from bot.mentions import KIND_ALIAS, find_mentions
+from bot.reload import ReloadingDatabase, create_source
+
+logger = Logger(child=True)
+
+CURRENT_PATH = Path(__file__).parent
+
+# memory mapped, records are only decoded when a reply needs them. Replies for
+# every handle are precomputed at build time, see data/build_db.py. New versions
+# published to S3 are swapped in without a redeploy, see bot/reload.py, so a reply
+# takes the current version once and uses it throughout.
+DATABASE = ReloadingDatabase(
+    packaged=CURRENT_PATH / "data" / "donors.db", source=create_source()
+)
+
+EXCLUDE_HANDLES = [
+    h.lower()
+    for h in ["@AusPolDonations", "#auspol", "#DonationsReform", "@SomeCompany"]
+]
+# a mention with other handles is only answered with a donor found by name if the
+# whole name is in it, e.g. an unmapped handle like @WoodsideEnergy, otherwise
+# it's more likely about them
+OTHER_HANDLES_MIN_SCORE = 1.0
+
+
+class Lane(str, Enum):
+    # nothing to reply to, not queued
+    NONE = "none"
+    # a reply from the database
+    FAST = "fast"
+    # only handles the database doesn't know, replied to with NOT_FOUND_TEMPLATE
+    NOT_FOUND = "not_found"
+
+
+class Resolution(NamedTuple):
+    # the handles mentioned, which the reply is addressed to
+    handles: List[str]
+    # hashtags to add back into the reply
+    hashtags: List[str]
+    # the handles whose replies could be used, in the order they were mentioned
+    reply_keys: List[str]
+    # the donor whose name the text matched, for mentions without reply_keys
+    donor_name: Optional[str] = None
+
+    @property
+    def lane(self) -> Lane:
+        if self.reply_keys or self.donor_name is not None:
+            return Lane.FAST
+        if self.handles:
+            return Lane.NOT_FOUND
+        return Lane.NONE
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**self._asdict(), "lane": self.lane.value}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Resolution":
+        return cls(*(data[field] for field in cls._fields))
+
+
+def get_handles_from_tweet(
+    tweet: str,
+    entities: Optional[Dict[str, Any]] = None,
+    database: Optional[DonorDatabase] = None,
+) -> Tuple[List[str], List[str], List[str]]:
+    """
+    The handles mentioned in a tweet, the hashtags to add back into the reply, and
+    the handles whose replies could be used, in the order they appear in the tweet.
+    An alias is replied to with the reply of the handle it stands for.
+    """
+    database = database or DATABASE.get()
+    mentions = find_mentions(
+        text=tweet,
+        automaton=database.automaton,
+        entities=entities,
+    )
+    handles = [m.text for m in mentions if m.kind != KIND_ALIAS]
+    filtered_handles = [handle for handle in handles if handle not in EXCLUDE_HANDLES]
+    # hash tags to add back into response, but not use in lookup
+    add_hashtags = [
+        handle
+        for handle in handles
+        if handle in EXCLUDE_HANDLES and handle.startswith("#")
+    ]
+    reply_keys = [m.key for m in mentions if m.key and m.text not in EXCLUDE_HANDLES]
+    return filtered_handles, add_hashtags, reply_keys
+
+
+def find_donor_by_name(
+    text: str,
+    database: DonorDatabase,
+    min_score: float = MIN_SCORE,
+    tweet_id: Optional[int] = None,
+) -> Optional[str]:
+    """
+    The donor whose name best matches the text of a tweet, for tweets without a
+    mapped handle, see bot/fuzzy.py
+    """
+    query = " ".join(
+        word for word in text.split() if word.lower() not in EXCLUDE_HANDLES
+    )
+    matches = search(database.trigrams, query, k=1)
+    if not matches or matches[0].score < min_score:
+        return None
+    name = database.donors.name(matches[0].donor_index)
+    logger.info(
+        f"tweet {tweet_id} matched {name} by name, score {matches[0].score:.2f}"
+    )
+    return name
+
+
+def resolve_mention(
+    text: str,
+    entities: Optional[Dict[str, Any]] = None,
+    database: Optional[DonorDatabase] = None,
+    tweet_id: Optional[int] = None,
+) -> Resolution:
+    database = database or DATABASE.get()
+    handles, hashtags, reply_keys = get_handles_from_tweet(
+        tweet=text, entities=entities, database=database
+    )
+    donor_name = None
+    if not reply_keys:
+        other_handles = any(handle.startswith("@") for handle in handles)
+        donor_name = find_donor_by_name(
+            text,
+            database,
+            min_score=OTHER_HANDLES_MIN_SCORE if other_handles else MIN_SCORE,
+            tweet_id=tweet_id,
+        )
+    return Resolution(
+        handles=handles,
+        hashtags=hashtags,
+        reply_keys=reply_keys,
+        donor_name=donor_name,
+    )
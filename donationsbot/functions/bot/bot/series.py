@@ -0,0 +1,144 @@
+"""
+Donations per party per financial year, as prefix sums.
+
+A donor's donations are a series per party, aligned with the financial years in
+the database: cumulative[i] is the total given to the party in years[0] to
+years[i]. The total over any range of years is then one subtraction per party,
+however many years the range covers, and series add up element by element, so
+combining a donor's entities is one pass over their series.
+
+This module has no dependencies so that data/build_db.py can use it too.
+"""
+
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+# a bucket of every year before a financial year, e.g. "before 2020-21", for data
+# which doesn't say which of those years the donations were made in. It's ordered
+# just ahead of the year it comes before.
+EARLIER_YEARS_PREFIX = "before "
+
+
+def earlier_years(financial_year: str) -> str:
+    """e.g. "2020-21" -> "before 2020-21"."""
+    return f"{EARLIER_YEARS_PREFIX}{financial_year}"
+
+
+def year_order(year: str) -> Tuple[str, int]:
+    """Sort key for financial years, and buckets of earlier years, oldest first."""
+    if year.startswith(EARLIER_YEARS_PREFIX):
+        return year[len(EARLIER_YEARS_PREFIX) :], 0
+    return year, 1
+
+
+class DonationSeries:
+    def __init__(
+        self, years: Sequence[str], cumulative: Mapping[str, Sequence[int]]
+    ) -> None:
+        # financial years look like "2020-21", oldest first, see year_order
+        self.years = tuple(years)
+        # party -> prefix sums, parties in the order they're displayed when tied
+        self.cumulative = dict(cumulative)
+
+    @classmethod
+    def from_amounts(
+        cls, years: Sequence[str], amounts: Mapping[str, Mapping[str, int]]
+    ) -> "DonationSeries":
+        """From party -> financial year -> amount."""
+        cumulative = dict()
+        for party, by_year in amounts.items():
+            total = 0
+            sums = []
+            for year in years:
+                total += by_year.get(year, 0)
+                sums.append(total)
+            cumulative[party] = sums
+        return cls(years=years, cumulative=cumulative)
+
+    @classmethod
+    def combine(cls, series: Sequence["DonationSeries"]) -> "DonationSeries":
+        """The sum of several series over the same years."""
+        years = series[0].years if series else ()
+        cumulative: Dict[str, List[int]] = dict()
+        for each in series:
+            if each.years != years:
+                raise ValueError("can't combine series over different years")
+            for party, sums in each.cumulative.items():
+                if (combined := cumulative.get(party)) is None:
+                    cumulative[party] = list(sums)
+                else:
+                    cumulative[party] = [a + b for a, b in zip(combined, sums)]
+        return cls(years=years, cumulative=cumulative)
+
+    def to_amounts(self) -> Dict[str, Dict[str, int]]:
+        """party -> financial year -> amount, without the years with nothing."""
+        amounts = dict()
+        for party, sums in self.cumulative.items():
+            previous = 0
+            by_year = dict()
+            for year, total in zip(self.years, sums):
+                if total != previous:
+                    by_year[year] = total - previous
+                previous = total
+            amounts[party] = by_year
+        return amounts
+
+    def span(self, first: Optional[str] = None, last: Optional[str] = None) -> range:
+        """
+        Indexes of the years from first to last inclusive, from the first year in
+        the series or to the last if either is None.
+        """
+        start = 0 if first is None else self._index(first, after=False)
+        end = len(self.years) if last is None else self._index(last, after=True)
+        return range(start, max(start, end))
+
+    def _index(self, year: str, after: bool) -> int:
+        # years missing from the series fall between their neighbours
+        order = year_order(year)
+        for index, each in enumerate(self.years):
+            if year_order(each) > order or (each == year and not after):
+                return index
+            if each == year:
+                return index + 1
+        return len(self.years)
+
+    def total(self, party: str, years: range) -> int:
+        """What was given to party in a span of years."""
+        if not years or (sums := self.cumulative.get(party)) is None:
+            return 0
+        before = sums[years.start - 1] if years.start else 0
+        return sums[years.stop - 1] - before
+
+    def totals(self, years: range) -> List[Tuple[str, int]]:
+        """(party, amount) given in a span of years, largest first, like a Counter"""
+        if not years:
+            return []
+        last, before = years.stop - 1, years.start - 1
+        donations = []
+        for party, sums in self.cumulative.items():
+            if amount := sums[last] - (sums[before] if before >= 0 else 0):
+                donations.append((party, amount))
+        donations.sort(key=lambda donation: donation[1], reverse=True)
+        return donations
+
+
+def donors_from_json(
+    data: Mapping[str, Mapping[str, Mapping[str, int]]]
+) -> Dict[str, DonationSeries]:
+    """
+    Each donor's series from donors.json, which maps donor -> party -> financial
+    year -> amount, over every year in the file. The years can include a bucket of
+    earlier years, see earlier_years.
+    """
+    years = sorted(
+        set(
+            year
+            for amounts in data.values()
+            for by_year in amounts.values()
+            for year in by_year
+        ),
+        key=year_order,
+    )
+    return dict(
+        (name, DonationSeries.from_amounts(years, amounts))
+        for name, amounts in data.items()
+    )
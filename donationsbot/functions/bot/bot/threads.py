@@ -0,0 +1,175 @@
+"""
+Pack the replies for every handle in a mention into as few tweets as possible,
+posted as a thread.
+
+Each reply is cut into chunks which fit in a tweet on their own, see
+reply_chunks(). A chunk never starts without saying who it's about: the first
+starts with the reply's required heading, and later ones with its title and the
+heading of the section they continue.
+
+Chunks are then bin packed into tweets, first fit decreasing: the lead chunk of
+the first handle mentioned is pinned to the first tweet, which also carries the
+recipients, cut to leave room for any reply's required heading, then the
+remaining chunks, biggest first, each go into the first tweet with room for
+them, or a new one. Within a tweet chunks keep the order they'd be read in, and
+tweets are ordered by the first chunk they hold. When the chunks take more than
+max_tweets, the lowest priority chunks, the oldest sections, then those of the
+handles mentioned last, are dropped until they fit.
+"""
+
+from typing import List, NamedTuple, Sequence
+
+from bot.fitting import (
+    KIND_HEADING,
+    KIND_LINE,
+    KIND_REQUIRED_HEADING,
+    TWITTER_MAX_CHARS,
+    Segment,
+    fit_prefix,
+    weighted_length,
+)
+
+
+class Chunk(NamedTuple):
+    # position in the thread when read in order, (reply, chunk within the reply)
+    order: tuple
+    text: str
+    # weighted length, see bot.fitting.weighted_length()
+    weight: int
+
+
+def thread_marker(number: int, count: int) -> str:
+    return f"\n\n{number}/{count}"
+
+
+def reply_title(heading: Segment) -> Segment:
+    """
+    "\\n\\n{title}\\n\\n{first section heading}" -> "\\n\\n{title}", see
+    bot.replies.render_segments(). Only the first name of combined donors, e.g.
+    "A / B / C" -> "A", which the lead chunk gives in full.
+    """
+    title = heading.text.rsplit("\n\n", 1)[0].split(" / ")[0]
+    return Segment(kind=KIND_HEADING, text=title, weight=weighted_length(title))
+
+
+def reply_chunks(reply: int, segments: List[Segment], capacity: int) -> List[Chunk]:
+    """
+    Cut a reply into chunks of at most capacity, between sections where possible,
+    otherwise between lines.
+    """
+    title = reply_title(segments[0])
+    chunks: List[Chunk] = []
+    parts: List[Segment] = []
+    weight = 0
+    # the headings a chunk starting at the current segment would need
+    context: List[Segment] = []
+
+    def close() -> None:
+        text = "".join(part.text for part in parts)
+        chunks.append(Chunk(order=(reply, len(chunks)), text=text, weight=weight))
+
+    # each section, a heading and its lines, is kept together if it fits
+    sections: List[List[Segment]] = []
+    for segment in segments:
+        if segment.kind == KIND_LINE and sections:
+            sections[-1].append(segment)
+        else:
+            sections.append([segment])
+
+    for section in sections:
+        heading, lines = section[0], section[1:]
+        section_weight = sum(segment.weight for segment in section)
+        if heading.kind == KIND_REQUIRED_HEADING:
+            context = [heading]
+        else:
+            context = [title, heading]
+        if parts and weight + section_weight > capacity:
+            close()
+            parts, weight = [title], title.weight
+        parts.append(heading)
+        weight += heading.weight
+        for line in lines:
+            if weight + line.weight > capacity and len(parts) > len(context):
+                close()
+                parts = list(context)
+                weight = sum(segment.weight for segment in parts)
+            parts.append(line)
+            weight += line.weight
+    close()
+    return chunks
+
+
+def pack_chunks(
+    chunks: Sequence[Chunk], first_capacity: int, capacity: int
+) -> List[List[Chunk]]:
+    """
+    First fit decreasing, with chunks[0] pinned to the first tweet, which has
+    first_capacity rather than capacity. Returns tweets in the order they're read.
+    """
+    tweets: List[List[Chunk]] = [[chunks[0]]]
+    room = [first_capacity - chunks[0].weight]
+    for chunk in sorted(chunks[1:], key=lambda chunk: (-chunk.weight, chunk.order)):
+        for index, available in enumerate(room):
+            if chunk.weight <= available:
+                tweets[index].append(chunk)
+                room[index] -= chunk.weight
+                break
+        else:
+            tweets.append([chunk])
+            room.append(capacity - chunk.weight)
+    for tweet in tweets:
+        tweet.sort(key=lambda chunk: chunk.order)
+    return tweets[:1] + sorted(tweets[1:], key=lambda tweet: tweet[0].order)
+
+
+def compose_thread(
+    prefix: str,
+    replies: Sequence[List[Segment]],
+    max_tweets: int,
+    max_length: int = TWITTER_MAX_CHARS,
+) -> List[str]:
+    """
+    The tweets of a thread replying with each of replies, in the order the handles
+    were mentioned, after prefix. Numbered "1/N" etc. if there's more than one.
+    """
+    heading_weight = max(
+        (
+            segment.weight
+            for segments in replies
+            for segment in segments
+            if segment.kind == KIND_REQUIRED_HEADING
+        ),
+        default=0,
+    )
+    recipients = prefix
+    tweets: List[List[Chunk]] = []
+    for marker_weight in (0, len(thread_marker(max_tweets, max_tweets))):
+        capacity = max_length - marker_weight
+        prefix = fit_prefix(recipients, capacity - heading_weight)
+        # every chunk fits in the first tweet, so the lead chunk can be pinned there
+        chunk_capacity = capacity - weighted_length(prefix)
+        chunks = [
+            chunk
+            for reply, segments in enumerate(replies)
+            for chunk in reply_chunks(reply, segments, chunk_capacity)
+        ]
+        tweets = pack_chunks(chunks, first_capacity=chunk_capacity, capacity=capacity)
+        if len(tweets) == 1:
+            break
+    # drop the lowest priority chunks until what's left fits
+    by_priority = sorted(chunks[1:], key=lambda chunk: chunk.order[::-1])
+    while len(tweets) > max_tweets:
+        by_priority.pop()
+        tweets = pack_chunks(
+            [chunks[0], *by_priority], first_capacity=chunk_capacity, capacity=capacity
+        )
+
+    texts = [prefix + "".join(chunk.text for chunk in tweets[0])]
+    texts += ["".join(chunk.text for chunk in tweet) for tweet in tweets[1:]]
+    texts = [text.lstrip() for text in texts]
+    if len(texts) > 1:
+        texts = [
+            text + thread_marker(number, len(texts))
+            for number, text in enumerate(texts, start=1)
+        ]
+    return texts
@@ -1,188 +1,227 @@
-import json
-from pathlib import Path
-from collections import Counter
-from typing import List, Tuple, Optional
-import jinja2
+import os
+from typing import Any, Dict, List, Optional
 
-import boto3
 from aws_lambda_powertools import Logger
+from requests.adapters import HTTPAdapter
 import tweepy
 
-ssm_client = boto3.client("ssm")
+from bot.db import DonorDatabase
+from bot.fitting import Segment, fit_segments
+from bot.replies import (
+    NOT_FOUND_TEMPLATE,
+    combine_donor_data,
+    get_donor_data,
+    render_party_segments,
+    render_segments,
+)
+from bot.resolve import DATABASE, Resolution, resolve_mention
+from bot.threads import compose_thread
+from shared.aws import lazy_parameters
+from shared.lazy import LazyResource
+from shared.ratelimit import TokenBucket
+from shared.timing import timed
 
 logger = Logger(child=True)
 
-
-twitter_param_strings = ssm_client.get_parameters(
-    Names=[
-        "TWITTER_ACCESS_TOKEN",
-        "TWITTER_ACCESS_TOKEN_SECRET",
-        "TWITTER_CONSUMER_KEY",
-        "TWITTER_CONSUMER_SECRET",
-    ],
-    WithDecryption=True,
-)
-
-twitter_credentials = dict(
-    (param["Name"].removeprefix("TWITTER_").lower(), param["Value"])
-    for param in twitter_param_strings.get("Parameters", [])
+# number of tweets replied to at once, see index.py
+REPLY_CONCURRENCY = int(os.environ.get("REPLY_CONCURRENCY", 10))
+
+# twitter's limit on creating tweets, until we've seen its x-rate-limit-* headers
+REPLY_RATE_LIMIT = int(os.environ.get("REPLY_RATE_LIMIT", 200))
+REPLY_RATE_LIMIT_WINDOW_SECONDS = 15 * 60
+# the most tweets replying to one mention, as a thread answering every handle in it.
+# 1 replies to the first handle only, in a single tweet.
+REPLY_THREAD_TWEETS = int(os.environ.get("REPLY_THREAD_TWEETS", 1))
+# replies in the rate limit which not found replies leave for mentions we can answer
+NOT_FOUND_REPLY_RESERVE = int(os.environ.get("NOT_FOUND_REPLY_RESERVE", 20))
+CREATE_TWEET_URL = "https://api.twitter.com/2/tweets"
+
+# replies we can send before being rate limited, shared by all threads
+reply_budget = TokenBucket(
+    name="create_tweet",
+    limit=REPLY_RATE_LIMIT,
+    window_seconds=REPLY_RATE_LIMIT_WINDOW_SECONDS,
 )
 
-tweepy_client = tweepy.Client(**twitter_credentials)
-
-CURRENT_PATH = Path(__file__).parent
-
-TWITTER_MAX_CHARS = 280
 
-REMOVE_FROM_DONOR_NAME = ["pty", "ltd"]
+class RateLimited(Exception):
+    def __init__(self, retry_after_seconds: float) -> None:
+        super().__init__(f"rate limited, retry after {retry_after_seconds:.0f}s")
+        self.retry_after_seconds = retry_after_seconds
 
-TEMPLATE = jinja2.Template(
-    source="""{{recipients}}{% for donor in donors %}
 
-{{ donor.name }}
+def update_reply_budget(response, *args, **kwargs) -> None:
+    """requests response hook, keeping reply_budget in line with twitter's."""
+    if response.request.method == "POST" and response.url == CREATE_TWEET_URL:
+        reply_budget.update_from_response(response.status_code, response.headers)
 
-FY 20-21: {% if donor.donations.fy_20_21 %}
-{% for donation in donor.donations.fy_20_21 %}
-{{ donation.0 }} {{ donation.1}}{% endfor %}
-{% else %}Nothing reported to AEC{% endif %}
 
-Before 2020: {% if donor.donations.fy_earlier %}
-{% for donation in donor.donations.fy_earlier %}
-{{ donation.0 }} {{ donation.1}}{% endfor %}
-{% else %}Nothing reported to AEC{% endif %}{% endfor %}"""
+twitter_params = lazy_parameters(
+    names=[
+        "TWITTER_ACCESS_TOKEN",
+        "TWITTER_ACCESS_TOKEN_SECRET",
+        "TWITTER_CONSUMER_KEY",
+        "TWITTER_CONSUMER_SECRET",
+    ]
 )
 
-# TODO: show total amount for earlier years.
-# how else to fit into a tweet.
 
-SHORT_TEMPLATE = jinja2.Template(
-    source="""{{recipients}}{% for donor in donors %}
+def create_tweepy_client() -> tweepy.Client:
+    twitter_credentials = dict(
+        (name.removeprefix("TWITTER_").lower(), value)
+        for name, value in twitter_params.get().items()
+    )
+    client = tweepy.Client(**twitter_credentials)
+    # allow a pooled connection per concurrent reply, rather than requests' default
+    # of 10, so connections are reused rather than dropped.
+    client.session.mount(
+        "https://", HTTPAdapter(pool_connections=1, pool_maxsize=REPLY_CONCURRENCY)
+    )
+    client.session.hooks["response"].append(update_reply_budget)
+    return client
 
-{{ donor.name }}
 
-FY 20-21: {% if donor.donations.fy_20_21 %}
-{% for donation in donor.donations.fy_20_21 %}
-{{ donation.0 }} {{ donation.1}}{% endfor %}
-{% else %}Nothing{% endif %}{% endfor %}"""
+# created on first use, and rebuilt whenever the credentials are refreshed.
+tweepy_client = LazyResource(
+    name="tweepy_client", factory=create_tweepy_client, depends_on=[twitter_params]
 )
 
-NOT_FOUND_TEMPLATE = jinja2.Template(
-    source="""Could not find any donation data for {{ donors }}.
-    
-    If you think we're missing something, please help us with the dataset at https://github.com/LaunchlabAU/auspol-donations-twitter-bot"""
-)
-
-
-with open(CURRENT_PATH / "data" / "twitter.json") as f:
-    TWITTER_HANDLES = json.load(f)
 
-with open(CURRENT_PATH / "data" / "donors.json") as f:
-    DONORS = json.load(f)
-
-EXCLUDE_HANDLES = [
-    h.lower()
-    for h in ["@AusPolDonations", "#auspol", "#DonationsReform", "@SomeCompany"]
-]
-
-
-def tweet_is_too_long(tweet: str) -> bool:
-    # TODO: follow rules here
-    # https://developer.twitter.com/en/docs/counting-characters
-    return len(tweet) > TWITTER_MAX_CHARS
-
-
-def format_money(amount: int) -> str:
-    return "${:,}".format(amount)
-
-
-def unformat_money(amount: str) -> int:
-    # TODO: we should delay formatting money rather than format and unformat!
-    return int(amount.replace("$", "").replace(",", ""))
-
-
-def get_handles_from_tweet(tweet: str) -> Tuple[List[str], List[str]]:
-    handles = [word.lower() for word in tweet.split() if word.startswith(("@", "#"))]
-    filtered_handles = [handle for handle in handles if handle not in EXCLUDE_HANDLES]
-    # hash tags to add back into response, but not use in lookup
-    add_hashtags = [
-        handle
-        for handle in handles
-        if handle in EXCLUDE_HANDLES and handle.startswith("#")
-    ]
-    return filtered_handles, add_hashtags
-
-
-def clean_donor_name(name: str) -> str:
-    new_name = " ".join(
-        part for part in name.split() if part.lower() not in REMOVE_FROM_DONOR_NAME
-    )
-    return new_name.strip()
-
-
-def combine_donor_data(donor_data):
-    name = " / ".join([d["name"] for d in donor_data])
-    fy_20_21 = Counter()
-    fy_earlier = Counter()
-    for donor in donor_data:
-        for donation in donor["donations"]["fy_20_21"]:
-            fy_20_21.update({donation[0]: unformat_money(donation[1])})
-        for donation in donor["donations"]["fy_earlier"]:
-            fy_earlier.update({donation[0]: unformat_money(donation[1])})
-    donations = {"fy_20_21": [], "fy_earlier": []}
-    for donor, amount in fy_20_21.most_common():
-        donations["fy_20_21"].append([donor, format_money(amount=amount)])
-    for donor, amount in fy_earlier.most_common():
-        donations["fy_earlier"].append([donor, format_money(amount=amount)])
-    return [{"name": name, "donations": donations}]
+def render_donor(name: str, database: DonorDatabase) -> List[Segment]:
+    """The reply for a donor matched by name, see bot/resolve.py"""
+    with timed("Combine"):
+        donor = combine_donor_data(
+            get_donor_data(donor_set=[name], donors=database.donors)
+        )[0]
+    with timed("Render"):
+        return render_segments(donor=donor, recent_year=database.meta["recent_year"])
+
+
+def lookup_reply(key: str, database: DonorDatabase) -> List[Segment]:
+    party = database.party_handles.get(key)
+    if party is None:
+        # replies are precomputed, so there's nothing to combine or render.
+        with timed("Lookup"):
+            return database.replies[key]
+    # who gives to a party is a single lookup in the reverse index
+    with timed("Lookup"):
+        top_donors = database.parties[party]
+    with timed("Render"):
+        return render_party_segments(
+            party=party, top_donors=top_donors, recent_year=database.meta["recent_year"]
+        )
+
+
+def send_tweet(in_reply_to_tweet_id: int, text: str) -> tweepy.Response:
+    """Reply, once the rate limit has been acquired."""
+    try:
+        with timed("CreateTweet"):
+            response = tweepy_client.get().create_tweet(
+                in_reply_to_tweet_id=in_reply_to_tweet_id, text=text
+            )
+    except tweepy.TooManyRequests:
+        # reply_budget has been updated from the response's headers
+        raise RateLimited(
+            retry_after_seconds=reply_budget.seconds_until_available()
+        ) from None
+    return response
+
+
+def create_tweet(in_reply_to_tweet_id: int, text: str, reserve: int = 0) -> None:
+    """
+    Reply if there's room in the rate limit, leaving reserve replies, otherwise
+    raise RateLimited so the reply can be retried once there is.
+    """
+    if (retry_after_seconds := reply_budget.try_acquire(reserve=reserve)) > 0:
+        raise RateLimited(retry_after_seconds=retry_after_seconds)
+    send_tweet(in_reply_to_tweet_id=in_reply_to_tweet_id, text=text)
+
+
+def create_thread(in_reply_to_tweet_id: int, texts: List[str]) -> None:
+    """
+    Reply with the first tweet, and each of the rest in reply to the one before.
+    The whole thread's share of the rate limit is taken up front, so it's deferred
+    before anything is sent rather than cut short.
+    """
+    if (retry_after_seconds := reply_budget.try_acquire(count=len(texts))) > 0:
+        raise RateLimited(retry_after_seconds=retry_after_seconds)
+    for number, text in enumerate(texts):
+        try:
+            response = send_tweet(in_reply_to_tweet_id=in_reply_to_tweet_id, text=text)
+        except Exception:
+            if number == 0:
+                raise
+            # retrying would repeat the tweets already sent, so stop here
+            logger.exception(f"sent {number} of the {len(texts)} tweets of a thread")
+            return
+        in_reply_to_tweet_id = response.data["id"]
 
 
 def reply_to_tweet(
-    id: int, text: str, testing: bool = False, in_reply_to_user_id: Optional[str] = None
+    id: int,
+    text: str,
+    testing: bool = False,
+    in_reply_to_user_id: Optional[str] = None,
+    entities: Optional[Dict[str, Any]] = None,
+    resolved: Optional[Dict[str, Any]] = None,
 ) -> None:
-    handles, hashtags_to_add_to_response = get_handles_from_tweet(tweet=text)
-    if not handles:
+    database = DATABASE.get()
+    with timed("Parse"):
+        if resolved is not None and resolved.get("database") == DATABASE.etag:
+            # resolved by the watcher, against the same version of the database
+            resolution = Resolution.from_dict(resolved)
+        else:
+            resolution = resolve_mention(
+                text=text, entities=entities, database=database, tweet_id=id
+            )
+    recipients = " ".join(resolution.handles)
+    if resolution.reply_keys:
+        # the reply for the first handle or alias in the tweet, or in a thread, for
+        # each of them. Handles for the same donors are only answered once.
+        reply_keys = resolution.reply_keys
+        keys = reply_keys if REPLY_THREAD_TWEETS > 1 else reply_keys[:1]
+        replies = dict.fromkeys(
+            tuple(lookup_reply(key=key, database=database)) for key in keys
+        )
+        replies = [list(reply) for reply in replies]
+    elif resolution.donor_name is not None:
+        replies = [render_donor(name=resolution.donor_name, database=database)]
+    else:
+        if resolution.handles:
+            with timed("Render"):
+                tweet_text = NOT_FOUND_TEMPLATE.render(donors=recipients)
+            create_tweet(
+                in_reply_to_tweet_id=id,
+                text=tweet_text,
+                reserve=NOT_FOUND_REPLY_RESERVE,
+            )
         return
-    donors_sets_from_handles = [
-        donor for handle in handles if (donor := TWITTER_HANDLES.get(handle))
-    ]
-    recipients = " ".join(handles)
-    if not donors_sets_from_handles:
-        tweet_text = NOT_FOUND_TEMPLATE.render(donors=recipients)
-        tweepy_client.create_tweet(in_reply_to_tweet_id=id, text=tweet_text)
-        return
-
-    # get the donors related to the first handle in the tweet
-    donor_set = donors_sets_from_handles[0]
-
-    # combine donor names and donations for the template context
-    donor_data = [
-        {"name": clean_donor_name(name=donor), "donations": DONORS[donor]}
-        for donor in donor_set
-    ]
 
-    # Testing: try combining donor data to reduce tweet size for e.g. #nine with multiple
-    # entities
-    # TODO: clean this up if it looks like combining entities will allow us to fit most
-    # cases within a tweet without having to drop contributions before FY 20-21
-    combined_donor_data = combine_donor_data(donor_data)
     # add #auspol hashtag to recipients - which has been stripped out to avoid trying
     # to match
-    for hashtag in hashtags_to_add_to_response:
+    for hashtag in resolution.hashtags:
         recipients += f" {hashtag}"
-    tweet_text = TEMPLATE.render(donors=combined_donor_data, recipients=recipients)
+    # fit as many donations as we can into the tweet, in a single pass over the
+    # precomputed segments, or pack them all into a thread, see bot/threads.py.
+    # without any recipients, don't start the reply with blank lines
+    with timed("Fit"):
+        if REPLY_THREAD_TWEETS > 1:
+            tweet_texts = compose_thread(
+                prefix=recipients, replies=replies, max_tweets=REPLY_THREAD_TWEETS
+            )
+        else:
+            tweet_text = fit_segments(prefix=recipients, segments=replies[0])
+            tweet_texts = [tweet_text.lstrip()]
     if testing:
-        print(tweet_text)
+        print("\n\n".join(tweet_texts))
         return
-    if tweet_is_too_long(tweet_text):
-        # TODO:
-        #  - better short template, include total donations for previous FY
-        #  - full tweet may be too long due to either FY 20/21 or earlier, we
-        #    should figure out which one.
-        tweet_text = SHORT_TEMPLATE.render(donors=donor_data, recipients=recipients)
 
     # send tweet
     try:
-        tweepy_client.create_tweet(in_reply_to_tweet_id=id, text=tweet_text)
+        if len(tweet_texts) == 1:
+            create_tweet(in_reply_to_tweet_id=id, text=tweet_texts[0])
+        else:
+            create_thread(in_reply_to_tweet_id=id, texts=tweet_texts)
     except tweepy.BadRequest as e:
         logger.info(msg=str(e))
-        logger.info(tweet_text)
+        logger.info(tweet_texts)
@@ -1,17 +1,159 @@
 import json
+import math
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional
 
-from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools import Logger, Metrics, Tracer
+from aws_lambda_powertools.metrics import MetricUnit
 from aws_lambda_powertools.utilities.data_classes import SQSEvent, event_source
+from aws_lambda_powertools.utilities.data_classes.sqs_event import SQSRecord
 from aws_lambda_powertools.utilities.typing import LambdaContext
-from bot.twitter import reply_to_tweet
+from bot.idempotency import ClaimResult, create_store
+from bot.twitter import (
+    DATABASE,
+    REPLY_CONCURRENCY,
+    RateLimited,
+    reply_budget,
+    reply_to_tweet,
+)
+from shared.aws import lazy_client
+from shared.lazy import init_timings
+from shared.profiling import Profiles, should_profile
+from shared.timing import timed
+
+# added to deferrals so messages reappear just after the rate limit resets
+DEFER_MARGIN_SECONDS = 1
+# SQS's maximum visibility timeout
+MAX_VISIBILITY_TIMEOUT_SECONDS = 12 * 60 * 60
 
 tracer = Tracer()
 logger = Logger()
+metrics = Metrics()
+
+sqs_client = lazy_client("sqs")
+
+# Replying is mostly waiting on twitter, so the records in a batch are handled
+# concurrently. The pool lives outside the handler so it, and the HTTP connections
+# its threads use, are reused across warm invocations.
+executor = ThreadPoolExecutor(max_workers=REPLY_CONCURRENCY)
+
+# SQS delivers messages at least once, so remember which tweets we've replied to.
+idempotency_store = create_store()
+
+# the first invocation in a lambda container is a cold start, whose timings include
+# e.g. creating clients, so they're published separately from warm invocations'.
+cold_start = True
+
+
+class ReplyInProgress(Exception):
+    pass
+
+
+def process_record(tweet: Dict[str, Any]) -> None:
+    tweet_id = str(tweet["id"])
+    result = idempotency_store.claim(tweet_id)
+    if result == ClaimResult.COMPLETE:
+        logger.info(f"already replied to tweet {tweet_id}, skipping")
+        return
+    if result == ClaimResult.IN_PROGRESS:
+        # fail the message, so it's retried once the other attempt has finished
+        raise ReplyInProgress(tweet_id)
+    try:
+        with timed("Reply"):
+            reply_to_tweet(**tweet)
+    except Exception:
+        idempotency_store.release(tweet_id)
+        raise
+    try:
+        idempotency_store.complete(tweet_id)
+    except Exception:
+        # the reply has been sent, so don't fail the message and have it retried.
+        # The claim expires on its own.
+        logger.exception(f"failed to mark tweet {tweet_id} as replied to")
+
+
+def queue_url(record: SQSRecord) -> str:
+    """
+    The URL of the queue a record came from, the fast lane's or the low priority
+    lane's, see bot/resolve.py
+    """
+    # arn:aws:sqs:<region>:<account>:<name>
+    _, _, _, region, account, name = record.event_source_arn.split(":")
+    return f"https://sqs.{region}.amazonaws.com/{account}/{name}"
+
+
+def defer(record: SQSRecord, delay_seconds: float) -> None:
+    """
+    Hide a message from the queue until the rate limit resets, rather than having
+    it retried straight away.
+    """
+    visibility_timeout = min(
+        math.ceil(delay_seconds + DEFER_MARGIN_SECONDS),
+        MAX_VISIBILITY_TIMEOUT_SECONDS,
+    )
+    try:
+        sqs_client.get().change_message_visibility(
+            QueueUrl=queue_url(record),
+            ReceiptHandle=record.receipt_handle,
+            VisibilityTimeout=visibility_timeout,
+        )
+    except Exception:
+        # it'll be retried after the queue's visibility timeout instead
+        logger.exception(f"failed to defer message {record.message_id}")
+
+
+def process_records(
+    records: Iterable[SQSRecord],
+    executor: Executor,
+    profiles: Optional[Profiles] = None,
+) -> List[Dict[str, str]]:
+    """
+    Reply to each record, returning the batch item failures for the records which
+    failed, so only those are retried by SQS. Replies which are rate limited are
+    deferred until the limit resets. If profiles are given, each reply is profiled.
+    """
+    tweets = [(record, json.loads(record.body)) for record in records]
+    # tweet ids increase over time, so when we're close to the rate limit the oldest
+    # mentions get the remaining replies.
+    tweets.sort(key=lambda record_tweet: int(record_tweet[1]["id"]))
+    process = profiles.profiled(process_record) if profiles else process_record
+    futures = [(record, executor.submit(process, tweet)) for record, tweet in tweets]
+    failures = []
+    for record, future in futures:
+        try:
+            future.result()
+        except RateLimited as e:
+            logger.info(f"deferring message {record.message_id}: {e}")
+            defer(record=record, delay_seconds=e.retry_after_seconds)
+            failures.append({"itemIdentifier": record.message_id})
+        except Exception:
+            logger.exception(f"failed to process message {record.message_id}")
+            failures.append({"itemIdentifier": record.message_id})
+    return failures
 
 
 @logger.inject_lambda_context()
+@metrics.log_metrics(capture_cold_start_metric=True)
 @tracer.capture_lambda_handler
 @event_source(data_class=SQSEvent)
-def handler(event: SQSEvent, context: LambdaContext) -> None:
-    for record in event.records:
-        reply_to_tweet(**json.loads(record.body))
+def handler(event: SQSEvent, context: LambdaContext) -> Dict[str, Any]:
+    global cold_start
+    metrics.add_dimension(name="start", value="cold" if cold_start else "warm")
+    cold_start = False
+    # usually nothing to do, at most every DATABASE_CHECK_SECONDS a conditional GET
+    # to S3, see bot/reload.py
+    with timed("Revalidate"):
+        DATABASE.get()
+    profiles = Profiles() if should_profile() else None
+    failures = process_records(
+        records=event.records, executor=executor, profiles=profiles
+    )
+    if profiles:
+        profiles.report(name=context.aws_request_id)
+    metrics.add_metric(
+        name="ReplyBudgetRemaining",
+        unit=MetricUnit.Count,
+        value=reply_budget.current_remaining(),
+    )
+    logger.debug({"init_timings": init_timings()})
+    return {"batchItemFailures": failures}
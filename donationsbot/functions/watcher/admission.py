@@ -0,0 +1,168 @@
+"""
+Decide which mentions get a reply before they're queued, so pile-ons, copy and
+paste spam, and one account mentioning us over and over don't use up our write
+limit and hold up everyone else's replies.
+
+Within each window of ADMISSION_WINDOW_SECONDS, a mention is admitted as long as
+fewer than ADMISSION_MAX_PER_AUTHOR mentions from its author, fewer than
+ADMISSION_MAX_PER_CONVERSATION from its conversation, fewer than
+ADMISSION_MAX_PER_TEXT with the same text from its author, and the same text from
+fewer than ADMISSION_MAX_AUTHORS_PER_TEXT authors, have been. Different people
+often ask the same thing, e.g. "@AusPolDonations @Woodside", so a text is only
+rejected once it's been copied by more authors than a genuine question would be.
+Texts are compared by a hash of their normalised text, without the mentions a
+reply starts with, case or spacing. Other mentions are kept, they're the handles
+being asked about, as are the leading mentions of a text which is only mentions.
+
+Each of those is a sliding window counter: a count for the current fixed window
+and the one before it, with the previous window's count weighted by how much of
+it still overlaps the sliding window. That's approximate, but it's three numbers
+per key, rather than a timestamp per mention. Mentions are counted at the time
+they were created, so a backfill counts them the way the watcher would have.
+Keys which have dropped out of the window are pruned, and beyond MAX_KEYS the
+least recently used are dropped, so the state stays small enough to store in S3
+between invocations.
+"""
+
+import hashlib
+import os
+import re
+import time
+from collections import Counter
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional
+
+import tweepy
+
+ADMISSION_WINDOW_SECONDS = int(os.environ.get("ADMISSION_WINDOW_SECONDS", 60 * 60))
+ADMISSION_MAX_PER_AUTHOR = int(os.environ.get("ADMISSION_MAX_PER_AUTHOR", 5))
+ADMISSION_MAX_PER_CONVERSATION = int(
+    os.environ.get("ADMISSION_MAX_PER_CONVERSATION", 10)
+)
+ADMISSION_MAX_PER_TEXT = int(os.environ.get("ADMISSION_MAX_PER_TEXT", 1))
+ADMISSION_MAX_AUTHORS_PER_TEXT = int(
+    os.environ.get("ADMISSION_MAX_AUTHORS_PER_TEXT", 25)
+)
+MAX_KEYS = 5000
+# tweet fields only used for admission, which the bot doesn't need
+ADMISSION_TWEET_FIELDS = ["author_id", "conversation_id", "created_at"]
+
+# the mentions twitter prefixes a reply with
+LEADING_MENTIONS_PATTERN = re.compile(r"^\s*(?:@\w+\s*)+")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+
+
+class Decision(str, Enum):
+    # values are metric names
+    ADMITTED = "Admitted"
+    AUTHOR = "RejectedAuthor"
+    CONVERSATION = "RejectedConversation"
+    DUPLICATE = "RejectedDuplicate"
+    COPIED = "RejectedCopied"
+
+
+def text_key(text: str) -> str:
+    """A hash of the text, ignoring leading mentions, case and spacing."""
+    text = LEADING_MENTIONS_PATTERN.sub("", text) or text
+    text = text.casefold()
+    text = WHITESPACE_PATTERN.sub(" ", text).strip()
+    return hashlib.blake2b(text.encode(), digest_size=8).hexdigest()
+
+
+class SlidingWindowCounter:
+    def __init__(
+        self, window_seconds: int, state: Optional[Dict[str, List[float]]] = None
+    ) -> None:
+        self.window_seconds = window_seconds
+        # key -> [current window's start, its count, the previous window's count]
+        self.windows: Dict[str, List[float]] = dict(state or {})
+
+    def _window(self, key: str, now: float) -> List[float]:
+        start = now - now % self.window_seconds
+        window = self.windows.setdefault(key, [start, 0, 0])
+        if start > window[0]:
+            previous = window[1] if start - window[0] == self.window_seconds else 0
+            window[:] = [start, 0, previous]
+        return window
+
+    def count(self, key: str, now: float) -> float:
+        if key not in self.windows:
+            return 0
+        start, current, previous = self._window(key, now)
+        if now < start:
+            # older than the window we're counting, e.g. from an earlier page
+            return current
+        overlap = 1 - (now - start) / self.window_seconds
+        return current + previous * overlap
+
+    def add(self, key: str, now: float) -> None:
+        self._window(key, now)[1] += 1
+
+    def prune(self, now: float, max_keys: int) -> None:
+        """Drop keys which no longer count, then the least recent over max_keys."""
+        oldest = now - now % self.window_seconds - self.window_seconds
+        self.windows = dict(
+            (key, window) for key, window in self.windows.items() if window[0] >= oldest
+        )
+        if len(self.windows) > max_keys:
+            recent = sorted(self.windows.items(), key=lambda item: item[1][0])
+            self.windows = dict(recent[-max_keys:])
+
+
+class Admission:
+    def __init__(
+        self,
+        state: Optional[Dict[str, Any]] = None,
+        window_seconds: int = ADMISSION_WINDOW_SECONDS,
+        max_per_author: int = ADMISSION_MAX_PER_AUTHOR,
+        max_per_conversation: int = ADMISSION_MAX_PER_CONVERSATION,
+        max_per_text: int = ADMISSION_MAX_PER_TEXT,
+        max_authors_per_text: int = ADMISSION_MAX_AUTHORS_PER_TEXT,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.counter = SlidingWindowCounter(
+            window_seconds=window_seconds, state=(state or {}).get("windows")
+        )
+        self.limits = [
+            ("author", max_per_author, Decision.AUTHOR),
+            ("conversation", max_per_conversation, Decision.CONVERSATION),
+            ("text", max_per_text, Decision.DUPLICATE),
+            ("copies", max_authors_per_text, Decision.COPIED),
+        ]
+        self._clock = clock
+        # decisions made by this instance, for metrics
+        self.decisions: Counter = Counter()
+
+    def admit(self, tweet: tweepy.Tweet) -> Decision:
+        now = tweet.created_at.timestamp() if tweet.created_at else self._clock()
+        text = text_key(tweet.text)
+        keys = dict(
+            author=tweet.author_id,
+            conversation=tweet.conversation_id,
+            # the same text from the same author
+            text=None if tweet.author_id is None else f"{tweet.author_id}:{text}",
+            # the same text from any author, counted once per author
+            copies=text,
+        )
+        decision = Decision.ADMITTED
+        for name, limit, rejected in self.limits:
+            if keys[name] is not None:
+                if self.counter.count(f"{name}:{keys[name]}", now) >= limit:
+                    decision = rejected
+                    break
+        if decision == Decision.ADMITTED:
+            if keys["text"] is not None and self.counter.count(
+                f"text:{keys['text']}", now
+            ):
+                # the author has already copied this text
+                keys["copies"] = None
+            for name, key in keys.items():
+                if key is not None:
+                    self.counter.add(f"{name}:{key}", now)
+        self.decisions[decision] += 1
+        return decision
+
+    def state(self) -> Dict[str, Any]:
+        """Pruned to what still counts, to be passed back in next time."""
+        self.counter.prune(now=self._clock(), max_keys=MAX_KEYS)
+        return {"windows": self.counter.windows}
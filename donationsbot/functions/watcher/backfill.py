@@ -0,0 +1,257 @@
+"""
+Queue the mentions the watcher missed, e.g. during an outage longer than
+POLL_INTERVAL_SECONDS with latest_id.txt lost, see
+index.get_starting_point_kwargs().
+
+The time range is split into windows of window_seconds, whose mentions are
+fetched in parallel, within the mentions endpoint's rate limit. Windows are sent
+to the queue in chronological order, oldest mention first, skipping tweets an
+earlier window already sent: each window is sent once the one before it has
+been, while the windows after it are fetched. Once a window has been queued it's
+recorded in the backfill's progress object in S3, and a backfill of the same
+range started again, e.g. after the lambda timed out, skips the windows which
+were. A window which was interrupted part way through is queued again in full,
+and the bot skips the mentions it has already replied to, see
+bot/idempotency.py. Fetches waiting for the rate limit to reset give up once the
+backfill stops, rather than keeping the lambda running past its timeout.
+
+Twitter only serves the 800 most recent mentions from the mentions timeline, so
+a backfill can't reach further back than that.
+
+Invoke the TweetBackfill lambda with e.g.
+
+    {"start_time": "2022-05-01T00:00:00Z", "end_time": "2022-05-03T00:00:00Z"}
+
+and optionally "window_seconds". If it returns "complete": false, invoke it again
+with the same event to carry on.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Set, Tuple
+
+import arrow
+import tweepy
+from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+from admission import Admission, Decision
+from index import (
+    BUCKET_NAME,
+    MAX_RESULTS_TWITTER,
+    TWEET_FIELDS,
+    get_twitter_id,
+    queue_tweets,
+    s3_client,
+    tweepy_client,
+)
+from shared.lazy import init_timings
+from shared.ratelimit import TokenBucket
+
+BACKFILL_WINDOW_SECONDS = int(os.environ.get("BACKFILL_WINDOW_SECONDS", 60 * 60))
+# windows fetched at once
+BACKFILL_CONCURRENCY = int(os.environ.get("BACKFILL_CONCURRENCY", 4))
+# the user mention timeline's limit for an app
+MENTIONS_RATE_LIMIT = 450
+MENTIONS_RATE_LIMIT_WINDOW_SECONDS = 15 * 60
+PROGRESS_KEY_PREFIX = "backfill/"
+# stop before the lambda times out, leaving time to record progress
+STOP_MARGIN_SECONDS = 60
+# while waiting for the rate limit to reset, how often to check whether to stop
+STOP_CHECK_SECONDS = 5
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+tracer = Tracer()
+logger = Logger()
+
+# requests we can make before being rate limited, shared by all windows
+mentions_budget = TokenBucket(
+    name="get_users_mentions",
+    limit=MENTIONS_RATE_LIMIT,
+    window_seconds=MENTIONS_RATE_LIMIT_WINDOW_SECONDS,
+)
+
+
+class Stopped(Exception):
+    pass
+
+
+class Window(NamedTuple):
+    # inclusive
+    start_time: str
+    # exclusive, like the API's end_time
+    end_time: str
+
+
+def split_windows(start_time: str, end_time: str, window_seconds: int) -> List[Window]:
+    start, end = arrow.get(start_time), arrow.get(end_time)
+    windows = []
+    while start < end:
+        window_end = min(start.shift(seconds=window_seconds), end)
+        windows.append(
+            Window(start.strftime(TIME_FORMAT), window_end.strftime(TIME_FORMAT))
+        )
+        start = window_end
+    return windows
+
+
+def progress_key(start_time: str, end_time: str) -> str:
+    return f"{PROGRESS_KEY_PREFIX}{start_time}_{end_time}.json"
+
+
+def load_progress(key: str) -> Dict[str, int]:
+    """window start time -> mentions in it, for the windows already queued"""
+    try:
+        response = s3_client.get().get_object(Bucket=BUCKET_NAME, Key=key)
+    except s3_client.get().exceptions.NoSuchKey:
+        return {}
+    return json.loads(response["Body"].read())["windows"]
+
+
+def store_progress(key: str, windows: Dict[str, int]) -> None:
+    s3_client.get().put_object(
+        Bucket=BUCKET_NAME,
+        Key=key,
+        ContentType="application/json",
+        Body=json.dumps({"windows": windows}).encode(),
+    )
+
+
+def get_mentions(
+    sleep: Callable[[float], None], should_stop: Callable[[], bool], **params
+) -> tweepy.Response:
+    """
+    get_users_mentions, waiting for the rate limit to reset when it's used up.
+    Raises Stopped if should_stop() becomes true while waiting.
+    """
+    while True:
+        if (retry_after_seconds := mentions_budget.try_acquire()) > 0:
+            if should_stop():
+                raise Stopped()
+            logger.debug(f"rate limited, {retry_after_seconds:.0f}s until reset")
+            sleep(min(retry_after_seconds, STOP_CHECK_SECONDS))
+            continue
+        try:
+            return tweepy_client.get().get_users_mentions(
+                id=get_twitter_id(),
+                max_results=MAX_RESULTS_TWITTER,
+                expansions=["in_reply_to_user_id"],
+                tweet_fields=TWEET_FIELDS,
+                **params,
+            )
+        except tweepy.TooManyRequests as e:
+            mentions_budget.update_from_response(
+                e.response.status_code, e.response.headers
+            )
+
+
+def fetch_window(
+    window: Window, sleep: Callable[[float], None], should_stop: Callable[[], bool]
+) -> List[tweepy.Tweet]:
+    """The window's mentions, oldest first."""
+    params = dict(start_time=window.start_time, end_time=window.end_time)
+    response = get_mentions(sleep=sleep, should_stop=should_stop, **params)
+    tweets = list(response.data or [])
+    while next_token := response.meta.get("next_token"):
+        response = get_mentions(
+            sleep=sleep, should_stop=should_stop, pagination_token=next_token, **params
+        )
+        tweets += response.data or []
+    tweets.reverse()
+    return tweets
+
+
+def backfill(
+    start_time: str,
+    end_time: str,
+    window_seconds: int = BACKFILL_WINDOW_SECONDS,
+    concurrency: int = BACKFILL_CONCURRENCY,
+    should_stop: Callable[[], bool] = lambda: False,
+    sleep: Callable[[float], None] = time.sleep,
+) -> Dict[str, Any]:
+    """
+    Queue the mentions between start_time and end_time which earlier runs haven't,
+    until they're all queued or should_stop() is true before a window is queued.
+    """
+    key = progress_key(start_time=start_time, end_time=end_time)
+    windows = split_windows(start_time, end_time, window_seconds)
+    progress = load_progress(key)
+    remaining = (window for window in windows if window.start_time not in progress)
+    queued_ids: Set[int] = set()
+    # counted afresh, at the times the mentions were made, see admission.py
+    admission = Admission()
+    lanes: Counter = Counter()
+
+    # set once this run is over, so fetches waiting on the rate limit give up
+    stopping = threading.Event()
+
+    def is_stopping() -> bool:
+        return stopping.is_set() or should_stop()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        # fetch up to a window ahead per thread, so stopping wastes little of the
+        # rate limit
+        fetches: Deque[Tuple[Window, Future]] = deque()
+
+        def fetch_next() -> None:
+            if (window := next(remaining, None)) is not None:
+                fetches.append(
+                    (window, pool.submit(fetch_window, window, sleep, is_stopping))
+                )
+
+        try:
+            for _ in range(2 * concurrency):
+                fetch_next()
+            while fetches and not should_stop():
+                window, fetch = fetches.popleft()
+                try:
+                    tweets = fetch.result()
+                except Stopped:
+                    break
+                fetch_next()
+                tweets = [tweet for tweet in tweets if tweet.id not in queued_ids]
+                queued_ids.update(tweet.id for tweet in tweets)
+                # sent while the next windows are fetched, but before the next
+                # window is sent, so mentions are queued oldest first. Raises if
+                # any of the window wasn't queued, leaving it to be queued again.
+                for future in queue_tweets(tweets, admission=admission, lanes=lanes):
+                    future.result()
+                progress[window.start_time] = len(tweets)
+                store_progress(key=key, windows=progress)
+        finally:
+            stopping.set()
+            for _, fetch in fetches:
+                fetch.cancel()
+
+    return {
+        "complete": len(progress) == len(windows),
+        "windows": len(windows),
+        "windows_queued": len(progress),
+        "mentions": sum(progress.values()),
+        "not_admitted": sum(
+            count
+            for decision, count in admission.decisions.items()
+            if decision != Decision.ADMITTED
+        ),
+        "lanes": dict((lane.value, count) for lane, count in lanes.items()),
+    }
+
+
+@logger.inject_lambda_context()
+@tracer.capture_lambda_handler
+def handler(event: Dict[str, Any], context: LambdaContext) -> Dict[str, Any]:
+    result = backfill(
+        start_time=event["start_time"],
+        end_time=event["end_time"],
+        window_seconds=int(event.get("window_seconds", BACKFILL_WINDOW_SECONDS)),
+        should_stop=lambda: (
+            context.get_remaining_time_in_millis() < STOP_MARGIN_SECONDS * 1000
+        ),
+    )
+    logger.info(result)
+    logger.debug({"init_timings": init_timings()})
+    return result
@@ -1,52 +1,80 @@
 import json
 import os
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from typing import Any, Dict, Generator, List, Union, Optional
 
 import arrow
-import boto3
 import tweepy
-from aws_lambda_powertools import Logger, Tracer
+from aws_lambda_powertools import Logger, Metrics, Tracer
+from aws_lambda_powertools.metrics import MetricUnit
 from aws_lambda_powertools.utilities.typing import LambdaContext
 
+from admission import ADMISSION_TWEET_FIELDS, Admission, Decision
+from bot.resolve import DATABASE, Lane, resolve_mention
+from shared.aws import lazy_client, lazy_parameters
+from shared.lazy import LazyResource, init_timings
+
 BUCKET_NAME = os.environ["BUCKET_NAME"]
 SQS_QUEUE_URL = os.environ["SQS_QUEUE_URL"]
+# not found mentions, replied to in bulk, see bot/resolve.py. Without one they share
+# SQS_QUEUE_URL with the mentions we can answer.
+LOW_PRIORITY_QUEUE_URL = os.environ.get("LOW_PRIORITY_QUEUE_URL", SQS_QUEUE_URL)
 POLL_INTERVAL_SECONDS = int(os.environ.get("POLL_INTERVAL_SECONDS", 60))
 
 tracer = Tracer()
 logger = Logger()
+metrics = Metrics()
 
-s3_client = boto3.client("s3")
-sqs_client = boto3.client("sqs")
-
-# get twitter credentials
-
-ssm_client = boto3.client("ssm")
+# clients and credentials are created on first use, see shared.lazy
 
+s3_client = lazy_client("s3")
+sqs_client = lazy_client("sqs")
 
-twitter_params_response = ssm_client.get_parameters(
-    Names=[
-        "TWITTER_ID",
-        "TWITTER_BEARER_TOKEN",
-    ],
-    WithDecryption=True,
+# TWITTER_USERNAME is only used by the stream's rule, see stream.py
+twitter_params = lazy_parameters(
+    names=["TWITTER_ID", "TWITTER_USERNAME", "TWITTER_BEARER_TOKEN"]
 )
 
-twitter_params = dict(
-    (param["Name"], param["Value"])
-    for param in twitter_params_response.get("Parameters", [])
+tweepy_client = LazyResource(
+    name="tweepy_client",
+    factory=lambda: tweepy.Client(twitter_params.get()["TWITTER_BEARER_TOKEN"]),
+    depends_on=[twitter_params],
 )
 
-TWITTER_ID = twitter_params["TWITTER_ID"]
 
-# set up twitter client.
-
-tweepy_client = tweepy.Client(twitter_params["TWITTER_BEARER_TOKEN"])
+def get_twitter_id() -> str:
+    return twitter_params.get()["TWITTER_ID"]
 
 
 LATEST_TWEET_ID_KEY = "latest_id.txt"
+# sliding window counts of the mentions admitted, see admission.py
+ADMISSION_STATE_KEY = "admission.json"
 MAX_RESULTS_TWITTER = 100
+# the bot uses the mentions and hashtags twitter found, rather than finding them
+# itself
+TWEET_FIELDS = ["entities", *ADMISSION_TWEET_FIELDS]
+# the queue each lane's mentions are sent to, mentions in Lane.NONE aren't sent
+LANE_QUEUE_URLS = {Lane.FAST: SQS_QUEUE_URL, Lane.NOT_FOUND: LOW_PRIORITY_QUEUE_URL}
+LANE_METRICS = {
+    Lane.FAST: "QueuedFast",
+    Lane.NOT_FOUND: "QueuedNotFound",
+    Lane.NONE: "DroppedNothingToReply",
+}
 # limit of 10 in send_message_batch
 SQS_BATCH_SIZE = 10
+# batches sent to SQS at once, while the next page of mentions is fetched
+SQS_SEND_CONCURRENCY = int(os.environ.get("SQS_SEND_CONCURRENCY", 8))
+SQS_SEND_ATTEMPTS = 5
+SQS_RETRY_BASE_DELAY_SECONDS = 0.1
+
+# lives outside the handler so it's reused across warm invocations.
+executor = ThreadPoolExecutor(max_workers=SQS_SEND_CONCURRENCY)
+
+
+class QueueError(Exception):
+    pass
 
 
 def chunks(data: List[Any], chunk_size: int) -> Generator[Any, None, None]:
@@ -63,8 +91,10 @@ def get_starting_point_kwargs() -> Union[Dict[str, str], Dict[str, int]]:
     # case there's a possibility of missing or duplicating only a small number of
     # tweets)
     try:
-        response = s3_client.get_object(Bucket=BUCKET_NAME, Key=LATEST_TWEET_ID_KEY)
-    except s3_client.exceptions.NoSuchKey:
+        response = s3_client.get().get_object(
+            Bucket=BUCKET_NAME, Key=LATEST_TWEET_ID_KEY
+        )
+    except s3_client.get().exceptions.NoSuchKey:
         return {
             "start_time": arrow.utcnow()
             .shift(seconds=-1 * POLL_INTERVAL_SECONDS)
@@ -74,7 +104,7 @@ def get_starting_point_kwargs() -> Union[Dict[str, str], Dict[str, int]]:
 
 
 def store_latest_id(latest_id: int) -> None:
-    s3_client.put_object(
+    s3_client.get().put_object(
         Bucket=BUCKET_NAME,
         Key=LATEST_TWEET_ID_KEY,
         ContentType="text/plain",
@@ -82,9 +112,84 @@ def store_latest_id(latest_id: int) -> None:
     )
 
 
-def queue_tweets(tweets: Optional[List[tweepy.Tweet]] = None) -> None:
+def load_admission() -> Admission:
+    try:
+        response = s3_client.get().get_object(
+            Bucket=BUCKET_NAME, Key=ADMISSION_STATE_KEY
+        )
+    except s3_client.get().exceptions.NoSuchKey:
+        return Admission()
+    return Admission(state=json.loads(response["Body"].read()))
+
+
+def store_admission(admission: Admission) -> None:
+    s3_client.get().put_object(
+        Bucket=BUCKET_NAME,
+        Key=ADMISSION_STATE_KEY,
+        ContentType="application/json",
+        Body=json.dumps(admission.state()).encode(),
+    )
+
+
+def add_admission_metrics(admission: Admission) -> None:
+    for decision in Decision:
+        metrics.add_metric(
+            name=decision.value,
+            unit=MetricUnit.Count,
+            value=admission.decisions[decision],
+        )
+    metrics.add_metric(
+        name="AdmissionKeys",
+        unit=MetricUnit.Count,
+        value=len(admission.counter.windows),
+    )
+
+
+def add_lane_metrics(lanes: Counter) -> None:
+    for lane, name in LANE_METRICS.items():
+        metrics.add_metric(name=name, unit=MetricUnit.Count, value=lanes[lane])
+
+
+def send_message_batch(queue_url: str, entries: List[Dict[str, str]]) -> None:
+    # send_message_batch can succeed for some entries and fail for others, so retry
+    # only the failed entries, backing off between attempts.
+    for attempt in range(SQS_SEND_ATTEMPTS):
+        if attempt:
+            time.sleep(SQS_RETRY_BASE_DELAY_SECONDS * 2 ** (attempt - 1))
+        try:
+            response = sqs_client.get().send_message_batch(
+                QueueUrl=queue_url, Entries=entries
+            )
+        except Exception:
+            logger.exception("send_message_batch failed")
+            continue
+        if not (failed := response.get("Failed")):
+            return
+        if sender_faults := [f for f in failed if f.get("SenderFault")]:
+            # retrying won't help if SQS didn't accept what we sent.
+            raise QueueError(f"SQS rejected messages: {sender_faults}")
+        failed_ids = set(f["Id"] for f in failed)
+        entries = [entry for entry in entries if entry["Id"] in failed_ids]
+    raise QueueError(
+        f"failed to queue {[entry['Id'] for entry in entries]} "
+        f"after {SQS_SEND_ATTEMPTS} attempts"
+    )
+
+
+def queue_tweets(
+    tweets: Optional[List[tweepy.Tweet]] = None,
+    admission: Optional[Admission] = None,
+    lanes: Optional[Counter] = None,
+) -> List[Future]:
+    """
+    Send tweets to their lane's queue in parallel batches, returning a future per
+    batch so the caller can carry on fetching tweets while they're sent. Given
+    admission, only the tweets with something to reply to are counted by it, and
+    only those it admits are sent, oldest first. Each tweet's lane is counted in
+    lanes, if given.
+    """
     if not tweets:
-        return
+        return []
     # If tweet is a direct reply to our own tweet, then igonre. We're seeing quite often
     # that someone will reply with e.g. "thanks" and then the bot will try and interpret
     # that tweet for donations. It could be that someone does actually want more donation
@@ -92,39 +197,106 @@ def queue_tweets(tweets: Optional[List[tweepy.Tweet]] = None) -> None:
     # more annoying than useful.
     # TODO: Can we do something more useful here than just exclude tweets which are a
     # reply to our own?
-    tweets = [t for t in tweets if t.in_reply_to_user_id != TWITTER_ID]
+    # tweepy parses ids as ints
+    twitter_id = int(get_twitter_id())
+    tweets = [t for t in tweets if t.in_reply_to_user_id != twitter_id]
     if not tweets:
-        return
-    messages = [
-        {
-            "Id": str(tweet.id),
-            "MessageBody": json.dumps(tweet.data),
-        }
-        for tweet in tweets
+        return []
+    # resolved here rather than by the bot, so mentions it has nothing to reply to
+    # aren't queued, and the rest are queued in their lane. See bot/resolve.py
+    database = DATABASE.get()
+    messages: Dict[Lane, List[Dict[str, str]]] = dict(
+        (lane, []) for lane in LANE_QUEUE_URLS
+    )
+    # oldest first, the order admission counts them in
+    for tweet in sorted(tweets, key=lambda tweet: tweet.id):
+        resolution = resolve_mention(
+            text=tweet.text,
+            entities=tweet.entities,
+            database=database,
+            tweet_id=tweet.id,
+        )
+        if resolution.lane == Lane.NONE:
+            if lanes is not None:
+                lanes[Lane.NONE] += 1
+            logger.info(f"not replying to tweet {tweet.id}: nothing to reply with")
+            continue
+        # only mentions we'd reply to count towards the limits, so e.g. "thanks" in a
+        # thread we're in doesn't use up the replies to that conversation
+        if admission is not None:
+            if (decision := admission.admit(tweet)) != Decision.ADMITTED:
+                logger.info(f"not replying to tweet {tweet.id}: {decision.value}")
+                continue
+        if lanes is not None:
+            lanes[resolution.lane] += 1
+        message = dict(
+            (field, value)
+            for field, value in tweet.data.items()
+            if field not in ADMISSION_TWEET_FIELDS
+        )
+        # the bot only uses the resolution with the same version of the database
+        message["resolved"] = {**resolution.to_dict(), "database": DATABASE.etag}
+        messages[resolution.lane].append(
+            {"Id": str(tweet.id), "MessageBody": json.dumps(message)}
+        )
+    return [
+        executor.submit(send_message_batch, LANE_QUEUE_URLS[lane], message_batch)
+        for lane, lane_messages in messages.items()
+        for message_batch in chunks(data=lane_messages, chunk_size=SQS_BATCH_SIZE)
     ]
-    for message_batch in chunks(data=messages, chunk_size=SQS_BATCH_SIZE):
-        sqs_client.send_message_batch(QueueUrl=SQS_QUEUE_URL, Entries=message_batch)
 
 
-@logger.inject_lambda_context()
-@tracer.capture_lambda_handler
-def handler(event: Dict[str, Any], context: LambdaContext) -> None:
+def queue_new_mentions(admission: Admission, lanes: Counter) -> Optional[int]:
+    """
+    Queue the mentions since the last one queued, and move the checkpoint on to the
+    newest of them, returning its id if there were any.
+    """
     starting_point_kwargs = get_starting_point_kwargs()
-    response = tweepy_client.get_users_mentions(
-        id=TWITTER_ID,
+    response = tweepy_client.get().get_users_mentions(
+        id=get_twitter_id(),
         max_results=MAX_RESULTS_TWITTER,
         expansions=["in_reply_to_user_id"],
+        tweet_fields=TWEET_FIELDS,
         **starting_point_kwargs,
     )
-    if newest_id := response.meta.get("newest_id"):
-        store_latest_id(latest_id=int(newest_id))
-    queue_tweets(response.data)
+    newest_id = response.meta.get("newest_id")
+    # queueing the tweets in each page happens in the background while we fetch the
+    # next page.
+    futures = queue_tweets(response.data, admission=admission, lanes=lanes)
     while next_token := response.meta.get("next_token"):
-        response = tweepy_client.get_users_mentions(
-            id=TWITTER_ID,
+        response = tweepy_client.get().get_users_mentions(
+            id=get_twitter_id(),
             max_results=MAX_RESULTS_TWITTER,
             pagination_token=next_token,
             expansions=["in_reply_to_user_id"],
+            tweet_fields=TWEET_FIELDS,
             **starting_point_kwargs,
         )
-        queue_tweets(response.data)
+        futures += queue_tweets(response.data, admission=admission, lanes=lanes)
+    wait(futures)
+    # Only move the checkpoint forward once every tweet up to it has been queued,
+    # otherwise a failure would mean those tweets are never seen again. Raising
+    # means they'll be fetched again on the next poll.
+    for future in futures:
+        future.result()
+    if not newest_id:
+        return None
+    store_latest_id(latest_id=int(newest_id))
+    return int(newest_id)
+
+
+def poll_mentions() -> None:
+    admission = load_admission()
+    lanes: Counter = Counter()
+    if queue_new_mentions(admission=admission, lanes=lanes):
+        store_admission(admission)
+    add_admission_metrics(admission)
+    add_lane_metrics(lanes)
+
+
+@logger.inject_lambda_context()
+@metrics.log_metrics()
+@tracer.capture_lambda_handler
+def handler(event: Dict[str, Any], context: LambdaContext) -> None:
+    poll_mentions()
+    logger.debug({"init_timings": init_timings()})
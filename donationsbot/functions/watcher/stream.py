@@ -0,0 +1,276 @@
+"""
+Queue mentions as twitter streams them, rather than polling for them every
+POLL_INTERVAL_SECONDS, see index.py, so a mention is queued within a second or so
+of being made rather than up to a minute later, and S3 isn't read and written
+every minute whether or not there were any mentions.
+
+The stream is twitter's filtered stream, with a rule matching mentions of the
+bot's TWITTER_USERNAME parameter, which is added if it isn't there. Each
+connection first queues the mentions made since the checkpoint, the newest
+mention queued, with index.queue_new_mentions(), and then the mentions it
+streams, skipping those the catch up already queued. Mentions are admitted and
+sent to their lane the same way polled mentions are, see index.queue_tweets(), as
+soon as they arrive. The checkpoint and the admission state are stored at most
+every STREAM_CHECKPOINT_SECONDS, once the mentions up to the checkpoint have been
+queued, so a run which fails only has to catch up since then.
+
+A dropped connection is reconnected with exponential backoff, starting from
+twitter's suggested delay for the kind of failure.
+
+A lambda can only run for 15 minutes, so the TweetStream lambda is invoked every
+15 minutes and streams until STOP_MARGIN_SECONDS before it times out. Its reserved
+concurrency is 1, so runs never overlap: an invocation while a run is still going
+waits for it to finish. The mentions made between runs are queued by the next
+run's catch up.
+"""
+
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import Future, wait
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import requests
+import tweepy
+from aws_lambda_powertools import Logger, Metrics, Tracer
+from aws_lambda_powertools.metrics import MetricUnit
+from aws_lambda_powertools.utilities.typing import LambdaContext
+
+from admission import Admission
+from index import (
+    TWEET_FIELDS,
+    add_admission_metrics,
+    add_lane_metrics,
+    load_admission,
+    queue_new_mentions,
+    queue_tweets,
+    store_admission,
+    store_latest_id,
+    twitter_params,
+)
+from shared.lazy import LazyResource, init_timings
+
+STREAM_URL = "https://api.twitter.com/2/tweets/search/stream"
+RULES_URL = f"{STREAM_URL}/rules"
+STREAM_RULE_TAG = "mentions"
+STREAM_CHECKPOINT_SECONDS = int(os.environ.get("STREAM_CHECKPOINT_SECONDS", 60))
+CONNECT_TIMEOUT_SECONDS = 10
+# twitter sends a keep alive every 20 seconds, so a connection quiet for longer is
+# stalled
+KEEP_ALIVE_TIMEOUT_SECONDS = 30
+# stop before the lambda times out, leaving time to store the checkpoint
+STOP_MARGIN_SECONDS = 60
+
+tracer = Tracer()
+logger = Logger()
+metrics = Metrics()
+
+
+def create_session(bearer_token: str) -> requests.Session:
+    session = requests.Session()
+    session.headers["Authorization"] = f"Bearer {bearer_token}"
+    return session
+
+
+stream_session = LazyResource(
+    name="stream_session",
+    factory=lambda: create_session(twitter_params.get()["TWITTER_BEARER_TOKEN"]),
+    depends_on=[twitter_params],
+)
+
+
+class StreamError(Exception):
+    pass
+
+
+class Backoff(NamedTuple):
+    initial_seconds: float
+    max_seconds: float
+
+    def seconds(self, attempt: int) -> float:
+        """The delay before the attempt'th reconnection, counting from 0."""
+        return min(self.initial_seconds * 2 ** attempt, self.max_seconds)
+
+
+# twitter's suggested delays, see
+# https://developer.twitter.com/en/docs/twitter-api/tweets/filtered-stream/integrate/handling-disconnections  # noqa: E501
+NETWORK_BACKOFF = Backoff(initial_seconds=0.25, max_seconds=16)
+HTTP_BACKOFF = Backoff(initial_seconds=5, max_seconds=320)
+RATE_LIMIT_BACKOFF = Backoff(initial_seconds=60, max_seconds=15 * 60)
+
+
+class Checkpoint:
+    """
+    The newest mention queued, or being queued, which is stored with the admission
+    state once the mentions up to it have been queued.
+    """
+
+    def __init__(self, admission: Admission, clock: Callable[[], float]):
+        self.admission = admission
+        self.clock = clock
+        self.newest_id: Optional[int] = None
+        self.futures: List[Future] = []
+        self._stored_id: Optional[int] = None
+        self._stored_at = clock()
+
+    def add(self, tweet_id: int, futures: List[Future]) -> None:
+        self.newest_id = max(tweet_id, self.newest_id or tweet_id)
+        self.futures += futures
+
+    def due(self) -> bool:
+        return self.clock() - self._stored_at >= STREAM_CHECKPOINT_SECONDS
+
+    def store(self) -> None:
+        # Raising leaves the checkpoint where it was, so the mentions after it are
+        # queued again by the next catch up.
+        wait(self.futures)
+        for future in self.futures:
+            future.result()
+        self.futures = []
+        if self.newest_id is not None and self.newest_id != self._stored_id:
+            store_latest_id(latest_id=self.newest_id)
+            store_admission(self.admission)
+            self._stored_id = self.newest_id
+        self._stored_at = self.clock()
+
+
+def stream_rule() -> str:
+    """Our mentions, without our own replies mentioning us in threads."""
+    username = twitter_params.get()["TWITTER_USERNAME"]
+    return f"@{username} -from:{username}"
+
+
+def ensure_rule() -> None:
+    session = stream_session.get()
+    response = session.get(RULES_URL, timeout=CONNECT_TIMEOUT_SECONDS)
+    response.raise_for_status()
+    rule = stream_rule()
+    if any(each["value"] == rule for each in response.json().get("data", [])):
+        return
+    logger.info(f"adding stream rule {rule}")
+    response = session.post(
+        RULES_URL,
+        json={"add": [{"value": rule, "tag": STREAM_RULE_TAG}]},
+        timeout=CONNECT_TIMEOUT_SECONDS,
+    )
+    response.raise_for_status()
+
+
+def connect() -> requests.Response:
+    return stream_session.get().get(
+        STREAM_URL,
+        params={
+            "expansions": "in_reply_to_user_id",
+            "tweet.fields": ",".join(TWEET_FIELDS),
+        },
+        stream=True,
+        timeout=(CONNECT_TIMEOUT_SECONDS, KEEP_ALIVE_TIMEOUT_SECONDS),
+    )
+
+
+def stream_mentions(
+    time_left: Callable[[], float],
+    sleep: Callable[[float], None] = time.sleep,
+    clock: Callable[[], float] = time.monotonic,
+) -> Dict[str, Any]:
+    """
+    Queue mentions as they're streamed, until time_left(), in seconds, runs out.
+    """
+    ensure_rule()
+    admission = load_admission()
+    lanes: Counter = Counter()
+    checkpoint = Checkpoint(admission=admission, clock=clock)
+    connections = streamed = 0
+    # failed connections since the stream last sent anything
+    failures = 0
+    backoff = NETWORK_BACKOFF
+
+    while time_left() > 0:
+        if failures:
+            delay = backoff.seconds(failures - 1)
+            logger.info(f"reconnecting in {delay:.2f}s")
+            sleep(min(delay, time_left()))
+            if time_left() <= 0:
+                break
+        try:
+            response = connect()
+        except requests.RequestException:
+            logger.exception("couldn't connect to the stream")
+            failures, backoff = failures + 1, NETWORK_BACKOFF
+            continue
+        with response:
+            if response.status_code != 200:
+                logger.warning(
+                    f"stream responded {response.status_code}: {response.text}"
+                )
+                if response.status_code == 429:
+                    backoff = RATE_LIMIT_BACKOFF
+                elif response.status_code >= 500:
+                    backoff = HTTP_BACKOFF
+                else:
+                    # e.g. bad credentials, which reconnecting won't fix
+                    raise StreamError(f"stream responded {response.status_code}")
+                failures += 1
+                continue
+            connections += 1
+            # catch up on the mentions made while we weren't connected, having
+            # connected first so none are missed
+            checkpoint.store()
+            caught_up_to = queue_new_mentions(admission=admission, lanes=lanes)
+            if caught_up_to is not None:
+                checkpoint.add(caught_up_to, [])
+            try:
+                for line in response.iter_lines():
+                    failures = 0
+                    # empty lines are keep alives
+                    if line:
+                        payload = json.loads(line)
+                        if "data" not in payload:
+                            # e.g. twitter disconnecting us, which it's about to
+                            logger.warning(payload)
+                        elif (tweet := tweepy.Tweet(payload["data"])).id > (
+                            caught_up_to or 0
+                        ):
+                            streamed += 1
+                            futures = queue_tweets(
+                                [tweet], admission=admission, lanes=lanes
+                            )
+                            checkpoint.add(tweet.id, futures)
+                    if checkpoint.due():
+                        checkpoint.store()
+                    if time_left() <= 0:
+                        break
+                else:
+                    logger.warning("stream closed")
+            except requests.RequestException as e:
+                # twitter drops connections now and then, so this isn't an error
+                logger.warning(f"stream disconnected: {e}")
+        if time_left() > 0:
+            failures, backoff = failures + 1, NETWORK_BACKOFF
+
+    checkpoint.store()
+    add_admission_metrics(admission)
+    add_lane_metrics(lanes)
+    metrics.add_metric(
+        name="StreamReconnects", unit=MetricUnit.Count, value=max(connections - 1, 0)
+    )
+    return {
+        "connections": connections,
+        "streamed": streamed,
+        "lanes": dict((lane.value, count) for lane, count in lanes.items()),
+    }
+
+
+@logger.inject_lambda_context()
+@metrics.log_metrics()
+@tracer.capture_lambda_handler
+def handler(event: Dict[str, Any], context: LambdaContext) -> Dict[str, Any]:
+    result = stream_mentions(
+        time_left=lambda: (
+            context.get_remaining_time_in_millis() / 1000 - STOP_MARGIN_SECONDS
+        ),
+    )
+    logger.info(result)
+    logger.debug({"init_timings": init_timings()})
+    return result
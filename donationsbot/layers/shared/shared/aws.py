@@ -0,0 +1,34 @@
+import os
+from typing import Dict, List
+
+import boto3
+
+from shared.lazy import LazyResource
+
+# how long to keep SSM parameters before fetching them again, so rotated secrets
+# are picked up by warm lambdas.
+SSM_PARAMETER_TTL_SECONDS = int(os.environ.get("SSM_PARAMETER_TTL_SECONDS", 900))
+
+
+def lazy_client(service_name: str) -> LazyResource:
+    return LazyResource(
+        name=f"boto3:{service_name}", factory=lambda: boto3.client(service_name)
+    )
+
+
+ssm_client = lazy_client("ssm")
+
+
+def lazy_parameters(names: List[str]) -> LazyResource[Dict[str, str]]:
+    def get_parameters() -> Dict[str, str]:
+        response = ssm_client.get().get_parameters(Names=names, WithDecryption=True)
+        return dict(
+            (param["Name"], param["Value"]) for param in response.get("Parameters", [])
+        )
+
+    return LazyResource(
+        name=f"ssm:{','.join(names)}",
+        factory=get_parameters,
+        ttl_seconds=SSM_PARAMETER_TTL_SECONDS,
+        depends_on=[ssm_client],
+    )
@@ -0,0 +1,109 @@
+"""
+Create clients and credentials on first use rather than at import time, and keep
+them in memory across warm lambda invocations.
+
+A resource can have a TTL, after which it is recreated on next use (e.g. so rotated
+secrets are picked up), and can depend on other resources so e.g. a twitter client
+is rebuilt when the credentials it was built from are refreshed.
+"""
+
+import threading
+import time
+from typing import Callable, Dict, Generic, List, Optional, TypeVar
+
+from aws_lambda_powertools import Logger
+
+logger = Logger(child=True)
+
+T = TypeVar("T")
+
+_registry: Dict[str, "LazyResource"] = {}
+
+
+class LazyResource(Generic[T]):
+    def __init__(
+        self,
+        name: str,
+        factory: Callable[[], T],
+        ttl_seconds: Optional[float] = None,
+        depends_on: Optional[List["LazyResource"]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.depends_on = depends_on or []
+        # incremented every time the value is (re)created, so dependants can tell
+        # when they need to rebuild.
+        self.version = 0
+        self.init_seconds: Optional[float] = None
+        self._factory = factory
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._value: Optional[T] = None
+        self._created_at: Optional[float] = None
+        self._dependency_versions: List[int] = []
+        _registry[name] = self
+
+    def _is_stale(self) -> bool:
+        if self._created_at is None:
+            return True
+        if [d.version for d in self.depends_on] != self._dependency_versions:
+            return True
+        if self.ttl_seconds is None:
+            return False
+        return self._clock() - self._created_at >= self.ttl_seconds
+
+    def _create(self) -> None:
+        start = time.perf_counter()
+        value = self._factory()
+        self.init_seconds = time.perf_counter() - start
+        self._value = value
+        self._created_at = self._clock()
+        self._dependency_versions = [d.version for d in self.depends_on]
+        self.version += 1
+        logger.info(
+            {
+                "message": "initialised resource",
+                "resource": self.name,
+                "init_seconds": self.init_seconds,
+            }
+        )
+
+    def get(self) -> T:
+        # refresh dependencies first so we can see whether they've changed
+        for dependency in self.depends_on:
+            dependency.get()
+        if not self._is_stale():
+            return self._value
+        with self._lock:
+            if self._is_stale():
+                if self._created_at is None:
+                    self._create()
+                else:
+                    try:
+                        self._create()
+                    except Exception:
+                        # keep using the value we already have rather than fail
+                        # the invocation, we'll try again on next use.
+                        logger.exception(f"failed to refresh {self.name}")
+                        self._created_at = self._clock()
+        return self._value
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._created_at = None
+
+    def set_factory(self, factory: Callable[[], T]) -> None:
+        """Replace the factory, e.g. with a local stand-in, and drop any value."""
+        with self._lock:
+            self._factory = factory
+            self._created_at = None
+
+
+def get_resource(name: str) -> LazyResource:
+    return _registry[name]
+
+
+def init_timings() -> Dict[str, Optional[float]]:
+    """Seconds taken to create each resource, None if not created yet."""
+    return dict((name, r.init_seconds) for name, r in _registry.items())
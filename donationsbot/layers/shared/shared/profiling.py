@@ -0,0 +1,80 @@
+"""
+Profile a sample of invocations with cProfile.
+
+PROFILE_ONE_IN=N profiles one in every N invocations, at random, and 0, the
+default, none. The slowest functions of a profiled invocation are logged, and if
+PROFILE_DIR is set its stats are written there too, to be read with pstats or e.g.
+snakeviz.
+
+cProfile only sees the thread it was enabled in, so functions run in a thread pool
+are each profiled in their own thread, and their stats combined.
+"""
+
+import cProfile
+import functools
+import io
+import os
+import pstats
+import random
+import threading
+from pathlib import Path
+from typing import Callable, List, Optional, TypeVar
+
+from aws_lambda_powertools import Logger
+
+logger = Logger(child=True)
+
+PROFILE_ONE_IN = int(os.environ.get("PROFILE_ONE_IN", 0))
+PROFILE_DIR = os.environ.get("PROFILE_DIR")
+# functions logged from each profile
+PROFILE_TOP_FUNCTIONS = 30
+
+T = TypeVar("T")
+
+
+def should_profile() -> bool:
+    return PROFILE_ONE_IN > 0 and random.randrange(PROFILE_ONE_IN) == 0
+
+
+class Profiles:
+    """cProfile stats for one invocation, gathered from each thread it used."""
+
+    def __init__(self) -> None:
+        self._profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    def profiled(self, function: Callable[..., T]) -> Callable[..., T]:
+        """function, profiled every time it's called, in the calling thread."""
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs) -> T:
+            profile = cProfile.Profile()
+            try:
+                return profile.runcall(function, *args, **kwargs)
+            finally:
+                with self._lock:
+                    self._profiles.append(profile)
+
+        return wrapper
+
+    def stats(self) -> Optional[pstats.Stats]:
+        with self._lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return None
+        stats = pstats.Stats(profiles[0], stream=io.StringIO())
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+    def report(self, name: str) -> None:
+        """Log the slowest functions, and write the stats to PROFILE_DIR/name.prof"""
+        if (stats := self.stats()) is None:
+            return
+        if PROFILE_DIR:
+            path = Path(PROFILE_DIR) / f"{name}.prof"
+            path.parent.mkdir(parents=True, exist_ok=True)
+            stats.dump_stats(path)
+        stats.stream = io.StringIO()
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_TOP_FUNCTIONS)
+        logger.info({"profile": name, "stats": stats.stream.getvalue()})
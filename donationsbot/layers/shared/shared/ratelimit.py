@@ -0,0 +1,111 @@
+"""
+Keep within twitter's rate limits rather than finding out from a 429.
+
+Twitter limits each endpoint to a number of requests per window (e.g. 200 tweets
+every 15 minutes), and reports what's left of the current window with every
+response in the x-rate-limit-* headers. A TokenBucket holds the tokens left in the
+current window, refilling all at once when the window resets. It starts out full,
+and is corrected from the headers of every response it's given.
+"""
+
+import threading
+import time
+from typing import Callable, Mapping, Optional
+
+from aws_lambda_powertools import Logger
+
+logger = Logger(child=True)
+
+TOO_MANY_REQUESTS = 429
+
+
+class TokenBucket:
+    def __init__(
+        self,
+        name: str,
+        limit: int,
+        window_seconds: float,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.name = name
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.remaining = limit
+        # epoch seconds, like the x-rate-limit-reset header
+        self.reset_at = clock() + window_seconds
+
+    def _refill(self, now: float) -> None:
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + self.window_seconds
+
+    def try_acquire(self, count: int = 1, reserve: int = 0) -> float:
+        """
+        Take count tokens if there are that many, and reserve more, returning 0.
+        Otherwise return the number of seconds until the bucket is refilled.
+        """
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            if self.remaining >= count + reserve:
+                self.remaining -= count
+                return 0.0
+            return self.reset_at - now
+
+    def seconds_until_available(self) -> float:
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            return 0.0 if self.remaining > 0 else self.reset_at - now
+
+    def current_remaining(self) -> int:
+        with self._lock:
+            self._refill(self._clock())
+            return self.remaining
+
+    def exhaust(self, until: float) -> None:
+        with self._lock:
+            self.remaining = 0
+            self.reset_at = max(self.reset_at, until)
+
+    def update(self, limit: int, remaining: int, reset_at: float) -> None:
+        with self._lock:
+            self.limit = limit
+            if reset_at > self.reset_at:
+                # a new window
+                self.remaining = remaining
+                self.reset_at = reset_at
+            else:
+                # tokens taken for requests still in flight aren't counted in the
+                # response's headers yet, so never give tokens back
+                self.remaining = min(self.remaining, remaining)
+
+    def update_from_response(self, status_code: int, headers: Mapping[str, str]):
+        limit = _int_header(headers, "x-rate-limit-limit")
+        remaining = _int_header(headers, "x-rate-limit-remaining")
+        reset_at = _int_header(headers, "x-rate-limit-reset")
+        if limit is not None and remaining is not None and reset_at is not None:
+            self.update(limit=limit, remaining=remaining, reset_at=reset_at)
+        if status_code != TOO_MANY_REQUESTS:
+            return
+        # A 429 can also come from the 24 hour limit on tweets per user, which has
+        # its own headers.
+        resets = [
+            reset
+            for name in ("x-rate-limit-reset", "x-user-limit-24hour-reset")
+            if (reset := _int_header(headers, name)) is not None
+        ]
+        until = max(resets, default=self._clock() + self.window_seconds)
+        logger.warning(
+            {"message": "rate limited", "bucket": self.name, "reset_at": until}
+        )
+        self.exhaust(until=until)
+
+
+def _int_header(headers: Mapping[str, str], name: str) -> Optional[int]:
+    try:
+        return int(headers[name])
+    except (KeyError, ValueError):
+        return None
@@ -0,0 +1,40 @@
+"""
+Time the stages of an invocation as CloudWatch metrics.
+
+Each stage's time is added to powertools' metrics, which are shared by every
+Metrics instance, so they're published in embedded metric format (EMF) along with
+the handler's own metrics when the handler decorated with log_metrics returns.
+Stages timed more than once in an invocation, e.g. once per reply, publish every
+time as values of the same metric.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+from aws_lambda_powertools import Metrics
+from aws_lambda_powertools.metrics import MetricUnit
+
+metrics = Metrics()
+
+# add_metric isn't thread safe, and stages are timed from concurrent threads
+_lock = threading.Lock()
+
+
+def metric_name(stage: str) -> str:
+    return f"{stage}Time"
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Add how long the block took, in milliseconds, as the metric <stage>Time."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with _lock:
+            metrics.add_metric(
+                name=metric_name(stage), unit=MetricUnit.Milliseconds, value=elapsed_ms
+            )
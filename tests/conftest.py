@@ -0,0 +1,95 @@
+"""
+The lambdas aren't installed packages, so their directories are put on the path
+the way each lambda sees them: the watcher's index.py wins over the bot's, whose
+package is a layer of the watcher's, and the bot's index.py is loaded by path,
+see load_module. The local stand-ins are the benchmarks', see benchmarks/fakes.py.
+"""
+
+import importlib.util
+import os
+import sys
+from pathlib import Path
+from types import ModuleType, SimpleNamespace
+
+import pytest
+
+ROOT_DIR = Path(__file__).parent.parent
+BOT_PATH = ROOT_DIR / "donationsbot" / "functions" / "bot"
+WATCHER_PATH = ROOT_DIR / "donationsbot" / "functions" / "watcher"
+
+sys.path.insert(0, str(ROOT_DIR / "benchmarks"))
+# puts data/ and the bot's directory on the path, behind the watcher's
+from cold_start import build_binary_database  # noqa: E402
+
+sys.path.insert(0, str(WATCHER_PATH))
+sys.path.insert(0, str(ROOT_DIR / "donationsbot" / "layers" / "shared"))
+sys.path.append(str(BOT_PATH))
+os.environ.setdefault("AWS_DEFAULT_REGION", "ap-southeast-2")
+os.environ.setdefault("BUCKET_NAME", "bucket")
+os.environ.setdefault("SQS_QUEUE_URL", "queue")
+os.environ.setdefault("POWERTOOLS_TRACE_DISABLED", "1")
+os.environ.setdefault("POWERTOOLS_METRICS_NAMESPACE", "DonationsBot")
+
+from bot.db import DonorDatabase  # noqa: E402
+from bot.resolve import Resolution  # noqa: E402
+from fakes import FakeMentions, FakeS3, FakeSQS, FakeSSM  # noqa: E402
+from shared.aws import ssm_client  # noqa: E402
+
+TWITTER_ID = "1"
+
+
+def load_module(name: str, path: Path) -> ModuleType:
+    """A lambda's handler module, under a name which doesn't clash with another's."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture(scope="session")
+def database(tmp_path_factory) -> DonorDatabase:
+    """The database built from the packaged donors.json and twitter.json."""
+    path = tmp_path_factory.mktemp("data") / "donors.db"
+    build_binary_database(path)
+    database = DonorDatabase(path)
+    yield database
+    database.close()
+
+
+@pytest.fixture
+def ssm() -> FakeSSM:
+    fake = FakeSSM(
+        {
+            "TWITTER_ID": TWITTER_ID,
+            "TWITTER_USERNAME": "AusPolDonations",
+            "TWITTER_BEARER_TOKEN": "token",
+        }
+    )
+    ssm_client.set_factory(lambda: fake)
+    return fake
+
+
+@pytest.fixture
+def watcher(ssm, monkeypatch) -> SimpleNamespace:
+    """
+    The watcher's index.py with twitter, S3 and SQS stood in for, and every mention
+    resolved as one the bot can answer, without the database.
+    """
+    import index
+
+    fakes = SimpleNamespace(mentions=FakeMentions(), s3=FakeS3(), sqs=FakeSQS())
+    index.tweepy_client.set_factory(lambda: fakes.mentions)
+    index.s3_client.set_factory(lambda: fakes.s3)
+    index.sqs_client.set_factory(lambda: fakes.sqs)
+    monkeypatch.setattr(index, "DATABASE", SimpleNamespace(get=lambda: None, etag="1"))
+    monkeypatch.setattr(
+        index,
+        "resolve_mention",
+        lambda text, entities, database, tweet_id: Resolution(
+            handles=["@donor"], hashtags=[], reply_keys=["@donor"]
+        ),
+    )
+    return fakes
@@ -0,0 +1,105 @@
+import itertools
+
+import arrow
+import pytest
+import tweepy
+
+from admission import Admission, Decision, SlidingWindowCounter, text_key
+
+HOUR = 60 * 60
+START = arrow.get("2022-05-01T00:00:00Z").timestamp()
+
+ids = itertools.count(1_500_000_000_000_000_000)
+
+
+def mention(text: str, author: str, at: float = START, conversation=None):
+    return tweepy.Tweet(
+        {
+            "id": str(next(ids)),
+            "text": text,
+            "author_id": author,
+            "conversation_id": conversation,
+            "created_at": arrow.get(at).format("YYYY-MM-DDTHH:mm:ss.SSS[Z]"),
+        }
+    )
+
+
+@pytest.fixture
+def admission() -> Admission:
+    return Admission(
+        window_seconds=HOUR,
+        max_per_author=5,
+        max_per_conversation=10,
+        max_per_text=1,
+        max_authors_per_text=3,
+        clock=lambda: START,
+    )
+
+
+def test_texts_ignore_leading_mentions_case_and_spacing():
+    assert text_key("@someone @AusPolDonations Who  funds @Them?") == text_key(
+        "who funds @them?"
+    )
+    assert text_key("@AusPolDonations @Woodside") == text_key(
+        "@auspoldonations @woodside"
+    )
+    assert text_key("who funds @them?") != text_key("who funds @others?")
+
+
+def test_the_same_question_from_different_people_is_admitted(admission):
+    decisions = [
+        admission.admit(mention("@AusPolDonations @Woodside", author=str(author)))
+        for author in range(4)
+    ]
+    assert decisions == [Decision.ADMITTED] * 3 + [Decision.COPIED]
+
+
+def test_an_author_repeating_a_text_is_a_duplicate(admission):
+    text = "@AusPolDonations @Woodside"
+    assert admission.admit(mention(text, author="1")) == Decision.ADMITTED
+    assert admission.admit(mention(text, author="1")) == Decision.DUPLICATE
+    assert admission.admit(mention(text, author="2")) == Decision.ADMITTED
+    # an hour later it counts again
+    later = START + 2 * HOUR
+    assert admission.admit(mention(text, author="1", at=later)) == Decision.ADMITTED
+
+
+def test_an_author_repeating_a_text_is_one_copy_of_it():
+    admission = Admission(window_seconds=HOUR, max_per_text=3, max_authors_per_text=2)
+    text = "@AusPolDonations @Woodside"
+    decisions = [admission.admit(mention(text, author="1")) for _ in range(3)]
+    assert decisions == [Decision.ADMITTED] * 3
+    assert admission.admit(mention(text, author="2")) == Decision.ADMITTED
+    assert admission.admit(mention(text, author="3")) == Decision.COPIED
+
+
+def test_authors_and_conversations_are_limited(admission):
+    decisions = [
+        admission.admit(mention(f"@AusPolDonations @mp{number}", author="1"))
+        for number in range(6)
+    ]
+    assert decisions == [Decision.ADMITTED] * 5 + [Decision.AUTHOR]
+    decisions = [
+        admission.admit(
+            mention(f"ratio {number}", author=str(number + 10), conversation="9")
+        )
+        for number in range(11)
+    ]
+    assert decisions == [Decision.ADMITTED] * 10 + [Decision.CONVERSATION]
+    assert admission.decisions[Decision.ADMITTED] == 15
+
+
+def test_the_previous_window_is_weighted_by_its_overlap():
+    counter = SlidingWindowCounter(window_seconds=HOUR)
+    for _ in range(4):
+        counter.add("key", START)
+    assert counter.count("key", START + HOUR) == 4
+    assert counter.count("key", START + HOUR + HOUR / 4) == 3
+    assert counter.count("key", START + 2 * HOUR) == 0
+
+
+def test_state_is_kept_between_invocations(admission):
+    text = "@AusPolDonations @Woodside"
+    admission.admit(mention(text, author="1"))
+    restored = Admission(state=admission.state(), window_seconds=HOUR)
+    assert restored.admit(mention(text, author="1")) == Decision.DUPLICATE
@@ -0,0 +1,158 @@
+import json
+
+import arrow
+import pytest
+
+import backfill
+import index
+from shared.ratelimit import TokenBucket
+
+START_TIME = "2022-05-01T00:00:00Z"
+END_TIME = "2022-05-01T04:00:00Z"
+HOUR = 60 * 60
+
+
+class Clock:
+    def __init__(self):
+        self.now = arrow.get(END_TIME).timestamp()
+        self.slept = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(
+        backfill,
+        "mentions_budget",
+        TokenBucket(
+            name="get_users_mentions",
+            limit=backfill.MENTIONS_RATE_LIMIT,
+            window_seconds=backfill.MENTIONS_RATE_LIMIT_WINDOW_SECONDS,
+            clock=clock,
+        ),
+    )
+    return clock
+
+
+@pytest.fixture
+def mentions(watcher):
+    """250 mentions over the 4 hours, so windows take several pages."""
+    start = arrow.get(START_TIME).timestamp()
+    return [
+        watcher.mentions.add_mention(f"@AusPolDonations #{number}", start + number * 57)
+        for number in range(250)
+    ]
+
+
+def run(clock, **kwargs):
+    return backfill.backfill(
+        start_time=START_TIME,
+        end_time=END_TIME,
+        window_seconds=HOUR,
+        concurrency=2,
+        sleep=clock.sleep,
+        **kwargs,
+    )
+
+
+def queued_ids(watcher):
+    return [message["Id"] for message in watcher.sqs.messages]
+
+
+def assert_queued_in_order(watcher, mentions):
+    """Each mention queued once, and none after a mention from a later window"""
+    ids = queued_ids(watcher)
+    assert sorted(ids) == [mention["id"] for mention in mentions]
+    window_of = dict(
+        (mention["id"], number * 57 // HOUR) for number, mention in enumerate(mentions)
+    )
+    windows = [window_of[id] for id in ids]
+    assert windows == sorted(windows)
+
+
+def stored_progress(watcher):
+    key = backfill.progress_key(start_time=START_TIME, end_time=END_TIME)
+    return json.loads(watcher.s3.objects[f"{index.BUCKET_NAME}/{key}"])["windows"]
+
+
+def test_every_mention_is_queued_once_oldest_first(watcher, mentions, clock):
+    result = run(clock)
+    assert result["complete"]
+    assert result["mentions"] == 250
+    assert_queued_in_order(watcher, mentions)
+    assert stored_progress(watcher) == {
+        "2022-05-01T00:00:00Z": 64,
+        "2022-05-01T01:00:00Z": 63,
+        "2022-05-01T02:00:00Z": 63,
+        "2022-05-01T03:00:00Z": 60,
+    }
+
+
+def test_a_backfill_resumes_after_the_windows_it_recorded(watcher, mentions, clock):
+    key = backfill.progress_key(start_time=START_TIME, end_time=END_TIME)
+    backfill.store_progress(
+        key=key, windows={"2022-05-01T00:00:00Z": 64, "2022-05-01T01:00:00Z": 63}
+    )
+    result = run(clock)
+    assert result["complete"]
+    assert result["windows_queued"] == 4
+    assert sorted(queued_ids(watcher)) == [mention["id"] for mention in mentions[127:]]
+
+
+def test_a_mention_fetched_in_two_windows_is_queued_once(
+    watcher, mentions, clock, monkeypatch
+):
+    fetch_window = backfill.fetch_window
+
+    def overlapping(window, sleep, should_stop):
+        # each window also returns the last mention of the window before it
+        start = arrow.get(window.start_time).shift(seconds=-HOUR)
+        previous = backfill.Window(
+            start.strftime(backfill.TIME_FORMAT), window.start_time
+        )
+        tweets = fetch_window(window, sleep, should_stop)
+        return fetch_window(previous, sleep, should_stop)[-1:] + tweets
+
+    monkeypatch.setattr(backfill, "fetch_window", overlapping)
+    result = run(clock)
+    assert_queued_in_order(watcher, mentions)
+    assert result["mentions"] == 250
+
+
+def test_a_window_which_fails_to_queue_is_not_recorded(
+    watcher, mentions, clock, monkeypatch
+):
+    monkeypatch.setattr(index, "SQS_RETRY_BASE_DELAY_SECONDS", 0)
+    send_message_batch = watcher.sqs.send_message_batch
+    batches = []
+
+    def failing_in_the_second_window(QueueUrl, Entries):
+        batches.append(Entries)
+        if len(batches) > 7:
+            raise ConnectionError()
+        return send_message_batch(QueueUrl=QueueUrl, Entries=Entries)
+
+    monkeypatch.setattr(watcher.sqs, "send_message_batch", failing_in_the_second_window)
+    with pytest.raises(index.QueueError):
+        run(clock)
+    assert list(stored_progress(watcher)) == ["2022-05-01T00:00:00Z"]
+
+
+def test_stopping_while_rate_limited_doesnt_wait_for_the_reset(
+    watcher, mentions, clock
+):
+    backfill.mentions_budget.exhaust(until=clock.now + 15 * 60)
+    stop_at = clock.now + 30
+    result = run(clock, should_stop=lambda: clock.now >= stop_at)
+    assert not result["complete"]
+    assert result["windows_queued"] == 0
+    assert watcher.mentions.calls == 0
+    assert max(clock.slept) <= backfill.STOP_CHECK_SECONDS
+    assert sum(clock.slept) < 60
@@ -0,0 +1,34 @@
+import shutil
+
+import build_db
+from bot.replies import combine_donor_data, get_donor_data, render_segments
+
+
+def test_precomputed_replies_are_what_the_bot_would_render(database):
+    recent_year = database.meta["recent_year"]
+    assert len(database.replies) == len(database.handles)
+    for handle, donor_set in database.handles.items():
+        donor = combine_donor_data(
+            get_donor_data(donor_set=donor_set, donors=database.donors)
+        )[0]
+        assert database.replies[handle] == render_segments(
+            donor=donor, recent_year=recent_year
+        ), handle
+
+
+def test_changing_how_replies_are_rendered_rebuilds_the_database(
+    tmp_path, monkeypatch
+):
+    (tmp_path / "bot").mkdir()
+    modules = [tmp_path / "bot" / path.name for path in build_db.BOT_MODULES]
+    for path, copy in zip(build_db.BOT_MODULES, modules):
+        shutil.copy(path, copy)
+    monkeypatch.setattr(build_db, "BOT_PATH", tmp_path)
+    monkeypatch.setattr(build_db, "BOT_MODULES", modules)
+    monkeypatch.setattr(build_db, "OUTPUTS", [])
+    manifest = {"version": build_db.BUILD_VERSION, **build_db.hash_inputs({})}
+    assert build_db.is_up_to_date(manifest, build_db.hash_inputs({}))
+
+    replies = tmp_path / "bot" / "replies.py"
+    replies.write_text(replies.read_text().replace("Nothing reported", "Nothing"))
+    assert not build_db.is_up_to_date(manifest, build_db.hash_inputs({}))
@@ -0,0 +1,83 @@
+from entities import SOURCES, entity_keys, resolve_entities
+
+DONATIONS_MADE, DONOR_RETURNS, THIRD_PARTY = (table for table, _, _ in SOURCES)
+
+
+def by_name(entities):
+    return {variant: entity for entity in entities for variant in entity.variants}
+
+
+def test_name_variants_are_one_entity():
+    totals = {
+        DONATIONS_MADE: {"Visy Industries Pty Ltd": 300, "VISY INDUSTRIES P/L": 50},
+        DONOR_RETURNS: {"Visy Industries Pty. Limited": 200},
+        THIRD_PARTY: {"Visy Industries": 10},
+    }
+    (entity,) = resolve_entities(totals)
+    assert entity.name == "Visy Industries Pty Ltd"
+    assert set(entity.variants) == {
+        name for names in totals.values() for name in names
+    }
+    assert entity.totals == {DONATIONS_MADE: 350, DONOR_RETURNS: 200, THIRD_PARTY: 10}
+
+
+def test_people_and_titles_are_normalised():
+    assert entity_keys("Smith, John") == entity_keys("Mr John Smith")
+    assert entity_keys("Café Co Pty Ltd") == entity_keys("CAFE CO")
+    assert entity_keys("Acme Pty Ltd t/as Road Runner") == entity_keys("Acme")
+
+
+def test_names_are_joined_transitively():
+    # neither of the first two shares a key with the other, only with the third
+    totals = {
+        DONATIONS_MADE: {"Acme Holdings ABN 12 345 678 901": 100},
+        DONOR_RETURNS: {"Road Runner Co Pty Ltd": 40},
+        THIRD_PARTY: {"Road Runner Co / Acme Holdings ABN 12345678901": 5},
+    }
+    (entity,) = resolve_entities(totals)
+    assert entity.name == "Acme Holdings ABN 12 345 678 901"
+    assert len(entity.variants) == 3
+    assert entity.totals == {DONATIONS_MADE: 100, DONOR_RETURNS: 40, THIRD_PARTY: 5}
+
+
+def test_a_chain_is_joined_whatever_the_order():
+    # each shares one key with the next: its name, its first part, then its ACN
+    names = [
+        "Alpha Beta Pty Ltd",
+        "Alpha Beta / Gamma Delta",
+        "Alpha Beta P/L / Gamma Delta ACN 444 555 666",
+        "Epsilon Zeta ACN 444555666",
+    ]
+    forwards = resolve_entities({DONATIONS_MADE: dict.fromkeys(names, 1)})
+    backwards = resolve_entities({DONATIONS_MADE: dict.fromkeys(names[::-1], 1)})
+    assert len(forwards) == 1
+    assert sorted(forwards[0].variants) == sorted(names)
+    assert forwards == backwards
+
+
+def test_similar_donors_stay_separate():
+    totals = {
+        DONATIONS_MADE: {
+            "Woodside Energy Ltd": 100,
+            "Woodside Energy Trading Pty Ltd": 20,
+            "Smith, John": 5,
+            "Smith, Joan": 5,
+            "Acme Holdings ABN 12 345 678 901": 10,
+            "Acme Holdings ABN 98 765 432 109": 10,
+        },
+        DONOR_RETURNS: {"Woodside Energy Limited": 50, "Vic / Tas": 1, "Vic": 1},
+    }
+    entities = by_name(resolve_entities(totals))
+    assert entities["Woodside Energy Limited"] is entities["Woodside Energy Ltd"]
+    assert (
+        entities["Woodside Energy Trading Pty Ltd"]
+        is not entities["Woodside Energy Ltd"]
+    )
+    assert entities["Smith, John"] is not entities["Smith, Joan"]
+    # the same name with different ABNs is still one name
+    assert (
+        entities["Acme Holdings ABN 12 345 678 901"]
+        is entities["Acme Holdings ABN 98 765 432 109"]
+    )
+    # a single word isn't joined on
+    assert entities["Vic / Tas"] is not entities["Vic"]
@@ -0,0 +1,59 @@
+from bot.fitting import (
+    KIND_HEADING,
+    KIND_LINE,
+    KIND_REQUIRED_HEADING,
+    TWITTER_MAX_CHARS,
+    fit_prefix,
+    fit_segments,
+    make_segment,
+    tweet_is_too_long,
+    weighted_length,
+)
+from bot.threads import compose_thread
+
+# 30 handles and a hashtag
+RECIPIENTS = " ".join(f"@SomeoneMentioned{number:02}" for number in range(30))
+RECIPIENTS += " #nine"
+
+
+def reply(name: str, lines: int = 5):
+    return [
+        make_segment(KIND_REQUIRED_HEADING, f"\n\n{name}\n\nFY 20-21:"),
+        *(make_segment(KIND_LINE, f"\nLIB ${number},000") for number in range(lines)),
+        make_segment(KIND_HEADING, "\n\nBefore 2020: $1,000 total"),
+        make_segment(KIND_LINE, "\nALP $1,000"),
+    ]
+
+
+def test_weighted_length_counts_urls_and_wide_characters():
+    assert weighted_length("see https://example.com/a/very/long/path") == 4 + 23
+    assert weighted_length("日本") == 4
+    assert weighted_length("👍🏽") == 2
+
+
+def test_the_prefix_is_cut_between_recipients():
+    assert fit_prefix("@a @b #auspol", 100) == "@a @b #auspol"
+    assert fit_prefix("@a @b #auspol", 5) == "@a @b"
+    assert fit_prefix("@a @b #auspol", 4) == "@a"
+    assert fit_prefix("@a @b #auspol", 1) == ""
+
+
+def test_recipients_are_cut_to_leave_room_for_the_reply():
+    tweet = fit_segments(prefix=RECIPIENTS, segments=reply("Nine Entertainment"))
+    assert weighted_length(RECIPIENTS) > TWITTER_MAX_CHARS
+    assert not tweet_is_too_long(tweet)
+    assert tweet.startswith("@SomeoneMentioned00 @SomeoneMentioned01")
+    assert "\n\nNine Entertainment\n\nFY 20-21:" in tweet
+
+
+def test_a_thread_cuts_recipients_to_leave_room_for_every_heading():
+    long_name = " / ".join(["Nine Entertainment Co Holdings Ltd"] * 5)
+    tweets = compose_thread(
+        prefix=RECIPIENTS,
+        replies=[reply("Nine Entertainment", lines=20), reply(long_name)],
+        max_tweets=4,
+    )
+    assert 1 < len(tweets) <= 4
+    assert not any(tweet_is_too_long(tweet) for tweet in tweets)
+    assert tweets[0].startswith("@SomeoneMentioned00")
+    assert any(long_name in tweet for tweet in tweets)
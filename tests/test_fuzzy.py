@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+from bot.fuzzy import MIN_NAME_TRIGRAMS, name_trigrams, search
+
+# common words in tweets about politics, which once run together spelled donors'
+# names across words, e.g. "hotel gas" for Elgas
+WORDS = """
+    the a to of and in is it for on that this with are be was not they have what
+    about who why how when we our government minister labor liberal greens party
+    election vote money donations lobby hotel gas coal mining energy banks climate
+    tax budget policy federal state senate parliament icac corruption power people
+    time again still just more now need want think know see look thread thanks
+    great news media water health super fund union business big right left one two
+    new old sun day week year
+""".split()
+
+
+def matched(database, text):
+    matches = search(database.trigrams, text, k=1)
+    return [database.donors.name(match.donor_index) for match in matches]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "@AusPolDonations what has Woodside Energy donated?",
+        "@AusPolDonations woodside energy",
+        "@AusPolDonations @WoodsideEnergy",
+    ],
+)
+def test_a_donor_is_found_by_name(database, text):
+    assert matched(database, text) == ["Woodside Energy Limited"]
+
+
+def test_words_left_out_of_names_are_left_out_of_tweets(database):
+    assert matched(
+        database, "@AusPolDonations what has the Accounting and Auditing Solutions?"
+    ) == ["Accounting and Auditing Solutions"]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        # "hotel gas" has every trigram of " elgas " but " el"
+        "@AusPolDonations the hotel gas lobby again",
+        # "see week" spells " seek "
+        "@AusPolDonations see week",
+        "@AusPolDonations hello",
+        "@AusPolDonations who funds the parties? #auspol",
+        "@AusPolDonations thanks, this is really useful",
+    ],
+)
+def test_a_name_spread_across_words_isnt_found(database, text):
+    assert matched(database, text) == []
+
+
+def test_short_names_arent_found_by_name(database):
+    assert len(name_trigrams("Boral Limited")) < MIN_NAME_TRIGRAMS
+    assert matched(database, "@AusPolDonations boral") == []
+
+
+def test_ordinary_tweets_rarely_match(database):
+    random.seed(0)
+    tweets = [
+        "@AusPolDonations " + " ".join(random.choices(WORDS, k=12))
+        for _ in range(500)
+    ]
+    assert [tweet for tweet in tweets if matched(database, tweet)] == []
@@ -0,0 +1,87 @@
+import pytest
+
+from bot.idempotency import (
+    COMPLETE_TTL_SECONDS,
+    IN_PROGRESS_TTL_SECONDS,
+    ClaimResult,
+    DynamoDBStore,
+    InMemoryStore,
+    TieredStore,
+)
+from fakes import FakeDynamoDB
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_650_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> Clock:
+    return Clock()
+
+
+@pytest.fixture
+def table() -> FakeDynamoDB:
+    return FakeDynamoDB()
+
+
+@pytest.fixture
+def store(table, clock) -> DynamoDBStore:
+    return DynamoDBStore(table_name="table", client_factory=lambda: table, clock=clock)
+
+
+def test_a_tweet_can_only_be_claimed_once(store):
+    assert store.claim("1") == ClaimResult.CLAIMED
+    assert store.claim("1") == ClaimResult.IN_PROGRESS
+    assert store.claim("2") == ClaimResult.CLAIMED
+
+
+def test_a_completed_tweet_is_not_claimed_again(store, clock):
+    store.claim("1")
+    store.complete("1")
+    assert store.claim("1") == ClaimResult.COMPLETE
+    clock.now += COMPLETE_TTL_SECONDS - 1
+    assert store.claim("1") == ClaimResult.COMPLETE
+
+
+def test_a_released_tweet_can_be_claimed_again(store):
+    store.claim("1")
+    store.release("1")
+    assert store.claim("1") == ClaimResult.CLAIMED
+
+
+def test_an_expired_claim_can_be_claimed_again(store, table, clock):
+    store.claim("1")
+    clock.now += IN_PROGRESS_TTL_SECONDS + 1
+    # DynamoDB hasn't deleted the expired item yet
+    assert "1" in table.items
+    assert store.claim("1") == ClaimResult.CLAIMED
+
+
+def test_a_claim_released_while_being_checked_is_claimed(store, table):
+    store.claim("1")
+    get_item = table.get_item
+
+    def released_first(**kwargs):
+        table.items.clear()
+        return get_item(**kwargs)
+
+    table.get_item = released_first
+    assert store.claim("1") == ClaimResult.CLAIMED
+
+
+def test_completed_tweets_are_answered_from_memory(store, table, clock):
+    tiered = TieredStore(local=InMemoryStore(clock=clock), durable=store)
+    assert tiered.claim("1") == ClaimResult.CLAIMED
+    tiered.complete("1")
+    calls = table.calls
+    assert tiered.claim("1") == ClaimResult.COMPLETE
+    assert table.calls == calls
+    # another container, without "1" in memory, asks the table
+    other = TieredStore(local=InMemoryStore(clock=clock), durable=store)
+    assert other.claim("1") == ClaimResult.COMPLETE
+    assert table.calls == calls + 2
@@ -0,0 +1,170 @@
+import itertools
+import json
+from collections import Counter
+from types import SimpleNamespace
+
+import pytest
+import tweepy
+
+import index
+from admission import ADMISSION_TWEET_FIELDS, Admission
+from bot import resolve, twitter
+from bot.resolve import Lane, Resolution
+from fakes import FakeQueues, FakeSQS, twitter_entities
+from shared.ratelimit import TokenBucket
+
+QUEUE_URLS = {
+    Lane.FAST: "https://sqs.ap-southeast-2.amazonaws.com/1/TweetQueue",
+    Lane.NOT_FOUND: "https://sqs.ap-southeast-2.amazonaws.com/1/NotFoundQueue",
+}
+DATABASE_ETAG = '"1"'
+FAST = "@AusPolDonations @VisyIndustries"
+NOT_FOUND = "@AusPolDonations @NobodyInParticular"
+NOTHING = "@AusPolDonations thanks!"
+
+ids = itertools.count(1_500_000_000_000_000_000)
+
+
+def mention(text: str, author: str = "2", conversation: str = "3") -> tweepy.Tweet:
+    return tweepy.Tweet(
+        {
+            "id": str(next(ids)),
+            "text": text,
+            "entities": twitter_entities(text),
+            "author_id": author,
+            "conversation_id": conversation,
+        }
+    )
+
+
+@pytest.fixture
+def queues(watcher, database, monkeypatch):
+    """The watcher resolving mentions against the database, with a queue per lane."""
+    queues = dict((lane, FakeSQS()) for lane in QUEUE_URLS)
+    index.sqs_client.set_factory(
+        lambda: FakeQueues(
+            dict((QUEUE_URLS[lane], queue) for lane, queue in queues.items())
+        )
+    )
+    monkeypatch.setattr(index, "LANE_QUEUE_URLS", QUEUE_URLS)
+    monkeypatch.setattr(
+        index, "DATABASE", SimpleNamespace(get=lambda: database, etag=DATABASE_ETAG)
+    )
+    monkeypatch.setattr(index, "resolve_mention", resolve.resolve_mention)
+    return queues
+
+
+def queue(tweets, **kwargs):
+    for future in index.queue_tweets(tweets, **kwargs):
+        future.result()
+
+
+def bodies(queue: FakeSQS):
+    return [json.loads(message["MessageBody"]) for message in queue.messages]
+
+
+def test_mentions_are_queued_in_their_lane(queues):
+    fast, not_found, nothing = mention(FAST), mention(NOT_FOUND), mention(NOTHING)
+    lanes: Counter = Counter()
+    queue([fast, not_found, nothing], lanes=lanes)
+    assert lanes == {Lane.FAST: 1, Lane.NOT_FOUND: 1, Lane.NONE: 1}
+    assert [body["id"] for body in bodies(queues[Lane.FAST])] == [str(fast.id)]
+    assert [body["id"] for body in bodies(queues[Lane.NOT_FOUND])] == [
+        str(not_found.id)
+    ]
+
+
+def test_the_resolution_travels_in_the_message(queues):
+    queue([mention(FAST)])
+    (body,) = bodies(queues[Lane.FAST])
+    assert body["resolved"] == {
+        **Resolution(
+            handles=["@visyindustries"],
+            hashtags=[],
+            reply_keys=["@visyindustries"],
+        ).to_dict(),
+        "database": DATABASE_ETAG,
+    }
+    # only the watcher needs them
+    assert not set(ADMISSION_TWEET_FIELDS).intersection(body)
+
+
+def test_mentions_without_anything_to_reply_to_arent_admitted(queues):
+    admission = Admission(max_per_conversation=1)
+    thanks = [mention(NOTHING), mention(NOTHING)]
+    question, another = mention(FAST), mention(NOT_FOUND)
+    queue([*thanks, question, another], admission=admission)
+    # the thanks didn't use up the conversation's replies, the question did
+    assert [message["Id"] for message in queues[Lane.FAST].messages] == [
+        str(question.id)
+    ]
+    assert queues[Lane.NOT_FOUND].messages == []
+    assert sum(admission.decisions.values()) == 2
+
+
+@pytest.fixture
+def bot(database, monkeypatch):
+    """The bot replying from the database, recording the tweets it would send."""
+    monkeypatch.setattr(
+        twitter, "DATABASE", SimpleNamespace(get=lambda: database, etag=DATABASE_ETAG)
+    )
+    monkeypatch.setattr(
+        twitter,
+        "reply_budget",
+        TokenBucket(
+            name="test",
+            limit=twitter.NOT_FOUND_REPLY_RESERVE + 1,
+            window_seconds=twitter.REPLY_RATE_LIMIT_WINDOW_SECONDS,
+        ),
+    )
+    sent = []
+    monkeypatch.setattr(
+        twitter,
+        "send_tweet",
+        lambda in_reply_to_tweet_id, text: sent.append(text),
+    )
+    return sent
+
+
+def test_the_bot_replies_from_the_resolution_for_its_database(bot):
+    resolved = {
+        **Resolution(
+            handles=["@visyindustries"],
+            hashtags=[],
+            reply_keys=["@visyindustries"],
+        ).to_dict(),
+        "database": DATABASE_ETAG,
+    }
+    # the text isn't looked at again
+    twitter.reply_to_tweet(id=1, text=NOTHING, resolved=resolved)
+    assert len(bot) == 1
+    assert bot[0].startswith("@visyindustries")
+    assert "Pratt Holdings" in bot[0]
+
+
+def test_a_resolution_for_another_database_is_resolved_again(bot):
+    resolved = {
+        **Resolution(
+            handles=["@visyindustries"],
+            hashtags=[],
+            reply_keys=["@visyindustries"],
+        ).to_dict(),
+        "database": '"0"',
+    }
+    twitter.reply_to_tweet(
+        id=1, text=NOTHING, entities=twitter_entities(NOTHING), resolved=resolved
+    )
+    assert bot == []
+
+
+def test_not_found_replies_leave_the_reserve_for_answers(bot):
+    twitter.reply_to_tweet(id=1, text=NOT_FOUND, entities=twitter_entities(NOT_FOUND))
+    assert len(bot) == 1
+    with pytest.raises(twitter.RateLimited):
+        twitter.reply_to_tweet(
+            id=2, text=NOT_FOUND, entities=twitter_entities(NOT_FOUND)
+        )
+    # answers can use the reserve
+    twitter.reply_to_tweet(id=3, text=FAST, entities=twitter_entities(FAST))
+    assert len(bot) == 2
+    assert "Pratt Holdings" in bot[1]
@@ -0,0 +1,78 @@
+import tweepy
+
+from shared.aws import lazy_parameters
+from shared.lazy import LazyResource
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_parameters_are_fetched_on_first_use(ssm):
+    params = lazy_parameters(names=["TWITTER_ID", "TWITTER_BEARER_TOKEN"])
+    assert ssm.calls == 0
+    assert params.get() == {"TWITTER_ID": "1", "TWITTER_BEARER_TOKEN": "token"}
+    params.get()
+    assert ssm.calls == 1
+
+
+def test_parameters_are_fetched_again_after_their_ttl(ssm):
+    clock = Clock()
+    params = LazyResource(
+        name="test:params",
+        factory=lambda: dict(ssm.parameters),
+        ttl_seconds=900,
+        clock=clock,
+    )
+    assert params.get()["TWITTER_BEARER_TOKEN"] == "token"
+    ssm.parameters["TWITTER_BEARER_TOKEN"] = "rotated"
+    clock.now = 899
+    assert params.get()["TWITTER_BEARER_TOKEN"] == "token"
+    clock.now = 900
+    assert params.get()["TWITTER_BEARER_TOKEN"] == "rotated"
+    assert params.version == 2
+
+
+def test_dependants_are_rebuilt_when_a_dependency_is_refreshed(ssm):
+    clock = Clock()
+    params = LazyResource(
+        name="test:params",
+        factory=lambda: dict(ssm.parameters),
+        ttl_seconds=900,
+        clock=clock,
+    )
+    client = LazyResource(
+        name="test:client",
+        factory=lambda: tweepy.Client(params.get()["TWITTER_BEARER_TOKEN"]),
+        depends_on=[params],
+        clock=clock,
+    )
+    first = client.get()
+    assert client.get() is first
+    ssm.parameters["TWITTER_BEARER_TOKEN"] = "rotated"
+    clock.now = 900
+    assert client.get() is not first
+    assert client.get().bearer_token == "rotated"
+
+
+def test_failing_to_refresh_keeps_the_value_we_have():
+    clock = Clock()
+    values = iter([{"TWITTER_ID": "1"}])
+
+    def fetch():
+        # SSM failing after the first fetch
+        return next(values)
+
+    params = LazyResource(
+        name="test:params", factory=fetch, ttl_seconds=900, clock=clock
+    )
+    assert params.get() == {"TWITTER_ID": "1"}
+    clock.now = 900
+    assert params.get() == {"TWITTER_ID": "1"}
+    # and it isn't tried again until the ttl has passed again
+    clock.now = 901
+    assert params.get() == {"TWITTER_ID": "1"}
@@ -0,0 +1,113 @@
+import pytest
+
+from binary_db import write_database
+from bot.db import DonorDatabase
+from bot.mentions import (
+    KIND_ALIAS,
+    KIND_HANDLE,
+    Mention,
+    build_automaton,
+    create_patterns,
+    find_mentions,
+)
+from fakes import twitter_entities
+
+HANDLES = ["@foo", "@foobar", "#nine"]
+ALIASES = {
+    "Woodside": "@foo",
+    "Woodside Energy": "@foobar",
+    "Energy Australia": "#nine",
+}
+
+
+@pytest.fixture(scope="module")
+def automaton(tmp_path_factory):
+    """A database of only the handles and aliases."""
+    path = tmp_path_factory.mktemp("mentions") / "donors.db"
+    patterns = create_patterns(handles=HANDLES, aliases=ALIASES)
+    write_database(
+        path=path,
+        twitter_handles={},
+        donors={},
+        replies={},
+        donor_trigrams={},
+        recent_year="2020-21",
+        financial_years=["2020-21"],
+        parties={},
+        party_handles={},
+        patterns=patterns,
+        automaton=build_automaton([pattern.text for pattern in patterns]),
+    )
+    database = DonorDatabase(path)
+    yield database.automaton
+    database.close()
+
+
+def keys(text, automaton, entities=None):
+    return [
+        (mention.text, mention.key)
+        for mention in find_mentions(text=text, automaton=automaton, entities=entities)
+    ]
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("@AusPolDonations @foo", [("@auspoldonations", None), ("@foo", "@foo")]),
+        ("@foobar", [("@foobar", "@foobar")]),
+        ("@foo_", [("@foo_", None)]),
+        ("@foo2", [("@foo2", None)]),
+        ("(@foo), @foobar.", [("@foo", "@foo"), ("@foobar", "@foobar")]),
+        ("#nine #ninenews", [("#nine", "#nine"), ("#ninenews", None)]),
+        ("ask@foo", []),
+    ],
+)
+def test_handles_match_whole_tokens(automaton, text, expected):
+    assert keys(text, automaton) == expected
+
+
+def test_handles_match_in_any_case(automaton):
+    assert keys("@FOO @FooBar #NINE", automaton) == [
+        ("@foo", "@foo"),
+        ("@foobar", "@foobar"),
+        ("#nine", "#nine"),
+    ]
+
+
+def test_the_longest_alias_at_a_position_wins(automaton):
+    assert keys("What has Woodside Energy donated?", automaton) == [
+        ("woodside energy", "@foobar")
+    ]
+    assert keys("what has woodside donated?", automaton) == [("woodside", "@foo")]
+
+
+def test_overlapping_aliases_are_all_found(automaton):
+    mentions = find_mentions(text="woodside energy australia", automaton=automaton)
+    assert mentions == [
+        Mention(start=0, text="woodside energy", key="@foobar", kind=KIND_ALIAS),
+        Mention(start=9, text="energy australia", key="#nine", kind=KIND_ALIAS),
+    ]
+
+
+def test_aliases_match_whole_words(automaton):
+    assert keys("woodsides and renewable energy australians", automaton) == []
+    assert keys("#woodside", automaton) == [("#woodside", None)]
+
+
+def test_entities_are_used_instead_of_the_text(automaton):
+    text = "@foo @foobar"
+    # twitter didn't find @foobar, e.g. a suspended account
+    entities = twitter_entities("@foo")
+    assert keys(text, automaton, entities) == [("@foo", "@foo")]
+    assert keys(text, automaton, twitter_entities(text)) == keys(text, automaton)
+
+
+def test_a_mention_entity_keeps_its_position(automaton):
+    text = "woodside @FooBar"
+    mentions = find_mentions(
+        text=text, automaton=automaton, entities=twitter_entities(text)
+    )
+    assert mentions == [
+        Mention(start=0, text="woodside", key="@foo", kind=KIND_ALIAS),
+        Mention(start=9, text="@foobar", key="@foobar", kind=KIND_HANDLE),
+    ]
@@ -0,0 +1,44 @@
+import pytest
+
+from build_db import UNSORTED_PARTY
+from bot.fitting import KIND_REQUIRED_HEADING
+from bot.replies import render_party_segments
+from bot.twitter import lookup_reply
+
+
+def top_donors(database, party: str, year: str, count: int = 10):
+    """The party's biggest donors in a year, from every donor's series."""
+    index = database.meta["financial_years"].index(year)
+    donations = [
+        (name, amount)
+        for name, series in database.donors.items()
+        for donated_to, amount in series.totals(range(index, index + 1))
+        if donated_to == party
+    ]
+    return sorted(donations, key=lambda donation: (-donation[1], donation[0]))[:count]
+
+
+@pytest.mark.parametrize("handle, party", [("#labor", "ALP"), ("@liberalaus", "LIB")])
+def test_a_party_handle_is_answered_with_its_top_donors(database, handle, party):
+    recent_year = database.meta["recent_year"]
+    assert database.party_handles[handle] == party
+    top_lists = database.parties[party]
+    assert top_lists[recent_year] == top_donors(database, party, recent_year)
+
+    segments = lookup_reply(key=handle, database=database)
+    assert segments == render_party_segments(
+        party=party, top_donors=top_lists, recent_year=recent_year
+    )
+    assert segments[0].kind == KIND_REQUIRED_HEADING
+    assert segments[0].text.startswith(f"\n\nTop donors to {party}")
+
+
+def test_a_donor_handle_is_answered_with_its_precomputed_reply(database):
+    assert "@visyindustries" not in database.party_handles
+    segments = lookup_reply(key="@visyindustries", database=database)
+    assert segments == database.replies["@visyindustries"]
+    assert "Pratt Holdings" in segments[0].text
+
+
+def test_unsorted_donations_arent_a_party(database):
+    assert UNSORTED_PARTY not in database.parties
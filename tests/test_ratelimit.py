@@ -0,0 +1,208 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+from aws_lambda_powertools.utilities.data_classes.sqs_event import SQSRecord
+
+from bot import twitter
+from bot.idempotency import InMemoryStore
+from tests.conftest import BOT_PATH, load_module
+from fakes import TWEET_QUEUE_URL, FakeSQS, FakeSSM, FakeTwitterAPI, queue_arn
+from shared.aws import ssm_client
+from shared.ratelimit import TokenBucket
+
+WINDOW_SECONDS = 15 * 60
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_650_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock() -> Clock:
+    return Clock()
+
+
+def test_tokens_run_out_until_the_window_resets(clock):
+    bucket = TokenBucket(
+        name="test", limit=2, window_seconds=WINDOW_SECONDS, clock=clock
+    )
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    clock.now += 100
+    assert bucket.try_acquire() == WINDOW_SECONDS - 100
+    clock.now += WINDOW_SECONDS - 100
+    assert bucket.try_acquire() == 0
+    assert bucket.current_remaining() == 1
+
+
+def test_tokens_can_be_reserved(clock):
+    bucket = TokenBucket(
+        name="test", limit=3, window_seconds=WINDOW_SECONDS, clock=clock
+    )
+    assert bucket.try_acquire(reserve=2) == 0
+    assert bucket.try_acquire(reserve=2) > 0
+    assert bucket.try_acquire(count=2) == 0
+
+
+def test_headers_start_a_new_window_but_never_give_tokens_back(clock):
+    bucket = TokenBucket(
+        name="test", limit=200, window_seconds=WINDOW_SECONDS, clock=clock
+    )
+    reset_at = int(clock.now) + WINDOW_SECONDS
+    bucket.update_from_response(
+        201,
+        {
+            "x-rate-limit-limit": "200",
+            "x-rate-limit-remaining": "150",
+            "x-rate-limit-reset": str(reset_at),
+        },
+    )
+    assert bucket.current_remaining() == 150
+    bucket.try_acquire(count=10)
+    # a response from before those 10 replies were sent
+    bucket.update_from_response(
+        201,
+        {
+            "x-rate-limit-limit": "200",
+            "x-rate-limit-remaining": "149",
+            "x-rate-limit-reset": str(reset_at),
+        },
+    )
+    assert bucket.current_remaining() == 140
+
+
+def test_a_429_exhausts_the_bucket_until_the_latest_reset(clock):
+    bucket = TokenBucket(
+        name="test", limit=200, window_seconds=WINDOW_SECONDS, clock=clock
+    )
+    daily_reset = int(clock.now) + 6 * 60 * 60
+    bucket.update_from_response(
+        429,
+        {
+            "x-rate-limit-limit": "200",
+            "x-rate-limit-remaining": "100",
+            "x-rate-limit-reset": str(int(clock.now) + 60),
+            "x-user-limit-24hour-reset": str(daily_reset),
+        },
+    )
+    assert bucket.try_acquire() == daily_reset - clock.now
+
+
+@pytest.fixture
+def bot_index(monkeypatch):
+    ssm_client.set_factory(
+        lambda: FakeSSM(
+            dict(
+                (name, "x")
+                for name in [
+                    "TWITTER_ACCESS_TOKEN",
+                    "TWITTER_ACCESS_TOKEN_SECRET",
+                    "TWITTER_CONSUMER_KEY",
+                    "TWITTER_CONSUMER_SECRET",
+                ]
+            )
+        )
+    )
+    module = load_module("bot_index", BOT_PATH / "index.py")
+    monkeypatch.setattr(module, "idempotency_store", InMemoryStore())
+    # replying without the database, so only the rate limit is exercised
+    monkeypatch.setattr(
+        module,
+        "reply_to_tweet",
+        lambda id, text, **kwargs: twitter.create_tweet(
+            in_reply_to_tweet_id=id, text=text
+        ),
+    )
+    return module
+
+
+def install(
+    monkeypatch, bot_index, api: FakeTwitterAPI, budget: TokenBucket
+) -> FakeSQS:
+    sqs = FakeSQS()
+    bot_index.sqs_client.set_factory(lambda: sqs)
+    monkeypatch.setattr(twitter, "reply_budget", budget)
+
+    def create_client():
+        client = twitter.create_tweepy_client()
+        client.session.mount("https://api.twitter.com/", api)
+        return client
+
+    twitter.tweepy_client.set_factory(create_client)
+    return sqs
+
+
+def records(count: int):
+    return [
+        SQSRecord(
+            {
+                "messageId": str(index),
+                "receiptHandle": f"receipt-{index}",
+                "eventSourceARN": queue_arn(TWEET_QUEUE_URL),
+                "body": json.dumps(
+                    {"id": 1_500_000_000_000_000_000 + index, "text": f"reply {index}"}
+                ),
+            }
+        )
+        for index in range(count)
+    ]
+
+
+def test_replies_over_the_budget_are_deferred_without_calling_twitter(
+    monkeypatch, bot_index
+):
+    api = FakeTwitterAPI(limit=2, window_seconds=WINDOW_SECONDS)
+    sqs = install(
+        monkeypatch,
+        bot_index,
+        api,
+        TokenBucket(name="test", limit=2, window_seconds=WINDOW_SECONDS),
+    )
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        failures = bot_index.process_records(records=records(3), executor=executor)
+    # the oldest mentions get the budget
+    assert failures == [{"itemIdentifier": "2"}]
+    assert len(api.tweets) == 2
+    assert api.rate_limited == 0
+    # hidden until just after the budget refills
+    assert WINDOW_SECONDS - 5 <= sqs.visibility_timeouts["receipt-2"]
+    assert sqs.visibility_timeouts["receipt-2"] <= WINDOW_SECONDS + 2
+
+
+def test_a_429_defers_the_reply_until_twitter_resets(monkeypatch, bot_index):
+    api = FakeTwitterAPI(limit=1, window_seconds=WINDOW_SECONDS)
+    sqs = install(
+        monkeypatch,
+        bot_index,
+        api,
+        TokenBucket(name="test", limit=200, window_seconds=WINDOW_SECONDS),
+    )
+    # the limit is used up by something the budget hasn't heard about
+    session = requests.Session()
+    session.mount("https://api.twitter.com/", api)
+    session.post(twitter.CREATE_TWEET_URL, data=json.dumps({"text": "elsewhere"}))
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        failures = bot_index.process_records(records=records(3), executor=executor)
+    assert [f["itemIdentifier"] for f in failures] == ["0", "1", "2"]
+    # the first 429 exhausts the budget, so the rest don't call twitter
+    assert api.rate_limited == 1
+    for receipt in ["receipt-0", "receipt-1", "receipt-2"]:
+        assert WINDOW_SECONDS - 5 <= sqs.visibility_timeouts[receipt]
+        assert sqs.visibility_timeouts[receipt] <= WINDOW_SECONDS + 2
+
+
+def test_deferrals_are_capped_at_sqs_maximum_visibility_timeout(bot_index):
+    sqs = FakeSQS()
+    bot_index.sqs_client.set_factory(lambda: sqs)
+    record = records(1)[0]
+    bot_index.defer(record=record, delay_seconds=24 * 60 * 60)
+    assert (
+        sqs.visibility_timeouts["receipt-0"]
+        == bot_index.MAX_VISIBILITY_TIMEOUT_SECONDS
+    )
@@ -0,0 +1,88 @@
+import pytest
+
+from bot import reload
+from bot.reload import ReloadingDatabase, S3Source
+from fakes import FakeS3
+from shared.lazy import LazyResource
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class Logged:
+    def __init__(self):
+        self.exceptions = []
+
+    def exception(self, message, *args, **kwargs):
+        self.exceptions.append(message)
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+@pytest.fixture
+def logged(monkeypatch) -> Logged:
+    logged = Logged()
+    monkeypatch.setattr(reload, "logger", logged)
+    # the databases are opened by path, there's no need to read them here
+    monkeypatch.setattr(reload, "DonorDatabase", lambda path: path.read_bytes())
+    return logged
+
+
+@pytest.fixture
+def s3() -> FakeS3:
+    return FakeS3()
+
+
+@pytest.fixture
+def database(tmp_path, s3) -> ReloadingDatabase:
+    packaged = tmp_path / "packaged.db"
+    packaged.write_bytes(b"packaged")
+    downloads = tmp_path / "downloads"
+    downloads.mkdir()
+    return ReloadingDatabase(
+        packaged=packaged,
+        source=S3Source(
+            client=LazyResource(name="s3", factory=lambda: s3),
+            bucket="bucket",
+            key="donors.db",
+        ),
+        check_seconds=60,
+        download_path=downloads,
+        clock=Clock(),
+    )
+
+
+def test_nothing_published_yet_is_not_an_update(logged, s3, database):
+    assert database.get() == b"packaged"
+    assert s3.requests == 1
+    assert logged.exceptions == []
+    assert list(database.download_path.iterdir()) == []
+
+
+def test_a_published_database_replaces_the_packaged_one(logged, s3, database):
+    database.get()
+    s3.put_object(Bucket="bucket", Key="donors.db", Body=b"published")
+    database._clock.now += 60
+    assert database.get() == b"published"
+    database._clock.now += 60
+    assert database.get() == b"published"
+    assert s3.not_modified == 1
+    assert database.loads == 2
+    assert logged.exceptions == []
+
+
+def test_unexpected_failures_are_logged_and_the_database_kept(
+    logged, s3, database, monkeypatch
+):
+    def get_object(**kwargs):
+        raise ConnectionError()
+
+    monkeypatch.setattr(s3, "get_object", get_object)
+    assert database.get() == b"packaged"
+    assert logged.exceptions == ["failed to check for a new donor database"]
@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from bot import resolve
+from bot.resolve import Lane, Resolution, resolve_mention
+from fakes import twitter_entities
+
+# a donor without a handle or alias
+DONOR_NAME = "Accounting and Auditing Solutions"
+
+
+def resolve_text(database, text: str) -> Resolution:
+    return resolve_mention(
+        text=text, entities=twitter_entities(text), database=database, tweet_id=1
+    )
+
+
+def test_a_mapped_handle_is_answered_from_the_database(database):
+    resolution = resolve_text(database, "@AusPolDonations @VisyIndustries #auspol")
+    assert resolution.lane == Lane.FAST
+    assert resolution.handles == ["@visyindustries"]
+    assert resolution.hashtags == ["#auspol"]
+    assert resolution.reply_keys == ["@visyindustries"]
+    assert resolution.donor_name is None
+
+
+def test_a_donor_named_without_a_handle_is_answered(database):
+    text = f"@AusPolDonations what has {DONOR_NAME} given?"
+    resolution = resolve_text(database, text)
+    assert resolution.lane == Lane.FAST
+    assert resolution.reply_keys == []
+    assert resolution.donor_name == DONOR_NAME
+
+
+def test_a_handle_the_database_doesnt_know_is_not_found(database):
+    resolution = resolve_text(database, "@AusPolDonations @NobodyInParticular")
+    assert resolution.lane == Lane.NOT_FOUND
+    assert resolution.handles == ["@nobodyinparticular"]
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "@AusPolDonations thanks!",
+        "@AusPolDonations #auspol #DonationsReform we need a federal ICAC now",
+    ],
+)
+def test_a_mention_without_anything_to_reply_to_isnt_answered(database, text):
+    assert resolve_text(database, text).lane == Lane.NONE
+
+
+def test_with_other_handles_a_name_must_match_in_full(database):
+    # most of the name's trigrams, enough on its own
+    text = "@AusPolDonations accounting auditing solution"
+    assert resolve_text(database, text).donor_name == DONOR_NAME
+    resolution = resolve_text(database, text.replace(" ", " @someone ", 1))
+    assert resolution.lane == Lane.NOT_FOUND
+    assert resolution.donor_name is None
+    resolution = resolve_text(database, f"@AusPolDonations @someone {DONOR_NAME}")
+    assert resolution.lane == Lane.FAST
+    assert resolution.handles == ["@someone"]
+    assert resolution.donor_name == DONOR_NAME
+
+
+def test_a_name_match_is_logged_with_the_tweet(database, monkeypatch):
+    logged = []
+    monkeypatch.setattr(resolve.logger, "info", logged.append)
+    resolve_mention(
+        text=f"@AusPolDonations {DONOR_NAME}",
+        database=database,
+        tweet_id=1_500_000_000_000_000_000,
+    )
+    assert logged == [
+        f"tweet 1500000000000000000 matched {DONOR_NAME} by name, score 1.00"
+    ]
+
+
+def test_a_resolution_travels_as_json():
+    resolution = Resolution(
+        handles=["@woodside"], hashtags=[], reply_keys=[], donor_name="Woodside"
+    )
+    data = json.loads(json.dumps(resolution.to_dict()))
+    assert data["lane"] == "fast"
+    assert Resolution.from_dict(data) == resolution
@@ -0,0 +1,69 @@
+from bot.replies import (
+    combine_donor_data,
+    financial_year_headings,
+    get_donor_data,
+    render_party_segments,
+    render_segments,
+)
+from bot.series import DonationSeries, donors_from_json, earlier_years
+
+
+def texts(segments):
+    return "".join(segment.text for segment in segments)
+
+
+def test_prefix_sums_total_any_span_of_years():
+    series = DonationSeries.from_amounts(
+        years=["2017-18", "2018-19", "2019-20", "2020-21"],
+        amounts={"ALP": {"2017-18": 1, "2019-20": 10}, "LIB": {"2020-21": 100}},
+    )
+    assert series.cumulative == {"ALP": [1, 1, 11, 11], "LIB": [0, 0, 0, 100]}
+    assert series.totals(series.span("2018-19", "2020-21")) == [
+        ("LIB", 100),
+        ("ALP", 10),
+    ]
+    assert series.total("ALP", series.span(last="2019-20")) == 11
+    assert series.to_amounts() == {
+        "ALP": {"2017-18": 1, "2019-20": 10},
+        "LIB": {"2020-21": 100},
+    }
+
+
+def test_a_bucket_of_earlier_years_comes_before_the_year_its_before():
+    donors = donors_from_json(
+        {
+            "Donor": {
+                "LIB": {earlier_years("2020-21"): 110000, "2020-21": 29000},
+            },
+            "Other": {"ALP": {"2020-21": 5}},
+        }
+    )
+    series = donors["Donor"]
+    assert series.years == (earlier_years("2020-21"), "2020-21")
+    assert series.totals(series.span("2020-21", "2020-21")) == [("LIB", 29000)]
+
+    donor = combine_donor_data(get_donor_data(donor_set=["Donor"], donors=donors))[0]
+    assert texts(render_segments(donor=donor, recent_year="2020-21")) == (
+        "\n\nDonor\n\nFY 20-21:\nLIB $29,000"
+        "\n\nBefore 2020: $110,000 total\nLIB $110,000"
+    )
+
+
+def test_a_bucket_of_earlier_years_is_headed_as_before_the_year():
+    assert financial_year_headings("2020-21") == ("FY 20-21", "Before 2020")
+    assert financial_year_headings(earlier_years("2020-21")) == (
+        "Before 2020",
+        "Before 2020",
+    )
+    segments = render_party_segments(
+        party="LIB",
+        top_donors={
+            "2020-21": [("Donor", 29000)],
+            earlier_years("2020-21"): [("Donor", 110000)],
+        },
+        recent_year="2020-21",
+    )
+    assert texts(segments) == (
+        "\n\nTop donors to LIB\n\nFY 20-21:\nDonor $29,000"
+        "\n\nBefore 2020:\nDonor $110,000"
+    )
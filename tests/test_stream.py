@@ -0,0 +1,142 @@
+import threading
+import time
+
+import pytest
+
+import index
+import stream
+from fakes import FakeStream
+
+STREAMED_ID = 1_600_000_000_000_000_000
+HOUR = 60 * 60
+
+
+@pytest.fixture
+def fake_stream(watcher, monkeypatch):
+    fake = FakeStream(keep_alive_seconds=0.05)
+    monkeypatch.setattr(stream, "STREAM_URL", fake.url)
+    monkeypatch.setattr(stream, "RULES_URL", fake.rules_url)
+    yield fake
+    fake.close()
+
+
+def wait_for(condition, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError()
+        time.sleep(0.01)
+
+
+def run(fake_stream, watcher, script):
+    """
+    Stream until script, run alongside, returns. Sleeps are recorded rather than
+    slept, so backoffs don't slow the tests.
+    """
+    done = threading.Event()
+    slept = []
+
+    def drive():
+        try:
+            script()
+        finally:
+            # seen at the next keep alive
+            done.set()
+
+    driver = threading.Thread(target=drive)
+    driver.start()
+    result = stream.stream_mentions(
+        time_left=lambda: 0 if done.is_set() else HOUR, sleep=slept.append
+    )
+    driver.join()
+    return result, slept
+
+
+def queued(watcher):
+    return [message["Id"] for message in watcher.sqs.messages]
+
+
+def push(fake_stream, watcher, number: int) -> None:
+    fake_stream.push(
+        {"id": str(STREAMED_ID + number), "text": f"@AusPolDonations #{number}"}
+    )
+    wait_for(lambda: str(STREAMED_ID + number) in queued(watcher))
+
+
+def test_backoff_doubles_up_to_its_maximum():
+    assert [stream.HTTP_BACKOFF.seconds(attempt) for attempt in range(8)] == [
+        5,
+        10,
+        20,
+        40,
+        80,
+        160,
+        320,
+        320,
+    ]
+
+
+def test_the_rule_is_added_for_the_bots_username_once(fake_stream, watcher):
+    stream.ensure_rule()
+    stream.ensure_rule()
+    assert fake_stream.rules == [
+        {
+            "id": "1",
+            "value": "@AusPolDonations -from:AusPolDonations",
+            "tag": stream.STREAM_RULE_TAG,
+        }
+    ]
+
+
+def test_mentions_are_caught_up_on_then_streamed(fake_stream, watcher):
+    missed = watcher.mentions.add_mention("@AusPolDonations #missed")
+
+    def script():
+        wait_for(lambda: fake_stream.connected())
+        push(fake_stream, watcher, 1)
+
+    result, slept = run(fake_stream, watcher, script)
+    assert queued(watcher) == [missed["id"], str(STREAMED_ID + 1)]
+    assert result["connections"] == 1
+    assert result["streamed"] == 1
+    assert slept == []
+    # the checkpoint moved on to the streamed mention
+    latest_id = watcher.s3.objects[f"{index.BUCKET_NAME}/{index.LATEST_TWEET_ID_KEY}"]
+    assert int(latest_id) == STREAMED_ID + 1
+
+
+def test_a_dropped_connection_is_reconnected(fake_stream, watcher):
+    def script():
+        wait_for(lambda: fake_stream.connected())
+        push(fake_stream, watcher, 1)
+        fake_stream.disconnect()
+        wait_for(lambda: fake_stream.connections == 2 and fake_stream.connected())
+        push(fake_stream, watcher, 2)
+
+    result, slept = run(fake_stream, watcher, script)
+    assert result["connections"] == 2
+    assert queued(watcher) == [str(STREAMED_ID + 1), str(STREAMED_ID + 2)]
+    assert slept == [stream.NETWORK_BACKOFF.seconds(0)]
+
+
+def test_failed_connections_back_off_by_kind(fake_stream, watcher):
+    fake_stream.fail_next = [503, 503, 429]
+
+    def script():
+        wait_for(lambda: fake_stream.connected())
+        push(fake_stream, watcher, 1)
+
+    result, slept = run(fake_stream, watcher, script)
+    assert fake_stream.connections == 4
+    assert result["connections"] == 1
+    assert slept == [
+        stream.HTTP_BACKOFF.seconds(0),
+        stream.HTTP_BACKOFF.seconds(1),
+        stream.RATE_LIMIT_BACKOFF.seconds(2),
+    ]
+
+
+def test_a_connection_refused_for_other_reasons_isnt_retried(fake_stream, watcher):
+    fake_stream.fail_next = [401]
+    with pytest.raises(stream.StreamError):
+        stream.stream_mentions(time_left=lambda: HOUR, sleep=lambda seconds: None)
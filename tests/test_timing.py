@@ -0,0 +1,78 @@
+import json
+import threading
+
+import pytest
+from aws_lambda_powertools import Metrics
+from aws_lambda_powertools.metrics import MetricUnit
+
+from shared.timing import metric_name, timed
+
+
+@pytest.fixture
+def metrics():
+    metrics = Metrics()
+    metrics.clear_metrics()
+    yield metrics
+    metrics.clear_metrics()
+
+
+def emitted(capsys) -> dict:
+    """The EMF blob the handler's log_metrics printed"""
+    return json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+
+
+def test_stages_are_published_with_the_handlers_metrics(metrics, capsys):
+    @metrics.log_metrics
+    def handler(event, context):
+        with timed("Parse"):
+            pass
+        for _ in range(3):
+            with timed("Reply"):
+                pass
+        metrics.add_metric(name="Replies", unit=MetricUnit.Count, value=3)
+
+    handler({}, None)
+    blob = emitted(capsys)
+    (directive,) = blob["_aws"]["CloudWatchMetrics"]
+    assert directive["Namespace"] == "DonationsBot"
+    units = dict((m["Name"], m["Unit"]) for m in directive["Metrics"])
+    assert units == {
+        "ParseTime": "Milliseconds",
+        "ReplyTime": "Milliseconds",
+        "Replies": "Count",
+    }
+    assert len(blob["ParseTime"]) == 1
+    assert all(value >= 0 for value in blob["ParseTime"])
+    # a stage timed more than once publishes every time
+    assert len(blob["ReplyTime"]) == 3
+
+
+def test_a_stage_which_raises_is_still_timed(metrics, capsys):
+    @metrics.log_metrics
+    def handler(event, context):
+        try:
+            with timed("CreateTweet"):
+                raise ValueError()
+        except ValueError:
+            pass
+
+    handler({}, None)
+    assert metric_name("CreateTweet") in emitted(capsys)
+
+
+def test_stages_timed_from_concurrent_threads_are_all_published(metrics, capsys):
+    @metrics.log_metrics
+    def handler(event, context):
+        def reply():
+            for _ in range(10):
+                with timed("Reply"):
+                    pass
+
+        threads = [threading.Thread(target=reply) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    handler({}, None)
+    assert len(emitted(capsys)["ReplyTime"]) == 50